@@ -0,0 +1,62 @@
+"""
+Compara dois arquivos de resultados de `benchmarks.etapas`.
+
+Para cada (etapa, tamanho) presente nos dois arquivos, mostra a mediana de
+cada execução e a razão novo/base (abaixo de 1 = mais rápido). Razões acima
+de `--limite` são marcadas como regressão, e o código de saída é 1 se houver
+alguma, para uso em scripts.
+
+Uso (a partir da raiz do repositório):
+
+    python -m benchmarks.comparar base.json novo.json
+    python -m benchmarks.comparar base.json novo.json --limite 1.2
+"""
+
+import argparse
+import json
+import sys
+
+
+LIMITE_REGRESSAO = 1.10
+
+
+def carregar(caminho: str) -> dict:
+    """Lê um arquivo de resultados e indexa as medições por (etapa, tamanho)."""
+    with open(caminho, encoding='utf-8') as arquivo:
+        dados = json.load(arquivo)
+    return {(r['etapa'], r['tamanho']): r for r in dados['resultados']}
+
+
+def comparar(base: dict, novo: dict, limite: float = LIMITE_REGRESSAO) -> list:
+    """
+    Retorna uma lista de (etapa, tamanho, mediana_base, mediana_nova, razão, regressão)
+    para as medições presentes nos dois resultados, na ordem da base.
+    """
+    linhas = []
+    for chave in base:
+        if chave not in novo:
+            continue
+        antes, depois = base[chave]['mediana_ms'], novo[chave]['mediana_ms']
+        razao = depois / antes if antes > 0 else float('inf')
+        linhas.append((*chave, antes, depois, razao, razao > limite))
+    return linhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('base')
+    parser.add_argument('novo')
+    parser.add_argument('--limite', type=float, default=LIMITE_REGRESSAO,
+                        help="Razão novo/base acima da qual a medição é marcada como regressão")
+    args = parser.parse_args()
+
+    linhas = comparar(carregar(args.base), carregar(args.novo), args.limite)
+    print(f"{'etapa':>19} | {'tamanho':>9} | {'base (ms)':>10} | {'novo (ms)':>10} | razão")
+    for etapa, tamanho, antes, depois, razao, regressao in linhas:
+        print(f"{etapa:>19} | {tamanho:>9,} | {antes:>10.1f} | {depois:>10.1f} | {razao:5.2f}x"
+              f"{'  <- regressão' if regressao else ''}")
+    sys.exit(1 if any(linha[-1] for linha in linhas) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Geradores de dados sintéticos para os benchmarks.
+
+Os PEs ficam espalhados num quadrado de ~45 km em torno de um centro no
+Triângulo Mineiro, e a ZAS é um MultiPolygon de contornos irregulares (raio
+com ruído, como os limites digitalizados reais) gravado em SIRGAS 2000 / UTM
+23S, para que a leitura inclua a reprojeção para WGS84. Todos os geradores são
+determinísticos pela `semente`.
+"""
+
+import html
+import io
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+
+CENTRO = (-18.45, -48.0)
+CRS_ZAS = "EPSG:31983"
+VERTICES_POR_PARTE = 5_000
+
+
+def gerar_pes(n: int, semente: int = 0) -> pd.DataFrame:
+    """PEs aleatórios num raio de ~20 km do centro, indexados por 'Nome'."""
+    rng = np.random.default_rng(semente)
+    return pd.DataFrame({
+        'Latitude': CENTRO[0] + rng.uniform(-0.2, 0.2, n),
+        'Longitude': CENTRO[1] + rng.uniform(-0.2, 0.2, n),
+    }, index=pd.Index([f"PE-{i:06d}" for i in range(n)], name='Nome'))
+
+
+def gerar_estado(nomes, semente: int = 0) -> dict:
+    """Estado de contagens (chaves de `pae_dashboard.contagens`) com valores aleatórios para todos os PEs."""
+    from pae_dashboard.contagens import chave_contagem
+
+    rng = np.random.default_rng(semente)
+    estado = {}
+    for nome, participantes, esperadas in zip(nomes, rng.integers(0, 80, len(nomes)), rng.integers(1, 100, len(nomes))):
+        estado[chave_contagem('participantes', nome)] = int(participantes)
+        estado[chave_contagem('esperadas', nome)] = int(esperadas)
+    return estado
+
+
+def texto_pes(df_pe: pd.DataFrame) -> str:
+    """Os PEs no formato digitado na barra lateral ("Nome | Latitude | Longitude", um por linha)."""
+    return '\n'.join(
+        f"{nome} | {lat!r} | {lon!r}"
+        for nome, lat, lon in zip(df_pe.index, df_pe['Latitude'].tolist(), df_pe['Longitude'].tolist())
+    )
+
+
+_XLSX_FIXOS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/sharedStrings.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/></Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="PEs" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" '
+        'Target="sharedStrings.xml"/></Relationships>'
+    ),
+}
+
+
+def xlsx_pes(df_pe: pd.DataFrame) -> bytes:
+    """
+    Os PEs numa planilha XLSX com as colunas 'Nome', 'Latitude', 'Longitude' e uma coluna extra de texto.
+
+    O XML é escrito diretamente (textos na tabela de strings compartilhadas,
+    como o Excel grava), pois o openpyxl leva dezenas de segundos para 100 mil
+    linhas.
+    """
+    nomes = [str(nome) for nome in df_pe.index]
+    textos = ['Nome', 'Latitude', 'Longitude', 'Observação'] + nomes + [f"Ponto de encontro {nome}" for nome in nomes]
+    n = len(nomes)
+    linhas = ['<row r="1">' + ''.join(f'<c r="{letra}1" t="s"><v>{i}</v></c>' for i, letra in enumerate('ABCD')) + '</row>']
+    for i, (lat, lon) in enumerate(zip(df_pe['Latitude'].tolist(), df_pe['Longitude'].tolist())):
+        r = i + 2
+        linhas.append(
+            f'<row r="{r}"><c r="A{r}" t="s"><v>{4 + i}</v></c><c r="B{r}"><v>{lat!r}</v></c>'
+            f'<c r="C{r}"><v>{lon!r}</v></c><c r="D{r}" t="s"><v>{4 + n + i}</v></c></row>'
+        )
+    aba = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+        + ''.join(linhas) + '</sheetData></worksheet>'
+    )
+    compartilhadas = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" count="{len(textos)}" '
+        f'uniqueCount="{len(textos)}">' + ''.join(f'<si><t>{html.escape(texto)}</t></si>' for texto in textos) + '</sst>'
+    )
+    saida = io.BytesIO()
+    with zipfile.ZipFile(saida, 'w', zipfile.ZIP_DEFLATED) as arquivo_zip:
+        for caminho, conteudo in _XLSX_FIXOS.items():
+            arquivo_zip.writestr(caminho, conteudo)
+        arquivo_zip.writestr('xl/worksheets/sheet1.xml', aba)
+        arquivo_zip.writestr('xl/sharedStrings.xml', compartilhadas)
+    return saida.getvalue()
+
+
+def _shapefile_zip(gdf, nome: str) -> bytes:
+    """Grava o GeoDataFrame como shapefile e devolve os arquivos compactados num .zip em memória."""
+    with tempfile.TemporaryDirectory() as pasta:
+        gdf.to_file(os.path.join(pasta, f"{nome}.shp"), engine="pyogrio")
+        saida = io.BytesIO()
+        with zipfile.ZipFile(saida, 'w', zipfile.ZIP_DEFLATED) as arquivo_zip:
+            for arquivo in sorted(os.listdir(pasta)):
+                arquivo_zip.write(os.path.join(pasta, arquivo), arquivo)
+    return saida.getvalue()
+
+
+def shapefile_pes(df_pe: pd.DataFrame) -> bytes:
+    """Os PEs como shapefile de pontos (WGS84) compactado, com o atributo 'Nome'."""
+    import geopandas
+
+    gdf = geopandas.GeoDataFrame(
+        {'Nome': df_pe.index.to_numpy(dtype=object)},
+        geometry=geopandas.points_from_xy(df_pe['Longitude'], df_pe['Latitude']),
+        crs="EPSG:4326",
+    )
+    return _shapefile_zip(gdf, "pes")
+
+
+def gerar_zas(vertices: int, semente: int = 0):
+    """
+    ZAS sintética com cerca de `vertices` vértices no total, em `CRS_ZAS`.
+
+    Retorna:
+    Um GeoDataFrame com uma única feição MultiPolygon, dividida em partes de
+    até `VERTICES_POR_PARTE` vértices dispostas em grade ao redor do centro.
+    """
+    import geopandas
+    import shapely
+
+    rng = np.random.default_rng(semente)
+    partes = max(1, int(np.ceil(vertices / VERTICES_POR_PARTE)))
+    por_parte = max(8, vertices // partes)
+    colunas = int(np.ceil(np.sqrt(partes)))
+    centro = geopandas.GeoSeries(shapely.points([CENTRO[1]], [CENTRO[0]]), crs="EPSG:4326").to_crs(CRS_ZAS)
+    x0, y0 = centro.x.iloc[0], centro.y.iloc[0]
+    angulos = np.linspace(0, 2 * np.pi, por_parte, endpoint=False)
+    poligonos = []
+    for i in range(partes):
+        # Contornos estrelados (raio positivo em ângulos crescentes) são sempre simples; as partes não se tocam.
+        raio = 3_000 * (1 + 0.15 * np.sin(7 * angulos + i) + 0.05 * rng.standard_normal(por_parte))
+        cx = x0 + (i % colunas - colunas / 2) * 8_000
+        cy = y0 + (i // colunas - colunas / 2) * 8_000
+        poligonos.append(shapely.polygons(np.column_stack([cx + raio * np.cos(angulos), cy + raio * np.sin(angulos)])))
+    geometria = shapely.multipolygons(poligonos)
+    return geopandas.GeoDataFrame(
+        {'nome': ['ZAS sintética'], 'area_km2': [geometria.area / 1e6]}, geometry=[geometria], crs=CRS_ZAS
+    )
+
+
+def shapefile_zas(gdf_zas) -> bytes:
+    """A ZAS como shapefile compactado."""
+    return _shapefile_zip(gdf_zas, "zas")
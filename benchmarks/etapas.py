@@ -0,0 +1,290 @@
+"""
+Tempo de cada etapa do dashboard com dados sintéticos, gravado em JSON.
+
+Etapas medidas (ver `ETAPAS`), cada uma em vários tamanhos:
+
+- texto_pes: leitura do texto "Nome | Latitude | Longitude" digitado na barra
+  lateral (`texto_pes.analisar_texto_pes`, usada por `parse_pe_data`);
+- xlsx_pes / shapefile_pes: carga de PEs de uma planilha ou de um shapefile
+  compactado, com o mapeamento das colunas (`pes.carregar_pes` e
+  `pes.mapear_pes`, usadas por `load_pe_from_file`), sem cache;
+- efetividade: montagem das contagens e cálculo de efetividade, cor e ícone;
+- zas_leitura: leitura da ZAS de um shapefile compactado e reprojeção para
+  WGS84; zas_lods: simplificação da ZAS nos níveis de zoom do mapa;
+- mapa_folium: mapa base com a ZAS (`VERTICES_ZAS_MAPA` vértices) e camada
+  de marcadores, até o HTML (registra o tamanho do HTML);
+- grafico_plotly: gráfico realizado vs. esperado (agregado acima de
+  `graficos.LIMIAR_MODO_AGREGADO` PEs), até o JSON enviado ao navegador
+  (registra o tamanho do JSON); grafico_atualizacao: o mesmo gráfico num
+  rerun em que a contagem de um PE mudou, com a figura anterior em
+  `graficos.CacheGrafico`;
+- cobertura: distância de cada célula da grade da ZAS (`VERTICES_ZAS_MAPA`
+  vértices) até o PE mais próximo (`cobertura.calcular_cobertura`), com a
+  grade já construída (registra o número de células).
+
+Os dados de entrada são gerados antes da medição (ver
+`benchmarks.dados_sinteticos`). Cada medição faz uma execução de aquecimento
+(registrada em `primeira_ms`) e depois `--repeticoes` execuções.
+
+Uso (a partir da raiz do repositório):
+
+    python -m benchmarks.etapas
+    python -m benchmarks.etapas --pes 10 1000 --vertices 1000 --etapas texto_pes efetividade
+    python -m benchmarks.comparar benchmarks/resultados/A.json benchmarks/resultados/B.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.dados_sinteticos import (
+    gerar_estado, gerar_pes, gerar_zas, shapefile_pes, shapefile_zas, texto_pes, xlsx_pes
+)
+
+
+PES_PADRAO = [10, 100, 1_000, 10_000, 100_000]
+VERTICES_PADRAO = [1_000, 10_000, 100_000, 1_000_000]
+# ZAS usada nas etapas que variam o número de PEs (mapa).
+VERTICES_ZAS_MAPA = 100_000
+PASTA_RESULTADOS = os.path.join(os.path.dirname(__file__), "resultados")
+VERSAO_FORMATO = 1
+
+
+# Cada etapa: (unidade do tamanho, preparar(tamanho, compartilhado) -> (executar, extras)).
+# `executar` é a função medida; `extras(resultado)` devolve medidas adicionais do último resultado.
+
+def _preparar_texto_pes(n, _):
+    from pae_dashboard.texto_pes import analisar_texto_pes
+
+    texto = texto_pes(gerar_pes(n))
+    return (lambda: analisar_texto_pes(texto)), (lambda resultado: {'bytes_entrada': len(texto.encode())})
+
+
+def _preparar_arquivo_pes(tipo, gerar_arquivo, nome_arquivo, col_nome):
+    def preparar(n, _):
+        from pae_dashboard.pes import carregar_pes, mapear_pes
+
+        data = gerar_arquivo(gerar_pes(n))
+        colunas = [col_nome, 'Latitude', 'Longitude'] if tipo == 'xlsx' else [col_nome]
+
+        def executar():
+            df, _ = carregar_pes(data, nome_arquivo, tipo, colunas=colunas)
+            return mapear_pes(df, col_nome, 'Latitude', 'Longitude')
+        return executar, (lambda resultado: {'bytes_entrada': len(data), 'pes_lidos': len(resultado)})
+    return preparar
+
+
+def _preparar_efetividade(n, _):
+    from pae_dashboard.efetividade import COL_ESPERADAS, COL_PARTICIPANTES, aplicar_indicadores, montar_contagens
+
+    df_pe_base = gerar_pes(n)
+    estado = gerar_estado(df_pe_base.index)
+
+    def executar():
+        df_pe = df_pe_base.copy()
+        contagens = montar_contagens(df_pe.index, estado)
+        df_pe[COL_PARTICIPANTES] = contagens[COL_PARTICIPANTES].to_numpy()
+        df_pe[COL_ESPERADAS] = contagens[COL_ESPERADAS].to_numpy()
+        return aplicar_indicadores(df_pe)
+    return executar, None
+
+
+def _preparar_zas_leitura(vertices, _):
+    from pae_dashboard.geodados import ler_geodados
+
+    data = shapefile_zas(gerar_zas(vertices))
+    return (lambda: ler_geodados(data, "zas.zip")), (lambda resultado: {'bytes_entrada': len(data)})
+
+
+def _preparar_zas_lods(vertices, _):
+    from pae_dashboard.zas import construir_lods
+
+    gdf_zas = gerar_zas(vertices).to_crs("EPSG:4326")
+    return (lambda: construir_lods(gdf_zas)), None
+
+
+def _df_pe_completo(n):
+    executar, _ = _preparar_efetividade(n, None)
+    return executar()
+
+
+def _preparar_mapa_folium(n, compartilhado):
+    from pae_dashboard.mapa import camada_marcadores, mapa_base
+
+    if 'zas_lod' not in compartilhado:
+        from pae_dashboard.zas import construir_lods
+
+        compartilhado['zas_lod'] = construir_lods(gerar_zas(VERTICES_ZAS_MAPA).to_crs("EPSG:4326"))
+    zas_lod = compartilhado['zas_lod']
+    df_pe = _df_pe_completo(n)
+
+    def executar():
+        m, _ = mapa_base(df_pe, zas_lod)
+        camada_marcadores(df_pe).add_to(m)
+        return m.get_root().render()
+    return executar, (lambda resultado: {'bytes_html': len(resultado.encode())})
+
+
+def _preparar_grafico_plotly(n, _):
+    from pae_dashboard.graficos import figura_realizado_esperado
+
+    df_pe = _df_pe_completo(n)
+    return (lambda: figura_realizado_esperado(df_pe).to_json()), (lambda resultado: {'bytes_json': len(resultado)})
+
+
+def _preparar_grafico_atualizacao(n, _):
+    from pae_dashboard.efetividade import COL_PARTICIPANTES, aplicar_indicadores
+    from pae_dashboard.graficos import CacheGrafico
+
+    df_pe = _df_pe_completo(n)
+    cache = CacheGrafico()
+    cache.figura(df_pe)
+    coluna = df_pe.columns.get_loc(COL_PARTICIPANTES)
+    passo = iter(range(1 << 62))
+
+    def executar():
+        # Um PE diferente por execução, como uma contagem digitada na barra lateral.
+        i = next(passo)
+        df_pe.iloc[i % len(df_pe), coluna] += 1
+        aplicar_indicadores(df_pe)
+        return cache.figura(df_pe).to_json()
+    return executar, (lambda resultado: {'bytes_json': len(resultado), 'atualizadas': cache.atualizadas})
+
+
+def _preparar_cobertura(n, compartilhado):
+    from pae_dashboard.cobertura import calcular_cobertura, construir_grade
+    from pae_dashboard.relacao_zas import construir_indice
+
+    if 'grade_zas' not in compartilhado:
+        compartilhado['grade_zas'] = construir_grade(
+            construir_indice(gerar_zas(VERTICES_ZAS_MAPA).to_crs("EPSG:4326"))
+        )
+    grade = compartilhado['grade_zas']
+    df_pe = gerar_pes(n)
+    return (lambda: calcular_cobertura(grade, df_pe)), (lambda resultado: {'celulas': len(resultado.grade)})
+
+
+ETAPAS = {
+    'texto_pes': ('pes', _preparar_texto_pes),
+    'xlsx_pes': ('pes', _preparar_arquivo_pes('xlsx', xlsx_pes, "pes.xlsx", 'Nome')),
+    'shapefile_pes': ('pes', _preparar_arquivo_pes('geo', shapefile_pes, "pes.zip", 'Nome')),
+    'efetividade': ('pes', _preparar_efetividade),
+    'zas_leitura': ('vertices', _preparar_zas_leitura),
+    'zas_lods': ('vertices', _preparar_zas_lods),
+    'mapa_folium': ('pes', _preparar_mapa_folium),
+    'grafico_plotly': ('pes', _preparar_grafico_plotly),
+    'grafico_atualizacao': ('pes', _preparar_grafico_atualizacao),
+    'cobertura': ('pes', _preparar_cobertura),
+}
+
+
+def medir(executar, repeticoes: int) -> tuple:
+    """
+    Executa `executar` uma vez para aquecimento e depois `repeticoes` vezes.
+
+    Retorna:
+    Uma tupla (tempos em ms das repetições, tempo em ms do aquecimento, último resultado).
+    """
+    inicio = time.perf_counter()
+    resultado = executar()
+    primeira = (time.perf_counter() - inicio) * 1000
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = executar()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return tempos, primeira, resultado
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ambiente() -> dict:
+    """Versões do Python, do sistema e das bibliotecas que influenciam as medições."""
+    from importlib.metadata import PackageNotFoundError, version
+
+    bibliotecas = {}
+    for pacote in ('numpy', 'pandas', 'geopandas', 'shapely', 'pyogrio', 'pyproj', 'folium', 'plotly', 'openpyxl'):
+        try:
+            bibliotecas[pacote] = version(pacote)
+        except PackageNotFoundError:
+            bibliotecas[pacote] = None
+    return {
+        'python': platform.python_version(),
+        'sistema': platform.platform(),
+        'processador': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'bibliotecas': bibliotecas,
+        'commit': _commit_atual(),
+    }
+
+
+def executar_etapas(etapas, pes, vertices, repeticoes: int, saida=sys.stdout) -> list:
+    """
+    Mede as `etapas` nos tamanhos dados.
+
+    Retorna:
+    A lista de resultados, um dicionário por (etapa, tamanho).
+    """
+    resultados = []
+    compartilhado = {}
+    for etapa in etapas:
+        unidade, preparar = ETAPAS[etapa]
+        for tamanho in (pes if unidade == 'pes' else vertices):
+            executar, extras = preparar(tamanho, compartilhado)
+            tempos, primeira, resultado = medir(executar, repeticoes)
+            registro = {
+                'etapa': etapa,
+                'unidade': unidade,
+                'tamanho': tamanho,
+                'repeticoes': repeticoes,
+                'mediana_ms': statistics.median(tempos),
+                'minimo_ms': min(tempos),
+                'maximo_ms': max(tempos),
+                'primeira_ms': primeira,
+                'extras': extras(resultado) if extras else {},
+            }
+            resultados.append(registro)
+            print(f"{etapa:>19} | {unidade:>8} {tamanho:>9,} | mediana {registro['mediana_ms']:>10.1f} ms"
+                  f" | {' '.join(f'{k}={v:,}' for k, v in registro['extras'].items())}", file=saida, flush=True)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--pes', type=int, nargs='+', default=PES_PADRAO)
+    parser.add_argument('--vertices', type=int, nargs='+', default=VERTICES_PADRAO)
+    parser.add_argument('--etapas', nargs='+', choices=list(ETAPAS), default=list(ETAPAS))
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--saida', help="Arquivo JSON de saída (padrão: benchmarks/resultados/etapas-<data>.json)")
+    args = parser.parse_args()
+
+    inicio = datetime.datetime.now()
+    resultados = executar_etapas(args.etapas, args.pes, args.vertices, args.repeticoes)
+    saida = args.saida or os.path.join(PASTA_RESULTADOS, f"etapas-{inicio:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, 'w', encoding='utf-8') as arquivo:
+        json.dump({
+            'versao': VERSAO_FORMATO,
+            'inicio': inicio.isoformat(timespec='seconds'),
+            'ambiente': ambiente(),
+            'resultados': resultados,
+        }, arquivo, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {saida}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Latência de atualização do dashboard após a alteração de uma contagem.
+
+Compara, com dados sintéticos, o trabalho feito no servidor quando um único PE
+tem a contagem alterada:
+
+- antes: o script inteiro era reexecutado, remontando as contagens, as
+  métricas, o gráfico Plotly e o mapa completo (fundo, ZAS e todos os
+  marcadores);
+- depois: só os fragmentos que dependem das contagens são reexecutados
+  (ver `pae_dashboard.paineis`), e o mapa reenvia a base sem mudanças (com a
+  ZAS já serializada, ver `pae_dashboard.mapa.CamadaZas`) e apenas a camada
+  de marcadores, com só o marcador alterado regerado.
+
+Uso (a partir da raiz do repositório):
+
+    python -m benchmarks.latencia_rerun
+    python -m benchmarks.latencia_rerun --pes 16 500 5000 --repeticoes 5
+"""
+
+import argparse
+import statistics
+import time
+
+import folium
+import plotly.express as px
+
+from benchmarks.dados_sinteticos import gerar_estado, gerar_pes, gerar_zas
+from pae_dashboard.contagens import aplicar_diff
+from pae_dashboard.efetividade import COL_ESPERADAS, COL_PARTICIPANTES, aplicar_indicadores, montar_contagens
+from pae_dashboard.mapa import CacheMarcadores, adicionar_marcadores, camada_marcadores
+from pae_dashboard.mapa import mapa_base as mapa_base_dashboard
+from pae_dashboard.zas import construir_lods
+
+
+VERTICES_ZAS = 16_000
+
+
+def montar_df_pe(df_pe_base, estado):
+    df_pe = df_pe_base.copy()
+    contagens = montar_contagens(df_pe.index, estado)
+    df_pe[COL_PARTICIPANTES] = contagens[COL_PARTICIPANTES].to_numpy()
+    df_pe[COL_ESPERADAS] = contagens[COL_ESPERADAS].to_numpy()
+    aplicar_indicadores(df_pe)
+    return df_pe
+
+
+def metricas(df_pe):
+    participantes = df_pe[COL_PARTICIPANTES].sum()
+    esperadas = df_pe[COL_ESPERADAS].sum()
+    return participantes, esperadas, (participantes / esperadas * 100) if esperadas > 0 else 0
+
+
+def grafico(df_pe):
+    df_melted = df_pe.reset_index().melt(
+        id_vars=['Nome'], value_vars=[COL_PARTICIPANTES, COL_ESPERADAS], var_name='Métrica', value_name='Quantidade'
+    )
+    return px.bar(df_melted, x='Nome', y='Quantidade', color='Métrica', barmode='group').to_json()
+
+
+def mapa_base(df_pe, zas_lod):
+    m = folium.Map(location=[df_pe['Latitude'].mean(), df_pe['Longitude'].mean()], zoom_start=11)
+    folium.GeoJson(zas_lod.geojson_para(11), name='ZAS').add_to(m)
+    return m
+
+
+def rerun_antes(df_pe_base, estado, zas_lod):
+    df_pe = montar_df_pe(df_pe_base, estado)
+    metricas(df_pe)
+    grafico(df_pe)
+    m = mapa_base(df_pe, zas_lod)
+    adicionar_marcadores(m, df_pe)
+    m.get_root().render()
+
+
+def rerun_depois(df_pe_base, estado, zas_lod, cache):
+    df_pe = montar_df_pe(df_pe_base, estado)
+    metricas(df_pe)
+    grafico(df_pe)
+    mapa_base_dashboard(df_pe, zas_lod)[0].get_root().render()
+    camada = camada_marcadores(df_pe, cache)
+    camada._template.module.script(camada)
+
+
+def medir(funcao, repeticoes: int) -> float:
+    """Mediana, em milissegundos, de `repeticoes` chamadas de `funcao`."""
+    tempos = []
+    for i in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(i)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--pes', type=int, nargs='+', default=[16, 200, 500, 2000, 10000])
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+
+    zas_lod = construir_lods(gerar_zas(VERTICES_ZAS).to_crs("EPSG:4326"))
+    print(f"{'PEs':>7} | {'antes (ms)':>11} | {'depois (ms)':>11} | {'ganho':>6}")
+    for n in args.pes:
+        df_pe_base = gerar_pes(n)
+        estado = gerar_estado(df_pe_base.index)
+        nome_alterado = df_pe_base.index[n // 2]
+
+        def alterar(i):
+            aplicar_diff(estado, {nome_alterado: {'participantes': i + 1}})
+
+        cache = CacheMarcadores()
+        rerun_depois(df_pe_base, estado, zas_lod, cache)
+        antes = medir(lambda i: (alterar(i), rerun_antes(df_pe_base, estado, zas_lod)), args.repeticoes)
+        depois = medir(lambda i: (alterar(i + args.repeticoes), rerun_depois(df_pe_base, estado, zas_lod, cache)),
+                       args.repeticoes)
+        print(f"{n:>7} | {antes:>11.1f} | {depois:>11.1f} | {antes / depois:>5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
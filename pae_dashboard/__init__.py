@@ -0,0 +1,27 @@
+"""
+Núcleo de processamento do Dashboard de Simulado PAE.
+
+Os módulos deste pacote não dependem do Streamlit e podem ser usados
+diretamente por scripts, rotinas em lote e testes.
+
+Importar o pacote não importa nenhum submódulo: eles são carregados no
+primeiro acesso (`pae_dashboard.efetividade`, por exemplo), e as dependências
+pesadas (geopandas, folium, plotly, openpyxl) só dentro das funções que as
+usam.
+"""
+
+import importlib
+
+SUBMODULOS = (
+    'cache', 'chegadas', 'cobertura', 'compartilhado', 'contagens', 'diagnostico', 'efetividade', 'geodados', 'graficos',
+    'ingestao', 'locais', 'mapa', 'paineis', 'persistencia', 'pes', 'planilhas', 'populacao', 'relacao_zas', 'texto_pes',
+    'tiles', 'tiles_vetoriais', 'zas',
+)
+
+__all__ = list(SUBMODULOS)
+
+
+def __getattr__(nome):
+    if nome in SUBMODULOS:
+        return importlib.import_module(f'{__name__}.{nome}')
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
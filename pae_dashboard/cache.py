@@ -0,0 +1,127 @@
+"""
+Cache em memória para camadas geográficas já lidas e reprojetadas.
+
+As entradas são indexadas pelo hash do conteúdo enviado mais os parâmetros da
+leitura (camada, colunas, CRS de destino...), de modo que um rerun do Streamlit
+com o mesmo arquivo não precise repetir a leitura e a reprojeção (ver
+`pae_dashboard.geodados`).
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 32
+
+
+def hash_bytes(data: bytes) -> str:
+    """Retorna o hash (BLAKE2b, 128 bits) do conteúdo de um arquivo enviado."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def estimar_bytes(obj) -> int:
+    """
+    Estima a memória ocupada por um objeto armazenado no cache.
+
+    Para GeoDataFrames, o `memory_usage` do pandas não enxerga as coordenadas
+    das geometrias, então elas são somadas à parte (16 bytes por vértice 2D).
+    """
+    if hasattr(obj, "estimar_bytes"):
+        return int(obj.estimar_bytes())
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, tuple):
+        return sum(estimar_bytes(item) for item in obj)
+    if isinstance(obj, pd.DataFrame):
+        total = int(obj.memory_usage(deep=True, index=True).sum())
+        geometry_name = getattr(obj, "_geometry_column_name", None)
+        if geometry_name is not None and geometry_name in obj.columns:
+            import shapely
+            total += int(shapely.get_num_coordinates(obj[geometry_name].values).sum()) * 16
+        return total
+    return 0
+
+
+class GeoCache:
+    """
+    Cache LRU limitado por número de entradas e por memória estimada.
+
+    É seguro para uso concorrente entre sessões do Streamlit, que rodam em
+    threads distintas do mesmo processo.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Retorna o valor em cache (marcando-o como recente) ou `default`."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value, nbytes: int = None):
+        """Armazena um valor, descartando as entradas menos recentes se necessário."""
+        if nbytes is None:
+            nbytes = estimar_bytes(value)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                # Não adianta esvaziar o cache para um objeto que nunca caberia nele.
+                return
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """Retorna o valor em cache ou executa `loader()` e armazena o resultado."""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = loader()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Retorna as estatísticas de uso do cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+            }
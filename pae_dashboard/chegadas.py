@@ -0,0 +1,356 @@
+"""
+Série temporal das chegadas aos PEs durante o exercício.
+
+Cada alteração do número de participantes de um PE vira um registro
+(momento, PE, valor absoluto, variação) num buffer colunar só de acréscimo:
+os registros vão para blocos de arrays NumPy de tamanho fixo, e os blocos só
+são concatenados (uma vez) quando a série é consultada. Os PEs são guardados
+como códigos inteiros, de modo que um registro ocupa 20 bytes.
+
+As agregações são vetorizadas sobre a série inteira:
+- chegadas por minuto, com média móvel;
+- efetividade geral acumulada ao longo do tempo;
+- tempo até 50% / 80% dos esperados, por PE e no total.
+
+As duas primeiras já saem reduzidas a no máximo `max_pontos` pontos, para que
+o gráfico de um exercício longo, com muitos eventos, continue leve no navegador.
+
+Os tempos são contados a partir do início do exercício (por padrão, o
+registro mais antigo da série) e as metas usam o número atual de esperados.
+Os registros podem chegar fora de ordem de tempo (eventos com o momento da
+chegada, lidos com atraso, ou uma edição manual feita antes de eles serem
+lidos): nesse caso a série é reordenada uma vez, na consulta seguinte, e as
+variações de cada PE são recalculadas a partir dos valores absolutos.
+"""
+
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+
+TAMANHO_BLOCO = 65_536
+METAS_PADRAO = (50, 80)
+MAX_PONTOS_PADRAO = 500
+JANELA_MEDIA_MIN = 5
+
+COL_MINUTO = 'Minutos desde o início'
+COL_CHEGADAS_MINUTO = 'Chegadas por minuto'
+COL_MEDIA_MOVEL = 'Média móvel'
+COL_PARTICIPANTES_ACUMULADOS = 'Participantes'
+COL_EFETIVIDADE_ACUMULADA = 'Efetividade (%)'
+
+
+def coluna_meta(meta) -> str:
+    """Nome da coluna do tempo (em minutos) até a `meta` (%) em `SerieChegadas.tempos_ate_meta`."""
+    return f'Até {meta}% (min)'
+
+
+class SerieChegadas:
+    """
+    Registro temporal do número de participantes de cada PE.
+
+    Pode ser compartilhada entre threads: a escrita e a consolidação dos
+    blocos são serializadas por um lock.
+
+    Argumentos:
+    tamanho_bloco: Número de registros de cada bloco do buffer.
+    inicio: Momento de início do exercício (segundos desde a época); padrão:
+    o registro mais antigo.
+    """
+
+    def __init__(self, tamanho_bloco: int = TAMANHO_BLOCO, inicio: float = None):
+        self.tamanho_bloco = tamanho_bloco
+        self.inicio = inicio
+        self._inicio_fixo = inicio is not None
+        self._ultimo_momento = -np.inf
+        self._fora_de_ordem = False
+        self._codigos = {}
+        # Valor e momento do registro mais recente (no tempo) de cada PE, por código.
+        self._ultimos = np.zeros(0, dtype=np.int32)
+        self._momentos = np.zeros(0, dtype=np.float64)
+        self._blocos = []
+        self._bloco = None
+        self._ocupados = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(bloco[0]) for bloco in self._blocos) + self._ocupados
+
+    def _novo_bloco(self):
+        self._bloco = (
+            np.empty(self.tamanho_bloco, dtype=np.float64),
+            np.empty(self.tamanho_bloco, dtype=np.int32),
+            np.empty(self.tamanho_bloco, dtype=np.int32),
+            np.empty(self.tamanho_bloco, dtype=np.int32),
+        )
+        self._ocupados = 0
+
+    def _codificar(self, nomes) -> np.ndarray:
+        codigos = self._codigos
+        resultado = np.fromiter((codigos.setdefault(nome, len(codigos)) for nome in nomes), dtype=np.int32)
+        if len(codigos) > len(self._ultimos):
+            novos = len(codigos) - len(self._ultimos)
+            self._ultimos = np.concatenate([self._ultimos, np.zeros(novos, np.int32)])
+            self._momentos = np.concatenate([self._momentos, np.full(novos, -np.inf)])
+        return resultado
+
+    def registrar(self, nomes, valores, ts=None):
+        """
+        Acrescenta novos valores absolutos de participantes.
+
+        Argumentos:
+        nomes: Os PEs alterados (um mesmo PE pode aparecer mais de uma vez, na
+        ordem em que as alterações ocorreram).
+        valores: O número de participantes de cada PE depois da alteração.
+        ts: Momento das alterações: um número para o lote todo ou um array
+        com um momento por alteração (padrão: agora). As alterações de um
+        mesmo PE devem vir em ordem de momento dentro do lote.
+
+        Registros que não mudam o valor anterior do PE são descartados.
+        Registros anteriores ao mais recente já gravado do PE são guardados
+        sem variação; ela é calculada quando a série é reordenada.
+        """
+        valores = np.asarray(valores, dtype=np.int32)
+        if len(valores) == 0:
+            return
+        ts = np.broadcast_to(np.asarray(time.time() if ts is None else ts, dtype=np.float64), valores.shape)
+        with self._lock:
+            codigos = self._codificar(nomes)
+            atrasados = ts < self._momentos[codigos]
+            if atrasados.any():
+                self._acrescentar(ts[atrasados], codigos[atrasados], valores[atrasados],
+                                  np.zeros(int(atrasados.sum()), np.int32))
+                ts, codigos, valores = ts[~atrasados], codigos[~atrasados], valores[~atrasados]
+            # Variação de cada registro em relação ao anterior do mesmo PE (no lote ou já gravado).
+            ordem = np.argsort(codigos, kind='stable')
+            codigos_ordenados, valores_ordenados = codigos[ordem], valores[ordem]
+            anteriores = np.empty_like(valores_ordenados)
+            anteriores[1:] = valores_ordenados[:-1]
+            primeiro = np.ones(len(ordem), dtype=bool)
+            primeiro[1:] = codigos_ordenados[1:] != codigos_ordenados[:-1]
+            anteriores[primeiro] = self._ultimos[codigos_ordenados[primeiro]]
+            deltas = np.empty_like(valores)
+            deltas[ordem] = valores_ordenados - anteriores
+
+            ultimo = np.ones(len(ordem), dtype=bool)
+            ultimo[:-1] = primeiro[1:]
+            self._ultimos[codigos_ordenados[ultimo]] = valores_ordenados[ultimo]
+            self._momentos[codigos_ordenados[ultimo]] = ts[ordem][ultimo]
+
+            mantidos = deltas != 0
+            self._acrescentar(ts[mantidos], codigos[mantidos], valores[mantidos], deltas[mantidos])
+
+    def _acrescentar(self, *colunas):
+        total = len(colunas[0])
+        posicao = 0
+        while posicao < total:
+            if self._bloco is None or self._ocupados == self.tamanho_bloco:
+                if self._bloco is not None:
+                    self._blocos.append(self._bloco)
+                self._novo_bloco()
+            n = min(total - posicao, self.tamanho_bloco - self._ocupados)
+            for destino, origem in zip(self._bloco, colunas):
+                destino[self._ocupados:self._ocupados + n] = origem[posicao:posicao + n]
+            self._ocupados += n
+            posicao += n
+        if total:
+            momentos = colunas[0]
+            if momentos[0] < self._ultimo_momento or (total > 1 and (np.diff(momentos) < 0).any()):
+                self._fora_de_ordem = True
+            self._ultimo_momento = max(self._ultimo_momento, float(momentos.max()))
+            if not self._inicio_fixo:
+                primeiro = float(momentos.min())
+                self.inicio = primeiro if self.inicio is None else min(self.inicio, primeiro)
+
+    def renomear(self, renomeados: dict):
+        """Passa o histórico de cada PE renomeado ({nome_anterior: nome_novo}) para o novo nome."""
+        with self._lock:
+            for anterior, novo in renomeados.items():
+                if anterior in self._codigos:
+                    self._codigos[novo] = self._codigos.pop(anterior)
+
+    def colunas(self) -> tuple:
+        """
+        Retorna os registros como arrays (momentos, códigos, valores, variações), em ordem de registro.
+
+        Os blocos cheios são concatenados num só na primeira consulta depois de
+        novas escritas; os arrays retornados não devem ser alterados. Se
+        chegaram registros fora de ordem de tempo, a série inteira é antes
+        reordenada pelo momento (de forma estável).
+        """
+        with self._lock:
+            if self._fora_de_ordem:
+                self._ordenar()
+            if len(self._blocos) > 1:
+                self._blocos = [tuple(np.concatenate(coluna) for coluna in zip(*self._blocos))]
+            partes = list(self._blocos)
+            if self._ocupados:
+                partes.append(tuple(coluna[:self._ocupados] for coluna in self._bloco))
+        if not partes:
+            return (np.zeros(0, np.float64), np.zeros(0, np.int32), np.zeros(0, np.int32), np.zeros(0, np.int32))
+        if len(partes) == 1:
+            return partes[0]
+        return tuple(np.concatenate(coluna) for coluna in zip(*partes))
+
+    def _ordenar(self):
+        partes = self._blocos + ([tuple(coluna[:self._ocupados] for coluna in self._bloco)] if self._ocupados else [])
+        if partes:
+            colunas = [np.concatenate(coluna) for coluna in zip(*partes)]
+            ordem = np.argsort(colunas[0], kind='stable')
+            ts, codigos, valores = (coluna[ordem] for coluna in colunas[:3])
+            # As variações gravadas valem para a ordem de chegada: refaz cada PE na ordem de tempo.
+            por_pe = np.argsort(codigos, kind='stable')
+            codigos_pe, valores_pe = codigos[por_pe], valores[por_pe]
+            primeiro = np.ones(len(por_pe), dtype=bool)
+            primeiro[1:] = codigos_pe[1:] != codigos_pe[:-1]
+            anteriores = np.empty_like(valores_pe)
+            anteriores[1:] = valores_pe[:-1]
+            anteriores[primeiro] = 0
+            deltas = np.empty_like(valores)
+            deltas[por_pe] = valores_pe - anteriores
+
+            ultimo = np.ones(len(por_pe), dtype=bool)
+            ultimo[:-1] = primeiro[1:]
+            self._ultimos[codigos_pe[ultimo]] = valores_pe[ultimo]
+            self._momentos[codigos_pe[ultimo]] = ts[por_pe][ultimo]
+
+            mantidos = deltas != 0
+            self._blocos = [(ts[mantidos], codigos[mantidos], valores[mantidos], deltas[mantidos])]
+        self._bloco, self._ocupados = None, 0
+        self._fora_de_ordem = False
+
+    def codigos(self, nomes) -> np.ndarray:
+        """Códigos dos PEs `nomes` na série (-1 para PEs sem registros)."""
+        with self._lock:
+            return np.fromiter((self._codigos.get(nome, -1) for nome in nomes), dtype=np.int64)
+
+    def _por_codigo(self, nomes, valores, vazio=np.nan) -> np.ndarray:
+        """Espalha `valores` (alinhados a `nomes`) num array indexado pelo código do PE."""
+        codigos = self.codigos(nomes)
+        conhecidos = codigos >= 0
+        resultado = np.full(len(self._ultimos), vazio, dtype=np.float64)
+        resultado[codigos[conhecidos]] = np.asarray(valores, dtype=np.float64)[conhecidos]
+        return resultado
+
+    def chegadas_por_minuto(self, nomes=None, janela_media_min: int = JANELA_MEDIA_MIN,
+                            max_pontos: int = MAX_PONTOS_PADRAO) -> pd.DataFrame:
+        """
+        Taxa de chegadas (variação líquida de participantes) por minuto.
+
+        Quando o exercício tem mais minutos do que `max_pontos`, os minutos são
+        agrupados em intervalos maiores e a taxa é a média por minuto de cada
+        intervalo.
+
+        Argumentos:
+        nomes: PEs considerados (padrão: todos os registrados).
+        janela_media_min: Largura (em minutos) da média móvel.
+        max_pontos: Número máximo de intervalos retornados.
+
+        Retorna:
+        Um DataFrame com o início de cada intervalo (minutos desde o início),
+        a taxa de chegadas por minuto e a média móvel da taxa.
+        """
+        ts, codigos, _, deltas = self.colunas()
+        if nomes is not None:
+            mascara = np.isin(codigos, self.codigos(nomes))
+            ts, deltas = ts[mascara], deltas[mascara]
+        if len(ts) == 0:
+            return pd.DataFrame(columns=[COL_MINUTO, COL_CHEGADAS_MINUTO, COL_MEDIA_MOVEL], dtype=np.float64)
+        minutos = (ts - self.inicio) / 60
+        largura = max(1, int(np.ceil((int(minutos.max()) + 1) / max_pontos)))
+        intervalos = np.maximum(minutos // largura, 0).astype(np.int64)
+        taxa = np.bincount(intervalos, weights=deltas) / largura
+
+        janela = max(1, round(janela_media_min / largura))
+        acumulada = np.concatenate([[0.0], np.cumsum(taxa)])
+        indices = np.arange(1, len(taxa) + 1)
+        media = (acumulada[indices] - acumulada[np.maximum(indices - janela, 0)]) / np.minimum(indices, janela)
+        return pd.DataFrame({
+            COL_MINUTO: np.arange(len(taxa), dtype=np.float64) * largura,
+            COL_CHEGADAS_MINUTO: taxa,
+            COL_MEDIA_MOVEL: media,
+        })
+
+    def efetividade_acumulada(self, esperadas: pd.Series, max_pontos: int = MAX_PONTOS_PADRAO) -> pd.DataFrame:
+        """
+        Total de participantes e efetividade geral ao longo do tempo.
+
+        Argumentos:
+        esperadas: Número atual de esperados, indexado pelo nome do PE; só os
+        PEs deste índice entram no total.
+        max_pontos: Número máximo de pontos retornados (o último valor de
+        cada intervalo de tempo é mantido).
+
+        Retorna:
+        Um DataFrame com o momento (minutos desde o início), o total de
+        participantes e a efetividade geral (%) em cada ponto.
+        """
+        ts, codigos, _, deltas = self.colunas()
+        mascara = np.isin(codigos, self.codigos(esperadas.index))
+        ts, deltas = ts[mascara], deltas[mascara]
+        if len(ts) == 0:
+            return pd.DataFrame(
+                columns=[COL_MINUTO, COL_PARTICIPANTES_ACUMULADOS, COL_EFETIVIDADE_ACUMULADA], dtype=np.float64
+            )
+        participantes = np.cumsum(deltas, dtype=np.int64)
+        if len(ts) > max_pontos:
+            limites = np.linspace(ts[0], ts[-1], max_pontos + 1)[1:]
+            pontos = np.unique(np.searchsorted(ts, limites, side='right') - 1)
+            ts, participantes = ts[pontos], participantes[pontos]
+        total_esperadas = float(esperadas.sum())
+        efetividade = participantes * 100 / total_esperadas if total_esperadas > 0 else np.zeros(len(ts))
+        return pd.DataFrame({
+            COL_MINUTO: (ts - self.inicio) / 60,
+            COL_PARTICIPANTES_ACUMULADOS: participantes,
+            COL_EFETIVIDADE_ACUMULADA: efetividade,
+        })
+
+    def tempos_ate_meta(self, esperadas: pd.Series, metas=METAS_PADRAO) -> pd.DataFrame:
+        """
+        Tempo até cada PE atingir as `metas` (% dos esperados).
+
+        Argumentos:
+        esperadas: Número atual de esperados, indexado pelo nome do PE.
+        metas: Percentuais de efetividade procurados.
+
+        Retorna:
+        Um DataFrame indexado como `esperadas`, com uma coluna por meta (ver
+        `coluna_meta`) com os minutos desde o início até o primeiro registro
+        que atingiu a meta; NaN se ainda não atingida ou sem esperados.
+        """
+        ts, codigos, valores, _ = self.colunas()
+        esperadas_codigo = self._por_codigo(esperadas.index, esperadas.to_numpy())
+        codigos_pe = self.codigos(esperadas.index)
+        tempos = {}
+        for meta in metas:
+            limiar = esperadas_codigo * meta / 100
+            limiar[~(limiar > 0)] = np.inf
+            atingiu = valores >= limiar[codigos]
+            # Os registros estão em ordem de tempo: o primeiro de cada código é o momento da meta.
+            codigos_meta, primeiros = np.unique(codigos[atingiu], return_index=True)
+            minutos = np.full(len(esperadas_codigo), np.nan)
+            minutos[codigos_meta] = (ts[atingiu][primeiros] - self.inicio) / 60
+            tempos[coluna_meta(meta)] = np.where(codigos_pe >= 0, minutos[codigos_pe], np.nan)
+        return pd.DataFrame(tempos, index=esperadas.index)
+
+    def tempos_gerais_ate_meta(self, esperadas: pd.Series, metas=METAS_PADRAO) -> dict:
+        """
+        Tempo até a efetividade geral atingir as `metas`.
+
+        Retorna:
+        Um dicionário {meta: minutos desde o início, ou None se ainda não atingida}.
+        """
+        acumulada = self.efetividade_acumulada(esperadas, max_pontos=len(self) or 1)
+        resultado = {}
+        for meta in metas:
+            atingiu = acumulada[COL_EFETIVIDADE_ACUMULADA].to_numpy() >= meta
+            resultado[meta] = float(acumulada[COL_MINUTO].to_numpy()[atingiu.argmax()]) if atingiu.any() else None
+        return resultado
+
+    def estimar_bytes(self) -> int:
+        with self._lock:
+            blocos = self._blocos + ([self._bloco] if self._bloco is not None else [])
+            return sum(coluna.nbytes for bloco in blocos for coluna in bloco)
@@ -0,0 +1,493 @@
+"""
+Cobertura da ZAS pelos Pontos de Encontro: distância de cada parte da ZAS até o PE mais próximo.
+
+A ZAS é rasterizada numa grade regular no CRS métrico do `IndiceZAS`
+(`pae_dashboard.relacao_zas`), e cada célula dentro dela recebe a distância,
+em linha reta, até o PE mais próximo, calculada com a grade de candidatos do
+`AtribuidorPEs` (`pae_dashboard.populacao`). Daí saem a porcentagem da área
+da ZAS em cada faixa de distância e a imagem da área descoberta (mais longe
+que um limite de qualquer PE), sobreposta ao mapa.
+
+A rasterização é feita por linhas de varredura, sem laços em Python sobre as
+células: cada aresta dos anéis é cruzada de uma vez com as linhas de centros
+de célula que atravessa; ordenados os cruzamentos por polígono, linha e x,
+cada par consecutivo delimita um trecho de células dentro do polígono (regra
+par-ímpar, que também trata os buracos).
+
+A grade depende só da ZAS e da resolução (`obter_grade`); as distâncias, dos
+PEs (`obter_cobertura`). As células ficam agrupadas em blocos, cada um com a
+maior distância de suas células: quando PEs são movidos, incluídos ou
+removidos, `Cobertura.atualizada` só recalcula as células cujo PE mais
+próximo mudou de lugar ou saiu e as dos blocos de que um PE novo pode ter
+ficado mais perto; as demais mantêm o resultado anterior.
+
+Distâncias acima de `distancia_maxima_m` não são calculadas: as células longe
+de todos os PEs ficam com distância infinita (e contam como descobertas), sem
+que os PEs distantes entrem nas listas de candidatos.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+RESOLUCAO_PADRAO_M = 25.0
+FAIXAS_DISTANCIA_M = (250, 500, 1_000, 2_000)
+# Distância máxima calculada; além dela a célula é descoberta (distância infinita).
+DISTANCIA_MAXIMA_M = 5_000
+# Limite de células do retângulo que envolve a ZAS; acima dele a resolução é aumentada.
+MAX_CELULAS_GRADE = 20_000_000
+# Lado dos blocos de células, em células.
+CELULAS_POR_BLOCO = 64
+# Acima desta fração de PEs alterados, a cobertura é recalculada do zero.
+FRACAO_MAX_PES_INCREMENTAL = 0.25
+
+# Imagem da área descoberta sobreposta ao mapa.
+MAX_LADO_IMAGEM_PX = 1_024
+COR_DESCOBERTA = (228, 26, 28, 150)
+
+COL_FAIXA = 'Distância ao PE mais próximo'
+COL_AREA_KM2 = 'Área (km²)'
+COL_PERCENTUAL = '% da ZAS'
+COL_PERCENTUAL_ACUMULADO = '% acumulado'
+
+
+def rasterizar(poligonos, resolucao: float) -> tuple:
+    """
+    Encontra as células de uma grade regular cujos centros estão dentro dos polígonos.
+
+    Argumentos:
+    poligonos: Array de polígonos num CRS métrico.
+    resolucao: Lado das células, nas unidades do CRS.
+
+    Retorna:
+    Uma tupla (x0, y0, nx, ny, celulas): o canto inferior esquerdo e as
+    dimensões da grade, e os índices (linha * nx + coluna, em ordem crescente)
+    das células dentro dos polígonos.
+    """
+    import shapely
+
+    x0, y0, x1, y1 = shapely.total_bounds(poligonos)
+    nx = max(int(np.ceil((x1 - x0) / resolucao)), 1)
+    ny = max(int(np.ceil((y1 - y0) / resolucao)), 1)
+
+    aneis, poligono_do_anel = shapely.get_rings(poligonos, return_index=True)
+    coords, anel = shapely.get_coordinates(aneis, return_index=True)
+    mesmo_anel = anel[:-1] == anel[1:]
+    xa, ya = coords[:-1][mesmo_anel].T
+    xb, yb = coords[1:][mesmo_anel].T
+    poligono = poligono_do_anel[anel[:-1][mesmo_anel]]
+
+    # Linhas de centros (y0 + (j + 0.5) * resolucao) no intervalo [min(ya, yb), max(ya, yb)) de cada aresta;
+    # o intervalo semiaberto conta uma única vez os vértices e ignora as arestas horizontais.
+    primeira = np.ceil((np.minimum(ya, yb) - y0) / resolucao - 0.5).astype(np.int64)
+    cruzadas = np.ceil((np.maximum(ya, yb) - y0) / resolucao - 0.5).astype(np.int64) - primeira
+    aresta = np.repeat(np.arange(len(xa)), cruzadas)
+    linha = np.repeat(primeira - (np.cumsum(cruzadas) - cruzadas), cruzadas) + np.arange(len(aresta))
+    t = (y0 + (linha + 0.5) * resolucao - ya[aresta]) / (yb[aresta] - ya[aresta])
+    x = xa[aresta] + t * (xb[aresta] - xa[aresta])
+
+    # Em cada polígono e linha há um número par de cruzamentos: (1º, 2º), (3º, 4º)... delimitam os trechos dentro.
+    ordem = np.lexsort((x, linha, poligono[aresta]))
+    linha, x = linha[ordem][0::2], x[ordem]
+    inicio = np.clip(np.ceil((x[0::2] - x0) / resolucao - 0.5).astype(np.int64), 0, nx)
+    fim = np.clip(np.ceil((x[1::2] - x0) / resolucao - 0.5).astype(np.int64), 0, nx)
+    tamanho = np.maximum(fim - inicio, 0)
+    primeira_celula = linha * nx + inicio
+    celulas = np.repeat(primeira_celula - (np.cumsum(tamanho) - tamanho), tamanho) + np.arange(tamanho.sum())
+
+    # Polígonos que se sobrepõem marcam a mesma célula mais de uma vez.
+    dentro = np.zeros(nx * ny, dtype=bool)
+    dentro[celulas] = True
+    return x0, y0, nx, ny, np.flatnonzero(dentro)
+
+
+class GradeZAS:
+    """
+    Células da ZAS numa grade regular, agrupadas em blocos de `CELULAS_POR_BLOCO` x `CELULAS_POR_BLOCO`.
+
+    Atributos:
+    crs_metrico: CRS métrico da grade.
+    resolucao: Lado das células, em metros.
+    x0, y0, nx, ny: Canto inferior esquerdo e dimensões da grade.
+    celulas: Índices (linha * nx + coluna) das células dentro da ZAS, em ordem de bloco.
+    blocos: Blocos com alguma célula, em ordem crescente.
+    inicios: Posição, em `celulas`, da primeira célula de cada bloco (mais o total no fim).
+    """
+
+    def __init__(self, crs_metrico, resolucao: float, x0: float, y0: float, nx: int, ny: int, celulas):
+        self.crs_metrico = crs_metrico
+        self.resolucao = resolucao
+        self.x0, self.y0, self.nx, self.ny = x0, y0, nx, ny
+        self.blocos_x = -(-nx // CELULAS_POR_BLOCO)
+        bloco = self._bloco(celulas)
+        ordem = np.argsort(bloco, kind='stable')
+        self.celulas = celulas[ordem].astype(np.int32 if nx * ny < 2 ** 31 else np.int64)
+        self.blocos, self.inicios = np.unique(bloco[ordem], return_index=True)
+        self.inicios = np.append(self.inicios, len(self.celulas))
+
+    def __len__(self):
+        return len(self.celulas)
+
+    def _bloco(self, celulas):
+        linha, coluna = np.divmod(celulas, self.nx)
+        return (linha // CELULAS_POR_BLOCO) * self.blocos_x + coluna // CELULAS_POR_BLOCO
+
+    @property
+    def area_celula_km2(self) -> float:
+        return self.resolucao * self.resolucao / 1e6
+
+    @property
+    def extensao(self) -> tuple:
+        return (self.x0, self.y0, self.x0 + self.nx * self.resolucao, self.y0 + self.ny * self.resolucao)
+
+    def centros(self, selecao=None) -> tuple:
+        """Coordenadas (x, y) dos centros das células (todas, ou as posições `selecao` de `celulas`)."""
+        celulas = self.celulas if selecao is None else self.celulas[selecao]
+        linha, coluna = np.divmod(celulas, self.nx)
+        return self.x0 + (coluna + 0.5) * self.resolucao, self.y0 + (linha + 0.5) * self.resolucao
+
+    def blocos_proximos(self, x, y, distancia_bloco) -> np.ndarray:
+        """
+        Blocos com alguma célula mais perto de um dos pontos (x, y) do que `distancia_bloco` do bloco.
+
+        Retorna:
+        Um array booleano, alinhado com `blocos`.
+        """
+        lado = CELULAS_POR_BLOCO * self.resolucao
+        by, bx = np.divmod(self.blocos, self.blocos_x)
+        # Retângulo dos centros de célula de cada bloco.
+        xmin = self.x0 + bx * lado + self.resolucao / 2
+        ymin = self.y0 + by * lado + self.resolucao / 2
+        xmax, ymax = xmin + lado - self.resolucao, ymin + lado - self.resolucao
+        proximos = np.zeros(len(self.blocos), dtype=bool)
+        for px, py in zip(np.atleast_1d(x), np.atleast_1d(y)):
+            dx = np.maximum(np.maximum(xmin - px, px - xmax), 0)
+            dy = np.maximum(np.maximum(ymin - py, py - ymax), 0)
+            proximos |= np.hypot(dx, dy) < distancia_bloco
+        return proximos
+
+    def estimar_bytes(self) -> int:
+        return int(self.celulas.nbytes + self.blocos.nbytes + self.inicios.nbytes)
+
+
+def construir_grade(indice, resolucao: float = RESOLUCAO_PADRAO_M) -> GradeZAS:
+    """
+    Rasteriza as partes poligonais de um `IndiceZAS`.
+
+    Argumentos:
+    indice: O IndiceZAS da ZAS (ver `relacao_zas.obter_indice`).
+    resolucao: Lado pedido para as células, em metros; é aumentado se o
+    retângulo da ZAS passar de `MAX_CELULAS_GRADE` células.
+
+    Levanta:
+    ValueError se a ZAS não tem polígonos.
+    """
+    import shapely
+
+    if not len(indice.poligonos):
+        raise ValueError("a ZAS não tem polígonos para calcular a cobertura")
+    x0, y0, x1, y1 = shapely.total_bounds(indice.poligonos)
+    resolucao = max(float(resolucao), float(np.sqrt((x1 - x0) * (y1 - y0) / MAX_CELULAS_GRADE)))
+    return GradeZAS(indice.crs_metrico, resolucao, *rasterizar(indice.poligonos, resolucao))
+
+
+def obter_grade(indice, chave_conteudo, resolucao: float = RESOLUCAO_PADRAO_M, cache=None) -> GradeZAS:
+    """
+    Versão de `construir_grade` com cache pelo identificador da ZAS e pela resolução.
+
+    Argumentos:
+    chave_conteudo: Identificador do conteúdo da ZAS (o mesmo de `obter_indice`).
+    cache: Um GeoCache opcional.
+    """
+    if cache is None:
+        return construir_grade(indice, resolucao)
+    key = ("cobertura_grade", chave_conteudo, float(resolucao), MAX_CELULAS_GRADE, CELULAS_POR_BLOCO)
+    return cache.get_or_load(key, lambda: construir_grade(indice, resolucao))
+
+
+class Cobertura:
+    """
+    Distância de cada célula de uma `GradeZAS` até o PE mais próximo.
+
+    Atributos:
+    grade: A GradeZAS.
+    distancia_maxima_m: Distância máxima calculada (ver `DISTANCIA_MAXIMA_M`).
+    nomes: Nomes dos PEs usados no cálculo.
+    x_pes, y_pes: Coordenadas dos PEs no CRS da grade.
+    distancias: Distância (m) de cada célula da grade ao PE mais próximo (inf além de `distancia_maxima_m`).
+    mais_proximo: Posição, em `nomes`, do PE mais próximo de cada célula (-1 além de `distancia_maxima_m`).
+    recalculadas: Células calculadas na construção (todas, ou só as afetadas em `atualizada`).
+    """
+
+    def __init__(self, grade: GradeZAS, distancia_maxima_m: float, nomes, x_pes, y_pes, distancias, mais_proximo,
+                 recalculadas: int = None):
+        self.grade = grade
+        self.distancia_maxima_m = distancia_maxima_m
+        self.nomes = np.asarray(nomes, dtype=object)
+        self.x_pes = x_pes
+        self.y_pes = y_pes
+        self.distancias = distancias
+        self.mais_proximo = mais_proximo
+        self.recalculadas = len(grade) if recalculadas is None else recalculadas
+        self.distancia_bloco = (
+            np.maximum.reduceat(distancias, grade.inicios[:-1]) if len(grade) else np.zeros(0, dtype=np.float32)
+        )
+        self._imagens = {}
+
+    def faixas(self, limites=FAIXAS_DISTANCIA_M) -> pd.DataFrame:
+        """
+        Área da ZAS em cada faixa de distância até o PE mais próximo.
+
+        Argumentos:
+        limites: Limites crescentes das faixas, em metros (até `distancia_maxima_m`).
+
+        Retorna:
+        Um DataFrame com uma linha por faixa ("até 250 m", "250–500 m"... e
+        "acima de 2000 m") e as colunas `COL_FAIXA`, `COL_AREA_KM2`,
+        `COL_PERCENTUAL` e `COL_PERCENTUAL_ACUMULADO`.
+        """
+        limites = [float(limite) for limite in limites]
+        contagens = np.bincount(np.searchsorted(limites, self.distancias, side='left'), minlength=len(limites) + 1)
+        total = max(len(self.distancias), 1)
+        rotulos = (
+            [f"até {limites[0]:,.0f} m"]
+            + [f"{a:,.0f}–{b:,.0f} m" for a, b in zip(limites[:-1], limites[1:])]
+            + [f"acima de {limites[-1]:,.0f} m"]
+        )
+        return pd.DataFrame({
+            COL_FAIXA: rotulos,
+            COL_AREA_KM2: contagens * self.grade.area_celula_km2,
+            COL_PERCENTUAL: contagens / total * 100,
+            COL_PERCENTUAL_ACUMULADO: np.cumsum(contagens) / total * 100,
+        })
+
+    def area_descoberta_km2(self, limite_m: float) -> float:
+        """Área (km²) da ZAS a mais de `limite_m` metros de qualquer PE."""
+        return int(np.count_nonzero(self.distancias > limite_m)) * self.grade.area_celula_km2
+
+    def imagem_descoberta(self, limite_m: float, cor: tuple = COR_DESCOBERTA) -> tuple:
+        """
+        Imagem da área da ZAS a mais de `limite_m` metros de qualquer PE, para sobrepor ao mapa.
+
+        A imagem é reamostrada da grade para Web Mercator (a projeção do mapa),
+        com no máximo `MAX_LADO_IMAGEM_PX` pixels de lado e pixels não menores
+        que as células. O resultado fica guardado por `limite_m` e `cor`.
+
+        Argumentos:
+        limite_m: Distância aceitável até um PE, em metros.
+        cor: Cor (R, G, B, A) dos pixels descobertos; os demais são transparentes.
+
+        Retorna:
+        Uma tupla (png, limites): a imagem PNG e os seus limites
+        ((sul, oeste), (norte, leste)) em graus, ou (None, None) se tudo está coberto.
+        """
+        chave = (float(limite_m), tuple(cor))
+        if chave not in self._imagens:
+            self._imagens[chave] = self._montar_imagem_descoberta(*chave)
+        return self._imagens[chave]
+
+    def _montar_imagem_descoberta(self, limite_m: float, cor: tuple) -> tuple:
+        from pyproj import Transformer
+
+        grade = self.grade
+        descobertas = self.distancias > limite_m
+        if not descobertas.any():
+            return None, None
+        descoberta = np.zeros(grade.nx * grade.ny, dtype=bool)
+        descoberta[grade.celulas[descobertas]] = True
+
+        oeste, sul, leste, norte = Transformer.from_crs(grade.crs_metrico, "EPSG:4326", always_xy=True).transform_bounds(
+            *grade.extensao
+        )
+        mercator = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
+        (xmin, xmax), (ymin, ymax) = mercator.transform([oeste, leste], [sul, norte])
+        # Em Web Mercator, a célula ocupa resolucao / cos(latitude) metros.
+        pixel = max(
+            grade.resolucao / np.cos(np.radians((sul + norte) / 2)),
+            max(xmax - xmin, ymax - ymin) / MAX_LADO_IMAGEM_PX,
+        )
+        largura = max(int(np.ceil((xmax - xmin) / pixel)), 1)
+        altura = max(int(np.ceil((ymax - ymin) / pixel)), 1)
+        # Centros dos pixels, de cima (norte) para baixo, levados ao CRS da grade.
+        px, py = np.meshgrid(xmin + (np.arange(largura) + 0.5) * pixel, ymax - (np.arange(altura) + 0.5) * pixel)
+        x, y = Transformer.from_crs("EPSG:3857", grade.crs_metrico, always_xy=True).transform(px.ravel(), py.ravel())
+        coluna = np.floor((x - grade.x0) / grade.resolucao)
+        linha = np.floor((y - grade.y0) / grade.resolucao)
+        na_grade = (coluna >= 0) & (coluna < grade.nx) & (linha >= 0) & (linha < grade.ny)
+        pixels = np.zeros(largura * altura, dtype=bool)
+        pixels[na_grade] = descoberta[(linha[na_grade] * grade.nx + coluna[na_grade]).astype(np.int64)]
+
+        rgba = np.zeros((largura * altura, 4), dtype=np.uint8)
+        rgba[pixels] = cor
+        norte_imagem, oeste_imagem = mercator.transform(xmin, ymax, direction='INVERSE')[::-1]
+        sul_imagem, leste_imagem = mercator.transform(xmin + largura * pixel, ymax - altura * pixel, direction='INVERSE')[::-1]
+        return _png(rgba.reshape(altura, largura, 4)), ((sul_imagem, oeste_imagem), (norte_imagem, leste_imagem))
+
+    def atualizada(self, df_pe: pd.DataFrame) -> "Cobertura":
+        """
+        Retorna a cobertura para um novo conjunto de PEs, recalculando só as células afetadas.
+
+        Uma célula precisa ser recalculada se o seu PE mais próximo foi
+        movido ou removido, ou se está num bloco do qual um PE movido ou
+        incluído ficou mais perto que a maior distância do bloco. Com mais de
+        `FRACAO_MAX_PES_INCREMENTAL` dos PEs alterados, tudo é recalculado.
+        A cobertura atual não é alterada.
+
+        Argumentos:
+        df_pe: DataFrame de PEs indexado por 'Nome', com 'Latitude' e 'Longitude'.
+        """
+        if df_pe.empty or not len(self.nomes):
+            return calcular_cobertura(self.grade, df_pe, self.distancia_maxima_m)
+        x, y = _xy_pes(self.grade, df_pe)
+        posicao_anterior = pd.Index(self.nomes).get_indexer(df_pe.index)
+        mantidos = posicao_anterior >= 0
+        mantidos[mantidos] = (self.x_pes[posicao_anterior[mantidos]] == x[mantidos]) & \
+            (self.y_pes[posicao_anterior[mantidos]] == y[mantidos])
+        novos = np.flatnonzero(~mantidos)
+        alterados = len(novos) + len(self.nomes) - int(mantidos.sum())
+        if alterados > FRACAO_MAX_PES_INCREMENTAL * max(len(self.nomes), len(df_pe)):
+            return calcular_cobertura(self.grade, df_pe, self.distancia_maxima_m)
+
+        nova_posicao = np.full(len(self.nomes), -1, dtype=np.int64)
+        nova_posicao[posicao_anterior[mantidos]] = np.flatnonzero(mantidos)
+        # Células sem PE a até a distância máxima continuam sem PE, a menos que um PE novo chegue perto.
+        com_pe = self.mais_proximo >= 0
+        mais_proximo = np.where(com_pe, nova_posicao[self.mais_proximo], -1).astype(np.int32)
+        distancias = self.distancias.copy()
+        recalcular = com_pe & (mais_proximo < 0)
+        if len(novos):
+            proximos = self.grade.blocos_proximos(
+                x[novos], y[novos], np.minimum(self.distancia_bloco, self.distancia_maxima_m)
+            )
+            recalcular |= np.repeat(proximos, np.diff(self.grade.inicios))
+        selecao = np.flatnonzero(recalcular)
+        if len(selecao):
+            mais_proximo[selecao], distancias[selecao] = _mais_proximos(
+                self.grade, df_pe, x, y, self.distancia_maxima_m, selecao
+            )
+        return Cobertura(
+            self.grade, self.distancia_maxima_m, df_pe.index.to_numpy(), x, y, distancias, mais_proximo, len(selecao)
+        )
+
+    def estimar_bytes(self) -> int:
+        # A grade é contada à parte, na sua própria entrada do cache.
+        return int(self.distancias.nbytes + self.mais_proximo.nbytes + self.distancia_bloco.nbytes) + len(self.nomes) * 100
+
+
+def _png(rgba) -> bytes:
+    """Codifica uma imagem RGBA (altura x largura x 4, uint8) em PNG."""
+    import struct
+    import zlib
+
+    def bloco(tipo: bytes, dados: bytes) -> bytes:
+        return struct.pack('>I', len(dados)) + tipo + dados + struct.pack('>I', zlib.crc32(tipo + dados))
+
+    altura, largura, _ = rgba.shape
+    # Cada linha começa com o byte do filtro (0 = nenhum).
+    linhas = np.concatenate([np.zeros((altura, 1), dtype=np.uint8), rgba.reshape(altura, -1)], axis=1)
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + bloco(b'IHDR', struct.pack('>IIBBBBB', largura, altura, 8, 6, 0, 0, 0))
+        + bloco(b'IDAT', zlib.compress(linhas.tobytes(), 6))
+        + bloco(b'IEND', b'')
+    )
+
+
+def _xy_pes(grade: GradeZAS, df_pe: pd.DataFrame) -> tuple:
+    """Coordenadas dos PEs no CRS da grade."""
+    from pyproj import Transformer
+
+    x, y = Transformer.from_crs("EPSG:4326", grade.crs_metrico, always_xy=True).transform(
+        df_pe['Longitude'].to_numpy(dtype=float), df_pe['Latitude'].to_numpy(dtype=float)
+    )
+    return np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+
+
+def _mais_proximos(grade: GradeZAS, df_pe: pd.DataFrame, x_pes, y_pes, distancia_maxima_m: float,
+                   selecao=None) -> tuple:
+    """
+    PE mais próximo de cada célula (todas, ou as posições `selecao`), até `distancia_maxima_m`.
+
+    Usa a grade de candidatos do `AtribuidorPEs`; como montá-la custa uma
+    consulta ao STRtree dos PEs por célula da grade, quando há menos células
+    da ZAS que isso elas são consultadas direto no STRtree.
+
+    Retorna:
+    Uma tupla (indices, distancias): a posição do PE em `df_pe` (int32, -1 sem
+    PE a até `distancia_maxima_m`) e a distância (float32, inf sem PE).
+    """
+    import shapely
+
+    from pae_dashboard.populacao import CELULAS_POR_PE, MIN_CELULAS_GRADE, AtribuidorPEs
+
+    x, y = grade.centros(selecao)
+    if len(x) < max(CELULAS_POR_PE * len(df_pe), MIN_CELULAS_GRADE):
+        indices = np.full(len(x), -1, dtype=np.int32)
+        distancias = np.full(len(x), np.inf, dtype=np.float32)
+        (celulas, pes), distancia = shapely.STRtree(shapely.points(x_pes, y_pes)).query_nearest(
+            shapely.points(x, y), max_distance=distancia_maxima_m, return_distance=True, all_matches=False
+        )
+        indices[celulas] = pes
+        distancias[celulas] = distancia
+        return indices, distancias
+
+    atribuidor = AtribuidorPEs(
+        df_pe['Latitude'].to_numpy(), df_pe['Longitude'].to_numpy(), crs_metrico=grade.crs_metrico,
+        extensao=grade.extensao, distancia_maxima_m=distancia_maxima_m
+    )
+    indices, distancias = atribuidor.atribuir_xy(x, y)
+    distancias[indices < 0] = np.inf
+    return indices.astype(np.int32), distancias.astype(np.float32)
+
+
+def calcular_cobertura(grade: GradeZAS, df_pe: pd.DataFrame, distancia_maxima_m: float = DISTANCIA_MAXIMA_M) -> Cobertura:
+    """
+    Calcula a distância de todas as células da `grade` até o PE mais próximo.
+
+    Argumentos:
+    grade: A GradeZAS (ver `obter_grade`).
+    df_pe: DataFrame de PEs indexado por 'Nome', com 'Latitude' e 'Longitude'.
+    distancia_maxima_m: Distância máxima calculada.
+
+    Retorna:
+    Uma Cobertura; sem PEs, todas as distâncias são infinitas.
+    """
+    if df_pe.empty:
+        vazio = np.zeros(0)
+        return Cobertura(grade, distancia_maxima_m, [], vazio, vazio, np.full(len(grade), np.inf, dtype=np.float32),
+                         np.full(len(grade), -1, dtype=np.int32))
+    x, y = _xy_pes(grade, df_pe)
+    indices, distancias = _mais_proximos(grade, df_pe, x, y, distancia_maxima_m)
+    return Cobertura(grade, distancia_maxima_m, df_pe.index.to_numpy(), x, y, distancias, indices)
+
+
+def obter_cobertura(indice, chave_conteudo, df_pe: pd.DataFrame, resolucao: float = RESOLUCAO_PADRAO_M,
+                    distancia_maxima_m: float = DISTANCIA_MAXIMA_M, cache=None, anterior: Cobertura = None) -> Cobertura:
+    """
+    Retorna a cobertura da ZAS pelos PEs, com cache pela ZAS, pela resolução e pelos PEs.
+
+    Argumentos:
+    indice: O IndiceZAS da ZAS.
+    chave_conteudo: Identificador do conteúdo da ZAS (o mesmo de `obter_indice`).
+    df_pe: DataFrame de PEs indexado por 'Nome', com 'Latitude' e 'Longitude'.
+    resolucao: Lado pedido para as células, em metros.
+    distancia_maxima_m: Distância máxima calculada.
+    cache: Um GeoCache opcional.
+    anterior: A cobertura calculada antes, para a mesma ZAS, resolução e distância máxima, com
+    outros PEs; se informada, só as células afetadas pela mudança dos PEs são
+    recalculadas (ver `Cobertura.atualizada`).
+    """
+    grade = obter_grade(indice, chave_conteudo, resolucao, cache)
+
+    def carregar():
+        if anterior is not None and anterior.grade is grade and anterior.distancia_maxima_m == distancia_maxima_m:
+            return anterior.atualizada(df_pe)
+        return calcular_cobertura(grade, df_pe, distancia_maxima_m)
+
+    if cache is None:
+        return carregar()
+    from pae_dashboard.cache import hash_bytes
+
+    hash_pes = hash_bytes(pd.util.hash_pandas_object(df_pe[['Latitude', 'Longitude']], index=True).to_numpy().tobytes())
+    key = ("cobertura", chave_conteudo, float(resolucao), float(distancia_maxima_m), hash_pes)
+    return cache.get_or_load(key, carregar)
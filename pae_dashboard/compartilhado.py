@@ -0,0 +1,254 @@
+"""
+Estado de exercício compartilhado por todas as sessões do servidor.
+
+Em vez de cada sessão do navegador manter sua própria cópia dos PEs, das
+contagens e da ZAS, um único `ExercicioCompartilhado` por exercício guarda
+esses dados no processo. As sessões são contadas (refcount) pelo
+`RegistroExercicios` e acompanham as versões de cada fonte de dados do
+exercício (`ExercicioCompartilhado.versoes`) para só reexecutar o dashboard
+quando algo realmente mudou. Uma sessão pode
+acompanhar vários exercícios ao mesmo tempo (`RegistroExercicios.obter_grupo`),
+um por local de um exercício com vários locais (`pae_dashboard.locais`).
+
+Os lotes do ingestor de chegadas já aplicados a um exercício ficam marcados
+por cursores gravados no armazém junto com as contagens (a versão do
+ingestor e a posição lida de cada arquivo de eventos), de modo que nem um
+exercício descartado da memória e reaberto nem um reinício do servidor, que
+relê o arquivo do início, aplicam os mesmos eventos de novo.
+
+Cada exercício também mantém a série temporal dos participantes por PE
+(`pae_dashboard.chegadas`), alimentada por toda alteração de contagem e,
+quando há armazém, reconstruída a partir dos eventos já gravados.
+"""
+
+import threading
+import time
+
+from pae_dashboard.chegadas import SerieChegadas
+from pae_dashboard.contagens import (
+    PADROES, DiferencaPEs, aplicar_alteracoes, aplicar_diff, carregar_do_armazem, chave_contagem, diferenca_pes,
+    obter_contagens, reconciliar_contagens
+)
+from pae_dashboard.ingestao import PREFIXO_CURSOR_VERSAO
+
+
+TTL_SESSAO_S = 300
+
+
+class ExercicioCompartilhado:
+    """
+    PEs, ZAS e contagens de um exercício, com um número de versão.
+
+    As contagens ficam num dicionário com as mesmas chaves usadas pelo módulo
+    `contagens` (`participantes_<PE>`, `esperadas_<PE>`, `contagens_df`), de
+    modo que as mesmas funções de diff servem aqui. Toda leitura e escrita é
+    serializada por um lock.
+
+    Argumentos:
+    exercicio: Identificador do exercício.
+    armazem: Um ArmazemContagens opcional, de onde as contagens são carregadas
+    uma única vez e onde cada diff é gravado.
+
+    Atributos:
+    chegadas: A SerieChegadas do exercício.
+    """
+
+    def __init__(self, exercicio: str, armazem=None):
+        self.exercicio = exercicio
+        self.armazem = armazem
+        self.versao = 0
+        self.versao_pes = 0
+        self.versao_zas = 0
+        self.versao_contagens = 0
+        self.pes_desconhecidos = set()
+        self._estado = {}
+        self._pes = None
+        self._zas = None
+        self._cursores_ingestao = {}
+        self._lock = threading.RLock()
+        self.chegadas = SerieChegadas()
+        if armazem is not None:
+            carregar_do_armazem(self._estado, armazem)
+            self._cursores_ingestao = armazem.cursores_ingestao()
+            historico = armazem.historico('participantes')
+            if historico:
+                nomes, valores, momentos = zip(*historico)
+                self.chegadas.registrar(nomes, valores, momentos)
+
+    def _registrar_chegadas(self, alterados):
+        """Acrescenta à série de chegadas o número atual de participantes dos PEs `alterados`."""
+        if alterados:
+            participantes = [
+                self._estado.get(chave_contagem('participantes', nome), PADROES['participantes']) for nome in alterados
+            ]
+            self.chegadas.registrar(alterados, participantes)
+
+    def _nova_versao(self):
+        self.versao += 1
+
+    def versoes(self) -> dict:
+        """Retorna a versão de cada fonte de dados do exercício ('pes', 'zas', 'contagens')."""
+        with self._lock:
+            return {'pes': self.versao_pes, 'zas': self.versao_zas, 'contagens': self.versao_contagens}
+
+    # --- PEs e ZAS ---
+
+    def definir_pes(self, df_pe_initial) -> DiferencaPEs:
+        """
+        Define o conjunto de PEs do exercício (DataFrame com 'Nome', 'Latitude', 'Longitude').
+
+        Só o delta em relação ao conjunto anterior é reconciliado nas contagens
+        (ver `contagens.reconciliar_contagens`); reenviar os mesmos PEs não gera
+        nova versão.
+
+        Retorna:
+        A DiferencaPEs em relação ao conjunto anterior.
+        """
+        with self._lock:
+            diferenca = diferenca_pes(self._pes, df_pe_initial)
+            if self._pes is not None and diferenca.vazia():
+                return diferenca
+            reconciliar_contagens(self._estado, diferenca, df_pe_initial['Nome'], self.armazem)
+            self.chegadas.renomear(diferenca.renomeados)
+            self._pes = df_pe_initial.copy()
+            self.versao_pes += 1
+            if diferenca.renomeados or diferenca.removidos:
+                self.versao_contagens += 1
+            self._nova_versao()
+            return diferenca
+
+    def pes(self):
+        """Retorna o DataFrame de PEs do exercício (compartilhado; não alterar no lugar) ou None."""
+        return self._pes
+
+    def definir_zas(self, zas_hash: str, gdf_zas):
+        """Define a ZAS do exercício; reenviar o mesmo arquivo não gera nova versão."""
+        with self._lock:
+            if self._zas is not None and self._zas[0] == zas_hash:
+                return
+            self._zas = (zas_hash, gdf_zas)
+            self.versao_zas += 1
+            self._nova_versao()
+
+    def zas(self):
+        """Retorna a tupla (hash, GeoDataFrame) da ZAS do exercício, ou None."""
+        return self._zas
+
+    # --- Contagens ---
+
+    def contagens(self, nomes):
+        """Retorna uma cópia do DataFrame de contagens dos PEs `nomes`."""
+        with self._lock:
+            return obter_contagens(self._estado, nomes).copy()
+
+    def aplicar_diff(self, diff: dict) -> list:
+        """Aplica (e grava no armazém) um diff de contagens; ver `contagens.aplicar_diff`."""
+        with self._lock:
+            alterados = aplicar_diff(self._estado, diff, self.armazem)
+            if alterados:
+                self._registrar_chegadas(alterados)
+                self.versao_contagens += 1
+                self._nova_versao()
+            return alterados
+
+    def sincronizar_ingestao(self, ingestor, nomes) -> list:
+        """
+        Aplica os lotes do `ingestor` que este exercício ainda não recebeu.
+
+        Cada lote é aplicado uma única vez por exercício, por mais sessões que
+        estejam acompanhando o mesmo ingestor. A última versão aplicada e a
+        posição lida de cada arquivo são gravadas no armazém com as contagens:
+        se o exercício for descartado da memória e reaberto, ou se o servidor
+        reiniciar e o arquivo for relido, as contagens carregadas já incluem
+        esses eventos e só os posteriores são aplicados.
+
+        Retorna:
+        A lista de PEs alterados.
+        """
+        with self._lock:
+            chave = PREFIXO_CURSOR_VERSAO + ingestor.identificador
+            versao = self._cursores_ingestao.get(chave, 0)
+            versao_ingestor, alteracoes, posicoes = ingestor.alteracoes_desde(versao, self._cursores_ingestao)
+            if versao_ingestor == versao:
+                return []
+            cursores = {chave: versao_ingestor, **posicoes}
+            alterados, desconhecidos, registros = aplicar_alteracoes(
+                self._estado, alteracoes, nomes, self.armazem, cursores
+            )
+            # As versões de um ingestor anterior (de antes de um reinício) não servem mais; o armazém
+            # também as descarta ao gravar a nova.
+            self._cursores_ingestao = {
+                chave_cursor: posicao for chave_cursor, posicao in self._cursores_ingestao.items()
+                if not chave_cursor.startswith(PREFIXO_CURSOR_VERSAO)
+            }
+            self._cursores_ingestao.update(cursores)
+            self.pes_desconhecidos.update(desconhecidos)
+            chegadas = [(momento, nome, valor) for momento, nome, campo, valor in registros if campo == 'participantes']
+            if chegadas:
+                # Cada chegada entra na série no momento do evento, não no da sincronização.
+                momentos, nomes_chegadas, valores = zip(*chegadas)
+                self.chegadas.registrar(nomes_chegadas, valores, momentos)
+            if alterados:
+                self.versao_contagens += 1
+                self._nova_versao()
+            return alterados
+
+
+class RegistroExercicios:
+    """
+    Registro dos exercícios carregados no processo, com contagem de sessões.
+
+    O Streamlit não avisa quando o navegador fecha, então as sessões não são
+    liberadas explicitamente: uma sessão que não é vista há mais de `ttl_s`
+    segundos é considerada encerrada, e os exercícios sem nenhuma sessão são
+    descartados da memória na próxima varredura (feita a cada `obter_grupo`).
+    Uma sessão que passa a acompanhar outros exercícios deixa de contar para
+    os anteriores na mesma chamada.
+
+    Argumentos:
+    fabrica_armazem: Função `exercicio -> ArmazemContagens` (ou None) usada ao
+    carregar um exercício pela primeira vez.
+    """
+
+    def __init__(self, fabrica_armazem=None, ttl_s: float = TTL_SESSAO_S):
+        self.fabrica_armazem = fabrica_armazem
+        self.ttl_s = ttl_s
+        self._exercicios = {}
+        self._sessoes = {}
+        self._lock = threading.Lock()
+
+    def obter(self, exercicio: str, sessao: str) -> ExercicioCompartilhado:
+        """Retorna o exercício (carregando-o se preciso) e registra/renova a `sessao` nele."""
+        return self.obter_grupo([exercicio], sessao)[exercicio]
+
+    def obter_grupo(self, exercicios: list, sessao: str) -> dict:
+        """
+        Retorna vários exercícios acompanhados pela mesma sessão (os locais de um exercício com vários locais).
+
+        A `sessao` passa a contar para todos os `exercicios`, e só para eles.
+
+        Retorna:
+        Um dicionário {exercicio: ExercicioCompartilhado}, na ordem de `exercicios`.
+        """
+        with self._lock:
+            agora = time.monotonic()
+            self._sessoes[sessao] = (tuple(exercicios), agora)
+            self._varrer(agora)
+            for exercicio in exercicios:
+                if exercicio not in self._exercicios:
+                    armazem = self.fabrica_armazem(exercicio) if self.fabrica_armazem else None
+                    self._exercicios[exercicio] = ExercicioCompartilhado(exercicio, armazem)
+            return {exercicio: self._exercicios[exercicio] for exercicio in exercicios}
+
+    def refcount(self, exercicio: str) -> int:
+        with self._lock:
+            return sum(1 for exercicios, _ in self._sessoes.values() if exercicio in exercicios)
+
+    def _varrer(self, agora: float):
+        expiradas = [s for s, (_, visto) in self._sessoes.items() if agora - visto > self.ttl_s]
+        for sessao in expiradas:
+            del self._sessoes[sessao]
+        em_uso = {ex for exercicios, _ in self._sessoes.values() for ex in exercicios}
+        for exercicio in list(self._exercicios):
+            if exercicio not in em_uso:
+                del self._exercicios[exercicio]
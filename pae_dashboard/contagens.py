@@ -0,0 +1,274 @@
+"""
+Armazenamento das contagens por PE no estado da sessão.
+
+Cada PE tem as chaves `participantes_<PE>` e `esperadas_<PE>`; além delas, a
+chave `contagens_df` guarda um DataFrame com as duas colunas para todos os
+PEs, atualizado linha a linha quando chega um diff, para que o rerun não
+precise reler todas as chaves.
+
+Quando há um ArmazemContagens configurado, o estado da sessão funciona como
+cache: é carregado do armazém na primeira execução e cada diff aplicado é
+gravado nele.
+
+Quando o conjunto de PEs muda, `diferenca_pes` separa os PEs adicionados,
+removidos, renomeados (mesmas coordenadas, outro nome) e movidos, e
+`reconciliar_contagens` mexe só nas chaves desse delta: os PEs que continuam
+mantêm as contagens, e as de um PE renomeado passam para o novo nome.
+"""
+
+import numpy as np
+import pandas as pd
+
+from pae_dashboard.efetividade import (
+    COL_ESPERADAS, COL_PARTICIPANTES, ESPERADAS_PADRAO, PARTICIPANTES_PADRAO, montar_contagens
+)
+from pae_dashboard.ingestao import resolver
+
+
+CAMPOS = {'participantes': COL_PARTICIPANTES, 'esperadas': COL_ESPERADAS}
+PADROES = {'participantes': PARTICIPANTES_PADRAO, 'esperadas': ESPERADAS_PADRAO}
+CHAVE_FRAME = 'contagens_df'
+
+# Casas decimais das coordenadas comparadas para reconhecer um PE renomeado (~1 cm).
+CASAS_COORDENADAS = 7
+
+
+def chave_contagem(campo: str, nome: str) -> str:
+    """Chave do estado da sessão para o `campo` ('participantes' ou 'esperadas') do PE `nome`."""
+    return f'{campo}_{nome}'
+
+
+def obter_contagens(state, nomes) -> pd.DataFrame:
+    """
+    Retorna o DataFrame de contagens dos PEs `nomes`, montando-o só quando o conjunto de PEs muda.
+
+    Argumentos:
+    state: O estado da sessão (ou outro mapeamento mutável).
+    nomes: Os nomes dos PEs, na ordem de `df_pe.index`.
+    """
+    frame = state.get(CHAVE_FRAME)
+    if frame is None or not frame.index.equals(pd.Index(nomes)):
+        frame = montar_contagens(nomes, state)
+        state[CHAVE_FRAME] = frame
+    return frame
+
+
+def aplicar_diff(state, diff: dict, armazem=None, cursores: dict = None) -> list:
+    """
+    Aplica um diff de contagens ao estado da sessão.
+
+    Argumentos:
+    state: O estado da sessão.
+    diff: Um dicionário {nome_do_pe: {'participantes': valor, 'esperadas': valor}}
+    com valores absolutos; campos ausentes ou None são ignorados.
+    armazem: Um ArmazemContagens opcional, onde os valores alterados são gravados.
+    cursores: Cursores da ingestão gravados no `armazem` junto com os valores
+    (ver `ArmazemContagens.registrar`).
+
+    Retorna:
+    A lista de PEs cujo valor realmente mudou.
+    """
+    frame = state.get(CHAVE_FRAME)
+    gravados = {}
+    for nome, campos in diff.items():
+        for campo, valor in campos.items():
+            if valor is None or campo not in CAMPOS:
+                continue
+            valor = int(valor)
+            chave = chave_contagem(campo, nome)
+            if state.get(chave, PADROES[campo]) == valor:
+                continue
+            state[chave] = valor
+            if frame is not None and nome in frame.index:
+                frame.loc[nome, CAMPOS[campo]] = valor
+            gravados.setdefault(nome, {})[campo] = valor
+    if armazem is not None and (gravados or cursores):
+        armazem.registrar(gravados, cursores=cursores)
+    return list(gravados)
+
+
+def carregar_do_armazem(state, armazem):
+    """
+    Preenche o estado da sessão com as contagens gravadas no armazém.
+
+    As chaves carregadas substituem as da sessão, e o DataFrame de contagens é
+    descartado para ser remontado no próximo `obter_contagens`.
+    """
+    for (nome, campo), valor in armazem.carregar().items():
+        if campo in CAMPOS:
+            state[chave_contagem(campo, nome)] = valor
+    state.pop(CHAVE_FRAME, None)
+
+
+def aplicar_alteracoes(state, alteracoes: dict, nomes, armazem=None, cursores: dict = None) -> tuple:
+    """
+    Aplica alterações consolidadas pela ingestão ({(pe, campo, intervalo): (absoluto, delta, momento)}).
+
+    As alterações de cada contagem são aplicadas em ordem de momento, somando
+    os deltas ao valor atual; PEs que não estão em `nomes` são ignorados. Cada
+    valor intermediário é gravado no `armazem` opcional com o momento do
+    evento que o produziu, na mesma transação que os `cursores`.
+
+    Retorna:
+    Uma tupla (alterados, ignorados, registros) com os PEs atualizados, os
+    desconhecidos e os registros (momento, pe, campo, valor) de cada valor
+    que mudou, em ordem de momento.
+    """
+    conhecidos = set(nomes)
+    por_contagem = {}
+    ignorados = set()
+    for (nome, campo, _), alteracao in alteracoes.items():
+        if nome not in conhecidos:
+            ignorados.add(nome)
+            continue
+        por_contagem.setdefault((nome, campo), []).append(alteracao)
+    diff = {}
+    registros = []
+    for (nome, campo), lista in por_contagem.items():
+        valor = state.get(chave_contagem(campo, nome), PADROES[campo])
+        for alteracao in sorted(lista, key=lambda alteracao: alteracao[2]):
+            novo = resolver(alteracao, valor)
+            if novo != valor:
+                registros.append((alteracao[2], nome, campo, novo))
+            valor = novo
+        diff.setdefault(nome, {})[campo] = valor
+    registros.sort(key=lambda registro: registro[0])
+    alterados = aplicar_diff(state, diff)
+    if armazem is not None and (registros or cursores):
+        armazem.registrar_eventos([(nome, campo, valor, momento) for momento, nome, campo, valor in registros], cursores)
+    return alterados, sorted(ignorados), registros
+
+
+class DiferencaPEs:
+    """
+    Diferença entre dois conjuntos de PEs.
+
+    Atributos:
+    adicionados: Nomes que só existem no conjunto novo (exceto renomeados).
+    removidos: Nomes que só existiam no conjunto anterior (exceto renomeados).
+    renomeados: {nome_anterior: nome_novo} de PEs com as mesmas coordenadas.
+    movidos: Nomes mantidos cujas coordenadas mudaram.
+    reordenados: Indica que os mesmos PEs aparecem em outra ordem.
+    """
+
+    def __init__(self, adicionados=(), removidos=(), renomeados=None, movidos=(), reordenados: bool = False):
+        self.adicionados = list(adicionados)
+        self.removidos = list(removidos)
+        self.renomeados = dict(renomeados or {})
+        self.movidos = list(movidos)
+        self.reordenados = reordenados
+
+    def vazia(self) -> bool:
+        return not (self.adicionados or self.removidos or self.renomeados or self.movidos or self.reordenados)
+
+    def resumo(self) -> str:
+        """Descrição curta da diferença (por exemplo, "2 adicionado(s), 1 renomeado(s)")."""
+        partes = [
+            f"{len(itens)} {rotulo}" for itens, rotulo in (
+                (self.adicionados, "adicionado(s)"), (self.removidos, "removido(s)"),
+                (self.renomeados, "renomeado(s)"), (self.movidos, "com coordenadas alteradas"),
+            ) if itens
+        ]
+        return ', '.join(partes) if partes else ("mesmos PEs em outra ordem" if self.reordenados else "sem alterações")
+
+
+def _coordenadas(df_pe: pd.DataFrame) -> pd.DataFrame:
+    # Índice de objetos Python: as operações de conjunto são bem mais rápidas que com o tipo texto do pyarrow.
+    coordenadas = df_pe.drop_duplicates('Nome')
+    return pd.DataFrame(
+        coordenadas[['Latitude', 'Longitude']].to_numpy(dtype=np.float64),
+        index=pd.Index(coordenadas['Nome'].to_numpy(dtype=object), dtype=object, name='Nome'),
+        columns=['Latitude', 'Longitude'],
+    )
+
+
+def diferenca_pes(anteriores, novos) -> DiferencaPEs:
+    """
+    Compara dois DataFrames de PEs ('Nome', 'Latitude', 'Longitude').
+
+    As comparações de nomes e coordenadas são vetorizadas; só o delta é
+    percorrido em Python. Um PE removido e um adicionado com as mesmas
+    coordenadas (até `CASAS_COORDENADAS` casas) contam como uma renomeação.
+
+    Argumentos:
+    anteriores: O conjunto anterior (ou None, quando ainda não havia PEs).
+    novos: O conjunto novo.
+    """
+    novos = _coordenadas(novos)
+    if anteriores is None:
+        return DiferencaPEs(adicionados=novos.index)
+    anteriores = _coordenadas(anteriores)
+
+    adicionados = novos.index.difference(anteriores.index, sort=False)
+    removidos = anteriores.index.difference(novos.index, sort=False)
+    mantidos = novos.index.intersection(anteriores.index, sort=False)
+    deslocamento = (novos.loc[mantidos].to_numpy() - anteriores.loc[mantidos].to_numpy())
+    movidos = mantidos[np.abs(deslocamento).max(axis=1, initial=0) > 10 ** -CASAS_COORDENADAS]
+
+    renomeados = {}
+    if len(adicionados) and len(removidos):
+        chaves_removidos = {}
+        for nome, lat, lon in anteriores.loc[removidos].round(CASAS_COORDENADAS).itertuples():
+            chaves_removidos.setdefault((lat, lon), []).append(nome)
+        for nome, lat, lon in novos.loc[adicionados].round(CASAS_COORDENADAS).itertuples():
+            candidatos = chaves_removidos.get((lat, lon))
+            if candidatos:
+                renomeados[candidatos.pop(0)] = nome
+        adicionados = adicionados.difference(list(renomeados.values()), sort=False)
+        removidos = removidos.difference(list(renomeados), sort=False)
+
+    reordenados = not (adicionados.size or removidos.size or renomeados) and not novos.index.equals(anteriores.index)
+    return DiferencaPEs(adicionados, removidos, renomeados, movidos, reordenados)
+
+
+def reconciliar_contagens(state, diferenca: DiferencaPEs, nomes, armazem=None) -> list:
+    """
+    Ajusta o estado de contagens a um novo conjunto de PEs, mexendo só no delta.
+
+    As contagens de um PE renomeado passam para o novo nome (e são gravadas no
+    `armazem`, se houver); as chaves dos PEs removidos saem do estado (o
+    histórico do armazém é mantido). PEs adicionados não criam chaves: valem
+    os padrões até a primeira contagem. O DataFrame de contagens, se já
+    montado, é ajustado em vez de remontado.
+
+    Argumentos:
+    state: O estado de contagens.
+    diferenca: A DiferencaPEs entre o conjunto anterior e o novo.
+    nomes: Os nomes do conjunto novo, na ordem desejada.
+    armazem: Um ArmazemContagens opcional.
+
+    Retorna:
+    A lista de PEs cujas contagens mudaram de nome.
+    """
+    gravados = {}
+    for antigo, novo in diferenca.renomeados.items():
+        for campo in CAMPOS:
+            chave_antiga = chave_contagem(campo, antigo)
+            if chave_antiga in state:
+                state[chave_contagem(campo, novo)] = state.pop(chave_antiga)
+                gravados.setdefault(novo, {})[campo] = state[chave_contagem(campo, novo)]
+    for nome in diferenca.removidos:
+        for campo in CAMPOS:
+            state.pop(chave_contagem(campo, nome), None)
+
+    frame = state.get(CHAVE_FRAME)
+    if frame is not None:
+        rotulos = frame.index.to_numpy(dtype=object)
+        if diferenca.renomeados:
+            rotulos = rotulos.copy()
+            posicoes = frame.index.get_indexer(list(diferenca.renomeados))
+            rotulos[posicoes[posicoes >= 0]] = [
+                novo for posicao, novo in zip(posicoes, diferenca.renomeados.values()) if posicao >= 0
+            ]
+        frame = frame.set_axis(pd.Index(rotulos, dtype=object, name='Nome'))
+        if diferenca.adicionados:
+            frame = pd.concat([frame, montar_contagens(pd.Index(diferenca.adicionados, dtype=object), state)])
+        posicoes = frame.index.get_indexer(pd.Index(nomes, dtype=object)) if frame.index.is_unique else None
+        if posicoes is not None and (posicoes >= 0).all():
+            state[CHAVE_FRAME] = frame.take(posicoes)
+        else:
+            state.pop(CHAVE_FRAME, None)
+
+    if armazem is not None and gravados:
+        armazem.registrar(gravados)
+    return list(gravados)
@@ -0,0 +1,364 @@
+"""
+Medição do tempo e da memória de cada etapa das execuções do dashboard.
+
+Cada execução do script (ou de um fragmento reexecutado sozinho) é uma
+`Execucao`: o que a disparou e as etapas medidas, com o tempo de parede e,
+opcionalmente, o pico de memória alocada pelo Python (via tracemalloc) em cada
+uma, além dos acertos e faltas dos caches durante a execução. O
+`RegistroDiagnostico` guarda as últimas execuções do processo, acrescenta cada
+uma a um arquivo JSON Lines e reescreve um arquivo no formato de texto do
+Prometheus com os totais acumulados (para o coletor de arquivos de texto do
+node_exporter, por exemplo).
+
+Com o diagnóstico desativado usa-se `EXECUCAO_INATIVA`, cujas etapas são um
+gerenciador de contexto vazio e compartilhado: o custo fica no de um `with`.
+
+O pico de memória é o do processo: com várias sessões executando ao mesmo
+tempo, as alocações de uma aparecem nas etapas das outras. O mesmo vale para
+os caches compartilhados entre sessões.
+"""
+
+import contextlib
+import datetime
+import json
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import deque
+
+import pandas as pd
+
+
+MAX_EXECUCOES_GUARDADAS = 1_000
+LIMITES_HISTOGRAMA_S = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PREFIXO_METRICAS = 'pae_dashboard'
+
+_lock_memoria = threading.Lock()
+_medicoes_memoria = 0
+_tracemalloc_iniciado_aqui = False
+
+
+def _iniciar_medicao_memoria():
+    """Liga o tracemalloc, se ainda não estiver ligado; conta quantas execuções o usam."""
+    global _medicoes_memoria, _tracemalloc_iniciado_aqui
+    with _lock_memoria:
+        if _medicoes_memoria == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_iniciado_aqui = True
+        _medicoes_memoria += 1
+
+
+def _encerrar_medicao_memoria():
+    """Desliga o tracemalloc quando a última execução que o usava termina (se foi ligado aqui)."""
+    global _medicoes_memoria, _tracemalloc_iniciado_aqui
+    with _lock_memoria:
+        _medicoes_memoria -= 1
+        if _medicoes_memoria == 0 and _tracemalloc_iniciado_aqui:
+            tracemalloc.stop()
+            _tracemalloc_iniciado_aqui = False
+
+
+class Execucao:
+    """
+    Etapas medidas de uma execução do script ou de um fragmento.
+
+    As etapas podem ser aninhadas (`with execucao.etapa(...)`) ou sequenciais
+    (`execucao.marco(...)`, que encerra a etapa do marco anterior), para medir
+    trechos longos do script sem reindentá-los. Marcos só devem ser usados
+    fora de qualquer `etapa`.
+
+    Atributos:
+    gatilho: O que disparou a execução (widgets alterados, fragmento etc.).
+    fragmento: Nome do fragmento reexecutado sozinho, ou None numa execução completa.
+    sessao: Identificador da sessão.
+    etapas: Lista de {'etapa', 'nivel', 'inicio_ms', 'ms', 'pico_bytes'}, na ordem em que
+    terminaram; `inicio_ms` é contado do início da execução.
+    valores: Medidas avulsas registradas com `registrar_valor`.
+    """
+
+    ativa = True
+
+    def __init__(self, gatilho: str = '', fragmento: str = None, sessao: str = None,
+                 medir_memoria: bool = False, caches: dict = None):
+        """
+        Argumentos:
+        gatilho, fragmento, sessao: Ver os atributos.
+        medir_memoria: Mede o pico de memória de cada etapa (liga o tracemalloc, que deixa o processo mais lento).
+        caches: {nome: cache} de objetos com contadores `hits` e `misses` (como o `GeoCache`).
+        """
+        self.gatilho = gatilho
+        self.fragmento = fragmento
+        self.sessao = sessao
+        self.etapas = []
+        self.valores = {}
+        self.inicio = time.time()
+        self._t0 = time.perf_counter()
+        self._caches = dict(caches or {})
+        self._consultas_iniciais = {nome: (cache.hits, cache.misses) for nome, cache in self._caches.items()}
+        self._medir_memoria = medir_memoria
+        # Etapas abertas: [nome, início, memória no início, maior pico das etapas filhas].
+        self._pilha = []
+        self._marco_aberto = False
+        self._finalizada = False
+        self._liberar_memoria = None
+        if medir_memoria:
+            _iniciar_medicao_memoria()
+            # Uma execução interrompida que nunca é finalizada libera o tracemalloc quando é descartada.
+            self._liberar_memoria = weakref.finalize(self, _encerrar_medicao_memoria)
+
+    def _abrir(self, nome: str):
+        memoria_inicial = 0
+        if self._medir_memoria:
+            atual, pico = tracemalloc.get_traced_memory()
+            # O pico é zerado para a etapa nova; o da etapa de fora até aqui fica guardado nela.
+            if self._pilha:
+                self._pilha[-1][3] = max(self._pilha[-1][3], pico)
+            tracemalloc.reset_peak()
+            memoria_inicial = atual
+        self._pilha.append([nome, time.perf_counter(), memoria_inicial, 0])
+
+    def _fechar(self):
+        nome, inicio, memoria_inicial, pico_filhas = self._pilha.pop()
+        ms = (time.perf_counter() - inicio) * 1000
+        pico_bytes = None
+        if self._medir_memoria:
+            pico = max(tracemalloc.get_traced_memory()[1], pico_filhas)
+            pico_bytes = max(0, pico - memoria_inicial)
+            if self._pilha:
+                self._pilha[-1][3] = max(self._pilha[-1][3], pico)
+        self.etapas.append({
+            'etapa': nome, 'nivel': len(self._pilha), 'inicio_ms': (inicio - self._t0) * 1000,
+            'ms': ms, 'pico_bytes': pico_bytes,
+        })
+
+    @contextlib.contextmanager
+    def etapa(self, nome: str):
+        """Mede o bloco `with` como a etapa `nome`."""
+        self._abrir(nome)
+        try:
+            yield
+        finally:
+            self._fechar()
+
+    def marco(self, nome: str):
+        """Encerra a etapa aberta pelo marco anterior (se houver) e abre a etapa `nome`."""
+        if self._marco_aberto:
+            self._fechar()
+        self._abrir(nome)
+        self._marco_aberto = True
+
+    def registrar_valor(self, nome: str, valor):
+        """Guarda uma medida avulsa da execução (por exemplo, o número de marcadores regerados)."""
+        self.valores[nome] = valor
+
+    def finalizar(self):
+        """
+        Encerra as etapas ainda abertas e monta o registro da execução.
+
+        Retorna:
+        Um dicionário serializável em JSON, ou None se a execução já foi finalizada.
+        """
+        if self._finalizada:
+            return None
+        self._finalizada = True
+        while self._pilha:
+            self._fechar()
+        if self._liberar_memoria is not None:
+            self._liberar_memoria()
+        caches = {}
+        for nome, cache in self._caches.items():
+            acertos, faltas = self._consultas_iniciais[nome]
+            caches[nome] = {'acertos': cache.hits - acertos, 'faltas': cache.misses - faltas}
+        return {
+            'inicio': datetime.datetime.fromtimestamp(self.inicio).isoformat(timespec='milliseconds'),
+            'sessao': self.sessao,
+            'gatilho': self.gatilho,
+            'fragmento': self.fragmento,
+            'duracao_ms': (time.perf_counter() - self._t0) * 1000,
+            'etapas': self.etapas,
+            'caches': caches,
+            'valores': self.valores,
+        }
+
+
+class _ExecucaoInativa:
+    """Execução sem medição, usada com o diagnóstico desativado."""
+
+    ativa = False
+    _sem_medicao = contextlib.nullcontext()
+
+    def etapa(self, nome: str):
+        return self._sem_medicao
+
+    def marco(self, nome: str):
+        pass
+
+    def registrar_valor(self, nome: str, valor):
+        pass
+
+    def finalizar(self):
+        return None
+
+
+EXECUCAO_INATIVA = _ExecucaoInativa()
+
+
+def _rotulo(valor) -> str:
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RegistroDiagnostico:
+    """
+    Execuções medidas do processo, com exportação em JSON Lines e no formato de texto do Prometheus.
+
+    É seguro para uso concorrente entre sessões do Streamlit. Os totais do
+    Prometheus (histograma de duração por etapa, pico de memória por etapa,
+    execuções por tipo e consultas aos caches) são acumulados desde a criação
+    do registro, e as medidas avulsas numéricas exportam o último valor; o
+    JSON Lines recebe uma linha por execução.
+    """
+
+    def __init__(self, caminho_jsonl: str = None, caminho_prometheus: str = None,
+                 max_execucoes: int = MAX_EXECUCOES_GUARDADAS):
+        """
+        Argumentos:
+        caminho_jsonl: Arquivo ao qual cada execução é acrescentada (None = não grava).
+        caminho_prometheus: Arquivo reescrito a cada execução com os totais (None = não grava).
+        max_execucoes: Quantas execuções recentes ficam em memória.
+        """
+        self.caminho_jsonl = caminho_jsonl
+        self.caminho_prometheus = caminho_prometheus
+        self.erro_gravacao = None
+        self._execucoes = deque(maxlen=max_execucoes)
+        self._lock = threading.Lock()
+        self._execucoes_por_tipo = {}
+        # {etapa: [contagens por limite do histograma..., soma em s, total, maior pico em bytes]}
+        self._etapas = {}
+        self._caches = {}
+        # {nome: último valor numérico registrado com `Execucao.registrar_valor`}
+        self._valores = {}
+
+    def registrar(self, registro: dict):
+        """Guarda o registro de uma execução (ver `Execucao.finalizar`) e atualiza os arquivos exportados."""
+        if registro is None:
+            return
+        with self._lock:
+            self._execucoes.append(registro)
+            tipo = 'fragmento' if registro['fragmento'] else 'completa'
+            self._execucoes_por_tipo[tipo] = self._execucoes_por_tipo.get(tipo, 0) + 1
+            for etapa in registro['etapas']:
+                totais = self._etapas.setdefault(etapa['etapa'], [0] * len(LIMITES_HISTOGRAMA_S) + [0.0, 0, None])
+                segundos = etapa['ms'] / 1000
+                for i, limite in enumerate(LIMITES_HISTOGRAMA_S):
+                    if segundos <= limite:
+                        totais[i] += 1
+                totais[-3] += segundos
+                totais[-2] += 1
+                if etapa['pico_bytes'] is not None:
+                    totais[-1] = max(totais[-1] or 0, etapa['pico_bytes'])
+            for nome, consultas in registro['caches'].items():
+                totais = self._caches.setdefault(nome, [0, 0])
+                totais[0] += consultas['acertos']
+                totais[1] += consultas['faltas']
+            for nome, valor in registro.get('valores', {}).items():
+                if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                    self._valores[nome] = valor
+            self._exportar(registro)
+
+    def _exportar(self, registro: dict):
+        try:
+            if self.caminho_jsonl:
+                with open(self.caminho_jsonl, 'a', encoding='utf-8') as arquivo:
+                    arquivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+            if self.caminho_prometheus:
+                # Grava num arquivo temporário e renomeia, para o coletor nunca ler um arquivo pela metade.
+                temporario = f"{self.caminho_prometheus}.tmp"
+                with open(temporario, 'w', encoding='utf-8') as arquivo:
+                    arquivo.write(self._texto_prometheus())
+                os.replace(temporario, self.caminho_prometheus)
+            self.erro_gravacao = None
+        except OSError as e:
+            self.erro_gravacao = str(e)
+
+    def execucoes(self, sessao: str = None) -> list:
+        """Retorna as execuções guardadas (de uma `sessao`, se dada), da mais antiga à mais recente."""
+        with self._lock:
+            return [registro for registro in self._execucoes if sessao is None or registro['sessao'] == sessao]
+
+    def texto_prometheus(self) -> str:
+        """Os totais acumulados no formato de exposição de texto do Prometheus."""
+        with self._lock:
+            return self._texto_prometheus()
+
+    def _texto_prometheus(self) -> str:
+        p = PREFIXO_METRICAS
+        linhas = [
+            f"# HELP {p}_execucoes_total Execuções medidas, por tipo (completa ou fragmento).",
+            f"# TYPE {p}_execucoes_total counter",
+        ]
+        linhas += [f'{p}_execucoes_total{{tipo="{tipo}"}} {n}' for tipo, n in sorted(self._execucoes_por_tipo.items())]
+
+        linhas += [
+            f"# HELP {p}_etapa_duracao_segundos Duração de cada etapa das execuções.",
+            f"# TYPE {p}_etapa_duracao_segundos histogram",
+        ]
+        for etapa, totais in sorted(self._etapas.items()):
+            rotulo = _rotulo(etapa)
+            for limite, n in zip(LIMITES_HISTOGRAMA_S, totais):
+                linhas.append(f'{p}_etapa_duracao_segundos_bucket{{etapa="{rotulo}",le="{limite}"}} {n}')
+            linhas.append(f'{p}_etapa_duracao_segundos_bucket{{etapa="{rotulo}",le="+Inf"}} {totais[-2]}')
+            linhas.append(f'{p}_etapa_duracao_segundos_sum{{etapa="{rotulo}"}} {totais[-3]:.6f}')
+            linhas.append(f'{p}_etapa_duracao_segundos_count{{etapa="{rotulo}"}} {totais[-2]}')
+
+        linhas += [
+            f"# HELP {p}_etapa_pico_memoria_bytes Maior pico de memória alocada numa etapa (só execuções com medição de memória).",
+            f"# TYPE {p}_etapa_pico_memoria_bytes gauge",
+        ]
+        linhas += [
+            f'{p}_etapa_pico_memoria_bytes{{etapa="{_rotulo(etapa)}"}} {totais[-1]}'
+            for etapa, totais in sorted(self._etapas.items()) if totais[-1] is not None
+        ]
+
+        linhas += [
+            f"# HELP {p}_cache_consultas_total Consultas aos caches durante as execuções medidas, por resultado.",
+            f"# TYPE {p}_cache_consultas_total counter",
+        ]
+        for nome, (acertos, faltas) in sorted(self._caches.items()):
+            linhas.append(f'{p}_cache_consultas_total{{cache="{_rotulo(nome)}",resultado="acerto"}} {acertos}')
+            linhas.append(f'{p}_cache_consultas_total{{cache="{_rotulo(nome)}",resultado="falta"}} {faltas}')
+
+        linhas += [
+            f"# HELP {p}_valor Último valor de cada medida avulsa das execuções (como o tamanho do mapa enviado, em bytes).",
+            f"# TYPE {p}_valor gauge",
+        ]
+        linhas += [f'{p}_valor{{nome="{_rotulo(nome)}"}} {valor}' for nome, valor in sorted(self._valores.items())]
+        return '\n'.join(linhas) + '\n'
+
+
+def resumo_etapas(execucoes: list) -> pd.DataFrame:
+    """
+    Resume a duração e a memória de cada etapa numa lista de execuções.
+
+    Retorna:
+    Um DataFrame indexado por 'Etapa', com o número de medições, a mediana, o
+    percentil 95 e o máximo da duração (ms) e o maior pico de memória (MB),
+    ordenado pela soma das durações (as etapas mais custosas primeiro).
+    """
+    etapas = [etapa for registro in execucoes for etapa in registro['etapas']]
+    colunas = ['Medições', 'Mediana (ms)', 'P95 (ms)', 'Máximo (ms)', 'Pico de memória (MB)']
+    if not etapas:
+        return pd.DataFrame(columns=colunas, index=pd.Index([], name='Etapa'))
+    df = pd.DataFrame(etapas)
+    df['pico_bytes'] = pd.to_numeric(df['pico_bytes'], errors='coerce')
+    grupos = df.groupby('etapa', sort=False)
+    resumo = pd.DataFrame({
+        'Medições': grupos['ms'].count(),
+        'Mediana (ms)': grupos['ms'].median(),
+        'P95 (ms)': grupos['ms'].quantile(0.95),
+        'Máximo (ms)': grupos['ms'].max(),
+        'Pico de memória (MB)': grupos['pico_bytes'].max() / 1e6,
+    })
+    resumo.index.name = 'Etapa'
+    return resumo.loc[grupos['ms'].sum().sort_values(ascending=False).index]
@@ -0,0 +1,103 @@
+"""
+Cálculo vetorizado de contagens, efetividade e classificação dos PEs.
+
+Todas as funções operam sobre colunas inteiras do DataFrame de PEs (indexado
+por 'Nome'), sem laços por linha, e podem ser usadas fora do Streamlit.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+COL_PARTICIPANTES = 'Total de Participantes'
+COL_ESPERADAS = 'Número de Pessoas Esperadas'
+COL_EFETIVIDADE = 'Efetividade (%)'
+COL_COR = 'Cor do Marcador'
+COL_ICONE = 'Ícone do Marcador'
+
+PARTICIPANTES_PADRAO = 0
+ESPERADAS_PADRAO = 1
+
+# Limiares de efetividade (%) para a classificação dos marcadores.
+LIMIAR_VERDE = 80
+LIMIAR_LARANJA = 50
+
+# Categorias na ordem do pior para o melhor resultado; 'gray' indica PE sem dados.
+CORES = pd.CategoricalDtype(['red', 'orange', 'green', 'gray'])
+ICONES = pd.CategoricalDtype(['remove-sign', 'info-sign', 'ok-sign', 'minus-sign'])
+
+
+def montar_contagens(nomes, state, participantes_padrao: int = PARTICIPANTES_PADRAO,
+                     esperadas_padrao: int = ESPERADAS_PADRAO) -> pd.DataFrame:
+    """
+    Monta, de uma só vez, as colunas de contagem a partir do estado da sessão.
+
+    Argumentos:
+    nomes: Os nomes dos PEs (normalmente `df_pe.index`).
+    state: Um mapeamento com as chaves `participantes_<PE>` e `esperadas_<PE>`
+    (por exemplo, `st.session_state`).
+
+    Retorna:
+    Um DataFrame indexado pelos nomes, com as colunas de participantes e esperados.
+    """
+    get = state.get
+    participantes = [get(f'participantes_{nome}', participantes_padrao) for nome in nomes]
+    esperadas = [get(f'esperadas_{nome}', esperadas_padrao) for nome in nomes]
+    return pd.DataFrame(
+        {
+            COL_PARTICIPANTES: np.asarray(participantes, dtype=np.int64),
+            COL_ESPERADAS: np.asarray(esperadas, dtype=np.int64),
+        },
+        index=pd.Index(nomes, name='Nome'),
+    )
+
+
+def calcular_efetividade(participantes, esperadas) -> np.ndarray:
+    """
+    Calcula a efetividade (%) de cada PE com divisão mascarada.
+
+    PEs sem pessoas esperadas recebem 0,0 em vez de uma divisão por zero.
+    """
+    participantes = np.asarray(participantes, dtype=np.float64)
+    esperadas = np.asarray(esperadas, dtype=np.float64)
+    efetividade = np.zeros_like(participantes)
+    np.divide(participantes * 100, esperadas, out=efetividade, where=esperadas > 0)
+    return efetividade
+
+
+def classificar_marcadores(efetividade, participantes, esperadas):
+    """
+    Atribui cor e ícone do marcador de cada PE pelos limiares de efetividade.
+
+    Retorna:
+    Uma tupla (cores, icones) de pd.Categorical. PEs sem participantes e sem
+    esperados (zero ou NaN) ficam em cinza.
+    """
+    efetividade = np.asarray(efetividade, dtype=np.float64)
+    sem_dados = ~((np.asarray(esperadas, dtype=np.float64) > 0) | (np.asarray(participantes, dtype=np.float64) > 0))
+    codigos = np.where(efetividade >= LIMIAR_VERDE, 2, np.where(efetividade >= LIMIAR_LARANJA, 1, 0))
+    codigos[sem_dados] = 3
+    codigos = codigos.astype(np.int8)
+    cores = pd.Categorical.from_codes(codigos, dtype=CORES)
+    icones = pd.Categorical.from_codes(codigos, dtype=ICONES)
+    return cores, icones
+
+
+def aplicar_indicadores(df_pe: pd.DataFrame) -> pd.DataFrame:
+    """
+    Acrescenta ao DataFrame de PEs as colunas de efetividade, cor e ícone do marcador.
+
+    Argumentos:
+    df_pe: DataFrame com as colunas de participantes e esperados.
+
+    Retorna:
+    O próprio `df_pe`, alterado no lugar.
+    """
+    participantes = df_pe[COL_PARTICIPANTES].to_numpy()
+    esperadas = df_pe[COL_ESPERADAS].to_numpy()
+    efetividade = calcular_efetividade(participantes, esperadas)
+    cores, icones = classificar_marcadores(efetividade, participantes, esperadas)
+    df_pe[COL_EFETIVIDADE] = efetividade
+    df_pe[COL_COR] = cores
+    df_pe[COL_ICONE] = icones
+    return df_pe
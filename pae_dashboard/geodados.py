@@ -0,0 +1,294 @@
+"""
+Leitura em memória de camadas geográficas enviadas pelo usuário.
+
+Formatos aceitos:
+
+- Shapefile compactado (.zip): cada .shp do .zip é uma camada. O .zip é lido
+  pelo sistema de arquivos virtual do GDAL (/vsizip/), direto da memória, sem
+  gravar nada em disco e descompactando só os arquivos da camada escolhida.
+  Shapefiles em subpastas são reempacotados em memória apenas com os seus
+  próprios arquivos (.shp, .shx, .dbf, .prj, .cpg);
+- GeoPackage (.gpkg), com uma camada por tabela;
+- FlatGeobuf (.fgb);
+- GeoParquet (.parquet).
+
+A seleção de colunas e o filtro por retângulo (bbox) são repassados à leitura:
+atributos não pedidos não são decodificados e, nos formatos com índice
+espacial (GeoPackage, FlatGeobuf, GeoParquet com coluna de bbox), feições fora
+do retângulo nem são lidas.
+"""
+
+import contextlib
+import io
+import json
+import os
+import warnings
+import zipfile
+
+EXTENSOES_GEODADOS = ["zip", "gpkg", "fgb", "parquet"]
+
+# Arquivos que acompanham o .shp e são levados junto ao reempacotar uma camada.
+EXTENSOES_SHAPEFILE = ('.shp', '.shx', '.dbf', '.prj', '.cpg')
+
+
+def _extensao(nome_arquivo: str) -> str:
+    return os.path.splitext(nome_arquivo.lower())[1].lstrip('.')
+
+
+def _em_cache(cache, key, loader):
+    return loader() if cache is None else cache.get_or_load(key, loader)
+
+
+def _shapefiles_do_zip(data: bytes) -> list:
+    """Lista os .shp do .zip (caminho sem extensão), lendo só o diretório central do arquivo."""
+    with zipfile.ZipFile(io.BytesIO(data)) as zip_ref:
+        return [
+            os.path.splitext(nome)[0] for nome in zip_ref.namelist()
+            if nome.lower().endswith('.shp') and not nome.startswith('__MACOSX/')
+        ]
+
+
+def listar_camadas(data: bytes, nome_arquivo: str, cache=None, content_hash: str = None) -> list:
+    """
+    Lista as camadas de um arquivo geográfico.
+
+    Argumentos:
+    data: O conteúdo do arquivo.
+    nome_arquivo: Nome do arquivo (a extensão define o formato).
+    cache: Um GeoCache opcional.
+    content_hash: O hash de `data` (obrigatório para usar o cache).
+
+    Retorna:
+    A lista de nomes de camada, na ordem do arquivo.
+
+    Levanta:
+    FileNotFoundError se o .zip não contém nenhum .shp; ValueError para
+    formatos não suportados.
+    """
+    extensao = _extensao(nome_arquivo)
+
+    def carregar():
+        if extensao == 'zip':
+            camadas = _shapefiles_do_zip(data)
+            if not camadas:
+                raise FileNotFoundError("Nenhum arquivo .shp encontrado no .zip.")
+            return camadas
+        if extensao == 'gpkg':
+            import pyogrio
+
+            with _sem_aviso_extensao():
+                return [str(camada) for camada in pyogrio.list_layers(data)[:, 0]]
+        if extensao in ('fgb', 'parquet'):
+            return [os.path.splitext(os.path.basename(nome_arquivo))[0]]
+        raise ValueError(f"Formato de arquivo geográfico não suportado: {nome_arquivo}")
+
+    if content_hash is None:
+        return carregar()
+    return _em_cache(cache, ("geodados_camadas", content_hash, extensao), carregar)
+
+
+@contextlib.contextmanager
+def _sem_aviso_extensao():
+    # O GDAL avisa que o buffer em memória não tem a extensão .gpkg; o aviso é irrelevante aqui.
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message=".*non conformant file extension")
+        yield
+
+
+def _fonte_ogr(data: bytes, extensao: str, camada: str) -> tuple:
+    """
+    Retorna o buffer e o nome de camada a entregar ao pyogrio.
+
+    Um shapefile na raiz do .zip é lido do próprio .zip; um shapefile numa
+    subpasta é copiado, com seus arquivos auxiliares, para um .zip em memória
+    sem compressão, já que o GDAL só enxerga como camadas os .shp da raiz.
+    """
+    if extensao == 'gpkg':
+        return data, camada
+    if extensao != 'zip':
+        return data, None
+    if '/' not in camada:
+        return data, camada
+
+    base = os.path.basename(camada)
+    saida = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(data)) as origem, zipfile.ZipFile(saida, 'w', zipfile.ZIP_STORED) as destino:
+        for nome in origem.namelist():
+            raiz, ext = os.path.splitext(nome)
+            if raiz == camada and ext.lower() in EXTENSOES_SHAPEFILE:
+                destino.writestr(base + ext.lower(), origem.read(nome))
+    return saida.getvalue(), base
+
+
+def _metadados_geoparquet(data: bytes) -> dict:
+    import pyarrow.parquet as pq
+
+    schema = pq.read_schema(io.BytesIO(data))
+    geo = json.loads((schema.metadata or {}).get(b'geo', b'{}'))
+    return {'colunas': schema.names, 'geo': geo}
+
+
+def ler_info(data: bytes, nome_arquivo: str, camada: str = None, cache=None, content_hash: str = None) -> dict:
+    """
+    Lê os metadados de uma camada sem carregar as feições.
+
+    Argumentos:
+    data, nome_arquivo, cache, content_hash: Como em `listar_camadas`.
+    camada: A camada (padrão: a primeira).
+
+    Retorna:
+    Um dicionário com 'colunas' (atributos, sem a geometria), 'crs' (string
+    ou None) e 'feicoes' (número de feições, ou None se desconhecido).
+    """
+    extensao = _extensao(nome_arquivo)
+    if camada is None:
+        camada = listar_camadas(data, nome_arquivo, cache, content_hash)[0]
+
+    def carregar():
+        if extensao == 'parquet':
+            import pyarrow.parquet as pq
+
+            metadados = _metadados_geoparquet(data)
+            geometrias = set(metadados['geo'].get('columns', {})) | {'geometry'}
+            return {
+                'colunas': [col for col in metadados['colunas'] if col not in geometrias],
+                'crs': _crs_geoparquet(metadados['geo']),
+                'feicoes': pq.ParquetFile(io.BytesIO(data)).metadata.num_rows,
+            }
+        import pyogrio
+
+        buffer, layer = _fonte_ogr(data, extensao, camada)
+        with _sem_aviso_extensao():
+            info = pyogrio.read_info(buffer, layer=layer)
+        return {
+            'colunas': [str(col) for col in info['fields']],
+            'crs': info['crs'],
+            'feicoes': info['features'] if info['features'] >= 0 else None,
+        }
+
+    if content_hash is None:
+        return carregar()
+    return _em_cache(cache, ("geodados_info", content_hash, extensao, camada), carregar)
+
+
+def _crs_geoparquet(geo: dict):
+    """CRS da coluna de geometria principal de um GeoParquet (OGC:CRS84 quando omitido, como manda a especificação)."""
+    from pyproj import CRS
+
+    coluna = geo.get('columns', {}).get(geo.get('primary_column', 'geometry'), {})
+    if 'crs' not in coluna:
+        return "OGC:CRS84"
+    if coluna['crs'] is None:
+        return None
+    return CRS.from_user_input(coluna['crs']).to_string()
+
+
+def _bbox_na_origem(bbox, bbox_crs: str, crs_origem):
+    """Converte o retângulo `bbox` (em `bbox_crs`) para o CRS da camada."""
+    if bbox is None or crs_origem is None:
+        return bbox
+    from pyproj import CRS, Transformer
+
+    if CRS.from_user_input(crs_origem) == CRS.from_user_input(bbox_crs):
+        return tuple(bbox)
+    return Transformer.from_crs(bbox_crs, crs_origem, always_xy=True).transform_bounds(*bbox)
+
+
+def _ler_geoparquet(data: bytes, colunas, bbox):
+    import geopandas
+    import shapely
+
+    geo = _metadados_geoparquet(data)['geo']
+    if colunas is not None:
+        colunas = list(colunas) + [geo.get('primary_column', 'geometry')]
+    try:
+        return geopandas.read_parquet(io.BytesIO(data), columns=colunas, bbox=bbox)
+    except ValueError:
+        if bbox is None:
+            raise
+    # Sem coluna de bbox no arquivo, o filtro é aplicado depois da leitura.
+    gdf = geopandas.read_parquet(io.BytesIO(data), columns=colunas)
+    return gdf.iloc[sorted(gdf.sindex.query(shapely.box(*bbox)))]
+
+
+def ler_geodados(data: bytes, nome_arquivo: str, camada: str = None, colunas: list = None, bbox: tuple = None,
+                 target_crs: str = "EPSG:4326", bbox_crs: str = "EPSG:4326") -> tuple:
+    """
+    Lê uma camada de um arquivo geográfico em memória e a reprojeta para `target_crs`.
+
+    Argumentos:
+    data: O conteúdo do arquivo.
+    nome_arquivo: Nome do arquivo (a extensão define o formato).
+    camada: A camada a ler (padrão: a primeira; ver `listar_camadas`).
+    colunas: Atributos a carregar (None = todos; [] = só a geometria).
+    bbox: Retângulo (xmin, ymin, xmax, ymax) em `bbox_crs`; só feições que o
+        intersectam são carregadas.
+    target_crs: O CRS de destino.
+    bbox_crs: O CRS de `bbox`.
+
+    Retorna:
+    Uma tupla (GeoDataFrame, crs_assumido), onde `crs_assumido` indica que a
+    camada não tinha CRS definido e `target_crs` foi atribuído a ela.
+
+    Levanta:
+    FileNotFoundError se o .zip não contém nenhum .shp; exceções de leitura e
+    reprojeção são propagadas sem tratamento.
+    """
+    extensao = _extensao(nome_arquivo)
+    if camada is None:
+        camada = listar_camadas(data, nome_arquivo)[0]
+
+    if extensao == 'parquet':
+        crs_origem = _crs_geoparquet(_metadados_geoparquet(data)['geo'])
+        gdf = _ler_geoparquet(data, colunas, _bbox_na_origem(bbox, bbox_crs, crs_origem or target_crs))
+    else:
+        import pyogrio
+
+        buffer, layer = _fonte_ogr(data, extensao, camada)
+        with _sem_aviso_extensao():
+            crs_origem = pyogrio.read_info(buffer, layer=layer)['crs'] if bbox is not None else None
+            gdf = pyogrio.read_dataframe(
+                buffer, layer=layer, columns=colunas,
+                bbox=_bbox_na_origem(bbox, bbox_crs, crs_origem or target_crs),
+            )
+
+    crs_assumido = False
+    if gdf.crs is None:
+        gdf.set_crs(target_crs, inplace=True, allow_override=True)
+        crs_assumido = True
+    elif gdf.crs.to_string() != target_crs:
+        gdf = gdf.to_crs(target_crs)
+    return gdf, crs_assumido
+
+
+def obter_geodados(data: bytes, nome_arquivo: str, camada: str = None, colunas: list = None, bbox: tuple = None,
+                   target_crs: str = "EPSG:4326", cache=None, content_hash: str = None) -> tuple:
+    """
+    Versão de `ler_geodados` com cache pelo hash do conteúdo, camada, colunas, bbox e CRS.
+
+    Argumentos:
+    cache: Um GeoCache opcional.
+    content_hash: O hash de `data`, se já calculado pelo chamador (ver `cache.hash_bytes`).
+    Os demais argumentos são os de `ler_geodados`.
+
+    Retorna:
+    Uma tupla (GeoDataFrame, crs_assumido). Com cache, o GeoDataFrame é uma
+    cópia rasa e pode ter colunas alteradas sem afetar o cache.
+    """
+    def carregar():
+        return ler_geodados(data, nome_arquivo, camada, colunas, bbox, target_crs)
+
+    if cache is None:
+        return carregar()
+    from pae_dashboard.cache import hash_bytes
+
+    if content_hash is None:
+        content_hash = hash_bytes(data)
+    key = (
+        "geodados", content_hash, _extensao(nome_arquivo), camada,
+        tuple(colunas) if colunas is not None else None,
+        tuple(bbox) if bbox is not None else None,
+        target_crs,
+    )
+    gdf, crs_assumido = cache.get_or_load(key, carregar)
+    return gdf.copy(deep=False), crs_assumido
@@ -0,0 +1,240 @@
+"""
+Figuras Plotly do dashboard.
+
+As funções recebem os DataFrames já calculados (PEs com contagens, séries de
+`pae_dashboard.chegadas`) e devolvem a figura pronta, sem depender do
+Streamlit; o Plotly só é importado na primeira figura montada.
+
+O gráfico realizado vs. esperado tem um modo agregado para muitos PEs (os de
+menor efetividade, em WebGL, ou totais por faixa de efetividade), e
+`CacheGrafico` reaproveita a figura entre reruns, trocando só os valores.
+"""
+
+import pandas as pd
+
+from pae_dashboard.chegadas import (
+    COL_CHEGADAS_MINUTO, COL_EFETIVIDADE_ACUMULADA, COL_MEDIA_MOVEL, COL_MINUTO, METAS_PADRAO
+)
+from pae_dashboard.efetividade import COL_EFETIVIDADE, COL_ESPERADAS, COL_PARTICIPANTES
+
+
+# Cores institucionais: 'primaria' (textos, esperados, efetividade), 'secundaria' (participantes, chegadas) e 'fundo'.
+PALETA_PADRAO = {'primaria': "#135D79", 'secundaria': "#169674", 'fundo': "#FFFFFF"}
+ALTURA_PADRAO_PX = 270
+
+# Gráfico realizado vs. esperado: um grupo de barras por PE até `LIMIAR_MODO_AGREGADO` PEs;
+# acima disso, só os `TOP_N_PADRAO` PEs de menor efetividade ou os totais por faixa de efetividade.
+MODO_INDIVIDUAL = 'individual'
+MODO_PIORES = 'piores'
+MODO_FAIXAS = 'faixas'
+LIMIAR_MODO_AGREGADO = 150
+TOP_N_PADRAO = 30
+FAIXAS_EFETIVIDADE = (0, 25, 50, 80, 100)
+ROTULOS_FAIXAS = [f"{inicio}–{fim}%" for inicio, fim in zip(FAIXAS_EFETIVIDADE, FAIXAS_EFETIVIDADE[1:])] + [
+    f"≥ {FAIXAS_EFETIVIDADE[-1]}%"
+]
+COL_PES_FAIXA = 'PEs'
+
+
+def _layout_padrao(fig, paleta: dict, altura: int):
+    fig.update_layout(
+        height=altura,
+        plot_bgcolor=paleta['fundo'], paper_bgcolor=paleta['fundo'],
+        font_color=paleta['primaria'],
+        xaxis=dict(tickfont=dict(color=paleta['primaria'])),
+        yaxis=dict(tickfont=dict(color=paleta['primaria'])),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1, font=dict(color=paleta['primaria'])),
+        margin=dict(t=20, b=0, l=0, r=0)
+    )
+    fig.update_yaxes(showgrid=True, gridwidth=0.5, gridcolor='LightGrey')
+    return fig
+
+
+def modo_realizado_esperado(n_pes: int, modo_agregado: str = MODO_PIORES,
+                            limiar_agregado: int = LIMIAR_MODO_AGREGADO) -> str:
+    """Modo do gráfico realizado vs. esperado: individual até `limiar_agregado` PEs, senão `modo_agregado`."""
+    return MODO_INDIVIDUAL if n_pes <= limiar_agregado else modo_agregado
+
+
+def dados_realizado_esperado(df_pe, modo: str = MODO_INDIVIDUAL, top_n: int = TOP_N_PADRAO):
+    """
+    Valores exibidos no gráfico realizado vs. esperado, por categoria do eixo x.
+
+    Argumentos:
+    df_pe: DataFrame de PEs indexado por 'Nome', com as colunas de contagem e de efetividade.
+    modo: `MODO_INDIVIDUAL` (um grupo de barras por PE), `MODO_PIORES` (os
+    `top_n` PEs de menor efetividade) ou `MODO_FAIXAS` (totais por faixa de efetividade).
+    top_n: Número de PEs do modo `MODO_PIORES`.
+
+    Retorna:
+    Um DataFrame indexado pela categoria, com as colunas de participantes e
+    esperados e uma coluna de detalhe para o hover (efetividade do PE ou
+    número de PEs da faixa; ausente no modo individual).
+    """
+    if modo == MODO_PIORES:
+        # Ordem estável: entre PEs empatados, vale a ordem original.
+        return df_pe[[COL_PARTICIPANTES, COL_ESPERADAS, COL_EFETIVIDADE]].sort_values(
+            COL_EFETIVIDADE, kind='stable'
+        ).head(top_n)
+    if modo == MODO_FAIXAS:
+        limites = list(FAIXAS_EFETIVIDADE) + [float('inf')]
+        faixas = pd.cut(df_pe[COL_EFETIVIDADE], limites, right=False, labels=ROTULOS_FAIXAS)
+        grupos = df_pe.groupby(faixas, observed=False)
+        dados = grupos[[COL_PARTICIPANTES, COL_ESPERADAS]].sum()
+        dados[COL_PES_FAIXA] = grupos.size()
+        return dados
+    if modo != MODO_INDIVIDUAL:
+        raise ValueError(f"Modo de gráfico desconhecido: {modo!r}")
+    return df_pe[[COL_PARTICIPANTES, COL_ESPERADAS]]
+
+
+def _figura_de_dados(dados, modo: str, paleta: dict, altura: int):
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    x = dados.index.astype(str).tolist()
+    cores = {COL_PARTICIPANTES: paleta['secundaria'], COL_ESPERADAS: paleta['primaria']}
+    for coluna in (COL_PARTICIPANTES, COL_ESPERADAS):
+        if modo == MODO_PIORES:
+            # Poucos pontos, mas em WebGL: o navegador não monta um elemento SVG por PE.
+            fig.add_trace(go.Scattergl(
+                x=x, y=dados[coluna].to_numpy(), name=coluna, mode='markers',
+                marker=dict(color=cores[coluna], size=10, symbol='circle' if coluna == COL_PARTICIPANTES else 'diamond'),
+                customdata=dados[COL_EFETIVIDADE].to_numpy(),
+                hovertemplate="%{x}<br>" + coluna + ": %{y:,}<br>Efetividade: %{customdata:.1f}%<extra></extra>"
+            ))
+        elif modo == MODO_FAIXAS:
+            fig.add_bar(
+                x=x, y=dados[coluna].to_numpy(), name=coluna, marker_color=cores[coluna],
+                customdata=dados[COL_PES_FAIXA].to_numpy(),
+                hovertemplate="Efetividade %{x}<br>" + coluna + ": %{y:,}<br>PEs: %{customdata:,}<extra></extra>"
+            )
+        else:
+            fig.add_bar(
+                x=x, y=dados[coluna].to_numpy(), name=coluna, marker_color=cores[coluna],
+                hovertemplate="%{x}<br>" + coluna + ": %{y:,}<extra></extra>"
+            )
+    fig.update_layout(
+        barmode='group', xaxis_title="Faixa de efetividade" if modo == MODO_FAIXAS else None,
+        yaxis_title="Número de Pessoas", legend_title_text=''
+    )
+    return _layout_padrao(fig, paleta, altura)
+
+
+def figura_realizado_esperado(df_pe, paleta: dict = PALETA_PADRAO, altura: int = ALTURA_PADRAO_PX,
+                              modo: str = None, top_n: int = TOP_N_PADRAO):
+    """
+    Gráfico de participantes realizados vs. esperados por PE.
+
+    Argumentos:
+    df_pe: DataFrame de PEs indexado por 'Nome', com as colunas de contagem e de efetividade.
+    paleta: Cores do gráfico (ver `PALETA_PADRAO`).
+    altura: Altura da figura, em pixels.
+    modo: Ver `dados_realizado_esperado`; None escolhe pelo número de PEs (ver `modo_realizado_esperado`).
+    top_n: Número de PEs do modo `MODO_PIORES`.
+
+    Retorna:
+    Uma plotly.graph_objects.Figure.
+    """
+    if modo is None:
+        modo = modo_realizado_esperado(len(df_pe))
+    return _figura_de_dados(dados_realizado_esperado(df_pe, modo, top_n), modo, paleta, altura)
+
+
+class CacheGrafico:
+    """
+    Figura do gráfico realizado vs. esperado, reaproveitada entre reruns.
+
+    A figura (traços, cores e layout) só é montada de novo quando mudam o
+    modo, a paleta, a altura ou o número de categorias; nos demais reruns,
+    só os valores alterados são trocados nos traços existentes.
+    `atualizadas` informa quantas barras (ou pontos) mudaram na última chamada.
+    """
+
+    def __init__(self):
+        self._figura = None
+        self._chave = None
+        self._dados = None
+        self.atualizadas = 0
+
+    def figura(self, df_pe, paleta: dict = PALETA_PADRAO, altura: int = ALTURA_PADRAO_PX,
+               modo: str = None, top_n: int = TOP_N_PADRAO):
+        """Retorna a figura de `df_pe` (ver `figura_realizado_esperado`), atualizando a anterior quando possível."""
+        if modo is None:
+            modo = modo_realizado_esperado(len(df_pe))
+        dados = dados_realizado_esperado(df_pe, modo, top_n)
+        chave = (modo, tuple(paleta.items()), altura, len(dados))
+        if self._figura is None or chave != self._chave:
+            self._figura = _figura_de_dados(dados, modo, paleta, altura)
+            self._chave = chave
+            self.atualizadas = len(dados) * 2
+        else:
+            self.atualizadas = self._atualizar(dados)
+        self._dados = dados
+        return self._figura
+
+    def _atualizar(self, dados) -> int:
+        anteriores = self._dados
+        mesmas_categorias = dados.index.equals(anteriores.index)
+        detalhe = [col for col in dados.columns if col not in (COL_PARTICIPANTES, COL_ESPERADAS)]
+        mudou_detalhe = bool(detalhe) and not (
+            mesmas_categorias and dados[detalhe[0]].equals(anteriores[detalhe[0]])
+        )
+        atualizadas = 0
+        with self._figura.batch_update():
+            for traco, coluna in zip(self._figura.data, (COL_PARTICIPANTES, COL_ESPERADAS)):
+                valores = dados[coluna].to_numpy()
+                if mesmas_categorias:
+                    alteradas = int((valores != anteriores[coluna].to_numpy()).sum())
+                else:
+                    traco.x = dados.index.astype(str).tolist()
+                    alteradas = len(valores)
+                if alteradas:
+                    traco.y = valores
+                    atualizadas += alteradas
+                if mudou_detalhe:
+                    traco.customdata = dados[detalhe[0]].to_numpy()
+        return atualizadas
+
+
+def figura_evolucao(por_minuto, acumulada, metas=METAS_PADRAO, janela_media_min: int = None,
+                    paleta: dict = PALETA_PADRAO, altura: int = ALTURA_PADRAO_PX):
+    """
+    Chegadas por minuto (barras e média móvel) com a efetividade geral acumulada num segundo eixo.
+
+    Argumentos:
+    por_minuto: Resultado de `SerieChegadas.chegadas_por_minuto`.
+    acumulada: Resultado de `SerieChegadas.efetividade_acumulada`.
+    metas: Percentuais de efetividade marcados com linhas de referência.
+    janela_media_min: Largura da média móvel, só para a legenda.
+    paleta: Cores do gráfico (ver `PALETA_PADRAO`).
+    altura: Altura da figura, em pixels.
+
+    Retorna:
+    Uma plotly.graph_objects.Figure.
+    """
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    fig.add_bar(
+        x=por_minuto[COL_MINUTO], y=por_minuto[COL_CHEGADAS_MINUTO], name=COL_CHEGADAS_MINUTO,
+        marker_color=paleta['secundaria'], opacity=0.6
+    )
+    fig.add_scatter(
+        x=por_minuto[COL_MINUTO], y=por_minuto[COL_MEDIA_MOVEL], mode='lines',
+        name=f"Média móvel ({janela_media_min} min)" if janela_media_min else "Média móvel",
+        line=dict(color=paleta['secundaria'])
+    )
+    fig.add_scatter(
+        x=acumulada[COL_MINUTO], y=acumulada[COL_EFETIVIDADE_ACUMULADA], mode='lines', line_shape='hv',
+        name="Efetividade geral (%)", line=dict(color=paleta['primaria'], width=2), yaxis='y2'
+    )
+    for meta in metas:
+        fig.add_hline(y=meta, yref='y2', line=dict(color='LightGrey', dash='dot'))
+    _layout_padrao(fig, paleta, altura)
+    fig.update_layout(
+        xaxis_title="Minutos desde o início", yaxis_title="Chegadas por minuto",
+        yaxis2=dict(title="Efetividade (%)", overlaying='y', side='right', rangemode='tozero',
+                    tickfont=dict(color=paleta['primaria'])),
+    )
+    return fig
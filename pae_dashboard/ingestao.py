@@ -0,0 +1,479 @@
+"""
+Recepção contínua de eventos de chegada aos PEs (leitores de crachá, tablets de campo).
+
+Os eventos chegam por um arquivo local só de acréscimo (NDJSON ou CSV) ou por
+um socket TCP local (NDJSON, um evento por linha). Cada evento tem o formato
+
+    {"id": "...", "pe": "PE-01", "delta": 3, "timestamp": "..."}
+    {"id": "...", "pe": "PE-01", "absolute": 42, "campo": "esperadas"}
+
+onde `campo` é 'participantes' (padrão) ou 'esperadas', e o valor vem em
+`delta` (incremento) ou `absolute` (valor total). O `id` é opcional e, quando
+presente, é usado para descartar eventos repetidos. O `timestamp` (segundos ou
+milissegundos desde a época, ou texto ISO 8601) é o momento da chegada; sem
+ele, vale o momento em que o evento foi consolidado.
+
+Leitores e consolidador rodam em threads próprias e se comunicam por uma fila
+limitada: se o consolidador não acompanhar, os leitores bloqueiam (o arquivo
+deixa de ser lido e o TCP segura o remetente), em vez de a memória crescer.
+O consolidador agrupa os eventos em lotes e os combina por PE e por segundo
+(`RESOLUCAO_MOMENTO_S`) do momento da chegada: numa leitura atrasada ou na
+releitura de um arquivo, as chegadas continuam distribuídas no tempo em que
+ocorreram, e não todas no momento da consolidação.
+
+Os eventos de um arquivo levam a posição (em bytes) do fim de sua linha, e
+cada lote guarda até onde leu cada arquivo. O exercício grava essa posição
+com as contagens (ver `compartilhado.ExercicioCompartilhado.sincronizar_ingestao`):
+depois de um reinício do servidor o arquivo é relido do início, mas os lotes
+até a posição gravada são pulados em vez de contados de novo. Para isso, o
+ingestor recebe as posições já gravadas (`cortes`) e fecha um lote em cada
+uma delas, de modo que nenhum lote fica metade antes e metade depois.
+"""
+
+import csv
+import datetime
+import io
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+
+CAMPOS_VALIDOS = ('participantes', 'esperadas')
+
+TAMANHO_FILA = 10_000
+TAMANHO_LOTE = 5_000
+INTERVALO_LOTE_S = 0.25
+INTERVALO_LEITURA_S = 0.2
+TAMANHO_BLOCO_LEITURA = 4 * 1024 * 1024
+MAX_IDS_VISTOS = 1_000_000
+MAX_LOTES_GUARDADOS = 2_000
+# Eventos de um mesmo PE e campo dentro deste intervalo são combinados numa só alteração.
+RESOLUCAO_MOMENTO_S = 1.0
+# Timestamps numéricos acima disto estão em milissegundos (1e11 s fica no ano 5138).
+LIMITE_TIMESTAMP_SEGUNDOS = 1e11
+PREFIXO_CURSOR_ARQUIVO = 'arquivo:'
+# Cursor da última versão do ingestor aplicada; só o da instância atual é mantido no armazém.
+PREFIXO_CURSOR_VERSAO = 'versao:'
+
+# Publicado por uma fonte para fechar o lote em formação (ver `FonteArquivo`).
+_CORTE = object()
+
+
+def combinar(anterior, novo):
+    """
+    Combina duas alterações consolidadas de um mesmo PE/campo.
+
+    Cada alteração é uma tupla (absoluto, delta, momento): `absoluto` é o
+    último valor total informado (ou None), `delta` a soma dos incrementos
+    posteriores a ele e `momento` o do último evento combinado.
+    """
+    if anterior is None or novo[0] is not None:
+        return novo
+    return anterior[0], anterior[1] + novo[1], max(anterior[2], novo[2])
+
+
+def resolver(alteracao, valor_atual: int) -> int:
+    """Converte uma alteração consolidada no novo valor absoluto da contagem (nunca negativo)."""
+    absoluto, delta = alteracao[:2]
+    base = valor_atual if absoluto is None else absoluto
+    return max(0, int(base) + int(delta))
+
+
+def interpretar_momento(valor):
+    """
+    Converte o `timestamp` de um evento em segundos desde a época.
+
+    Aceita números (segundos, ou milissegundos acima de
+    `LIMITE_TIMESTAMP_SEGUNDOS`) e texto ISO 8601; sem fuso horário, vale o
+    horário local do servidor.
+
+    Retorna:
+    O momento em segundos, ou None se o evento não tem timestamp.
+
+    Levanta:
+    ValueError se o timestamp não é reconhecido.
+    """
+    if valor is None or valor == '':
+        return None
+    if isinstance(valor, bool):
+        raise ValueError(f"timestamp inválido: {valor!r}")
+    try:
+        momento = float(valor)
+    except (TypeError, ValueError):
+        try:
+            momento = datetime.datetime.fromisoformat(str(valor).strip().replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            raise ValueError(f"timestamp inválido: {valor!r}") from None
+    return momento / 1000 if momento > LIMITE_TIMESTAMP_SEGUNDOS else momento
+
+
+def interpretar_evento(dados: dict):
+    """
+    Valida um evento já decodificado.
+
+    Retorna:
+    Uma tupla (id, pe, campo, absoluto, delta, momento), com o momento em
+    segundos desde a época ou None (ver `interpretar_momento`).
+
+    Levanta:
+    ValueError se o evento não tem PE, tem campo desconhecido, não traz
+    `delta` nem `absolute` ou tem timestamp inválido.
+    """
+    pe = dados.get('pe')
+    if pe in (None, ''):
+        raise ValueError("evento sem 'pe'")
+    campo = dados.get('campo') or 'participantes'
+    if campo not in CAMPOS_VALIDOS:
+        raise ValueError(f"campo desconhecido: {campo}")
+    absoluto = dados.get('absolute')
+    delta = dados.get('delta')
+    if absoluto in (None, ''):
+        if delta in (None, ''):
+            raise ValueError("evento sem 'delta' nem 'absolute'")
+        absoluto, delta = None, int(float(delta))
+    else:
+        absoluto, delta = int(float(absoluto)), 0
+    id_evento = dados.get('id')
+    if id_evento == '':
+        id_evento = None
+    return id_evento, str(pe), campo, absoluto, delta, interpretar_momento(dados.get('timestamp'))
+
+
+class IngestorEventos:
+    """
+    Consolida eventos de chegada vindos de uma ou mais fontes.
+
+    Os lotes consolidados ficam numerados por versão; cada sessão do dashboard
+    guarda a última versão que aplicou e pede apenas o que veio depois
+    (`alteracoes_desde`), de modo que várias sessões podem acompanhar o mesmo
+    ingestor.
+
+    Argumentos:
+    cortes: Cursores da ingestão já gravados ({chave: posições}, ver
+    `persistencia.cursores_gravados`); os lotes de cada arquivo são fechados
+    nessas posições.
+
+    Atributos:
+    identificador: Identifica esta instância (e sua numeração de versões); muda
+    a cada reinício do servidor.
+    """
+
+    def __init__(self, tamanho_fila: int = TAMANHO_FILA, tamanho_lote: int = TAMANHO_LOTE,
+                 intervalo_lote_s: float = INTERVALO_LOTE_S, cortes: dict = None):
+        self.fila = queue.Queue(maxsize=tamanho_fila)
+        self.tamanho_lote = tamanho_lote
+        self.intervalo_lote_s = intervalo_lote_s
+        self.identificador = uuid.uuid4().hex
+        self.versao = 0
+        self.recebidos = 0
+        self.duplicados = 0
+        self.invalidos = 0
+        self.ultimo_timestamp = None
+        self.cortes = {
+            chave[len(PREFIXO_CURSOR_ARQUIVO):]: frozenset(posicoes)
+            for chave, posicoes in (cortes or {}).items() if chave.startswith(PREFIXO_CURSOR_ARQUIVO)
+        }
+        self._lotes = deque(maxlen=MAX_LOTES_GUARDADOS)
+        self._ids_vistos = OrderedDict()
+        self._fontes = []
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._consolidar, name="ingestor-consolidador", daemon=True)
+        self._thread.start()
+
+    # --- Entrada ---
+
+    def publicar(self, evento, bloquear: bool = True, origem: tuple = None):
+        """
+        Enfileira um evento já interpretado; bloqueia enquanto a fila estiver cheia.
+
+        Argumentos:
+        evento: Tupla retornada por `interpretar_evento`.
+        origem: (fonte, posição) do evento num arquivo, ou None.
+        """
+        self.fila.put((*evento, origem), block=bloquear)
+
+    def cortar(self):
+        """Fecha o lote em formação: os eventos seguintes vão para outro lote."""
+        self.fila.put(_CORTE)
+
+    def publicar_linha(self, linha: str):
+        """Interpreta uma linha NDJSON e a enfileira; linhas inválidas são contadas e descartadas."""
+        linha = linha.strip()
+        if not linha:
+            return
+        try:
+            self.publicar(interpretar_evento(json.loads(linha)))
+        except (ValueError, TypeError, AttributeError):
+            self.invalidos += 1
+
+    def adicionar_fonte(self, fonte):
+        """Inicia uma fonte (`FonteArquivo` ou `FonteSocket`) que alimenta este ingestor."""
+        fonte.iniciar(self)
+        self._fontes.append(fonte)
+        return fonte
+
+    # --- Consolidação ---
+
+    def _visto(self, id_evento) -> bool:
+        if id_evento is None:
+            return False
+        if id_evento in self._ids_vistos:
+            return True
+        self._ids_vistos[id_evento] = None
+        if len(self._ids_vistos) > MAX_IDS_VISTOS:
+            self._ids_vistos.popitem(last=False)
+        return False
+
+    def _consolidar(self):
+        while not self._parar.is_set():
+            try:
+                primeiro = self.fila.get(timeout=self.intervalo_lote_s)
+            except queue.Empty:
+                continue
+            if primeiro is _CORTE:
+                continue
+            lote = [primeiro]
+            prazo = time.monotonic() + self.intervalo_lote_s
+            while len(lote) < self.tamanho_lote:
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    evento = self.fila.get(timeout=restante)
+                except queue.Empty:
+                    break
+                if evento is _CORTE:
+                    break
+                lote.append(evento)
+            self._processar_lote(lote)
+
+    def _processar_lote(self, lote):
+        alteracoes = {}
+        posicoes = {}
+        sem_origem = False
+        duplicados = 0
+        agora = time.time()
+        for id_evento, pe, campo, absoluto, delta, momento, origem in lote:
+            if origem is None:
+                sem_origem = True
+            else:
+                posicoes[origem[0]] = origem[1]
+            if self._visto(id_evento):
+                duplicados += 1
+                continue
+            if momento is None:
+                momento = agora
+            else:
+                self.ultimo_timestamp = momento
+            chave = (pe, campo, int(momento // RESOLUCAO_MOMENTO_S))
+            alteracoes[chave] = combinar(alteracoes.get(chave), (absoluto, delta, momento))
+        with self._lock:
+            self.recebidos += len(lote)
+            self.duplicados += duplicados
+            if alteracoes or posicoes:
+                # Um lote só de eventos repetidos ainda avança as posições dos arquivos.
+                self.versao += 1
+                self._lotes.append((self.versao, alteracoes, posicoes, sem_origem))
+
+    # --- Saída ---
+
+    def alteracoes_desde(self, versao: int, cursores: dict = None):
+        """
+        Retorna as alterações consolidadas posteriores a `versao`.
+
+        Argumentos:
+        versao: Última versão deste ingestor já aplicada.
+        cursores: Cursores da ingestão já gravados pelo exercício; os lotes
+        que só têm eventos de arquivos até a posição gravada são pulados.
+
+        Retorna:
+        Uma tupla (nova_versao, alteracoes, posicoes), com `alteracoes` no
+        formato {(pe, campo, intervalo): (absoluto, delta, momento)} (ver
+        `combinar`) e `posicoes` os novos cursores
+        dos arquivos lidos ({chave: posição}). Se a sessão ficou tanto tempo
+        sem consultar que lotes antigos foram descartados, recebe só os que restam.
+        """
+        cursores = cursores or {}
+        with self._lock:
+            lotes = [lote[1:] for lote in self._lotes if lote[0] > versao]
+            versao_atual = self.versao
+        combinadas = {}
+        novas_posicoes = {}
+        for alteracoes, posicoes, sem_origem in lotes:
+            chaves = {fonte: PREFIXO_CURSOR_ARQUIVO + fonte for fonte in posicoes}
+            aplicado = bool(posicoes) and not sem_origem and all(
+                posicao <= cursores.get(chaves[fonte], -1) for fonte, posicao in posicoes.items()
+            )
+            for fonte, posicao in posicoes.items():
+                novas_posicoes[chaves[fonte]] = max(posicao, novas_posicoes.get(chaves[fonte], 0))
+            if aplicado:
+                continue
+            for chave, alteracao in alteracoes.items():
+                combinadas[chave] = combinar(combinadas.get(chave), alteracao)
+        novas_posicoes = {
+            chave: posicao for chave, posicao in novas_posicoes.items() if posicao > cursores.get(chave, -1)
+        }
+        return versao_atual, combinadas, novas_posicoes
+
+    def estatisticas(self) -> dict:
+        return {
+            "versao": self.versao,
+            "recebidos": self.recebidos,
+            "duplicados": self.duplicados,
+            "invalidos": self.invalidos + sum(f.invalidos for f in self._fontes),
+            "na_fila": self.fila.qsize(),
+            "ultimo_timestamp": self.ultimo_timestamp,
+        }
+
+    def parar(self):
+        for fonte in self._fontes:
+            fonte.parar()
+        self._parar.set()
+
+
+class FonteArquivo:
+    """
+    Acompanha um arquivo local só de acréscimo (`tail -f`), em NDJSON ou CSV com cabeçalho.
+
+    O formato é deduzido pela extensão (.csv → CSV). Linhas incompletas no fim
+    do arquivo aguardam a próxima leitura; se o arquivo for truncado ou
+    substituído, a leitura recomeça do início.
+
+    Cada evento sai com a origem (fonte, posição do fim da linha). A fonte
+    identifica o arquivo pelo caminho e pelo inode, de modo que um arquivo
+    substituído (ou truncado) não herda as posições já gravadas do anterior.
+    """
+
+    def __init__(self, caminho: str, intervalo_s: float = INTERVALO_LEITURA_S, desde_inicio: bool = True):
+        self.caminho = caminho
+        self.intervalo_s = intervalo_s
+        self.desde_inicio = desde_inicio
+        self.csv = caminho.lower().endswith('.csv')
+        self.invalidos = 0
+        self._cabecalho = None
+        self._parar = threading.Event()
+        self._thread = None
+
+    def iniciar(self, ingestor: IngestorEventos):
+        self._thread = threading.Thread(target=self._ler, args=(ingestor,), name="ingestor-arquivo", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+
+    def _publicar(self, ingestor, linha: str, origem: tuple = None):
+        linha = linha.strip()
+        if not linha:
+            return
+        try:
+            if self.csv:
+                valores = next(csv.reader(io.StringIO(linha)))
+                if self._cabecalho is None:
+                    self._cabecalho = [col.strip() for col in valores]
+                    return
+                dados = dict(zip(self._cabecalho, (v.strip() for v in valores)))
+            else:
+                dados = json.loads(linha)
+            evento = interpretar_evento(dados)
+        except (ValueError, TypeError, AttributeError):
+            self.invalidos += 1
+            return
+        ingestor.publicar(evento, origem=origem)
+
+    def _ler(self, ingestor):
+        posicao = None
+        identidade = None
+        fonte = None
+        cortes = frozenset()
+        reinicios = 0
+        resto = b''
+        while not self._parar.is_set():
+            try:
+                info = os.stat(self.caminho)
+            except FileNotFoundError:
+                self._parar.wait(self.intervalo_s)
+                continue
+            if posicao is None:
+                posicao = 0 if self.desde_inicio else info.st_size
+            if identidade != (info.st_dev, info.st_ino) or info.st_size < posicao:
+                if identidade is not None:
+                    posicao, resto, self._cabecalho = 0, b'', None
+                    reinicios += identidade == (info.st_dev, info.st_ino)
+                identidade = (info.st_dev, info.st_ino)
+                fonte = f"{os.path.abspath(self.caminho)}@{info.st_dev}:{info.st_ino}"
+                if reinicios:
+                    fonte += f"#{reinicios}"
+                cortes = ingestor.cortes.get(fonte, frozenset())
+            if info.st_size > posicao:
+                with open(self.caminho, 'rb') as f:
+                    f.seek(posicao)
+                    bloco = f.read(TAMANHO_BLOCO_LEITURA)
+                fim = posicao - len(resto)
+                posicao += len(bloco)
+                *linhas, resto = (resto + bloco).split(b'\n')
+                for linha in linhas:
+                    fim += len(linha) + 1
+                    self._publicar(ingestor, linha.decode('utf-8', errors='replace'), (fonte, fim))
+                    if fim in cortes:
+                        ingestor.cortar()
+                    if self._parar.is_set():
+                        return
+                continue
+            self._parar.wait(self.intervalo_s)
+
+
+class _ReceptorLinhas(socketserver.StreamRequestHandler):
+    def handle(self):
+        for linha in self.rfile:
+            self.server.ingestor.publicar_linha(linha.decode('utf-8', errors='replace'))
+
+
+class _ServidorTCP(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class FonteSocket:
+    """
+    Servidor TCP local que recebe eventos NDJSON, um por linha.
+
+    Cada conexão é lida numa thread própria; enquanto a fila do ingestor
+    estiver cheia, a leitura para e o controle de fluxo do TCP segura o remetente.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', porta: int = 9100):
+        self.host = host
+        self.porta = porta
+        self.invalidos = 0
+        self._servidor = None
+
+    def iniciar(self, ingestor: IngestorEventos):
+        self._servidor = _ServidorTCP((self.host, self.porta), _ReceptorLinhas)
+        self._servidor.ingestor = ingestor
+        self.porta = self._servidor.server_address[1]
+        threading.Thread(target=self._servidor.serve_forever, name="ingestor-socket", daemon=True).start()
+
+    def parar(self):
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+
+
+def criar_fonte(endereco: str):
+    """
+    Cria a fonte de eventos a partir do endereço informado pelo usuário.
+
+    `tcp://host:porta` abre um servidor TCP local; qualquer outro valor é
+    tratado como o caminho de um arquivo NDJSON/CSV.
+    """
+    endereco = endereco.strip()
+    if endereco.startswith('tcp://'):
+        host, _, porta = endereco[len('tcp://'):].rpartition(':')
+        return FonteSocket(host or '127.0.0.1', int(porta))
+    return FonteArquivo(endereco)
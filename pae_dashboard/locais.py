@@ -0,0 +1,238 @@
+"""
+Exercícios com vários locais (simulados simultâneos em várias barragens).
+
+Cada local tem seus próprios PEs, ZAS e contagens, guardados num
+`ExercicioCompartilhado` próprio. Os dados de um local vêm de um único arquivo
+geográfico (Shapefile .zip, GeoPackage, FlatGeobuf ou GeoParquet) com o nome
+do local: a primeira camada de pontos são os PEs e a primeira de polígonos, a
+ZAS.
+
+A leitura e a reprojeção dos arquivos são feitas em paralelo, num pool de
+processos, e o resultado de cada arquivo fica no cache pelo hash do conteúdo:
+reenviar os mesmos arquivos, ou trocar o local em detalhe, não relê nada.
+`consolidar_locais` agrega as contagens de todos os locais por local.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from pae_dashboard.efetividade import COL_EFETIVIDADE, COL_ESPERADAS, COL_PARTICIPANTES, calcular_efetividade
+from pae_dashboard.relacao_zas import COL_DENTRO_ZAS
+
+
+COL_LOCAL = 'Local'
+COL_NUM_PES = 'PEs'
+COL_PES_DENTRO_ZAS = 'PEs dentro da ZAS'
+COLUNAS_NOME_PE = ('Nome', 'nome', 'NOME', 'Name', 'name', 'NAME')
+
+
+def nome_do_local(nome_arquivo: str) -> str:
+    """Nome do local a partir do nome do arquivo ('Barragem B1.gpkg' -> 'Barragem B1', 'b2.shp.zip' -> 'b2')."""
+    nome = os.path.basename(nome_arquivo)
+    while True:
+        nome, extensao = os.path.splitext(nome)
+        if not extensao:
+            return nome
+        if extensao.lower() not in ('.zip', '.shp', '.gpkg', '.fgb', '.parquet', '.geoparquet'):
+            return nome + extensao
+
+
+class Local:
+    """
+    PEs e ZAS de um local, lidos do arquivo do local.
+
+    Atributos:
+    nome: Nome do local.
+    conteudo_hash: Hash do arquivo de origem.
+    pes: DataFrame com ['Nome', 'Latitude', 'Longitude'].
+    zas: GeoDataFrame da ZAS em EPSG:4326, ou None.
+    zas_hash: Identificador das geometrias da ZAS (para os caches da ZAS), ou None.
+    crs_assumido: Camadas do arquivo sem CRS definido (WGS84 foi assumido).
+    """
+
+    def __init__(self, nome: str, conteudo_hash: str, pes: pd.DataFrame, zas=None, zas_hash: str = None,
+                 crs_assumido: list = None):
+        self.nome = nome
+        self.conteudo_hash = conteudo_hash
+        self.pes = pes
+        self.zas = zas
+        self.zas_hash = zas_hash
+        self.crs_assumido = list(crs_assumido or [])
+
+    def estimar_bytes(self) -> int:
+        from pae_dashboard.cache import estimar_bytes
+
+        return estimar_bytes(self.pes) + (estimar_bytes(self.zas) if self.zas is not None else 0)
+
+
+def _coluna_nome(gdf) -> str:
+    """Coluna com o nome dos PEs: uma das `COLUNAS_NOME_PE` ou a primeira coluna de texto (None se não há)."""
+    for coluna in COLUNAS_NOME_PE:
+        if coluna in gdf.columns:
+            return coluna
+    texto = [col for col in gdf.columns if col != gdf.geometry.name and pd.api.types.is_string_dtype(gdf[col])]
+    return texto[0] if texto else None
+
+
+def ler_local(data: bytes, nome_arquivo: str, conteudo_hash: str) -> Local:
+    """
+    Lê e reprojeta os PEs e a ZAS de um arquivo de local.
+
+    Roda nos processos do pool (ver `carregar_locais`); por isso recebe o
+    conteúdo do arquivo e não usa cache.
+
+    Levanta:
+    ValueError se o arquivo não tem nenhuma camada de pontos; as exceções de
+    leitura são propagadas sem tratamento.
+    """
+    from pae_dashboard.geodados import ler_geodados, listar_camadas
+    from pae_dashboard.pes import mapear_pes, pes_de_geodados
+
+    pes = zas = zas_hash = None
+    crs_assumido = []
+    for camada in listar_camadas(data, nome_arquivo):
+        gdf, assumido = ler_geodados(data, nome_arquivo, camada)
+        if gdf.empty:
+            continue
+        tipos = set(gdf.geometry.geom_type.dropna())
+        if pes is None and tipos <= {'Point'}:
+            df = pes_de_geodados(gdf)
+            coluna_nome = _coluna_nome(gdf)
+            if coluna_nome is None:
+                df['Nome'] = [f"PE-{i + 1:02d}" for i in range(len(df))]
+                coluna_nome = 'Nome'
+            pes = mapear_pes(df, coluna_nome, 'Latitude', 'Longitude')
+        elif zas is None and tipos <= {'Polygon', 'MultiPolygon'}:
+            from pae_dashboard.cache import hash_bytes
+
+            zas = gdf
+            zas_hash = hash_bytes(repr((conteudo_hash, camada)).encode())
+        else:
+            continue
+        if assumido:
+            crs_assumido.append(camada)
+    if pes is None:
+        raise ValueError("nenhuma camada de pontos (PEs) encontrada no arquivo")
+    return Local(nome_do_local(nome_arquivo), conteudo_hash, pes, zas, zas_hash, crs_assumido)
+
+
+def carregar_locais(arquivos: list, cache=None, executor=None) -> tuple:
+    """
+    Lê os arquivos dos locais, em paralelo no `executor` quando há mais de um a ler.
+
+    Argumentos:
+    arquivos: Lista de (nome_arquivo, conteúdo).
+    cache: Um GeoCache opcional; arquivos já lidos (pelo hash do conteúdo) não são relidos.
+    executor: Um `concurrent.futures.Executor` (tipicamente um ProcessPoolExecutor),
+    ou None para ler na thread atual.
+
+    Retorna:
+    Uma tupla ({nome do local: Local}, {nome do local: mensagem de erro}), na
+    ordem de `arquivos`. Arquivos com o mesmo nome de local (como 'B1.gpkg' e
+    'B1.zip') não são lidos: o local fica só com o erro.
+
+    Levanta:
+    concurrent.futures.BrokenExecutor se o `executor` quebrou (um processo do
+    pool terminou de forma anormal): ele não aceita mais tarefas e deve ser
+    substituído; nenhum arquivo é dado como lido.
+    """
+    from concurrent.futures import BrokenExecutor
+
+    from pae_dashboard.cache import hash_bytes
+
+    locais, erros, pendentes = {}, {}, []
+    arquivos_do_local = {}
+    for nome_arquivo, _ in arquivos:
+        arquivos_do_local.setdefault(nome_do_local(nome_arquivo), []).append(nome_arquivo)
+    for nome, nomes_arquivos in arquivos_do_local.items():
+        if len(nomes_arquivos) > 1:
+            erros[nome] = f"mais de um arquivo para o mesmo local ({', '.join(nomes_arquivos)}); envie só um"
+    for nome_arquivo, data in arquivos:
+        nome = nome_do_local(nome_arquivo)
+        if nome in erros:
+            continue
+        conteudo_hash = hash_bytes(data)
+        local = cache.get(("local", conteudo_hash, nome)) if cache is not None else None
+        locais[nome] = local
+        if local is None:
+            pendentes.append((nome, data, nome_arquivo, conteudo_hash))
+
+    if executor is not None and len(pendentes) > 1:
+        futuros = [(nome, executor.submit(ler_local, data, nome_arquivo, conteudo_hash))
+                   for nome, data, nome_arquivo, conteudo_hash in pendentes]
+        resultados = []
+        for nome, futuro in futuros:
+            try:
+                resultados.append((nome, futuro.result(), None))
+            except BrokenExecutor:
+                raise
+            except Exception as e:
+                resultados.append((nome, None, e))
+    else:
+        resultados = []
+        for nome, data, nome_arquivo, conteudo_hash in pendentes:
+            try:
+                resultados.append((nome, ler_local(data, nome_arquivo, conteudo_hash), None))
+            except Exception as e:
+                resultados.append((nome, None, e))
+
+    for nome, local, erro in resultados:
+        if erro is not None:
+            erros[nome] = str(erro)
+            continue
+        locais[nome] = local
+        if cache is not None:
+            cache.put(("local", local.conteudo_hash, nome), local)
+    return (
+        {nome: local for nome, local in locais.items() if local is not None},
+        {nome: erros[nome] for nome in arquivos_do_local if nome in erros},
+    )
+
+
+def consolidar_locais(df_por_local: dict) -> pd.DataFrame:
+    """
+    Agrega as contagens dos PEs de vários locais por local.
+
+    Argumentos:
+    df_por_local: {nome do local: DataFrame de PEs indexado por 'Nome', com as
+    colunas de contagem e, se o local tem ZAS, `COL_DENTRO_ZAS`}.
+
+    Retorna:
+    Um DataFrame indexado por `COL_LOCAL`, com o número de PEs, os totais de
+    participantes e esperados, a efetividade e o número de PEs dentro da ZAS
+    (vazio nos locais sem ZAS).
+    """
+    colunas = [COL_PARTICIPANTES, COL_ESPERADAS, COL_DENTRO_ZAS]
+    if not df_por_local:
+        return pd.DataFrame(
+            columns=[COL_NUM_PES, COL_PARTICIPANTES, COL_ESPERADAS, COL_EFETIVIDADE, COL_PES_DENTRO_ZAS],
+            index=pd.Index([], name=COL_LOCAL)
+        )
+    todos = pd.concat(
+        {nome: df.reindex(columns=colunas) for nome, df in df_por_local.items()}, names=[COL_LOCAL, 'Nome']
+    )
+    grupos = todos.groupby(level=COL_LOCAL, sort=False)
+    consolidado = grupos.agg(**{
+        COL_NUM_PES: (COL_PARTICIPANTES, 'size'),
+        COL_PARTICIPANTES: (COL_PARTICIPANTES, 'sum'),
+        COL_ESPERADAS: (COL_ESPERADAS, 'sum'),
+    })
+    consolidado[COL_EFETIVIDADE] = calcular_efetividade(
+        consolidado[COL_PARTICIPANTES].to_numpy(), consolidado[COL_ESPERADAS].to_numpy()
+    )
+    dentro = todos[COL_DENTRO_ZAS].astype('float64')
+    consolidado[COL_PES_DENTRO_ZAS] = dentro.groupby(level=COL_LOCAL, sort=False).sum(min_count=1)
+    return consolidado
+
+
+def totais_consolidados(consolidado: pd.DataFrame) -> dict:
+    """Totais gerais de um resultado de `consolidar_locais`: participantes, esperados e efetividade."""
+    participantes = int(consolidado[COL_PARTICIPANTES].sum())
+    esperadas = int(consolidado[COL_ESPERADAS].sum())
+    return {
+        COL_PARTICIPANTES: participantes,
+        COL_ESPERADAS: esperadas,
+        COL_EFETIVIDADE: float(calcular_efetividade(np.array([participantes]), np.array([esperadas]))[0]),
+    }
@@ -0,0 +1,507 @@
+"""
+Construção das camadas de marcadores dos Pontos de Encontro no mapa Folium.
+
+Há dois modos de renderização:
+- individual: um `folium.Marker` com popup e ícone próprios por PE, adequado
+  para algumas centenas de pontos;
+- agrupado: todos os PEs são enviados ao navegador num único bloco de dados,
+  os marcadores são criados em JavaScript e agrupados no cliente
+  (Leaflet.markercluster), e popups/tooltips só são montados quando abertos.
+
+Para o dashboard, os marcadores formam uma camada separada do mapa base
+(`camada_marcadores`), enviada com `st_folium(feature_group_to_add=...)`:
+quando só as contagens mudam, o mapa base (fundo e ZAS) não é recarregado no
+navegador, e no modo individual só o código dos marcadores alterados é regerado.
+
+Quando há uma ZAS carregada (colunas de `pae_dashboard.relacao_zas`), os PEs
+dentro dela mantêm a cor da efetividade, mas com um ícone de alerta, e o popup
+mostra a distância até o limite da ZAS.
+
+O folium só é importado no primeiro uso (montagem de um mapa ou acesso às
+classes de camada), para que quem usa o pacote sem desenhar mapas não pague
+pelo import.
+"""
+
+import functools
+import json
+
+from pae_dashboard.efetividade import (
+    COL_COR, COL_EFETIVIDADE, COL_ESPERADAS, COL_ICONE, COL_PARTICIPANTES, CORES, ICONES
+)
+from pae_dashboard.relacao_zas import COL_DENTRO_ZAS, COL_DISTANCIA_ZAS
+
+
+# Acima deste número de PEs o mapa passa para o modo agrupado.
+LIMIAR_MODO_AGRUPADO = 500
+
+# Cores de fundo dos ícones do Leaflet.awesome-markers, na ordem de `CORES`.
+CORES_HEX = {'red': '#d63e2a', 'orange': '#f69730', 'green': '#72b026', 'gray': '#575757'}
+
+# PEs dentro da ZAS mantêm a cor da efetividade, mas trocam o ícone por um alerta.
+ICONE_DENTRO_ZAS = 'warning-sign'
+
+# Mapa base: imagem de satélite da Esri e polígonos da ZAS em azul com contorno vermelho.
+ZOOM_INICIAL = 11
+TILES_PADRAO = "https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}"
+ATRIBUICAO_TILES_PADRAO = (
+    "Esri &mdash; Esri, i-cubed, USDA, USGS, AEX, GeoEye, Getmapping, Aerogrid, IGN, IGP, UPR-EGP, "
+    "and the GIS User Community"
+)
+ESTILO_ZAS = {'fillColor': '#00c5ff', 'color': '#e41a1c', 'weight': 0.7, 'fillOpacity': 0.5}
+
+
+def popup_html(nome, participantes, esperadas, efetividade, dentro_zas=None, distancia_zas=None) -> str:
+    """Conteúdo HTML do popup de um PE; a linha da ZAS só aparece quando há uma ZAS carregada."""
+    linha_zas = ""
+    if dentro_zas is not None:
+        situacao = "<span style=\"color: #d63e2a;\">dentro</span>" if dentro_zas else "fora"
+        linha_zas = f"<br>\n            <strong>ZAS:</strong> {situacao} (limite a {distancia_zas:,.0f} m)"
+    return f"""<div style="font-family: Arial, sans-serif; font-size: 12px;">
+            <strong>PE:</strong> {nome}<br>
+            <strong>Participantes:</strong> {participantes:,.0f}<br>
+            <strong>Esperados:</strong> {esperadas:,.0f}<br>
+            <strong>Efetividade:</strong> {efetividade:.2f}%{linha_zas}</div>"""
+
+
+def _colunas_marcador(df_pe) -> list:
+    """Colunas usadas para montar cada marcador individual; as da ZAS viram None quando ausentes."""
+    colunas = [
+        df_pe.index, df_pe['Latitude'], df_pe['Longitude'], df_pe[COL_PARTICIPANTES],
+        df_pe[COL_ESPERADAS], df_pe[COL_EFETIVIDADE], df_pe[COL_COR], df_pe[COL_ICONE],
+    ]
+    for col in (COL_DENTRO_ZAS, COL_DISTANCIA_ZAS):
+        colunas.append(df_pe[col] if col in df_pe.columns else [None] * len(df_pe))
+    return colunas
+
+
+def _script_marcador(nome, lat, lon, participantes, esperadas, efetividade, cor, icone,
+                     dentro_zas=None, distancia_zas=None) -> str:
+    """Código JavaScript que cria o marcador de um PE e o adiciona à variável `grupo`."""
+    if dentro_zas:
+        icone = ICONE_DENTRO_ZAS
+    popup = json.dumps(
+        popup_html(nome, participantes, esperadas, efetividade, dentro_zas, distancia_zas)
+    ).replace('</', '<\\/')
+    tooltip = json.dumps(f"<div>{nome} | Efetividade: {efetividade:.1f}%</div>").replace('</', '<\\/')
+    return (
+        f"L.marker([{float(lat)!r}, {float(lon)!r}], "
+        f"{{icon: L.AwesomeMarkers.icon({{markerColor: '{cor}', icon: '{icone}', prefix: 'glyphicon'}})}})"
+        f".bindPopup({popup}, {{maxWidth: 250}}).bindTooltip({tooltip}, {{sticky: true}}).addTo(grupo);"
+    )
+
+
+class CacheMarcadores:
+    """
+    Código JavaScript dos marcadores individuais, reaproveitado entre reruns.
+
+    O código de cada PE fica guardado junto com os valores que o geraram; a
+    cada chamada de `scripts` só é regerado o de PEs cuja posição, contagens ou
+    classificação mudaram. `regerados` informa quantos foram regerados na
+    última chamada.
+    """
+
+    def __init__(self):
+        self._marcadores = {}
+        self.regerados = 0
+
+    def scripts(self, df_pe) -> list:
+        """Retorna o código de todos os marcadores de `df_pe`, na ordem do DataFrame."""
+        atuais = {}
+        regerados = 0
+        for valores in zip(*_colunas_marcador(df_pe)):
+            anterior = self._marcadores.get(valores[0])
+            if anterior is not None and anterior[0] == valores:
+                atuais[valores[0]] = anterior
+            else:
+                atuais[valores[0]] = (valores, _script_marcador(*valores))
+                regerados += 1
+        self._marcadores = atuais
+        self.regerados = regerados
+        return [script for _, script in atuais.values()]
+
+
+@functools.lru_cache(maxsize=None)
+def _classes_folium() -> dict:
+    """Define, no primeiro uso, as camadas que estendem classes do folium."""
+    import folium
+    from branca.element import Element
+    from folium.elements import ElementAddToElement
+    from folium.plugins import MarkerCluster, VectorGridProtobuf
+    from folium.template import Template
+
+    class MarcadoresAgrupados(MarkerCluster):
+        """
+        Camada de PEs agrupados no cliente, com cor do grupo dada pelo pior PE.
+
+        Os dados vão para o HTML como colunas (uma lista por atributo), e os
+        marcadores são inseridos de uma vez com `addLayers`. A classe de cada PE é
+        o código da categoria de `CORES` (0 = pior); grupos só com PEs sem dados
+        ficam em cinza.
+        """
+
+        _template = Template(
+            """
+            {% macro script(this, kwargs) %}
+                var {{ this.get_name() }} = (function(){
+                    var d = {{ this.data|tojson }};
+                    var cores = {{ this.cores|tojson }};
+                    var icones = {{ this.icones|tojson }};
+                    var coresHex = {{ this.cores_hex|tojson }};
+                    var semDados = cores.length - 1;
+                    var iconesPorClasse = cores.map(function(cor, i) {
+                        return L.AwesomeMarkers.icon({markerColor: cor, icon: icones[i], prefix: 'glyphicon'});
+                    });
+                    var iconesDentroZas = cores.map(function(cor) {
+                        return L.AwesomeMarkers.icon({markerColor: cor, icon: {{ this.icone_dentro_zas|tojson }}, prefix: 'glyphicon'});
+                    });
+                    var fmt = function(v) { return Number(v).toLocaleString('en-US', {maximumFractionDigits: 0}); };
+                    var esc = function(s) {
+                        return String(s).replace(/[&<>"']/g, function(c) {
+                            return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+                        });
+                    };
+
+                    var cluster = L.markerClusterGroup({{ this.options|tojavascript }});
+                    cluster.options.iconCreateFunction = function(grupo) {
+                        var filhos = grupo.getAllChildMarkers();
+                        var pior = semDados;
+                        for (var j = 0; j < filhos.length; j++) {
+                            var classe = filhos[j].options.classe;
+                            if (classe < pior) { pior = classe; if (pior === 0) { break; } }
+                        }
+                        var n = grupo.getChildCount();
+                        var tamanho = n < 100 ? 34 : (n < 1000 ? 40 : 48);
+                        return L.divIcon({
+                            html: '<div style="background:' + coresHex[pior] + ';width:' + tamanho + 'px;height:' + tamanho
+                                + 'px;line-height:' + tamanho + 'px;border-radius:50%;border:2px solid #fff;color:#fff;'
+                                + 'font-weight:bold;text-align:center;box-shadow:0 0 4px rgba(0,0,0,.4);">' + n + '</div>',
+                            className: 'pe-cluster',
+                            iconSize: L.point(tamanho, tamanho)
+                        });
+                    };
+
+                    var marcadores = new Array(d.lat.length);
+                    for (var i = 0; i < d.lat.length; i++) {
+                        var icone = (d.zas && d.zas[i]) ? iconesDentroZas[d.classe[i]] : iconesPorClasse[d.classe[i]];
+                        var marcador = L.marker([d.lat[i], d.lon[i]], {icon: icone, classe: d.classe[i]});
+                        marcador.indice = i;
+                        marcador.bindTooltip(function(layer) {
+                            var k = layer.indice;
+                            return esc(d.nome[k]) + ' | Efetividade: ' + d.ef[k].toFixed(1) + '%';
+                        });
+                        marcador.bindPopup(function(layer) {
+                            var k = layer.indice;
+                            return '<div style="font-family: Arial, sans-serif; font-size: 12px;">'
+                                + '<strong>PE:</strong> ' + esc(d.nome[k]) + '<br>'
+                                + '<strong>Participantes:</strong> ' + fmt(d.part[k]) + '<br>'
+                                + '<strong>Esperados:</strong> ' + fmt(d.esp[k]) + '<br>'
+                                + '<strong>Efetividade:</strong> ' + d.ef[k].toFixed(2) + '%'
+                                + (d.zas ? '<br><strong>ZAS:</strong> '
+                                    + (d.zas[k] ? '<span style="color: #d63e2a;">dentro</span>' : 'fora')
+                                    + ' (limite a ' + fmt(d.dist_zas[k]) + ' m)' : '')
+                                + '</div>';
+                        }, {maxWidth: 250});
+                        marcadores[i] = marcador;
+                    }
+                    cluster.addLayers(marcadores);
+                    cluster.addTo({{ this._parent.get_name() }});
+                    return cluster;
+                })();
+            {% endmacro %}"""
+        )
+
+        def __init__(self, df_pe, name=None, **kwargs):
+            kwargs.setdefault("chunkedLoading", True)
+            super().__init__(name=name, **kwargs)
+            self._name = "MarcadoresAgrupados"
+            self.data = {
+                "lat": df_pe['Latitude'].round(6).tolist(),
+                "lon": df_pe['Longitude'].round(6).tolist(),
+                "nome": df_pe.index.astype(str).tolist(),
+                "part": df_pe[COL_PARTICIPANTES].tolist(),
+                "esp": df_pe[COL_ESPERADAS].tolist(),
+                "ef": df_pe[COL_EFETIVIDADE].round(2).tolist(),
+                "classe": df_pe[COL_COR].cat.codes.tolist(),
+            }
+            if COL_DENTRO_ZAS in df_pe.columns:
+                self.data["zas"] = df_pe[COL_DENTRO_ZAS].astype(int).tolist()
+                self.data["dist_zas"] = df_pe[COL_DISTANCIA_ZAS].round(0).fillna(0).tolist()
+            self.icone_dentro_zas = ICONE_DENTRO_ZAS
+            self.cores = list(CORES.categories)
+            self.icones = list(ICONES.categories)
+            self.cores_hex = [CORES_HEX[cor] for cor in self.cores]
+
+    class CamadaMarcadores(folium.FeatureGroup):
+        """FeatureGroup com marcadores individuais já convertidos em JavaScript (ver `CacheMarcadores`)."""
+
+        _template = Template(
+            """
+            {% macro script(this, kwargs) %}
+                var {{ this.get_name() }} = L.featureGroup(
+                    {{ this.options|tojavascript }}
+                );
+                (function(grupo) {
+                    {{ this.scripts|join('\n') }}
+                })({{ this.get_name() }});
+            {% endmacro %}
+            """
+        )
+
+        def __init__(self, scripts, name=None, **kwargs):
+            super().__init__(name=name, **kwargs)
+            self.scripts = scripts
+
+    class CamadaZasVetorial(VectorGridProtobuf):
+        """
+        ZAS em tiles vetoriais (ver `pae_dashboard.tiles_vetoriais`), com os atributos buscados no clique.
+
+        Os tiles trazem só o número de cada feição; ao clicar, os atributos são
+        pedidos em {url_atributos}/{id} e mostrados num popup.
+        """
+
+        _template = Template(
+            """
+            {% macro script(this, kwargs) -%}
+                var {{ this.get_name() }} = L.vectorGrid.protobuf(
+                    {{ this.url|tojson }},
+                    {{ this.options|tojavascript }}
+                );
+                {{ this.get_name() }}.on('click', function(e) {
+                    var esc = function(s) {
+                        return String(s).replace(/[&<>"']/g, function(c) {
+                            return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+                        });
+                    };
+                    var mapa = {{ this._parent.get_name() }};
+                    fetch({{ this.url_atributos|tojson }} + '/' + e.layer.properties.id)
+                        .then(function(r) { return r.json(); })
+                        .then(function(atributos) {
+                            var linhas = Object.keys(atributos).map(function(k) {
+                                return '<strong>' + esc(k) + ':</strong> ' + esc(atributos[k] === null ? '' : atributos[k]);
+                            });
+                            if (linhas.length) {
+                                L.popup({maxWidth: 300}).setLatLng(e.latlng)
+                                    .setContent('<div style="font-family: Arial, sans-serif; font-size: 12px;">'
+                                        + linhas.join('<br>') + '</div>')
+                                    .openOn(mapa);
+                            }
+                        });
+                });
+            {%- endmacro %}
+            """
+        )
+
+        def __init__(self, url, url_atributos, nome_camada, zoom_max, name=None, **kwargs):
+            super().__init__(url, name=name, options={
+                'vectorTileLayerStyles': {nome_camada: dict(ESTILO_ZAS, fill=True)},
+                'interactive': True,
+                'maxNativeZoom': zoom_max,
+                'rendererFactory': folium.JsCode('L.canvas.tile'),
+            }, **kwargs)
+            self._name = "CamadaZasVetorial"
+            self.url_atributos = url_atributos
+
+    class ScriptPronto(Element):
+        """Trecho de script já renderizado, incluído no mapa como texto (sem passar pelo jinja)."""
+
+        def __init__(self, texto):
+            super().__init__()
+            self.texto = texto
+
+        def render(self, **kwargs):
+            return self.texto
+
+    class CamadaZas(folium.map.Layer):
+        """
+        ZAS em GeoJSON, com estilo fixo e tooltip com os campos (ver `ZasLOD.geojson_texto_para`).
+
+        Faz o mesmo que um `folium.GeoJson` com `GeoJsonTooltip`, mas recebe o
+        GeoJSON já serializado e entra no mapa como texto pronto: a cada
+        reenvio do mapa, o `folium.GeoJson` serializava a ZAS duas vezes e o
+        branca compilava o script resultante (com a ZAS inteira) como template.
+        """
+
+        _template = Template(
+            """
+            {% macro script(this, kwargs) -%}
+                var {{ this.get_name() }} = L.geoJson(null, {
+                    style: function() { return {{ this.estilo|tojson }}; },
+                    {%- if this.campos %}
+                    onEachFeature: function(feature, layer) {
+                        var esc = function(s) {
+                            return String(s).replace(/[&<>"']/g, function(c) {
+                                return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+                            });
+                        };
+                        var campos = {{ this.campos|tojson }};
+                        layer.bindTooltip(function() {
+                            return '<table>' + campos.map(function(c) {
+                                var valor = feature.properties[c];
+                                return '<tr><th>' + esc(c) + ':</th><td>'
+                                    + esc(valor === null || valor === undefined ? '' : valor) + '</td></tr>';
+                            }).join('') + '</table>';
+                        }, {sticky: false});
+                    },
+                    {%- endif %}
+                });
+                {{ this.get_name() }}.addData({{ this.dados }});
+            {%- endmacro %}
+            """
+        )
+
+        def __init__(self, dados: str, campos: list, name=None, **kwargs):
+            super().__init__(name=name, overlay=True, **kwargs)
+            self._name = "CamadaZas"
+            self.dados = dados
+            self.campos = list(campos)
+            self.estilo = ESTILO_ZAS
+
+        def render(self, **kwargs):
+            # Como `Layer.render` e `MacroElement.render`, mas com o script incluído como texto pronto.
+            if self.show:
+                self.add_child(
+                    ElementAddToElement(element_name=self.get_name(), element_parent_name=self._parent.get_name()),
+                    name=self.get_name() + "_add",
+                )
+            self.get_root().script.add_child(
+                ScriptPronto(self._template.module.script(self, kwargs)), name=self.get_name()
+            )
+            for elemento in self._children.values():
+                elemento.render(**kwargs)
+
+    return {
+        'MarcadoresAgrupados': MarcadoresAgrupados, 'CamadaMarcadores': CamadaMarcadores,
+        'CamadaZasVetorial': CamadaZasVetorial, 'CamadaZas': CamadaZas,
+    }
+
+
+def __getattr__(nome):
+    if nome in ('MarcadoresAgrupados', 'CamadaMarcadores', 'CamadaZasVetorial', 'CamadaZas'):
+        return _classes_folium()[nome]
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+
+
+def adicionar_marcadores_individuais(m, df_pe):
+    """Adiciona um `folium.Marker` por PE ao mapa `m`."""
+    import folium
+
+    for idx_name, lat, lon, participantes, esperadas, efetividade, cor, icone, dentro_zas, distancia_zas in zip(
+        *_colunas_marcador(df_pe)
+    ):
+        folium.Marker(
+            location=[lat, lon],
+            popup=folium.Popup(
+                popup_html(idx_name, participantes, esperadas, efetividade, dentro_zas, distancia_zas), max_width=250
+            ),
+            tooltip=f"{idx_name} | Efetividade: {efetividade:.1f}%",
+            icon=folium.Icon(color=cor, icon=ICONE_DENTRO_ZAS if dentro_zas else icone, prefix='glyphicon')
+        ).add_to(m)
+
+
+def adicionar_marcadores(m, df_pe, limiar_agrupado: int = LIMIAR_MODO_AGRUPADO) -> str:
+    """
+    Adiciona os PEs ao mapa, escolhendo o modo de renderização pelo número de PEs.
+
+    Argumentos:
+    m: O mapa (ou FeatureGroup) Folium de destino.
+    df_pe: DataFrame de PEs com as colunas de contagem e de classificação.
+    limiar_agrupado: Acima deste número de PEs, usa o modo agrupado.
+
+    Retorna:
+    O modo usado: "individual" ou "agrupado".
+    """
+    if len(df_pe) > limiar_agrupado:
+        _classes_folium()['MarcadoresAgrupados'](df_pe, name="Pontos de Encontro").add_to(m)
+        return "agrupado"
+    adicionar_marcadores_individuais(m, df_pe)
+    return "individual"
+
+
+def camada_marcadores(df_pe, cache: CacheMarcadores = None, limiar_agrupado: int = LIMIAR_MODO_AGRUPADO):
+    """
+    Monta a camada de PEs separada do mapa base, para `st_folium(feature_group_to_add=...)`.
+
+    Argumentos:
+    df_pe: DataFrame de PEs com as colunas de contagem e de classificação.
+    cache: CacheMarcadores da sessão, usado no modo individual para regerar só
+    os marcadores alterados desde a chamada anterior.
+    limiar_agrupado: Acima deste número de PEs, usa o modo agrupado.
+
+    Retorna:
+    Um `folium.FeatureGroup` com os marcadores.
+    """
+    import folium
+
+    classes = _classes_folium()
+    if len(df_pe) > limiar_agrupado:
+        camada = folium.FeatureGroup(name="Pontos de Encontro")
+        classes['MarcadoresAgrupados'](df_pe).add_to(camada)
+        return camada
+    if cache is None:
+        cache = CacheMarcadores()
+    return classes['CamadaMarcadores'](cache.scripts(df_pe), name="Pontos de Encontro")
+
+
+def mapa_base(df_pe, zas_lod=None, zoom_start: int = ZOOM_INICIAL, tiles: str = TILES_PADRAO,
+              attr: str = ATRIBUICAO_TILES_PADRAO, zas_tiles: str = None, sobreposicao: tuple = None) -> tuple:
+    """
+    Monta o mapa base (fundo e ZAS), centrado na média das coordenadas dos PEs.
+
+    Argumentos:
+    df_pe: DataFrame de PEs com 'Latitude' e 'Longitude'.
+    zas_lod: Os níveis de detalhe da ZAS (ver `pae_dashboard.zas.obter_lods`), ou None.
+    zoom_start: Zoom inicial do mapa (define o nível de detalhe da ZAS enviado).
+    tiles, attr: URL e atribuição do mapa de fundo.
+    zas_tiles: Endereço de uma `PiramideZas` no servidor local de tiles; se
+    informado, a ZAS é desenhada a partir dos tiles vetoriais, no lugar de `zas_lod`.
+    sobreposicao: Uma imagem (png, limites, nome) desenhada sobre a ZAS, como a
+    área descoberta de `pae_dashboard.cobertura.Cobertura.imagem_descoberta`.
+
+    Retorna:
+    Uma tupla (mapa, controle_de_camadas), com o controle None quando não há ZAS.
+    """
+    import folium
+
+    m = folium.Map(
+        location=[df_pe['Latitude'].mean(), df_pe['Longitude'].mean()],
+        zoom_start=zoom_start,
+        tiles=tiles,
+        attr=attr
+    )
+    if zas_tiles is not None:
+        from pae_dashboard.tiles_vetoriais import NOME_CAMADA_MVT, ZOOM_MAX_VETORIAL
+
+        _classes_folium()['CamadaZasVetorial'](
+            f"{zas_tiles}/{{z}}/{{x}}/{{y}}.pbf", f"{zas_tiles}/atributos", NOME_CAMADA_MVT, ZOOM_MAX_VETORIAL,
+            name='Zona de Autossalvamento (ZAS)'
+        ).add_to(m)
+    elif zas_lod is not None:
+        _classes_folium()['CamadaZas'](
+            zas_lod.geojson_texto_para(zoom_start), zas_lod.campos_tooltip, name='Zona de Autossalvamento (ZAS)'
+        ).add_to(m)
+    else:
+        return m, None
+    if sobreposicao is not None:
+        import base64
+
+        png, limites, nome = sobreposicao
+        folium.raster_layers.ImageOverlay(
+            f"data:image/png;base64,{base64.b64encode(png).decode()}", bounds=[list(limites[0]), list(limites[1])],
+            name=nome, interactive=False
+        ).add_to(m)
+    return m, folium.LayerControl()
+
+
+def tamanho_script(elemento) -> int:
+    """
+    Bytes do script de um elemento do folium e dos seus filhos, sem renderizar o mapa inteiro.
+
+    Argumentos:
+    elemento: Um elemento já incluído num mapa (como a camada de marcadores depois do `st_folium`).
+
+    Retorna:
+    O tamanho, em bytes UTF-8, do código que o elemento e seus filhos acrescentam ao mapa.
+    """
+    script = elemento._template.module.__dict__.get('script')
+    tamanho = len(script(elemento, {}).encode('utf-8')) if script is not None else 0
+    return tamanho + sum(tamanho_script(filho) for filho in elemento._children.values())
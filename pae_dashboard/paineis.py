@@ -0,0 +1,83 @@
+"""
+Dependências entre os painéis do dashboard e as fontes de dados do exercício.
+
+Cada painel do dashboard é um fragmento que pode ser reexecutado sozinho. Aqui
+fica declarado de quais fontes de dados ('pes', 'zas', 'contagens') cada
+painel depende, para que uma alteração reexecute apenas os painéis afetados:
+uma mudança de contagem, por exemplo, não reconstrói a ZAS nem a barra
+lateral de entrada.
+
+O painel 'app' representa o script inteiro (entradas da barra lateral,
+seletores que dependem dos PEs e da ZAS); quando ele é afetado, os demais
+painéis são reexecutados junto com ele.
+
+`reexecutar_fragmentos` é o único ponto que usa a API interna do
+ScriptRunner do Streamlit; a versão do Streamlit fica fixada em
+requirements.txt e o caminho é coberto por tests/test_paineis.py.
+"""
+
+
+FONTES = ('pes', 'zas', 'contagens')
+
+PAINEL_APP = 'app'
+
+DEPENDENCIAS = {
+    PAINEL_APP: ('pes', 'zas'),
+    'contagens': ('contagens',),
+    'metricas': ('contagens',),
+    'pe_detalhe': ('contagens',),
+    'grafico': ('contagens',),
+    'evolucao': ('contagens',),
+    'mapa': ('contagens', 'zas'),
+}
+
+
+def fontes_alteradas(vistas: dict, atuais: dict) -> set:
+    """
+    Compara as versões das fontes vistas pela sessão com as atuais do exercício.
+
+    Argumentos:
+    vistas: {fonte: versão} registrado na última execução da sessão (pode estar vazio).
+    atuais: {fonte: versão} atual do exercício.
+
+    Retorna:
+    O conjunto de fontes cuja versão mudou.
+    """
+    return {fonte for fonte, versao in atuais.items() if vistas.get(fonte) != versao}
+
+
+def reexecutar_fragmentos(paineis: list):
+    """
+    Pede ao Streamlit a reexecução só dos fragmentos `paineis`, a partir do corpo de um fragmento.
+
+    O `st.rerun` público só aceita chaves de fragmentos em callbacks de
+    widgets; no corpo de um fragmento (a verificação periódica do exercício)
+    o pedido é montado com a API interna do ScriptRunner. Se ela mudar numa
+    versão do Streamlit, o erro é propagado em vez de virar, em silêncio, uma
+    reexecução do script inteiro.
+    """
+    from streamlit.runtime.scriptrunner import RerunData, get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    ctx.script_requests.request_rerun(RerunData(
+        query_string=ctx.query_string,
+        page_script_hash=ctx.page_script_hash,
+        fragment_id_queue=ctx.fragment_storage.resolve_target(paineis),
+        is_fragment_scoped_rerun=True,
+        cached_message_hashes=ctx.cached_message_hashes,
+        context_info=ctx.context_info,
+    ))
+
+
+def paineis_afetados(fontes, dependencias: dict = DEPENDENCIAS) -> list:
+    """
+    Retorna os painéis que dependem de alguma das `fontes`, na ordem de `dependencias`.
+
+    Se o painel 'app' for afetado, retorna apenas ['app'], já que a execução
+    completa do script redesenha todos os outros.
+    """
+    fontes = set(fontes)
+    afetados = [painel for painel, deps in dependencias.items() if fontes.intersection(deps)]
+    if PAINEL_APP in afetados:
+        return [PAINEL_APP]
+    return afetados
@@ -0,0 +1,243 @@
+"""
+Armazenamento durável das contagens em SQLite.
+
+Cada alteração de contagem é gravada numa tabela de eventos só de acréscimo
+(valor absoluto por PE e campo). De tempos em tempos é gravado um snapshot com
+o estado completo, e a carga do estado mais recente lê o último snapshot e
+reaplica apenas os eventos posteriores a ele.
+
+Junto com as contagens ficam os cursores da ingestão (até onde cada fonte de
+eventos já foi aplicada ao exercício), gravados na mesma transação: ao
+recarregar o exercício, os eventos já contados não são aplicados de novo.
+
+O banco usa WAL com `synchronous=NORMAL`: cada lote de alterações é uma única
+transação, sem fsync por commit, mantendo a latência por edição na casa dos
+milissegundos.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from pae_dashboard.ingestao import PREFIXO_CURSOR_VERSAO
+
+
+SNAPSHOT_A_CADA_EVENTOS = 500
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS eventos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    exercicio TEXT NOT NULL,
+    pe TEXT NOT NULL,
+    campo TEXT NOT NULL,
+    valor INTEGER NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS eventos_exercicio_id ON eventos (exercicio, id);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    exercicio TEXT NOT NULL,
+    ultimo_evento INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    estado TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_exercicio_id ON snapshots (exercicio, id);
+CREATE TABLE IF NOT EXISTS cursores_ingestao (
+    exercicio TEXT NOT NULL,
+    chave TEXT NOT NULL,
+    posicao INTEGER NOT NULL,
+    PRIMARY KEY (exercicio, chave)
+);
+"""
+
+
+def cursores_gravados(caminho: str) -> dict:
+    """
+    Lê os cursores da ingestão de todos os exercícios gravados em `caminho`.
+
+    Não cria o arquivo se ele não existe.
+
+    Retorna:
+    Um dicionário {chave: conjunto de posições}, com uma posição por exercício.
+    """
+    if not caminho or not os.path.exists(caminho):
+        return {}
+    conn = sqlite3.connect(caminho)
+    try:
+        linhas = conn.execute("SELECT chave, posicao FROM cursores_ingestao").fetchall()
+    except sqlite3.OperationalError:
+        # Banco de uma versão anterior, ainda sem a tabela.
+        linhas = []
+    finally:
+        conn.close()
+    cursores = {}
+    for chave, posicao in linhas:
+        cursores.setdefault(chave, set()).add(posicao)
+    return cursores
+
+
+class ArmazemContagens:
+    """
+    Log de eventos de contagem de um exercício, com snapshots periódicos.
+
+    Uma instância pode ser compartilhada entre threads (sessões do Streamlit):
+    o acesso à conexão é serializado por um lock.
+
+    Argumentos:
+    caminho: Caminho do arquivo SQLite (criado se não existir).
+    exercicio: Identificador do exercício; um mesmo arquivo guarda vários exercícios.
+    snapshot_a_cada: Número de eventos entre snapshots automáticos.
+    """
+
+    def __init__(self, caminho: str, exercicio: str, snapshot_a_cada: int = SNAPSHOT_A_CADA_EVENTOS):
+        self.caminho = caminho
+        self.exercicio = exercicio
+        self.snapshot_a_cada = snapshot_a_cada
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_ESQUEMA)
+        self._eventos_desde_snapshot = self._contar_eventos_desde_snapshot()
+
+    def _ultimo_snapshot(self):
+        return self._conn.execute(
+            "SELECT ultimo_evento, estado FROM snapshots WHERE exercicio = ? ORDER BY id DESC LIMIT 1",
+            (self.exercicio,)
+        ).fetchone()
+
+    def _contar_eventos_desde_snapshot(self) -> int:
+        snapshot = self._ultimo_snapshot()
+        ultimo_evento = snapshot[0] if snapshot else 0
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM eventos WHERE exercicio = ? AND id > ?",
+            (self.exercicio, ultimo_evento)
+        ).fetchone()[0]
+
+    def _carregar(self) -> dict:
+        snapshot = self._ultimo_snapshot()
+        estado = {}
+        ultimo_evento = 0
+        if snapshot:
+            ultimo_evento = snapshot[0]
+            for pe, campos in json.loads(snapshot[1]).items():
+                for campo, valor in campos.items():
+                    estado[(pe, campo)] = valor
+        linhas = self._conn.execute(
+            "SELECT pe, campo, valor FROM eventos WHERE exercicio = ? AND id > ? ORDER BY id",
+            (self.exercicio, ultimo_evento)
+        )
+        for pe, campo, valor in linhas:
+            estado[(pe, campo)] = valor
+        return estado
+
+    def carregar(self) -> dict:
+        """
+        Carrega o estado mais recente do exercício.
+
+        Retorna:
+        Um dicionário {(pe, campo): valor} com o último valor gravado de cada contagem.
+        """
+        with self._lock:
+            return self._carregar()
+
+    def historico(self, campo: str) -> list:
+        """
+        Lê todos os eventos gravados de um campo, em ordem de gravação.
+
+        Retorna:
+        Uma lista de tuplas (pe, valor, ts).
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT pe, valor, ts FROM eventos WHERE exercicio = ? AND campo = ? ORDER BY id",
+                (self.exercicio, campo)
+            ).fetchall()
+
+    def cursores_ingestao(self) -> dict:
+        """Retorna os cursores da ingestão gravados para o exercício ({chave: posição})."""
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT chave, posicao FROM cursores_ingestao WHERE exercicio = ?", (self.exercicio,)
+            ).fetchall())
+
+    def registrar(self, diff: dict, ts: float = None, cursores: dict = None):
+        """
+        Grava um lote de alterações numa única transação.
+
+        Argumentos:
+        diff: {nome_do_pe: {campo: valor_absoluto}}.
+        ts: Momento das alterações (padrão: agora, em segundos desde a época).
+        cursores: Cursores da ingestão ({chave: posição}) gravados na mesma
+        transação que as alterações que os avançaram.
+        """
+        if ts is None:
+            ts = time.time()
+        self.registrar_eventos(
+            [(pe, campo, valor, ts) for pe, campos in diff.items() for campo, valor in campos.items()], cursores
+        )
+
+    def registrar_eventos(self, eventos: list, cursores: dict = None):
+        """
+        Grava, numa única transação, alterações com o momento de cada uma.
+
+        Argumentos:
+        eventos: Lista de (pe, campo, valor_absoluto, ts), na ordem em que as
+        alterações foram aplicadas (o último valor de cada contagem é o atual).
+        cursores: Cursores da ingestão, como em `registrar`.
+        """
+        linhas = [(self.exercicio, str(pe), campo, int(valor), float(ts)) for pe, campo, valor, ts in eventos]
+        if not linhas and not cursores:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO eventos (exercicio, pe, campo, valor, ts) VALUES (?, ?, ?, ?, ?)", linhas
+                )
+                if cursores:
+                    self._conn.executemany(
+                        "INSERT INTO cursores_ingestao (exercicio, chave, posicao) VALUES (?, ?, ?) "
+                        "ON CONFLICT (exercicio, chave) DO UPDATE SET posicao = excluded.posicao",
+                        [(self.exercicio, chave, int(posicao)) for chave, posicao in cursores.items()]
+                    )
+                    versoes = [chave for chave in cursores if chave.startswith(PREFIXO_CURSOR_VERSAO)]
+                    if versoes:
+                        # A numeração de versões recomeça a cada instância do ingestor: as linhas das
+                        # instâncias anteriores não servem mais e deixariam a tabela crescer a cada reinício.
+                        self._conn.execute(
+                            "DELETE FROM cursores_ingestao WHERE exercicio = ? AND chave LIKE ? "
+                            f"AND chave NOT IN ({', '.join('?' * len(versoes))})",
+                            (self.exercicio, PREFIXO_CURSOR_VERSAO + '%', *versoes)
+                        )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._eventos_desde_snapshot += len(linhas)
+            if self._eventos_desde_snapshot >= self.snapshot_a_cada:
+                self._gravar_snapshot()
+
+    def _gravar_snapshot(self):
+        estado = {}
+        for (pe, campo), valor in self._carregar().items():
+            estado.setdefault(pe, {})[campo] = valor
+        ultimo_evento = self._conn.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM eventos WHERE exercicio = ?", (self.exercicio,)
+        ).fetchone()[0]
+        self._conn.execute(
+            "INSERT INTO snapshots (exercicio, ultimo_evento, ts, estado) VALUES (?, ?, ?, ?)",
+            (self.exercicio, ultimo_evento, time.time(), json.dumps(estado))
+        )
+        self._eventos_desde_snapshot = 0
+
+    def gravar_snapshot(self):
+        """Grava imediatamente um snapshot do estado atual do exercício."""
+        with self._lock:
+            self._gravar_snapshot()
+
+    def fechar(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,96 @@
+"""
+Carga dos Pontos de Encontro a partir de planilhas XLSX e arquivos geográficos.
+
+Reúne a leitura (ver `pae_dashboard.planilhas` e `pae_dashboard.geodados`) e o
+mapeamento das colunas escolhidas pelo usuário para o DataFrame de PEs usado
+no resto do pacote, com as colunas ['Nome', 'Latitude', 'Longitude']. Para o
+texto digitado ou colado, ver `pae_dashboard.texto_pes`.
+"""
+
+import pandas as pd
+
+
+COLUNAS_PES = ['Nome', 'Latitude', 'Longitude']
+
+
+def pes_de_geodados(gdf) -> pd.DataFrame:
+    """
+    Converte uma camada de pontos num DataFrame com 'Longitude' e 'Latitude' e os demais atributos.
+
+    Argumentos:
+    gdf: GeoDataFrame de pontos, já em coordenadas geográficas.
+
+    Retorna:
+    Um DataFrame com a geometria, as coordenadas dos pontos e os atributos da camada.
+    """
+    df = pd.DataFrame()
+    df['geometry'] = gdf.geometry
+    df['Longitude'] = gdf.geometry.x
+    df['Latitude'] = gdf.geometry.y
+    for col in gdf.columns:
+        if col not in ['geometry', 'Longitude', 'Latitude']:
+            df[col] = gdf[col]
+    return df
+
+
+def carregar_pes(data: bytes, nome_arquivo: str, tipo: str, camada: str = None, colunas: list = None,
+                 cache=None, content_hash: str = None, pasta_parquet: str = None) -> tuple:
+    """
+    Lê os dados brutos de PEs de um arquivo.
+
+    Argumentos:
+    data: O conteúdo do arquivo.
+    nome_arquivo: Nome do arquivo (a extensão define o formato geográfico).
+    tipo: "xlsx" ou "geo" (Shapefile .zip, GeoPackage, FlatGeobuf ou GeoParquet).
+    camada: Aba da planilha ou camada do arquivo geográfico (padrão: a primeira).
+    colunas: Colunas a carregar (None = todas).
+    cache: Um GeoCache opcional.
+    content_hash: O hash de `data`, se já calculado pelo chamador.
+    pasta_parquet: Pasta das cópias em Parquet das colunas lidas de planilhas
+    (ver `planilhas.obter_colunas`).
+
+    Retorna:
+    Uma tupla (DataFrame, crs_assumido), com `crs_assumido` True quando o
+    arquivo geográfico não tinha CRS e WGS84 foi assumido.
+
+    Levanta:
+    FileNotFoundError se o .zip não contém nenhum .shp; ValueError para um
+    `tipo` desconhecido; exceções de leitura são propagadas sem tratamento.
+    """
+    if tipo == "xlsx":
+        from pae_dashboard.planilhas import ler_cabecalho, obter_colunas
+
+        if content_hash is None and cache is not None:
+            from pae_dashboard.cache import hash_bytes
+
+            content_hash = hash_bytes(data)
+        if colunas is None:
+            colunas = ler_cabecalho(data, camada, cache=cache, content_hash=content_hash)
+        df = obter_colunas(data, colunas, camada, cache=cache, content_hash=content_hash, pasta_parquet=pasta_parquet)
+        return df, False
+    if tipo == "geo":
+        from pae_dashboard.geodados import obter_geodados
+
+        gdf, crs_assumido = obter_geodados(data, nome_arquivo, camada, colunas, cache=cache, content_hash=content_hash)
+        return pes_de_geodados(gdf), crs_assumido
+    raise ValueError(f"Tipo de arquivo de PEs desconhecido: {tipo}")
+
+
+def mapear_pes(df: pd.DataFrame, col_nome: str, col_latitude: str, col_longitude: str) -> pd.DataFrame:
+    """
+    Monta o DataFrame de PEs a partir das colunas escolhidas.
+
+    Linhas sem coordenadas são descartadas.
+
+    Retorna:
+    Um DataFrame com as colunas ['Nome', 'Latitude', 'Longitude'].
+
+    Levanta:
+    KeyError se alguma coluna não existe; ValueError se as coordenadas não são numéricas.
+    """
+    df_pe = pd.DataFrame({
+        'Nome': df[col_nome].astype(str),
+        'Latitude': pd.to_numeric(df[col_latitude]),
+        'Longitude': pd.to_numeric(df[col_longitude])
+    })
+    return df_pe.dropna(subset=['Latitude', 'Longitude'])
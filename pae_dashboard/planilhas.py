@@ -0,0 +1,397 @@
+"""
+Leitura de planilhas XLSX de PEs só com as colunas mapeadas.
+
+As planilhas de PEs costumam ter dezenas de colunas de atributos, das quais o
+dashboard usa três (Nome, Latitude e Longitude). Em vez de carregar a pasta de
+trabalho inteira num DataFrame a cada rerun:
+
+- os nomes das abas e o cabeçalho são lidos sozinhos, direto do XML, para
+  preencher os seletores de mapeamento (sem carregar a tabela de textos
+  compartilhados inteira, como o openpyxl faz ao abrir a pasta de trabalho);
+- depois do mapeamento, o XML da aba é lido em blocos direto do .xlsx (sem
+  descompactá-lo inteiro na memória) e só as células das colunas mapeadas são
+  decodificadas; as demais são puladas por uma busca em C (expressão regular),
+  sem criar objetos Python por célula. Planilhas com marcação incomum (prefixo
+  de namespace, células sem referência) são lidas pelo modo somente leitura
+  do openpyxl;
+- o DataFrame resultante fica no GeoCache, indexado pelo hash do arquivo, pela
+  aba e pelas colunas, e pode ser gravado em Parquet numa pasta local para que
+  cargas seguintes do mesmo arquivo (inclusive após reiniciar o app) não
+  precisem abrir o XLSX.
+"""
+
+import html
+import io
+import os
+import posixpath
+import re
+import zipfile
+from operator import itemgetter
+
+import pandas as pd
+
+
+# Bytes do XML da aba descompactados por vez.
+TAMANHO_BLOCO_XML = 8 * 1024 * 1024
+# Bytes da tabela de textos compartilhados descompactados por vez (a leitura para no maior índice usado).
+TAMANHO_BLOCO_COMPARTILHADAS = 256 * 1024
+
+_NS_PLANILHA = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_MARCACAO_INCOMUM = re.compile(rb'<\w+:c[ >/]|<c(?:>| (?!r="))')
+_TEXTO = re.compile(rb'<t(?: [^>]*)?>(.*?)</t>', re.S)
+_FONETICA = re.compile(rb'<rPh\b.*?</rPh>', re.S)
+_VALOR = re.compile(rb'<v>(.*?)</v>', re.S)
+_TIPO = re.compile(rb'\bt="(\w+)"')
+_TEXTO_COMPARTILHADO = re.compile(rb'<si>(.*?)</si>', re.S)
+
+
+class _MarcacaoIncomum(Exception):
+    """A aba usa uma marcação XML que a leitura direta não trata."""
+
+
+def _abrir(data: bytes):
+    import openpyxl
+
+    return openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+
+
+def _aba(workbook, aba: str = None):
+    planilha = workbook[aba] if aba else workbook.worksheets[0]
+    # Arquivos gerados por outros programas podem declarar dimensões erradas.
+    planilha.reset_dimensions()
+    return planilha
+
+
+def _nomes_colunas(cabecalho) -> list:
+    """Nomes das colunas como o pandas os daria ('Unnamed: i' para vazias, sufixo '.n' para repetidas)."""
+    nomes, vistos = [], {}
+    for i, valor in enumerate(cabecalho):
+        nome = f"Unnamed: {i}" if valor is None or str(valor).strip() == '' else str(valor)
+        if nome in vistos:
+            vistos[nome] += 1
+            nome = f"{nome}.{vistos[nome]}"
+        else:
+            vistos[nome] = 0
+        nomes.append(nome)
+    return nomes
+
+
+def _em_cache(cache, key, loader):
+    return loader() if cache is None else cache.get_or_load(key, loader)
+
+
+def listar_abas(data: bytes, cache=None, content_hash: str = None) -> list:
+    """
+    Retorna os nomes das abas da pasta de trabalho.
+
+    Argumentos:
+    data: O conteúdo do arquivo XLSX.
+    cache: Um GeoCache opcional.
+    content_hash: O hash de `data` (obrigatório para usar o cache).
+    """
+    def carregar():
+        import xml.etree.ElementTree as ET
+
+        with zipfile.ZipFile(io.BytesIO(data)) as arquivo_zip:
+            workbook = ET.fromstring(arquivo_zip.read('xl/workbook.xml'))
+        return [el.get('name') for el in workbook.find(f'{_NS_PLANILHA}sheets')]
+
+    if content_hash is None:
+        return carregar()
+    return _em_cache(cache, ("planilha_abas", content_hash), carregar)
+
+
+def ler_cabecalho(data: bytes, aba: str = None, cache=None, content_hash: str = None) -> list:
+    """
+    Retorna os nomes das colunas da aba (primeira linha), sem ler as demais linhas.
+
+    Argumentos:
+    aba: A aba (padrão: a primeira).
+    data, cache, content_hash: Como em `listar_abas`.
+    """
+    def carregar():
+        try:
+            primeira_linha = _ler_primeira_linha_xml(data, aba)
+        except _MarcacaoIncomum:
+            workbook = _abrir(data)
+            try:
+                primeira_linha = next(_aba(workbook, aba).iter_rows(max_row=1, values_only=True), ())
+            finally:
+                workbook.close()
+        return _nomes_colunas(primeira_linha)
+
+    if content_hash is None:
+        return carregar()
+    return _em_cache(cache, ("planilha_cabecalho", content_hash, aba), carregar)
+
+
+def _caminho_aba(arquivo_zip, aba: str = None) -> str:
+    """Caminho, dentro do .xlsx, do XML da aba (a primeira, se `aba` for None)."""
+    import xml.etree.ElementTree as ET
+
+    workbook = ET.fromstring(arquivo_zip.read('xl/workbook.xml'))
+    abas = workbook.find(f'{_NS_PLANILHA}sheets')
+    elemento = next(el for el in abas if aba is None or el.get('name') == aba)
+    relacoes = ET.fromstring(arquivo_zip.read('xl/_rels/workbook.xml.rels'))
+    alvo = next(rel.get('Target') for rel in relacoes if rel.get('Id') == elemento.get(f'{_NS_REL}id'))
+    return alvo.lstrip('/') if alvo.startswith('/') else posixpath.normpath(posixpath.join('xl', alvo))
+
+
+def _letra_coluna(indice: int) -> str:
+    letras = ''
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+
+def _texto(conteudo: bytes) -> str:
+    """Texto de um <si> ou <is> (concatenando as partes com formatação, sem as fonéticas)."""
+    return html.unescape(b''.join(_TEXTO.findall(_FONETICA.sub(b'', conteudo))).decode('utf-8'))
+
+
+def _numero(texto: bytes):
+    # Como o pandas, valores inteiros viram int (um nome "101" não vira "101.0").
+    if any(caractere in texto for caractere in b'.eE'):
+        valor = float(texto)
+        return int(valor) if valor.is_integer() and abs(valor) < 2 ** 53 else valor
+    return int(texto)
+
+
+def _valor_celula(atributos: bytes, conteudo: bytes):
+    """
+    Valor de uma célula <c> a partir dos seus atributos e conteúdo.
+
+    Retorna:
+    O valor, ('s', índice) para um texto compartilhado (resolvido depois, ver
+    `_resolver_compartilhadas`), ou None para células vazias e erros.
+    """
+    tipo = _TIPO.search(atributos)
+    tipo = tipo.group(1) if tipo else b'n'
+    if tipo == b'inlineStr':
+        return _texto(conteudo)
+    v = _VALOR.search(conteudo) if conteudo else None
+    if v is None or tipo == b'e':
+        return None
+    v = v.group(1)
+    if tipo == b's':
+        return ('s', int(v))
+    if tipo == b'b':
+        return v == b'1'
+    if tipo in (b'str', b'd'):
+        return html.unescape(v.decode('utf-8'))
+    return _numero(v)
+
+
+def _resolver_compartilhadas(arquivo_zip, linhas):
+    """Troca, no lugar, os ('s', índice) das `linhas` (listas) pelos textos compartilhados."""
+    indices = {valor[1] for linha in linhas for valor in linha if type(valor) is tuple}
+    if not indices:
+        return
+    # A tabela é lida em blocos só até o maior índice usado (no cabeçalho, em geral, os primeiros).
+    ultimo = max(indices)
+    tabela = []
+    with arquivo_zip.open('xl/sharedStrings.xml') as xml:
+        resto = b''
+        while len(tabela) <= ultimo:
+            bloco = xml.read(TAMANHO_BLOCO_COMPARTILHADAS)
+            if not bloco:
+                break
+            texto = resto + bloco
+            corte = texto.rfind(b'</si>') + len(b'</si>') if b'</si>' in texto else 0
+            tabela.extend(_TEXTO_COMPARTILHADO.findall(texto, 0, corte))
+            resto = texto[corte:]
+    textos = {indice: _texto(tabela[indice]) for indice in indices}
+    for linha in linhas:
+        for i, valor in enumerate(linha):
+            if type(valor) is tuple:
+                linha[i] = textos[valor[1]]
+
+
+def _ler_primeira_linha_xml(data: bytes, aba: str = None) -> list:
+    """
+    Valores da linha 1 da aba, lendo o XML só até o fim dessa linha.
+
+    Levanta:
+    _MarcacaoIncomum se a aba usa marcação que esta leitura não trata.
+    """
+    celula = re.compile(rb'<c r="([A-Z]+)1"([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+    with zipfile.ZipFile(io.BytesIO(data)) as arquivo_zip:
+        with arquivo_zip.open(_caminho_aba(arquivo_zip, aba)) as xml:
+            texto = b''
+            while True:
+                bloco = xml.read(64 * 1024)
+                texto += bloco
+                fim = texto.find(b'</row>')
+                if fim >= 0 or not bloco:
+                    break
+        linha = texto[:fim] if fim >= 0 else texto
+        if _MARCACAO_INCOMUM.search(linha):
+            raise _MarcacaoIncomum()
+        if not re.search(rb'<row [^>]*\br="1"', linha):
+            return []
+        valores = {}
+        for letras, atributos, conteudo in celula.findall(linha):
+            indice = 0
+            for letra in letras:
+                indice = indice * 26 + letra - ord('A') + 1
+            valores[indice - 1] = _valor_celula(atributos, conteudo)
+        primeira_linha = [valores.get(i) for i in range(max(valores) + 1)] if valores else []
+        _resolver_compartilhadas(arquivo_zip, [primeira_linha])
+    # Como no openpyxl, células vazias no fim da linha não contam como colunas.
+    while primeira_linha and primeira_linha[-1] is None:
+        primeira_linha.pop()
+    return primeira_linha
+
+
+def _ler_colunas_xml(data: bytes, posicoes: list, aba: str = None) -> list:
+    """
+    Lê as células das colunas nas `posicoes` (base 0) direto do XML da aba.
+
+    Retorna:
+    A lista de linhas (tuplas na ordem de `posicoes`) a partir da segunda
+    linha da aba, sem as linhas em que todas essas células estão vazias.
+
+    Levanta:
+    _MarcacaoIncomum se a aba usa marcação que esta leitura não trata.
+    """
+    letras = [_letra_coluna(posicao) for posicao in posicoes]
+    coluna_de = {letra.encode(): i for i, letra in enumerate(letras)}
+    celula = re.compile(
+        rb'<c r="(' + b'|'.join(coluna_de) + rb')(\d+)"([^>]*?)(?:/>|>(.*?)</c>)', re.S
+    )
+
+    valores = {}
+    with zipfile.ZipFile(io.BytesIO(data)) as arquivo_zip:
+        with arquivo_zip.open(_caminho_aba(arquivo_zip, aba)) as xml:
+            resto = b''
+            while True:
+                bloco = xml.read(TAMANHO_BLOCO_XML)
+                texto = resto + bloco
+                if bloco:
+                    # Só linhas completas são processadas; o restante vai para o próximo bloco.
+                    corte = texto.rfind(b'</row>') + len(b'</row>') if b'</row>' in texto else 0
+                    texto, resto = texto[:corte], texto[corte:]
+                if _MARCACAO_INCOMUM.search(texto):
+                    raise _MarcacaoIncomum()
+                for letra, linha, atributos, conteudo in celula.findall(texto):
+                    linha = int(linha)
+                    if linha < 2:
+                        continue
+                    valor = _valor_celula(atributos, conteudo)
+                    if valor is None:
+                        continue
+                    valores.setdefault(linha, [None] * len(letras))[coluna_de[letra]] = valor
+                if not bloco:
+                    break
+
+        _resolver_compartilhadas(arquivo_zip, valores.values())
+
+    return [tuple(valores[linha]) for linha in sorted(valores)]
+
+
+def _ler_colunas_openpyxl(data: bytes, posicoes: list, aba: str = None) -> list:
+    """Como `_ler_colunas_xml`, percorrendo as linhas no modo somente leitura do openpyxl."""
+    workbook = _abrir(data)
+    try:
+        planilha = _aba(workbook, aba)
+        # Só o intervalo de colunas que contém as mapeadas é percorrido.
+        primeira, ultima = min(posicoes), max(posicoes)
+        indices = [p - primeira for p in posicoes]
+        extrair = itemgetter(*indices) if len(indices) > 1 else (lambda linha: (linha[indices[0]],))
+        largura = ultima - primeira + 1
+        linhas = []
+        for linha in planilha.iter_rows(min_row=2, min_col=primeira + 1, max_col=ultima + 1, values_only=True):
+            if len(linha) < largura:
+                linha = tuple(linha) + (None,) * (largura - len(linha))
+            valores = extrair(linha)
+            if any(valor is not None for valor in valores):
+                linhas.append(valores)
+        return linhas
+    finally:
+        workbook.close()
+
+
+def ler_colunas(data: bytes, colunas: list, aba: str = None) -> pd.DataFrame:
+    """
+    Lê só as `colunas` da aba.
+
+    Argumentos:
+    data: O conteúdo do arquivo XLSX.
+    colunas: Nomes das colunas a ler (como retornados por `ler_cabecalho`).
+    aba: A aba (padrão: a primeira).
+
+    Retorna:
+    Um DataFrame com as `colunas`, na ordem pedida. Linhas inteiramente vazias
+    são ignoradas. Na leitura direta do XML, datas vêm como o número de série
+    do Excel.
+
+    Levanta:
+    KeyError se alguma coluna não existir na aba.
+    """
+    colunas = list(dict.fromkeys(colunas))
+    cabecalho = ler_cabecalho(data, aba)
+    faltando = [col for col in colunas if col not in cabecalho]
+    if faltando:
+        raise KeyError(f"Colunas não encontradas na planilha: {', '.join(faltando)}")
+    posicoes = [cabecalho.index(col) for col in colunas]
+    try:
+        linhas = _ler_colunas_xml(data, posicoes, aba)
+    except _MarcacaoIncomum:
+        linhas = _ler_colunas_openpyxl(data, posicoes, aba)
+    return pd.DataFrame.from_records(linhas, columns=colunas)
+
+
+def _para_parquet(df: pd.DataFrame, caminho: str):
+    """Grava `df` em Parquet de forma atômica; colunas com tipos misturados são gravadas como texto."""
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object and df[col].dropna().map(type).nunique() > 1:
+            df[col] = df[col].map(lambda valor: None if valor is None else str(valor))
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    df.to_parquet(temporario, index=False)
+    os.replace(temporario, caminho)
+
+
+def obter_colunas(data: bytes, colunas: list, aba: str = None, cache=None, content_hash: str = None,
+                  pasta_parquet: str = None) -> pd.DataFrame:
+    """
+    Versão de `ler_colunas` com cache pelo hash do arquivo, pela aba e pelas colunas.
+
+    Argumentos:
+    cache: Um GeoCache opcional.
+    content_hash: O hash de `data`, se já calculado pelo chamador (ver `cache.hash_bytes`).
+    pasta_parquet: Pasta onde o resultado é gravado em Parquet e procurado nas
+        cargas seguintes (None = sem cópia em disco).
+    Os demais argumentos são os de `ler_colunas`.
+
+    Retorna:
+    Um DataFrame que pode ser alterado sem afetar o cache.
+    """
+    from pae_dashboard.cache import hash_bytes
+
+    if content_hash is None:
+        content_hash = hash_bytes(data)
+    colunas = list(dict.fromkeys(colunas))
+
+    def carregar():
+        if not pasta_parquet:
+            return ler_colunas(data, colunas, aba)
+        caminho = os.path.join(pasta_parquet, f"{content_hash}_{hash_bytes(repr((aba, colunas)).encode())}.parquet")
+        if os.path.exists(caminho):
+            return pd.read_parquet(caminho)
+        df = ler_colunas(data, colunas, aba)
+        try:
+            os.makedirs(pasta_parquet, exist_ok=True)
+            _para_parquet(df, caminho)
+        except (OSError, ValueError, TypeError, ImportError):
+            # A cópia em Parquet é só uma otimização; sem ela, o XLSX é lido de novo na próxima carga.
+            pass
+        return df
+
+    if cache is None:
+        return carregar()
+    key = ("planilha", content_hash, aba, tuple(colunas), pasta_parquet)
+    return cache.get_or_load(key, carregar).copy()
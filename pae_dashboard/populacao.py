@@ -0,0 +1,319 @@
+"""
+Cálculo das pessoas esperadas por PE a partir de pontos de população.
+
+Cadastros de moradores e trabalhadores da ZAS (um ponto geocodificado por
+pessoa, domicílio ou estabelecimento, opcionalmente com o número de pessoas
+do ponto) são atribuídos ao PE mais próximo. O arquivo é lido em blocos, e
+cada bloco é projetado para um CRS métrico e atribuído aos PEs; só os totais
+por PE são acumulados, de modo que a memória não cresce com o tamanho do
+arquivo.
+
+A busca do PE mais próximo usa uma grade sobre a área dos PEs em que cada
+célula guarda a lista (curta) de PEs que podem ser o mais próximo de algum
+ponto da célula; cada ponto é então comparado só com esses candidatos, em
+operações vetorizadas do NumPy. Pontos fora da grade, ou em células com
+candidatos demais, são resolvidos por um índice STRtree.
+
+Formatos aceitos: CSV (separador ',', ';' ou tabulação; com ';' a vírgula é
+tratada como separador decimal) e Parquet.
+"""
+
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+
+
+TAMANHO_BLOCO = 500_000
+
+# Células da grade de candidatos por PE (células menores, listas de candidatos mais curtas).
+CELULAS_POR_PE = 4
+# Mínimo de células da grade (com poucos PEs numa área grande, as listas de candidatos ficam curtas).
+MIN_CELULAS_GRADE = 4_096
+# Limite de PEs candidatos por célula da grade; células acima dele usam o STRtree.
+MAX_CANDIDATOS_CELULA = 32
+# Pontos comparados de uma vez com os candidatos (limita a matriz de distâncias).
+TAMANHO_LOTE_GRADE = 100_000
+EXTENSOES_PARQUET = ('.parquet', '.pq')
+
+
+def _eh_parquet(nome_arquivo: str) -> bool:
+    return nome_arquivo.lower().endswith(EXTENSOES_PARQUET)
+
+
+def _formato_csv(data: bytes) -> dict:
+    """Deduz o separador (e o separador decimal) a partir do início do arquivo."""
+    inicio = data[:65536].decode('utf-8', errors='replace')
+    primeira_linha = inicio.splitlines()[0] if inicio else ''
+    try:
+        separador = csv.Sniffer().sniff(primeira_linha, delimiters=',;\t').delimiter
+    except csv.Error:
+        separador = ','
+    return {'sep': separador, 'decimal': ',' if separador == ';' else '.'}
+
+
+def ler_colunas(data: bytes, nome_arquivo: str) -> list:
+    """Retorna os nomes das colunas do arquivo de população, lendo só o cabeçalho."""
+    if _eh_parquet(nome_arquivo):
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(io.BytesIO(data)).schema_arrow.names
+    return pd.read_csv(io.BytesIO(data), nrows=0, **_formato_csv(data)).columns.tolist()
+
+
+def ler_blocos(data: bytes, nome_arquivo: str, colunas: list, tamanho_bloco: int = TAMANHO_BLOCO):
+    """
+    Lê o arquivo de população em blocos, só com as `colunas` pedidas.
+
+    Retorna:
+    Um iterador de DataFrames com no máximo `tamanho_bloco` linhas cada.
+    """
+    if _eh_parquet(nome_arquivo):
+        import pyarrow.parquet as pq
+
+        for lote in pq.ParquetFile(io.BytesIO(data)).iter_batches(batch_size=tamanho_bloco, columns=colunas):
+            yield lote.to_pandas()
+        return
+    yield from pd.read_csv(io.BytesIO(data), usecols=colunas, chunksize=tamanho_bloco, **_formato_csv(data))
+
+
+class AtribuidorPEs:
+    """
+    Índices espaciais dos PEs para a busca do PE mais próximo.
+
+    Argumentos:
+    latitudes, longitudes: Coordenadas dos PEs (EPSG:4326).
+    crs_metrico: CRS métrico das contas (padrão: o UTM estimado a partir dos PEs).
+    extensao: (xmin, ymin, xmax, ymax), no CRS métrico, da área em que estão os
+    pontos a atribuir; a grade de candidatos passa a cobri-la também.
+    distancia_maxima_m: Se informada, pontos mais distantes que isso de qualquer
+    PE nunca são atribuídos, e os PEs além dela não entram nas listas de
+    candidatos (células longe de todos os PEs ficam sem candidatos).
+    """
+
+    def __init__(self, latitudes, longitudes, crs_metrico=None, extensao: tuple = None, distancia_maxima_m: float = None):
+        import geopandas
+        import shapely
+        from pyproj import Transformer
+
+        pes = geopandas.GeoSeries(geopandas.points_from_xy(longitudes, latitudes), crs="EPSG:4326")
+        self.crs_metrico = crs_metrico if crs_metrico is not None else pes.estimate_utm_crs()
+        self.transformador = Transformer.from_crs("EPSG:4326", self.crs_metrico, always_xy=True)
+        geometrias = pes.to_crs(self.crs_metrico).values.to_numpy()
+        self.x = shapely.get_x(geometrias)
+        self.y = shapely.get_y(geometrias)
+        self.arvore = shapely.STRtree(geometrias)
+        self.distancia_maxima_m = distancia_maxima_m
+        self._montar_grade(extensao)
+
+    def _montar_grade(self, extensao: tuple = None):
+        """
+        Monta a grade de candidatos, com `CELULAS_POR_PE` células por PE, sobre
+        a área dos PEs (e a `extensao`, se informada).
+
+        Para uma célula de centro `c` e meia-diagonal `h`, com `d` a distância
+        de `c` ao PE mais próximo, nenhum PE a mais de `d + 2h` de `c` pode ser
+        o mais próximo de um ponto da célula; os demais são os candidatos.
+        """
+        import shapely
+
+        xmin, ymin, xmax, ymax = self.x.min(), self.y.min(), self.x.max(), self.y.max()
+        if extensao is not None:
+            xmin, ymin = min(xmin, extensao[0]), min(ymin, extensao[1])
+            xmax, ymax = max(xmax, extensao[2]), max(ymax, extensao[3])
+        margem = max(xmax - xmin, ymax - ymin) * 0.1 + 1.0
+        self.x0, self.y0 = xmin - margem, ymin - margem
+        largura = xmax - xmin + 2 * margem
+        altura = ymax - ymin + 2 * margem
+        self.lado = max(np.sqrt(largura * altura / max(CELULAS_POR_PE * len(self.x), MIN_CELULAS_GRADE)), 1.0)
+        self.nx = int(np.ceil(largura / self.lado))
+        self.ny = int(np.ceil(altura / self.lado))
+
+        ix, iy = np.meshgrid(np.arange(self.nx), np.arange(self.ny))
+        centros = shapely.points(self.x0 + (ix.ravel() + 0.5) * self.lado, self.y0 + (iy.ravel() + 0.5) * self.lado)
+        _, distancia_centro = self.arvore.query_nearest(centros, return_distance=True, all_matches=False)
+        raio = distancia_centro + self.lado * np.sqrt(2)
+        if self.distancia_maxima_m:
+            # Um PE a mais de `distancia_maxima_m` mais a meia-diagonal do centro está longe demais de toda a célula.
+            raio = np.minimum(raio, self.distancia_maxima_m + self.lado / np.sqrt(2))
+        celulas, candidatos = self.arvore.query(centros, predicate='dwithin', distance=raio)
+
+        contagem = np.bincount(celulas, minlength=len(centros))
+        largura_tabela = int(min(max(contagem.max(), 1), MAX_CANDIDATOS_CELULA))
+        ordem = np.argsort(celulas, kind='stable')
+        celulas, candidatos = celulas[ordem], candidatos[ordem]
+        posicao = np.arange(len(celulas)) - (np.cumsum(contagem) - contagem)[celulas]
+        cabe = posicao < largura_tabela
+        self.candidatos = np.full((len(centros), largura_tabela), -1, dtype=np.int64)
+        self.candidatos[celulas[cabe], posicao[cabe]] = candidatos[cabe]
+        self.celula_excedente = contagem > largura_tabela
+        self.num_candidatos = np.minimum(contagem, largura_tabela)
+
+    def _atribuir_pela_grade(self, x, y, indices, distancias, selecao):
+        celula = ((y[selecao] - self.y0) // self.lado).astype(np.int64) * self.nx + \
+            ((x[selecao] - self.x0) // self.lado).astype(np.int64)
+        # Pontos em células sem candidatos (longe de todos os PEs, ver `distancia_maxima_m`) ficam sem PE.
+        com_candidatos = self.num_candidatos[celula] > 0
+        selecao, celula = selecao[com_candidatos], celula[com_candidatos]
+        for inicio in range(0, len(selecao), TAMANHO_LOTE_GRADE):
+            lote = selecao[inicio:inicio + TAMANHO_LOTE_GRADE]
+            celulas_lote = celula[inicio:inicio + TAMANHO_LOTE_GRADE]
+            # A tabela é cortada no maior número de candidatos entre as células do lote.
+            candidatos = self.candidatos[celulas_lote, :self.num_candidatos[celulas_lote].max()]
+            dx = self.x[candidatos] - x[lote, None]
+            dy = self.y[candidatos] - y[lote, None]
+            d2 = dx * dx + dy * dy
+            d2[candidatos < 0] = np.inf
+            melhor = d2.argmin(axis=1)
+            linhas = np.arange(len(lote))
+            indices[lote] = candidatos[linhas, melhor]
+            distancias[lote] = np.sqrt(d2[linhas, melhor])
+
+    def atribuir(self, latitudes, longitudes, distancia_maxima_m: float = None) -> tuple:
+        """
+        Encontra o PE mais próximo de cada ponto.
+
+        Retorna:
+        Uma tupla (indices, distancias): a posição do PE de cada ponto (-1 se
+        não houver PE a até `distancia_maxima_m`) e a distância em metros (NaN
+        se o ponto está além da `distancia_maxima_m` do atribuidor).
+        """
+        x, y = self.transformador.transform(np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float))
+        return self.atribuir_xy(x, y, distancia_maxima_m)
+
+    def atribuir_xy(self, x, y, distancia_maxima_m: float = None) -> tuple:
+        """Como `atribuir`, para pontos já no `crs_metrico`."""
+        import shapely
+
+        limites = [d for d in (self.distancia_maxima_m, distancia_maxima_m) if d]
+        distancia_maxima_m = min(limites) if limites else None
+
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        indices = np.full(len(x), -1, dtype=np.int64)
+        distancias = np.full(len(x), np.nan)
+
+        ix = np.floor((x - self.x0) / self.lado)
+        iy = np.floor((y - self.y0) / self.lado)
+        na_grade = (ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny)
+        na_grade[na_grade] = ~self.celula_excedente[(iy[na_grade] * self.nx + ix[na_grade]).astype(np.int64)]
+        self._atribuir_pela_grade(x, y, indices, distancias, np.flatnonzero(na_grade))
+
+        restantes = np.flatnonzero(~na_grade)
+        if len(restantes):
+            pares, dist = self.arvore.query_nearest(
+                shapely.points(x[restantes], y[restantes]), return_distance=True, all_matches=False,
+                max_distance=self.distancia_maxima_m
+            )
+            indices[restantes[pares[0]]] = pares[1]
+            distancias[restantes[pares[0]]] = dist
+
+        if distancia_maxima_m:
+            indices[distancias > distancia_maxima_m] = -1
+        return indices, distancias
+
+
+class ResultadoPopulacao:
+    """
+    Totais de pessoas por PE calculados a partir de um arquivo de população.
+
+    Atributos:
+    totais: Série de pessoas esperadas (inteiros) indexada pelos nomes dos PEs.
+    pontos_lidos: Linhas lidas do arquivo.
+    pontos_invalidos: Linhas sem coordenadas ou peso numéricos, descartadas.
+    pessoas_sem_pe: Pessoas de pontos sem PE dentro da distância máxima.
+    distancia_media_m: Distância média (ponderada pelas pessoas) até o PE atribuído.
+    """
+
+    def __init__(self, totais: pd.Series, pontos_lidos: int, pontos_invalidos: int,
+                 pessoas_sem_pe: float, distancia_media_m: float):
+        self.totais = totais
+        self.pontos_lidos = pontos_lidos
+        self.pontos_invalidos = pontos_invalidos
+        self.pessoas_sem_pe = pessoas_sem_pe
+        self.distancia_media_m = distancia_media_m
+
+    def estimar_bytes(self) -> int:
+        return int(self.totais.memory_usage(deep=True, index=True))
+
+
+def atribuir_populacao(data: bytes, nome_arquivo: str, df_pe: pd.DataFrame, col_lat: str, col_lon: str,
+                       col_pessoas: str = None, distancia_maxima_m: float = None,
+                       tamanho_bloco: int = TAMANHO_BLOCO) -> ResultadoPopulacao:
+    """
+    Atribui cada ponto de população ao PE mais próximo e soma as pessoas por PE.
+
+    Argumentos:
+    data: Conteúdo do arquivo de população.
+    nome_arquivo: Nome do arquivo (a extensão define o formato).
+    df_pe: DataFrame de PEs indexado por 'Nome', com 'Latitude' e 'Longitude'.
+    col_lat, col_lon: Colunas de coordenadas (WGS84) do arquivo.
+    col_pessoas: Coluna com o número de pessoas de cada ponto (None = 1 por ponto).
+    distancia_maxima_m: Pontos mais distantes que isso de qualquer PE não são atribuídos.
+    tamanho_bloco: Linhas lidas por bloco.
+
+    Retorna:
+    Um ResultadoPopulacao.
+    """
+    atribuidor = AtribuidorPEs(df_pe['Latitude'].to_numpy(), df_pe['Longitude'].to_numpy())
+    colunas = [col_lat, col_lon] + ([col_pessoas] if col_pessoas else [])
+    formato = {} if _eh_parquet(nome_arquivo) else {'decimal': _formato_csv(data)['decimal']}
+
+    totais = np.zeros(len(df_pe), dtype=np.float64)
+    pontos_lidos = pontos_invalidos = 0
+    pessoas_sem_pe = soma_distancias = 0.0
+    for bloco in ler_blocos(data, nome_arquivo, colunas, tamanho_bloco):
+        pontos_lidos += len(bloco)
+        valores = [_para_numero(bloco[col], **formato) for col in colunas]
+        pessoas = valores[2] if col_pessoas else np.ones(len(bloco))
+        validos = np.isfinite(valores[0]) & np.isfinite(valores[1]) & np.isfinite(pessoas)
+        pontos_invalidos += int((~validos).sum())
+        indices, distancias = atribuidor.atribuir(valores[0][validos], valores[1][validos], distancia_maxima_m)
+        pessoas = pessoas[validos]
+        atribuidos = indices >= 0
+        totais += np.bincount(indices[atribuidos], weights=pessoas[atribuidos], minlength=len(df_pe))
+        pessoas_sem_pe += float(pessoas[~atribuidos].sum())
+        soma_distancias += float((distancias[atribuidos] * pessoas[atribuidos]).sum())
+
+    pessoas_atribuidas = float(totais.sum())
+    return ResultadoPopulacao(
+        pd.Series(np.round(totais).astype(np.int64), index=df_pe.index),
+        pontos_lidos,
+        pontos_invalidos,
+        pessoas_sem_pe,
+        soma_distancias / pessoas_atribuidas if pessoas_atribuidas else float('nan'),
+    )
+
+
+def _para_numero(serie: pd.Series, decimal: str = '.') -> np.ndarray:
+    """Converte uma coluna lida como texto (ou já numérica) em floats; valores inválidos viram NaN."""
+    if serie.dtype == object or pd.api.types.is_string_dtype(serie):
+        serie = serie.str.strip()
+        if decimal == ',':
+            serie = serie.str.replace(',', '.', regex=False)
+    return pd.to_numeric(serie, errors='coerce').to_numpy(dtype=float)
+
+
+def obter_populacao(data: bytes, nome_arquivo: str, df_pe: pd.DataFrame, col_lat: str, col_lon: str,
+                    col_pessoas: str = None, distancia_maxima_m: float = None,
+                    cache=None, content_hash: str = None) -> ResultadoPopulacao:
+    """
+    Versão de `atribuir_populacao` com cache pelo hash do arquivo, pelo mapeamento de colunas e pelos PEs.
+
+    Argumentos:
+    cache: Um GeoCache opcional.
+    content_hash: Hash já calculado do conteúdo (evita recalcular).
+    Os demais argumentos são os de `atribuir_populacao`.
+    """
+    def carregar():
+        return atribuir_populacao(data, nome_arquivo, df_pe, col_lat, col_lon, col_pessoas, distancia_maxima_m)
+
+    if cache is None:
+        return carregar()
+    from pae_dashboard.cache import hash_bytes
+
+    if content_hash is None:
+        content_hash = hash_bytes(data)
+    hash_pes = hash_bytes(pd.util.hash_pandas_object(df_pe[['Latitude', 'Longitude']], index=True).to_numpy().tobytes())
+    key = ("populacao", content_hash, hash_pes, col_lat, col_lon, col_pessoas, distancia_maxima_m or None)
+    return cache.get_or_load(key, carregar)
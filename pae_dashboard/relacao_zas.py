@@ -0,0 +1,173 @@
+"""
+Relação espacial entre os Pontos de Encontro e a Zona de Autossalvamento.
+
+Para cada PE, indica se ele está dentro da ZAS e a distância, em metros, até o
+limite da ZAS. As contas são feitas num CRS métrico (UTM estimado a partir da
+ZAS) com dois índices espaciais STRtree, construídos uma única vez por ZAS:
+
+- um sobre as partes poligonais, que filtra os candidatos do teste de
+  pertinência, feito depois contra os polígonos preparados (sem percorrer
+  todos os vértices a cada ponto);
+- outro sobre o contorno dissolvido da ZAS, quebrado em trechos curtos, para
+  que a busca do trecho mais próximo de cada PE seja logarítmica, e não
+  proporcional ao número de vértices.
+"""
+
+import numpy as np
+
+
+COL_DENTRO_ZAS = 'Dentro da ZAS'
+COL_DISTANCIA_ZAS = 'Distância ao Limite da ZAS (m)'
+
+# Número de segmentos por trecho do contorno indexado.
+SEGMENTOS_POR_TRECHO = 16
+
+
+class IndiceZAS:
+    """
+    Índices espaciais da ZAS num CRS métrico.
+
+    Argumentos:
+    crs_metrico: CRS métrico em que os índices foram construídos.
+    poligonos: Array de partes poligonais da ZAS (no CRS métrico).
+    trechos: Array de trechos de linha do contorno dissolvido da ZAS.
+    vertices: Número de vértices da ZAS original.
+    """
+
+    def __init__(self, crs_metrico, poligonos, trechos, vertices: int):
+        import shapely
+
+        self.crs_metrico = crs_metrico
+        self.poligonos = poligonos
+        self.trechos = trechos
+        self.vertices = vertices
+        shapely.prepare(poligonos)
+        self.arvore_poligonos = shapely.STRtree(poligonos)
+        self.arvore_trechos = shapely.STRtree(trechos)
+
+    def relacionar(self, latitudes, longitudes) -> tuple:
+        """
+        Relaciona pontos em WGS84 com a ZAS.
+
+        Argumentos:
+        latitudes, longitudes: Coordenadas dos pontos (EPSG:4326).
+
+        Retorna:
+        Uma tupla (dentro, distancia) de arrays: `dentro` é True para pontos
+        dentro da ZAS (ou sobre o limite) e `distancia` é a distância em metros
+        até o limite da ZAS (NaN se a ZAS não tiver contorno).
+        """
+        import shapely
+        from pyproj import Transformer
+
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        transformador = Transformer.from_crs("EPSG:4326", self.crs_metrico, always_xy=True)
+        x, y = (np.asarray(v) for v in transformador.transform(longitudes, latitudes))
+        pontos = shapely.points(x, y)
+
+        dentro = np.zeros(len(pontos), dtype=bool)
+        distancia = np.full(len(pontos), np.nan)
+        if len(pontos) == 0:
+            return dentro, distancia
+        if len(self.poligonos):
+            # A árvore só filtra pelos envelopes; o teste exato usa os polígonos preparados.
+            indices_pontos, indices_poligonos = self.arvore_poligonos.query(pontos)
+            acertos = shapely.intersects_xy(self.poligonos[indices_poligonos], x[indices_pontos], y[indices_pontos])
+            dentro[indices_pontos[acertos]] = True
+        if len(self.trechos):
+            indices, distancias = self.arvore_trechos.query_nearest(pontos, return_distance=True, all_matches=False)
+            distancia[indices[0]] = distancias
+        return dentro, distancia
+
+    def estimar_bytes(self) -> int:
+        # Geometrias no CRS métrico (16 bytes por vértice) mais os nós das duas árvores.
+        import shapely
+
+        vertices = int(shapely.get_num_coordinates(self.poligonos).sum() + shapely.get_num_coordinates(self.trechos).sum())
+        return vertices * 16 + (len(self.poligonos) + len(self.trechos)) * 200
+
+
+def _trechos_do_contorno(contorno, segmentos_por_trecho: int):
+    """Quebra as linhas de `contorno` em trechos de até `segmentos_por_trecho` segmentos."""
+    import shapely
+
+    trechos = []
+    for linha in shapely.get_parts(contorno):
+        coords = shapely.get_coordinates(linha)
+        for inicio in range(0, len(coords) - 1, segmentos_por_trecho):
+            trechos.append(shapely.linestrings(coords[inicio:inicio + segmentos_por_trecho + 1]))
+    return np.array(trechos, dtype=object)
+
+
+def construir_indice(gdf, segmentos_por_trecho: int = SEGMENTOS_POR_TRECHO) -> IndiceZAS:
+    """
+    Constrói os índices espaciais da ZAS.
+
+    Argumentos:
+    gdf: GeoDataFrame da ZAS em EPSG:4326.
+    segmentos_por_trecho: Tamanho dos trechos do contorno indexado.
+
+    Retorna:
+    Um IndiceZAS. Feições inválidas são corrigidas com `make_valid`; o contorno
+    é o da união de todas as feições, de modo que bordas compartilhadas entre
+    feições vizinhas não contam como limite da ZAS.
+    """
+    import shapely
+
+    from pae_dashboard.zas import _forma_cobertura
+
+    crs_metrico = gdf.estimate_utm_crs()
+    geoms = gdf.geometry.to_crs(crs_metrico).values.to_numpy()
+    geoms = geoms[~(shapely.is_missing(geoms) | shapely.is_empty(geoms))]
+    invalidas = ~shapely.is_valid(geoms)
+    if invalidas.any():
+        geoms = geoms.copy()
+        geoms[invalidas] = shapely.make_valid(geoms[invalidas])
+
+    partes = shapely.get_parts(geoms)
+    poligonos = partes[np.isin(shapely.get_type_id(partes), (3, 6))]
+    if len(poligonos):
+        if _forma_cobertura(poligonos):
+            uniao = shapely.coverage_union_all(poligonos)
+        else:
+            uniao = shapely.union_all(poligonos)
+        contorno = shapely.boundary(uniao)
+    else:
+        # ZAS só de linhas: a distância é medida até as próprias linhas.
+        contorno = shapely.union_all(partes)
+
+    return IndiceZAS(
+        crs_metrico,
+        poligonos,
+        _trechos_do_contorno(contorno, segmentos_por_trecho),
+        vertices=int(shapely.get_num_coordinates(geoms).sum()),
+    )
+
+
+def obter_indice(gdf, chave_conteudo, cache=None) -> IndiceZAS:
+    """
+    Retorna os índices espaciais da ZAS, reaproveitando-os do `cache` quando possível.
+
+    Argumentos:
+    gdf: GeoDataFrame da ZAS em EPSG:4326.
+    chave_conteudo: Identificador do conteúdo de origem (por exemplo, o hash do upload).
+    cache: Um GeoCache opcional.
+    """
+    if cache is None:
+        return construir_indice(gdf)
+    key = ("zas_indice", chave_conteudo, SEGMENTOS_POR_TRECHO)
+    return cache.get_or_load(key, lambda: construir_indice(gdf))
+
+
+def aplicar_relacao_zas(df_pe, indice: IndiceZAS):
+    """
+    Adiciona (no lugar) as colunas de pertinência e distância à ZAS ao DataFrame de PEs.
+
+    Argumentos:
+    df_pe: DataFrame de PEs com 'Latitude' e 'Longitude'.
+    indice: O IndiceZAS da ZAS carregada.
+    """
+    dentro, distancia = indice.relacionar(df_pe['Latitude'].to_numpy(), df_pe['Longitude'].to_numpy())
+    df_pe[COL_DENTRO_ZAS] = dentro
+    df_pe[COL_DISTANCIA_ZAS] = np.round(distancia, 1)
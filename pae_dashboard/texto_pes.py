@@ -0,0 +1,117 @@
+"""
+Leitura em lote dos PEs digitados (ou colados) no formato "Nome | Latitude | Longitude".
+
+Todas as linhas são tratadas de uma vez com as operações vetorizadas de texto
+do pandas: separação pelos '|', remoção de espaços (inclusive tabulações e
+espaços não separáveis, comuns em textos exportados de SIGs) e conversão das
+coordenadas com vírgula ou ponto decimal. As linhas com problema não geram um
+aviso cada: elas são reunidas num único relatório com o número da linha e o
+motivo.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+COLUNAS_ERROS = ['Linha', 'Motivo', 'Conteúdo']
+
+# Linhas citadas por motivo no resumo dos erros.
+MAX_LINHAS_RESUMO = 5
+
+
+class ResultadoTextoPEs:
+    """
+    Resultado da leitura do texto de PEs.
+
+    Atributos:
+    pes: DataFrame com ['Nome', 'Latitude', 'Longitude'] das linhas válidas.
+    erros: DataFrame com ['Linha', 'Motivo', 'Conteúdo'] das linhas descartadas
+        (linhas numeradas a partir de 1, como no texto original).
+    """
+
+    def __init__(self, pes: pd.DataFrame, erros: pd.DataFrame):
+        self.pes = pes
+        self.erros = erros
+
+    def resumo_erros(self, max_linhas: int = MAX_LINHAS_RESUMO) -> str:
+        """Resumo de uma linha por motivo, com as primeiras linhas afetadas (vazio se não houver erros)."""
+        partes = []
+        for motivo, linhas in self.erros.groupby('Motivo', sort=False)['Linha']:
+            citadas = ', '.join(map(str, linhas.iloc[:max_linhas]))
+            reticencias = ', ...' if len(linhas) > max_linhas else ''
+            partes.append(f"{motivo}: {len(linhas)} (linha{'s' if len(linhas) > 1 else ''} {citadas}{reticencias})")
+        return '; '.join(partes)
+
+    def estimar_bytes(self) -> int:
+        return int(self.pes.memory_usage(deep=True).sum() + self.erros.memory_usage(deep=True).sum())
+
+
+def _coordenada(campo: pd.Series) -> pd.Series:
+    return pd.to_numeric(campo.str.replace(',', '.', regex=False), errors='coerce')
+
+
+def analisar_texto_pes(texto: str) -> ResultadoTextoPEs:
+    """
+    Lê os PEs de um texto com uma linha "Nome | Latitude | Longitude" por PE.
+
+    Linhas em branco são ignoradas sem erro. São descartadas (e relatadas) as
+    linhas sem '|' ou com outro número de campos, sem nome, com coordenada não
+    numérica ou fora do intervalo válido, e as que repetem o nome de um PE já
+    lido (vale a primeira ocorrência).
+
+    Retorna:
+    Um ResultadoTextoPEs.
+    """
+    linhas = pd.Series(texto.split('\n'), dtype=object)
+    linhas.index = pd.RangeIndex(1, len(linhas) + 1, name='Linha')
+    linhas = linhas[linhas.str.strip() != '']
+
+    separadores = linhas.str.count(r'\|')
+    campos = linhas.str.split('|', n=2, expand=True).reindex(columns=range(3)).astype(object)
+    campos = campos.apply(lambda coluna: coluna.str.strip())
+    nomes, latitudes, longitudes = campos[0], _coordenada(campos[1]), _coordenada(campos[2])
+
+    motivo = pd.Series(None, index=linhas.index, dtype=object)
+    # Os motivos são aplicados do menos para o mais importante; cada linha fica com o último que se aplica.
+    motivo[longitudes.abs() > 180] = "Longitude fora do intervalo [-180, 180]"
+    motivo[latitudes.abs() > 90] = "Latitude fora do intervalo [-90, 90]"
+    motivo[longitudes.isna()] = "Longitude não numérica"
+    motivo[latitudes.isna()] = "Latitude não numérica"
+    motivo[nomes == ''] = "Nome vazio"
+    motivo[(separadores != 2) & (separadores > 0)] = "Número de campos diferente de 3 (Nome | Latitude | Longitude)"
+    motivo[separadores == 0] = "Linha sem o delimitador '|'"
+    # Nomes repetidos só são comparados entre linhas válidas.
+    validas = motivo.isna()
+    motivo[validas & nomes.where(validas).duplicated()] = "Nome repetido"
+    validas = motivo.isna()
+
+    pes = pd.DataFrame({
+        'Nome': nomes[validas].to_numpy(dtype=object),
+        'Latitude': latitudes[validas].to_numpy(dtype=np.float64),
+        'Longitude': longitudes[validas].to_numpy(dtype=np.float64),
+    })
+    erros = pd.DataFrame({
+        'Linha': linhas.index[~validas],
+        'Motivo': motivo[~validas].to_numpy(),
+        'Conteúdo': linhas[~validas].to_numpy(),
+    }, columns=COLUNAS_ERROS)
+    return ResultadoTextoPEs(pes, erros)
+
+
+def obter_pes_do_texto(texto: str, cache=None) -> ResultadoTextoPEs:
+    """
+    Versão de `analisar_texto_pes` memorizada pelo hash do texto.
+
+    Argumentos:
+    texto: O texto digitado ou colado.
+    cache: Um GeoCache opcional.
+
+    Retorna:
+    Um ResultadoTextoPEs cujo DataFrame de PEs pode ser alterado sem afetar o cache.
+    """
+    if cache is None:
+        return analisar_texto_pes(texto)
+    from pae_dashboard.cache import hash_bytes
+
+    resultado = cache.get_or_load(("texto_pes", hash_bytes(texto.encode('utf-8'))), lambda: analisar_texto_pes(texto))
+    return ResultadoTextoPEs(resultado.pes.copy(), resultado.erros)
@@ -0,0 +1,456 @@
+"""
+Cache local dos tiles do mapa base, para uso com pouca ou nenhuma conexão.
+
+Antes do exercício, `prebaixar` busca na origem (por padrão, o World_Imagery
+da Esri usado em `pae_dashboard.mapa`) os tiles que cobrem a área dos PEs e da
+ZAS numa faixa de zooms e os grava num arquivo MBTiles (SQLite). Durante o
+exercício, o `ServidorTiles` os entrega ao navegador por um endereço HTTP
+local, com os mais usados em memória, e o mapa passa a usar a URL do servidor.
+Tiles ausentes do arquivo podem ser buscados na origem (e gravados) quando há
+conexão.
+
+A origem é só um modelo de URL com {z}, {x} e {y}, e a função que faz as
+requisições pode ser trocada: um servidor local de teste pode substituir a
+origem real.
+"""
+
+import concurrent.futures
+import http.server
+import math
+import sqlite3
+import threading
+import urllib.request
+from collections import OrderedDict
+
+from pae_dashboard.cache import GeoCache
+from pae_dashboard.mapa import TILES_PADRAO
+
+
+ORIGEM_PADRAO = TILES_PADRAO
+AGENTE_HTTP = "pae-dashboard-tiles/1.0"
+TIMEOUT_REQUISICAO_S = 15
+MAX_TILES_PREBAIXAR = 50_000
+TRABALHADORES_PADRAO = 8
+LOTE_GRAVACAO = 256
+PASSO_PROGRESSO = 64
+MAX_BYTES_MEMORIA = 64 * 1024 * 1024
+MAX_TILES_MEMORIA = 20_000
+ZOOM_MAXIMO = 22
+MAX_CAMADAS = 8
+LATITUDE_MAXIMA = 85.05112878
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT);
+CREATE UNIQUE INDEX IF NOT EXISTS name ON metadata (name);
+CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row);
+"""
+
+
+def tile_do_ponto(longitude: float, latitude: float, zoom: int) -> tuple:
+    """Retorna o tile (x, y) do esquema XYZ (Web Mercator) que contém o ponto, no `zoom` dado."""
+    latitude = max(-LATITUDE_MAXIMA, min(LATITUDE_MAXIMA, latitude))
+    n = 2 ** zoom
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def _faixas(bbox, zoom: int) -> tuple:
+    oeste, sul, leste, norte = bbox
+    x_min, y_min = tile_do_ponto(oeste, norte, zoom)
+    x_max, y_max = tile_do_ponto(leste, sul, zoom)
+    return range(x_min, x_max + 1), range(y_min, y_max + 1)
+
+
+def contar_tiles(bbox, zoom_min: int, zoom_max: int) -> int:
+    """Número de tiles que cobrem `bbox` (oeste, sul, leste, norte) de `zoom_min` a `zoom_max`."""
+    total = 0
+    for zoom in range(zoom_min, zoom_max + 1):
+        xs, ys = _faixas(bbox, zoom)
+        total += len(xs) * len(ys)
+    return total
+
+
+def area_de_interesse(df_pe, limites_zas=None, margem_km: float = 2.0) -> tuple:
+    """
+    Retângulo que cobre os PEs e a ZAS, com uma margem.
+
+    Argumentos:
+    df_pe: DataFrame de PEs com 'Latitude' e 'Longitude'.
+    limites_zas: (oeste, sul, leste, norte) da ZAS em WGS84, ou None.
+    margem_km: Margem acrescentada em todos os lados.
+
+    Retorna:
+    Uma tupla (oeste, sul, leste, norte) em graus.
+    """
+    oeste, leste = df_pe['Longitude'].min(), df_pe['Longitude'].max()
+    sul, norte = df_pe['Latitude'].min(), df_pe['Latitude'].max()
+    if limites_zas is not None:
+        oeste, sul = min(oeste, limites_zas[0]), min(sul, limites_zas[1])
+        leste, norte = max(leste, limites_zas[2]), max(norte, limites_zas[3])
+    margem_lat = margem_km / 111.32
+    margem_lon = margem_km / (111.32 * max(math.cos(math.radians((sul + norte) / 2)), 0.01))
+    return (
+        float(max(oeste - margem_lon, -180.0)), float(max(sul - margem_lat, -LATITUDE_MAXIMA)),
+        float(min(leste + margem_lon, 180.0)), float(min(norte + margem_lat, LATITUDE_MAXIMA)),
+    )
+
+
+def formato_imagem(dados: bytes) -> str:
+    """'png', 'jpg' ou 'webp', pelos primeiros bytes da imagem ('' se desconhecido)."""
+    if dados.startswith(b'\x89PNG'):
+        return 'png'
+    if dados.startswith(b'\xff\xd8'):
+        return 'jpg'
+    if dados[:4] == b'RIFF' and dados[8:12] == b'WEBP':
+        return 'webp'
+    return ''
+
+
+TIPOS_CONTEUDO = {'png': 'image/png', 'jpg': 'image/jpeg', 'webp': 'image/webp', '': 'application/octet-stream'}
+
+
+def buscar_url(url: str, timeout: float = TIMEOUT_REQUISICAO_S) -> bytes:
+    """
+    Baixa um tile.
+
+    Levanta:
+    OSError (inclusive `urllib.error.URLError`/`HTTPError`) se a requisição falha.
+    """
+    requisicao = urllib.request.Request(url, headers={'User-Agent': AGENTE_HTTP})
+    with urllib.request.urlopen(requisicao, timeout=timeout) as resposta:
+        return resposta.read()
+
+
+class ArmazemTiles:
+    """
+    Arquivo MBTiles com os tiles do mapa base.
+
+    Os tiles são endereçados no esquema XYZ (o do Leaflet); a conversão para
+    a numeração de linhas TMS do MBTiles é feita aqui. Uma instância pode ser
+    compartilhada entre threads: o acesso à conexão é serializado por um lock.
+
+    Argumentos:
+    caminho: Caminho do arquivo (criado se não existir).
+    """
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_ESQUEMA)
+        self._total = self._conn.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+    def __len__(self):
+        return self._total
+
+    def obter(self, z: int, x: int, y: int):
+        """Retorna os bytes do tile, ou None se ele não está no arquivo."""
+        with self._lock:
+            linha = self._conn.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, (1 << z) - 1 - y)
+            ).fetchone()
+        return linha[0] if linha else None
+
+    def existentes(self, z: int, xs: range, ys: range) -> set:
+        """Os tiles (x, y) do zoom `z` dentro das faixas dadas que já estão no arquivo."""
+        linha_max, linha_min = (1 << z) - 1 - ys.start, (1 << z) - 1 - (ys.stop - 1)
+        with self._lock:
+            linhas = self._conn.execute(
+                "SELECT tile_column, tile_row FROM tiles WHERE zoom_level = ? AND tile_column BETWEEN ? AND ? "
+                "AND tile_row BETWEEN ? AND ?",
+                (z, xs.start, xs.stop - 1, linha_min, linha_max)
+            ).fetchall()
+        return {(x, (1 << z) - 1 - linha) for x, linha in linhas}
+
+    def gravar(self, tiles: list):
+        """Grava (ou substitui) uma lista de (z, x, y, dados) numa única transação."""
+        if not tiles:
+            return
+        with self._lock:
+            antes = self._conn.total_changes
+            self._conn.execute("BEGIN")
+            try:
+                for z, x, y, dados in tiles:
+                    self._conn.execute(
+                        "DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                        (z, x, (1 << z) - 1 - y)
+                    )
+                novos = len(tiles) - (self._conn.total_changes - antes)
+                self._conn.executemany(
+                    "INSERT INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                    [(z, x, (1 << z) - 1 - y, sqlite3.Binary(dados)) for z, x, y, dados in tiles]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._total += novos
+
+    def metadados(self) -> dict:
+        with self._lock:
+            return dict(self._conn.execute("SELECT name, value FROM metadata").fetchall())
+
+    def definir_metadados(self, valores: dict):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                [(nome, str(valor)) for nome, valor in valores.items()]
+            )
+
+    def fechar(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _atualizar_metadados(armazem: ArmazemTiles, bbox, zoom_min: int, zoom_max: int, formato: str, url_origem: str):
+    """Amplia os limites e a faixa de zooms registrados no MBTiles para incluir a área baixada."""
+    atuais = armazem.metadados()
+    if 'bounds' in atuais:
+        anteriores = [float(v) for v in atuais['bounds'].split(',')]
+        bbox = (min(bbox[0], anteriores[0]), min(bbox[1], anteriores[1]),
+                max(bbox[2], anteriores[2]), max(bbox[3], anteriores[3]))
+    valores = {
+        'name': atuais.get('name', "Mapa base do exercício"),
+        'type': 'baselayer',
+        'version': '1.0',
+        'description': f"Tiles de {url_origem}",
+        'bounds': ','.join(f"{v:.6f}" for v in bbox),
+        'minzoom': min(zoom_min, int(atuais.get('minzoom', zoom_min))),
+        'maxzoom': max(zoom_max, int(atuais.get('maxzoom', zoom_max))),
+    }
+    if formato:
+        valores['format'] = formato
+    armazem.definir_metadados(valores)
+
+
+def prebaixar(armazem: ArmazemTiles, bbox, zoom_min: int, zoom_max: int, url_origem: str = ORIGEM_PADRAO,
+              buscar=None, max_tiles: int = MAX_TILES_PREBAIXAR, trabalhadores: int = TRABALHADORES_PADRAO,
+              progresso=None) -> dict:
+    """
+    Baixa para o `armazem` os tiles que cobrem `bbox` nos zooms dados e que ainda não estão nele.
+
+    Argumentos:
+    armazem: O arquivo MBTiles de destino.
+    bbox: (oeste, sul, leste, norte) em graus (ver `area_de_interesse`).
+    zoom_min, zoom_max: Faixa de zooms (inclusive).
+    url_origem: Modelo da URL dos tiles, com {z}, {x} e {y}.
+    buscar: Função url -> bytes usada nas requisições (padrão: `buscar_url`).
+    max_tiles: Limite de tiles da área, para não disparar downloads de milhões de tiles.
+    trabalhadores: Requisições simultâneas.
+    progresso: Função opcional (feitos, total), chamada na thread de quem chamou a cada
+    `PASSO_PROGRESSO` tiles.
+
+    Retorna:
+    {'total', 'existentes', 'baixados', 'falhas'} com o número de tiles.
+
+    Levanta:
+    ValueError se a área tem mais de `max_tiles` tiles ou a faixa de zooms é inválida.
+    """
+    if not 0 <= zoom_min <= zoom_max <= ZOOM_MAXIMO:
+        raise ValueError(f"Faixa de zooms inválida: {zoom_min}–{zoom_max}")
+    total = contar_tiles(bbox, zoom_min, zoom_max)
+    if total > max_tiles:
+        raise ValueError(
+            f"A área tem {total:,} tiles nos zooms {zoom_min}–{zoom_max}, acima do limite de {max_tiles:,}: "
+            "reduza o zoom máximo."
+        )
+    buscar = buscar or buscar_url
+    faltantes = []
+    existentes = 0
+    for zoom in range(zoom_min, zoom_max + 1):
+        xs, ys = _faixas(bbox, zoom)
+        ja_baixados = armazem.existentes(zoom, xs, ys)
+        existentes += len(ja_baixados)
+        faltantes.extend((zoom, x, y) for x in xs for y in ys if (x, y) not in ja_baixados)
+
+    def baixar(tile):
+        z, x, y = tile
+        return buscar(url_origem.format(z=z, x=x, y=y))
+
+    baixados = falhas = 0
+    formato = ''
+    lote = []
+    feitos = existentes
+    if progresso is not None:
+        progresso(feitos, total)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=trabalhadores) as executor:
+        futuros = {executor.submit(baixar, tile): tile for tile in faltantes}
+        for futuro in concurrent.futures.as_completed(futuros):
+            feitos += 1
+            try:
+                dados = futuro.result()
+            except (OSError, ValueError):
+                falhas += 1
+            else:
+                formato = formato or formato_imagem(dados)
+                lote.append((*futuros[futuro], dados))
+                baixados += 1
+                if len(lote) >= LOTE_GRAVACAO:
+                    armazem.gravar(lote)
+                    lote = []
+            if progresso is not None and feitos % PASSO_PROGRESSO == 0:
+                progresso(feitos, total)
+    armazem.gravar(lote)
+    if progresso is not None:
+        progresso(total, total)
+    if baixados:
+        _atualizar_metadados(armazem, bbox, zoom_min, zoom_max, formato, url_origem)
+    return {'total': total, 'existentes': existentes, 'baixados': baixados, 'falhas': falhas}
+
+
+def indices_tile(partes: list):
+    """Converte as três partes finais de um caminho /{z}/{x}/{y}[.ext] em (z, x, y), ou None se inválidas."""
+    try:
+        z, x, y = (int(parte.split('.', 1)[0]) for parte in partes)
+    except ValueError:
+        return None
+    if not (0 <= z <= ZOOM_MAXIMO and 0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        return None
+    return z, x, y
+
+
+class _TratadorTiles(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        partes = self.path.split('?', 1)[0].strip('/').split('/')
+        resposta = self.server.tiles.responder(partes)
+        if resposta is None:
+            self.send_error(404)
+            return
+        dados, tipo_conteudo = resposta
+        self.send_response(200)
+        self.send_header('Content-Type', tipo_conteudo)
+        self.send_header('Content-Length', str(len(dados)))
+        self.send_header('Cache-Control', 'public, max-age=86400')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, formato, *args):
+        pass
+
+
+class _ServidorHTTP(http.server.ThreadingHTTPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class ServidorTiles:
+    """
+    Servidor HTTP local que entrega os tiles de um `ArmazemTiles` em /{z}/{x}/{y}.
+
+    Os tiles mais usados ficam num cache LRU em memória (um `GeoCache`
+    limitado por bytes). Com `url_origem`, um tile ausente do arquivo é
+    buscado na origem e gravado; sem ela (ou sem conexão), o servidor responde
+    404 e o Leaflet deixa o espaço vazio.
+
+    Outras camadas (os tiles vetoriais da ZAS, por exemplo) podem ser
+    servidas em /{nome}/... com `registrar_camada`.
+
+    Argumentos:
+    armazem: O arquivo MBTiles, ou None para servir só as camadas registradas.
+    host, porta: Endereço em que o servidor escuta (porta 0 = escolhida pelo sistema).
+    url_origem: Modelo da URL da origem para tiles ausentes, ou None.
+    buscar: Função url -> bytes usada nas requisições à origem (padrão: `buscar_url`).
+    max_bytes_memoria: Memória máxima do cache de tiles.
+    """
+
+    def __init__(self, armazem: ArmazemTiles, host: str = '127.0.0.1', porta: int = 0, url_origem: str = None,
+                 buscar=None, max_bytes_memoria: int = MAX_BYTES_MEMORIA):
+        self.armazem = armazem
+        self.host = host
+        self.porta = porta
+        self.url_origem = url_origem
+        self._buscar = buscar or buscar_url
+        self._memoria = GeoCache(max_bytes=max_bytes_memoria, max_entries=MAX_TILES_MEMORIA)
+        self._lock = threading.Lock()
+        self._servidor = None
+        self._camadas = OrderedDict()
+        self.estatisticas = {'memoria': 0, 'arquivo': 0, 'origem': 0, 'ausentes': 0}
+
+    def _contar(self, fonte: str):
+        with self._lock:
+            self.estatisticas[fonte] += 1
+
+    def registrar_camada(self, nome: str, camada):
+        """
+        Passa a servir `camada` em /{nome}/...
+
+        `camada.responder(partes)` recebe as partes do caminho após o nome e
+        retorna (dados, tipo de conteúdo), ou None para responder 404. Só as
+        `MAX_CAMADAS` registradas mais recentemente são mantidas.
+        """
+        with self._lock:
+            self._camadas[nome] = camada
+            self._camadas.move_to_end(nome)
+            while len(self._camadas) > MAX_CAMADAS:
+                self._camadas.popitem(last=False)
+
+    def responder(self, partes: list):
+        """Retorna (dados, tipo de conteúdo) para o caminho pedido, ou None."""
+        camada = self._camadas.get(partes[0]) if partes else None
+        if camada is not None:
+            return camada.responder(partes[1:])
+        indices = indices_tile(partes[-3:])
+        if indices is None:
+            return None
+        dados = self.obter(*indices)
+        return None if dados is None else (dados, TIPOS_CONTEUDO[formato_imagem(dados)])
+
+    def obter(self, z: int, x: int, y: int):
+        """Retorna o tile da memória, do arquivo ou da origem (nesta ordem), ou None."""
+        if self.armazem is None:
+            return None
+        chave = (z, x, y)
+        dados = self._memoria.get(chave)
+        if dados is not None:
+            self._contar('memoria')
+            return dados
+        dados = self.armazem.obter(z, x, y)
+        if dados is not None:
+            self._contar('arquivo')
+        elif self.url_origem:
+            try:
+                dados = self._buscar(self.url_origem.format(z=z, x=x, y=y))
+            except (OSError, ValueError):
+                dados = None
+            if dados:
+                self.armazem.gravar([(z, x, y, dados)])
+                self._contar('origem')
+        if dados is None:
+            self._contar('ausentes')
+            return None
+        self._memoria.put(chave, dados, len(dados))
+        return dados
+
+    def iniciar(self):
+        self._servidor = _ServidorHTTP((self.host, self.porta), _TratadorTiles)
+        self._servidor.tiles = self
+        self.porta = self._servidor.server_address[1]
+        threading.Thread(target=self._servidor.serve_forever, name="servidor-tiles", daemon=True).start()
+
+    def url_modelo(self, url_publica: str = None, camada: str = None) -> str:
+        """
+        Endereço do servidor visto pelo navegador.
+
+        `url_publica` é o endereço base pelo qual os navegadores alcançam o
+        servidor (por exemplo, 'http://10.0.0.5:8765' ou o caminho de um proxy
+        reverso com https); padrão: o endereço de escuta, só visível na
+        própria máquina quando ele é 127.0.0.1.
+
+        Sem `camada`, retorna o modelo da URL dos tiles para o Leaflet
+        (.../{z}/{x}/{y}); com ela, o prefixo da camada registrada com esse nome.
+        """
+        base = url_publica.rstrip('/') if url_publica else f"http://{self.host}:{self.porta}"
+        if camada is not None:
+            return f"{base}/{camada}"
+        return f"{base}/{{z}}/{{x}}/{{y}}"
+
+    def parar(self):
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
@@ -0,0 +1,326 @@
+"""
+Pirâmide de tiles vetoriais (Mapbox Vector Tiles) da Zona de Autossalvamento.
+
+Para ZAS muito grandes, mesmo os níveis de detalhe de `pae_dashboard.zas`
+geram um GeoJSON grande demais para o HTML do mapa. Neste modo a ZAS é
+recortada em tiles vetoriais por zoom, servidos pelo servidor local de
+`pae_dashboard.tiles`: o navegador carrega só os tiles da área visível, e o
+HTML do mapa tem tamanho constante, qualquer que seja a ZAS.
+
+Os tiles são gerados sob demanda, na primeira vez em que são pedidos:
+recortados com uma pequena margem, simplificados com tolerância de meio pixel
+do zoom e codificados em MVT (protobuf). Ficam guardados num arquivo MBTiles
+por conteúdo da ZAS (de modo que um reinício do servidor não os recalcula) e,
+os mais usados, também em memória. Os tiles trazem só o número de cada feição;
+os atributos são pedidos ao servidor quando o usuário clica numa feição.
+"""
+
+import json
+import math
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+from pae_dashboard.cache import GeoCache
+from pae_dashboard.tiles import ArmazemTiles, indices_tile
+
+
+EXTENSAO_MVT = 4096
+MARGEM_MVT = 64
+TOLERANCIA_PIXELS = 0.5
+ZOOM_MAX_VETORIAL = 16
+NOME_CAMADA_MVT = 'zas'
+CAMPO_ID = 'id'
+VERSAO_TILES = 1
+MAX_BYTES_MEMORIA = 32 * 1024 * 1024
+MAX_TILES_MEMORIA = 5_000
+TIPO_CONTEUDO_MVT = 'application/vnd.mapbox-vector-tile'
+
+# Metade da circunferência da Terra no Web Mercator (EPSG:3857), em metros.
+ORIGEM_MERCATOR = 20037508.342789244
+
+_MOVER, _LINHA, _FECHAR = 1, 2, 7
+_TIPO_PONTO, _TIPO_LINHA, _TIPO_POLIGONO = 1, 2, 3
+
+
+def _varint(valor: int) -> bytes:
+    saida = bytearray()
+    while valor > 0x7F:
+        saida.append((valor & 0x7F) | 0x80)
+        valor >>= 7
+    saida.append(valor)
+    return bytes(saida)
+
+
+def _zigzag(valor: int) -> int:
+    return (valor << 1) ^ (valor >> 63)
+
+
+def _campo_varint(numero: int, valor: int) -> bytes:
+    return _varint(numero << 3) + _varint(valor)
+
+
+def _campo_bytes(numero: int, dados: bytes) -> bytes:
+    return _varint((numero << 3) | 2) + _varint(len(dados)) + dados
+
+
+def _empacotados(numero: int, valores) -> bytes:
+    return _campo_bytes(numero, b''.join(_varint(v) for v in valores))
+
+
+def _valor_mvt(valor) -> bytes:
+    """Mensagem `Value` do MVT para um número ou texto."""
+    if isinstance(valor, (bool, np.bool_)):
+        return _campo_varint(7, int(valor))
+    if isinstance(valor, (int, np.integer)):
+        return _campo_varint(5, int(valor)) if valor >= 0 else _campo_varint(6, _zigzag(int(valor)))
+    if isinstance(valor, (float, np.floating)):
+        return _varint((3 << 3) | 1) + struct.pack('<d', float(valor))
+    return _campo_bytes(1, str(valor).encode('utf-8'))
+
+
+def _area_assinada(pontos: np.ndarray) -> float:
+    x, y = pontos[:, 0], pontos[:, 1]
+    return float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)) / 2
+
+
+def _comandos_anel(pontos: np.ndarray, cursor: list, externo: bool) -> list:
+    """Comandos de um anel de polígono; o externo fica no sentido horário (área positiva com y para baixo)."""
+    pontos = pontos[:-1] if len(pontos) > 1 and (pontos[0] == pontos[-1]).all() else pontos
+    if len(pontos):
+        mudou = np.any(pontos != np.roll(pontos, 1, axis=0), axis=1)
+        pontos = pontos[mudou] if mudou.any() else pontos[:1]
+    if len(pontos) < 3:
+        return []
+    area = _area_assinada(pontos)
+    if area == 0:
+        return []
+    if (area > 0) != externo:
+        pontos = pontos[::-1]
+    return _comandos_linha(pontos, cursor) + [_FECHAR | (1 << 3)]
+
+
+def _comandos_linha(pontos: np.ndarray, cursor: list) -> list:
+    """MoveTo no primeiro ponto e LineTo nos demais, em deltas relativos ao `cursor` (atualizado)."""
+    deltas = np.diff(np.vstack([cursor, pontos]), axis=0)
+    cursor[:] = pontos[-1].tolist()
+    comandos = [_MOVER | (1 << 3), _zigzag(int(deltas[0, 0])), _zigzag(int(deltas[0, 1]))]
+    if len(deltas) > 1:
+        comandos.append(_LINHA | ((len(deltas) - 1) << 3))
+        comandos.extend(_zigzag(int(d)) for d in deltas[1:].ravel())
+    return comandos
+
+
+def comandos_geometria(geom, cursor: list) -> tuple:
+    """
+    Codifica uma geometria shapely (já em coordenadas inteiras do tile) como comandos MVT.
+
+    Retorna:
+    Uma tupla (tipo MVT, lista de inteiros), com tipo None se nada sobrou
+    (anéis e linhas degenerados são descartados).
+    """
+    import shapely
+
+    comandos = []
+    tipo = None
+    for parte in shapely.get_parts(geom):
+        id_tipo = shapely.get_type_id(parte)
+        if id_tipo == 3:
+            externos = _comandos_anel(shapely.get_coordinates(parte.exterior), cursor, True)
+            if not externos:
+                continue
+            comandos += externos
+            for anel in parte.interiors:
+                comandos += _comandos_anel(shapely.get_coordinates(anel), cursor, False)
+            tipo = _TIPO_POLIGONO
+        elif id_tipo == 1 and tipo in (None, _TIPO_LINHA):
+            pontos = shapely.get_coordinates(parte)
+            if len(pontos) >= 2:
+                comandos += _comandos_linha(pontos, cursor)
+                tipo = _TIPO_LINHA
+        elif id_tipo == 0 and tipo in (None, _TIPO_PONTO):
+            pontos = shapely.get_coordinates(parte)
+            deltas = np.diff(np.vstack([cursor, pontos]), axis=0)
+            cursor[:] = pontos[-1].tolist()
+            comandos += [_MOVER | (1 << 3)] + [_zigzag(int(d)) for d in deltas[0]]
+            tipo = _TIPO_PONTO
+    return tipo, comandos
+
+
+def codificar_tile(feicoes: list, nome_camada: str = NOME_CAMADA_MVT, extensao: int = EXTENSAO_MVT) -> bytes:
+    """
+    Codifica um tile MVT (versão 2) com uma camada.
+
+    Argumentos:
+    feicoes: Lista de (id, geometria shapely em coordenadas do tile, {atributo: valor}).
+    nome_camada: Nome da camada no tile.
+    extensao: Resolução das coordenadas do tile.
+
+    Retorna:
+    Os bytes do tile; vazio se nenhuma feição tem geometria.
+    """
+    chaves, valores = {}, {}
+    mensagens = []
+    for id_feicao, geom, atributos in feicoes:
+        tipo, comandos = comandos_geometria(geom, [0, 0])
+        if tipo is None:
+            continue
+        tags = []
+        for chave, valor in atributos.items():
+            tags.append(chaves.setdefault(chave, len(chaves)))
+            tags.append(valores.setdefault((type(valor).__name__, valor), len(valores)))
+        mensagens.append(_campo_bytes(2, (
+            _campo_varint(1, int(id_feicao)) + (_empacotados(2, tags) if tags else b'')
+            + _campo_varint(3, tipo) + _empacotados(4, comandos)
+        )))
+    if not mensagens:
+        return b''
+    camada = (
+        _campo_varint(15, 2) + _campo_bytes(1, nome_camada.encode('utf-8')) + b''.join(mensagens)
+        + b''.join(_campo_bytes(3, chave.encode('utf-8')) for chave in chaves)
+        + b''.join(_campo_bytes(4, _valor_mvt(valor)) for _, valor in valores)
+        + _campo_varint(5, extensao)
+    )
+    return _campo_bytes(3, camada)
+
+
+def limites_tile(z: int, x: int, y: int) -> tuple:
+    """Limites (oeste, sul, leste, norte) do tile XYZ em metros do Web Mercator."""
+    tamanho = 2 * ORIGEM_MERCATOR / (1 << z)
+    oeste = -ORIGEM_MERCATOR + x * tamanho
+    norte = ORIGEM_MERCATOR - y * tamanho
+    return oeste, norte - tamanho, oeste + tamanho, norte
+
+
+def _valor_json(valor):
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return None
+    if isinstance(valor, (np.integer, np.floating, np.bool_)):
+        return valor.item()
+    if isinstance(valor, (int, float, bool, str)):
+        return valor
+    return str(valor)
+
+
+class PiramideZas:
+    """
+    Tiles vetoriais da ZAS, gerados sob demanda e guardados em disco e em memória.
+
+    Atende às requisições do servidor local (ver `ServidorTiles.registrar_camada`):
+    {z}/{x}/{y}.pbf para os tiles e atributos/{id} para os atributos de uma feição.
+
+    Argumentos:
+    gdf: GeoDataFrame da ZAS em EPSG:4326.
+    chave: Identificador do conteúdo da ZAS (o arquivo em disco é por chave).
+    campos: Colunas de atributo retornadas no clique (padrão: todas).
+    pasta: Pasta dos arquivos MBTiles com os tiles gerados; None = só em memória.
+    zoom_max: Maior zoom gerado; acima dele, o navegador amplia os tiles deste zoom.
+    """
+
+    def __init__(self, gdf, chave: str, campos: list = None, pasta: str = None, zoom_max: int = ZOOM_MAX_VETORIAL):
+        import shapely
+
+        self.chave = chave
+        self.zoom_max = zoom_max
+        if campos is None:
+            campos = [col for col in gdf.columns if col != gdf.geometry.name]
+        self.campos = [col for col in campos if col in gdf.columns and col != gdf.geometry.name]
+        self._atributos = gdf[self.campos].reset_index(drop=True)
+        # Cada parte das geometrias múltiplas é indexada sozinha, para o recorte de um tile
+        # não percorrer todos os vértices de uma feição que só o toca num canto.
+        geoms = gdf.geometry.to_crs("EPSG:3857").values.to_numpy()
+        self._partes, self._feicao_da_parte = shapely.get_parts(geoms, return_index=True)
+        self._arvore = shapely.STRtree(self._partes)
+        self.vertices = int(shapely.get_num_coordinates(self._partes).sum())
+        self._memoria = GeoCache(max_bytes=MAX_BYTES_MEMORIA, max_entries=MAX_TILES_MEMORIA)
+        self._armazem = None
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+            self._armazem = ArmazemTiles(os.path.join(pasta, f"{chave}-v{VERSAO_TILES}.mbtiles"))
+
+    def gerar_tile(self, z: int, x: int, y: int) -> bytes:
+        """Recorta, simplifica e codifica o tile (z, x, y)."""
+        import shapely
+
+        oeste, sul, leste, norte = limites_tile(z, x, y)
+        tamanho = leste - oeste
+        margem = tamanho * MARGEM_MVT / EXTENSAO_MVT
+        caixa = (oeste - margem, sul - margem, leste + margem, norte + margem)
+        indices = self._arvore.query(shapely.box(*caixa))
+        if not len(indices):
+            return b''
+        indices.sort()
+        recortes = shapely.clip_by_rect(self._partes[indices], *caixa)
+        recortes = shapely.simplify(recortes, tamanho / 256 * TOLERANCIA_PIXELS, preserve_topology=True)
+        escala = EXTENSAO_MVT / tamanho
+        recortes = shapely.transform(
+            recortes, lambda c: np.round(np.column_stack([(c[:, 0] - oeste) * escala, (norte - c[:, 1]) * escala]))
+        )
+        feicoes = self._feicao_da_parte[indices]
+        validos = ~shapely.is_empty(recortes)
+        por_feicao = pd.Series(recortes[validos]).groupby(feicoes[validos], sort=True)
+        return codificar_tile([
+            (int(id_feicao), shapely.union_all(grupo.to_numpy()) if len(grupo) > 1 else grupo.iloc[0],
+             {CAMPO_ID: int(id_feicao)})
+            for id_feicao, grupo in por_feicao
+        ])
+
+    def tile(self, z: int, x: int, y: int) -> bytes:
+        """Retorna o tile da memória, do disco ou recém-gerado (e guardado)."""
+        chave = (z, x, y)
+        dados = self._memoria.get(chave)
+        if dados is not None:
+            return dados
+        if self._armazem is not None:
+            dados = self._armazem.obter(z, x, y)
+        if dados is None:
+            dados = self.gerar_tile(z, x, y)
+            if self._armazem is not None:
+                self._armazem.gravar([(z, x, y, dados)])
+        self._memoria.put(chave, dados, len(dados) + 100)
+        return dados
+
+    def atributos(self, id_feicao: int) -> dict:
+        """Os atributos (`campos`) da feição, com valores serializáveis em JSON; vazio se o id não existe."""
+        if not 0 <= id_feicao < len(self._atributos):
+            return {}
+        linha = self._atributos.iloc[id_feicao]
+        return {col: _valor_json(linha[col]) for col in self.campos}
+
+    def responder(self, partes: list):
+        """Responde a {z}/{x}/{y}.pbf ou atributos/{id} (ver `ServidorTiles.registrar_camada`)."""
+        if len(partes) == 2 and partes[0] == 'atributos' and partes[1].isdigit():
+            dados = json.dumps(self.atributos(int(partes[1])), ensure_ascii=False).encode('utf-8')
+            return dados, 'application/json; charset=utf-8'
+        if len(partes) != 3:
+            return None
+        indices = indices_tile(partes)
+        if indices is None:
+            return None
+        if indices[0] > self.zoom_max:
+            return b'', TIPO_CONTEUDO_MVT
+        return self.tile(*indices), TIPO_CONTEUDO_MVT
+
+    def estimar_bytes(self) -> int:
+        # Coordenadas das partes (16 bytes por vértice, mais a árvore) e os atributos.
+        return self.vertices * 24 + int(self._atributos.memory_usage(deep=True).sum())
+
+
+def obter_piramide(gdf, chave: str, campos: list = None, pasta: str = None, cache=None) -> PiramideZas:
+    """
+    Retorna a pirâmide de tiles vetoriais da ZAS, reaproveitando-a do `cache` quando possível.
+
+    Argumentos:
+    gdf: GeoDataFrame da ZAS em EPSG:4326.
+    chave: Identificador do conteúdo da ZAS (por exemplo, o hash do upload).
+    campos: Colunas de atributo retornadas no clique.
+    pasta: Pasta dos tiles gerados em disco (ver `PiramideZas`).
+    cache: Um GeoCache opcional.
+    """
+    if cache is None:
+        return PiramideZas(gdf, chave, campos, pasta)
+    campos_key = tuple(campos) if campos is not None else None
+    key = ("zas_piramide", chave, campos_key, pasta)
+    return cache.get_or_load(key, lambda: PiramideZas(gdf, chave, campos, pasta))
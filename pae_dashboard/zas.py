@@ -0,0 +1,178 @@
+"""
+Níveis de detalhe (LOD) da Zona de Autossalvamento para exibição no mapa.
+
+A ZAS original costuma ter dezenas de milhares de vértices e várias colunas de
+atributos. Para o mapa, são pré-calculadas versões simplificadas por nível de
+zoom, com coordenadas arredondadas e apenas os campos escolhidos para o
+tooltip, reduzindo o HTML enviado ao navegador.
+"""
+
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+
+# Zooms de referência para os quais são gerados níveis de detalhe.
+LOD_ZOOMS = (8, 10, 12, 14, 16)
+MAX_TOOLTIP_FIELDS = 3
+
+
+def tamanho_pixel_graus(zoom: int) -> float:
+    """Retorna a largura aproximada de um pixel, em graus, num mapa web no `zoom` dado."""
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def casas_decimais_para_zoom(zoom: int) -> int:
+    """Número de casas decimais suficiente para erro de arredondamento abaixo de 1/4 de pixel."""
+    return min(7, max(0, math.ceil(-math.log10(tamanho_pixel_graus(zoom) / 4))))
+
+
+def campos_tooltip_padrao(gdf) -> list:
+    """Seleciona os primeiros campos de atributo para o tooltip da ZAS."""
+    return [col for col in gdf.columns if col != gdf.geometry.name][:MAX_TOOLTIP_FIELDS]
+
+
+def contar_vertices(gdf) -> int:
+    """Retorna o número total de vértices das geometrias do GeoDataFrame."""
+    import shapely
+
+    return int(shapely.get_num_coordinates(gdf.geometry.values).sum())
+
+
+def _simplificar(geoms, tolerancia: float, cobertura: bool):
+    import shapely
+
+    if cobertura:
+        # A tolerância da simplificação de cobertura é a raiz da área dos triângulos removidos.
+        return shapely.coverage_simplify(geoms, tolerancia)
+    return shapely.simplify(geoms, tolerancia, preserve_topology=True)
+
+
+def _forma_cobertura(geoms) -> bool:
+    """Indica se as geometrias formam uma cobertura poligonal (sem sobreposição, bordas casadas)."""
+    import shapely
+
+    if not hasattr(shapely, "coverage_simplify"):
+        return False
+    tipos = shapely.get_type_id(geoms)
+    if not np.isin(tipos, (3, 6)).all():
+        return False
+    return bool(shapely.coverage_is_valid(geoms))
+
+
+class ZasLOD:
+    """
+    Conjunto de versões simplificadas da ZAS, uma por zoom de referência.
+
+    Cada nível é guardado já convertido para um dicionário GeoJSON, pronto
+    para ser passado ao `folium.GeoJson`; o texto JSON de cada nível é gerado
+    uma vez, no primeiro uso (ver `geojson_texto_para`).
+    """
+
+    def __init__(self, niveis: dict, campos_tooltip: list, vertices_originais: int, vertices_por_nivel: dict):
+        self.niveis = niveis
+        self.campos_tooltip = campos_tooltip
+        self.vertices_originais = vertices_originais
+        self.vertices_por_nivel = vertices_por_nivel
+        self._textos = {}
+
+    def zoom_para(self, zoom: int) -> int:
+        """Retorna o zoom de referência mais próximo que ainda tem detalhe suficiente para `zoom`."""
+        zooms = sorted(self.niveis)
+        for nivel in zooms:
+            if nivel >= zoom:
+                return nivel
+        return zooms[-1]
+
+    def geojson_para(self, zoom: int) -> dict:
+        """Retorna o GeoJSON do nível de detalhe adequado ao `zoom` do mapa."""
+        return self.niveis[self.zoom_para(zoom)]
+
+    def geojson_texto_para(self, zoom: int) -> str:
+        """
+        O GeoJSON de `geojson_para` serializado, pronto para ser embutido num `<script>`.
+
+        O texto de cada nível é gerado uma vez e reaproveitado: reenviar o mapa
+        não serializa a ZAS de novo.
+        """
+        nivel = self.zoom_para(zoom)
+        texto = self._textos.get(nivel)
+        if texto is None:
+            texto = json.dumps(self.niveis[nivel], ensure_ascii=False, separators=(',', ':'))
+            # Como o filtro `tojson` do jinja: nada no texto pode fechar o <script>.
+            texto = texto.replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026')
+            self._textos[nivel] = texto
+        return texto
+
+    def estimar_bytes(self) -> int:
+        # Cada vértice em GeoJSON vira uma lista Python com dois floats (~100 bytes), mais os textos já gerados.
+        return sum(self.vertices_por_nivel.values()) * 100 + sum(len(texto) for texto in self._textos.values())
+
+
+def construir_lods(gdf, campos_tooltip: list = None, zooms=LOD_ZOOMS) -> ZasLOD:
+    """
+    Gera os níveis de detalhe da ZAS.
+
+    Argumentos:
+    gdf: GeoDataFrame da ZAS em EPSG:4326.
+    campos_tooltip: Colunas de atributo mantidas no GeoJSON (padrão: as primeiras colunas).
+    zooms: Zooms de referência para os quais gerar níveis.
+
+    Retorna:
+    Um ZasLOD. A simplificação preserva a topologia: se as feições formam uma
+    cobertura poligonal, as bordas compartilhadas são simplificadas em conjunto;
+    caso contrário, cada geometria é simplificada sem gerar autointerseções.
+    """
+    import geopandas
+    import shapely
+
+    if campos_tooltip is None:
+        campos_tooltip = campos_tooltip_padrao(gdf)
+    campos_tooltip = [col for col in campos_tooltip if col in gdf.columns and col != gdf.geometry.name]
+
+    geoms = gdf.geometry.values.to_numpy()
+    cobertura = _forma_cobertura(geoms)
+    atributos = gdf[campos_tooltip].copy()
+    for col in campos_tooltip:
+        # Garante que os valores sejam serializáveis em JSON (datas, decimais etc.).
+        if not (pd.api.types.is_numeric_dtype(atributos[col]) or pd.api.types.is_bool_dtype(atributos[col])):
+            atributos[col] = atributos[col].astype(str)
+
+    niveis = {}
+    vertices_por_nivel = {}
+    for zoom in zooms:
+        pixel = tamanho_pixel_graus(zoom)
+        simplificadas = _simplificar(geoms, pixel / 2, cobertura)
+        casas = casas_decimais_para_zoom(zoom)
+        simplificadas = shapely.transform(simplificadas, lambda coords, casas=casas: np.round(coords, casas))
+        validas = ~shapely.is_empty(simplificadas)
+
+        nivel_gdf = geopandas.GeoDataFrame(atributos[validas], geometry=simplificadas[validas], crs=gdf.crs)
+        niveis[zoom] = nivel_gdf.to_geo_dict(drop_id=True)
+        vertices_por_nivel[zoom] = int(shapely.get_num_coordinates(simplificadas[validas]).sum())
+
+    return ZasLOD(
+        niveis,
+        campos_tooltip,
+        vertices_originais=int(shapely.get_num_coordinates(geoms).sum()),
+        vertices_por_nivel=vertices_por_nivel,
+    )
+
+
+def obter_lods(gdf, chave_conteudo, campos_tooltip: list = None, cache=None) -> ZasLOD:
+    """
+    Retorna os níveis de detalhe da ZAS, reaproveitando-os do `cache` quando possível.
+
+    Argumentos:
+    gdf: GeoDataFrame da ZAS em EPSG:4326.
+    chave_conteudo: Identificador do conteúdo de origem (por exemplo, o hash do upload).
+    campos_tooltip: Colunas de atributo mantidas no GeoJSON.
+    cache: Um GeoCache opcional.
+    """
+    if cache is None:
+        return construir_lods(gdf, campos_tooltip)
+    campos_key = tuple(campos_tooltip) if campos_tooltip is not None else None
+    key = ("zas_lod", chave_conteudo, campos_key, LOD_ZOOMS)
+    return cache.get_or_load(key, lambda: construir_lods(gdf, campos_tooltip))
@@ -4,25 +4,546 @@
 
 import streamlit as st
 import pandas as pd
-import geopandas
-import folium
-from streamlit_folium import st_folium
-import plotly.express as px
-import zipfile
-import tempfile
+import numpy as np
+import functools
+import json
+import math
 import os
+from pae_dashboard.cache import GeoCache, hash_bytes
+from pae_dashboard.cobertura import COL_AREA_KM2, COL_PERCENTUAL, COL_PERCENTUAL_ACUMULADO, obter_cobertura
+from pae_dashboard.chegadas import coluna_meta
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from pae_dashboard.compartilhado import ExercicioCompartilhado, RegistroExercicios
+from pae_dashboard.diagnostico import EXECUCAO_INATIVA, Execucao, RegistroDiagnostico, resumo_etapas
+from pae_dashboard.efetividade import (
+    COL_COR, COL_EFETIVIDADE, COL_ESPERADAS, COL_PARTICIPANTES,
+    aplicar_indicadores
+)
+from pae_dashboard.geodados import EXTENSOES_GEODADOS, ler_info, listar_camadas, obter_geodados
+from pae_dashboard.graficos import MODO_FAIXAS, MODO_PIORES, CacheGrafico, figura_evolucao, modo_realizado_esperado
+from pae_dashboard.ingestao import IngestorEventos, criar_fonte
+from pae_dashboard.locais import (
+    COL_LOCAL, COL_PES_DENTRO_ZAS, carregar_locais, consolidar_locais, nome_do_local, totais_consolidados
+)
+from pae_dashboard.mapa import TILES_PADRAO, CacheMarcadores, camada_marcadores, mapa_base, tamanho_script
+from pae_dashboard.paineis import PAINEL_APP, fontes_alteradas, paineis_afetados, reexecutar_fragmentos
+from pae_dashboard.persistencia import ArmazemContagens, cursores_gravados
+from pae_dashboard.pes import COLUNAS_PES, carregar_pes, mapear_pes
+from pae_dashboard.planilhas import ler_cabecalho, listar_abas
+from pae_dashboard.populacao import ler_colunas, obter_populacao
+from pae_dashboard.relacao_zas import COL_DENTRO_ZAS, COL_DISTANCIA_ZAS, aplicar_relacao_zas, obter_indice
+from pae_dashboard.texto_pes import obter_pes_do_texto
+from pae_dashboard.tiles import ArmazemTiles, ServidorTiles, area_de_interesse, contar_tiles, prebaixar
+from pae_dashboard.tiles_vetoriais import obter_piramide
+from pae_dashboard.zas import MAX_TOOLTIP_FIELDS, campos_tooltip_padrao, contar_vertices, obter_lods
 
 # --- Paleta de Cores da Empresa ---
 COLOR_PRIMARY = "#135D79"
 COLOR_SECONDARY = "#169674"
 COLOR_WHITE = "#FFFFFF"
+PALETA_GRAFICOS = {'primaria': COLOR_PRIMARY, 'secundaria': COLOR_SECONDARY, 'fundo': COLOR_WHITE}
 
 # --- Definindo alturas fixas para as seções ---
 MAP_SECTION_HEIGHT_PX = 365 # Mude conforme o tamanho do monitor
 TOP_DATA_ROW_CONTENT_HEIGHT_PX = 270 # Mude conforme o tamanho do monitor
 
+# --- Gráfico realizado vs. esperado ---
+CHART_AGGREGATE_THRESHOLD_PES = 150 # Acima deste número de PEs, o gráfico mostra só os piores PEs ou faixas de efetividade
+CHART_TOP_N_PES = 30 # PEs de menor efetividade exibidos no modo agregado
+
+# --- Renderização do mapa ---
+MAP_CLUSTER_THRESHOLD_PES = 500 # Acima deste número de PEs, os marcadores são agrupados no navegador
+
+# --- Tabela de contagens da barra lateral ---
+COUNTS_EDITOR_PAGE_SIZE = 50 # PEs por página da tabela de contagens
+COUNTS_STATUS_FILTERS = {
+    "Todos": None,
+    "Sem dados": 'gray',
+    "Abaixo de 50%": 'red',
+    "Entre 50% e 80%": 'orange',
+    "80% ou mais": 'green',
+}
+
+# --- Sincronização entre sessões e recepção automática de chegadas ---
+EXERCISE_POLL_SECONDS = 2 # Intervalo de verificação de atualizações do exercício (outras sessões e eventos de chegada)
+
+# --- Evolução das chegadas no tempo ---
+TIMESERIES_MAX_POINTS = 500 # Pontos máximos enviados ao gráfico de evolução (a série é reduzida no servidor)
+TIMESERIES_ROLLING_MINUTES = 5 # Janela (min) da média móvel das chegadas por minuto
+TIMESERIES_TARGETS = (50, 80) # Metas de efetividade (%) cujo tempo de alcance é exibido
+
+# --- Leitura das planilhas de PEs ---
+PE_SHEET_PARQUET_DIR = ".cache_planilhas" # Pasta das cópias em Parquet das colunas lidas de planilhas XLSX; None desativa
+
+# --- Leitura da ZAS ---
+ZAS_PE_BBOX_MARGIN_KM = 20 # Margem ao redor dos PEs ao carregar só a parte próxima da ZAS
+ZAS_VECTOR_TILES_MIN_VERTICES = 200_000 # A partir deste número de vértices, a ZAS é desenhada por padrão com tiles vetoriais (só com BASEMAP_TILE_PUBLIC_URL configurado)
+ZAS_VECTOR_TILES_DIR = ".cache_zas_tiles" # Pasta dos tiles vetoriais da ZAS já gerados; None = só em memória
+
+# --- Cobertura da ZAS pelos PEs (distância até o PE mais próximo) ---
+COVERAGE_GRID_RESOLUTIONS_M = (10, 25, 50, 100) # Opções de lado (m) das células da grade da ZAS
+COVERAGE_GRID_RESOLUTION_M = 25 # Lado padrão das células; ZAS muito grandes usam células maiores
+COVERAGE_ACCEPTABLE_DISTANCE_M = 500 # Distância aceitável (m) até um PE, padrão; a área além dela é destacada no mapa
+COVERAGE_DISTANCE_BANDS_M = (250, 500, 1000, 2000) # Faixas de distância (m) da tabela de cobertura
+COVERAGE_MAX_DISTANCE_M = 5000 # Distâncias acima disto não são calculadas (a célula conta como descoberta)
+
+# --- Pessoas esperadas a partir de pontos de população ---
+POPULATION_MAX_DISTANCE_M = 0 # Distância máxima (m) de um ponto ao PE atribuído; 0 = sem limite
+
+# --- Mapa base offline (tiles baixados antes do exercício) ---
+BASEMAP_TILES_DB_PATH = "tiles_mapa_base.mbtiles" # Arquivo MBTiles com os tiles baixados; None desativa (tiles sempre da internet)
+BASEMAP_TILE_SERVER_ADDRESS = ("127.0.0.1", 8765) # Endereço em que o servidor local de tiles escuta (use "0.0.0.0" para outras máquinas)
+BASEMAP_TILE_PUBLIC_URL = None # Endereço do servidor de tiles alcançável pelos navegadores dos operadores (ex.: "http://10.0.0.5:8765", ou https por um proxy reverso se o painel usa https); None = o mapa não usa o servidor local
+BASEMAP_PREFETCH_ZOOMS = (10, 16) # Faixa padrão de zooms baixados
+BASEMAP_PREFETCH_MARGIN_KM = 2 # Margem ao redor dos PEs e da ZAS na área baixada
+BASEMAP_MEMORY_CACHE_MB = 64 # Memória para os tiles mais usados no servidor local
+BASEMAP_ONLINE_FALLBACK = True # Tiles que faltam no arquivo são buscados na internet (e gravados) quando há conexão
+
+# --- Exercício com vários locais (simulados simultâneos em várias barragens) ---
+MULTI_SITE_INPUT_OPTION = "Vários locais (um arquivo geográfico por local)" # Origem dos PEs que ativa o modo com vários locais
+SITES_LOADER_PROCESSES = 4 # Processos que leem em paralelo os arquivos dos locais; 0 = leitura na própria sessão
+
+# --- Persistência das contagens ---
+COUNTS_DB_PATH = "contagens_simulado.sqlite3" # Arquivo SQLite das contagens; None desativa a persistência
+
+# --- Diagnóstico de desempenho (ativado na barra lateral) ---
+DIAGNOSTICS_JSONL_PATH = "diagnostico_execucoes.jsonl" # Uma linha JSON por execução medida; None desativa
+DIAGNOSTICS_PROMETHEUS_PATH = "diagnostico_execucoes.prom" # Totais no formato de texto do Prometheus; None desativa
+DIAGNOSTICS_RECENT_RUNS = 30 # Execuções recentes da sessão exibidas no painel de diagnóstico
+
 
 # --- Funções Auxiliares ---
+@st.cache_resource
+def get_geo_cache() -> GeoCache:
+    """Cache de camadas geográficas compartilhado por todas as sessões do servidor."""
+    return GeoCache()
+
+@st.cache_resource
+def get_armazem(caminho: str, exercicio: str) -> ArmazemContagens:
+    """Armazém SQLite das contagens do exercício, compartilhado por todas as sessões."""
+    return ArmazemContagens(caminho, exercicio)
+
+@st.cache_resource
+def get_registro_exercicios() -> RegistroExercicios:
+    """Registro dos exercícios em andamento, compartilhado por todas as sessões do servidor."""
+    fabrica_armazem = (lambda exercicio: get_armazem(COUNTS_DB_PATH, exercicio)) if COUNTS_DB_PATH else None
+    return RegistroExercicios(fabrica_armazem)
+
+def locais_da_sessao() -> list:
+    """Locais do exercício da sessão no modo com vários locais (lista vazia fora dele)."""
+    if st.session_state.get("pe_input_method_key") != MULTI_SITE_INPUT_OPTION:
+        return []
+    return st.session_state.get("locais", [])
+
+def local_em_detalhe() -> str:
+    """O local escolhido para o detalhe (padrão: o primeiro), ou None fora do modo com vários locais."""
+    locais = locais_da_sessao()
+    if not locais:
+        return None
+    local_ativo = st.session_state.get("local_ativo")
+    return local_ativo if local_ativo in locais else locais[0]
+
+def id_exercicio(local: str = None) -> str:
+    """Identificador do exercício compartilhado da sessão ou, com `local`, do exercício desse local."""
+    exercicio = st.session_state.get("exercise_id", "simulado")
+    return exercicio if local is None else f"{exercicio}/{local}"
+
+def exercicios_dos_locais() -> dict:
+    """Retorna {local: exercício compartilhado} dos locais da sessão, renovando o registro da sessão em todos."""
+    locais = locais_da_sessao()
+    if not locais:
+        return {}
+    ctx = get_script_run_ctx()
+    sessao = ctx.session_id if ctx is not None else "local"
+    grupo = get_registro_exercicios().obter_grupo([id_exercicio(local) for local in locais], sessao)
+    return {local: grupo[id_exercicio(local)] for local in locais}
+
+def exercicio_da_sessao() -> ExercicioCompartilhado:
+    """
+    Retorna o exercício compartilhado da sessão atual, renovando o registro da sessão nele.
+
+    No modo com vários locais, é o exercício do local em detalhe.
+    """
+    local = local_em_detalhe()
+    if local is not None:
+        return exercicios_dos_locais()[local]
+    ctx = get_script_run_ctx()
+    sessao = ctx.session_id if ctx is not None else "local"
+    return get_registro_exercicios().obter(id_exercicio(), sessao)
+
+def versoes_dos_locais() -> dict:
+    """Versões das fontes de dados de cada local da sessão (vazio fora do modo com vários locais)."""
+    return {local: exercicio.versoes() for local, exercicio in exercicios_dos_locais().items()}
+
+@st.cache_resource
+def get_executor_locais(processos: int):
+    """Pool de processos que lê os arquivos dos locais, compartilhado por todas as sessões."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    # "spawn": os processos auxiliares não herdam as threads do servidor do Streamlit.
+    return ProcessPoolExecutor(processos, mp_context=multiprocessing.get_context("spawn"))
+
+def ler_arquivos_locais(arquivos: list) -> tuple:
+    """
+    Lê os arquivos dos locais com `carregar_locais`, no pool de processos quando ele está ativo.
+
+    Se o pool quebrou (um processo auxiliar morreu, por falta de memória por
+    exemplo), ele é descartado do cache e a leitura é repetida uma vez num
+    pool novo; se quebrar de novo, os arquivos pendentes são dados como erro.
+    """
+    from concurrent.futures import BrokenExecutor
+
+    if not SITES_LOADER_PROCESSES:
+        return carregar_locais(arquivos, cache=get_geo_cache())
+    for _ in range(2):
+        executor = get_executor_locais(SITES_LOADER_PROCESSES)
+        try:
+            return carregar_locais(arquivos, cache=get_geo_cache(), executor=executor)
+        except BrokenExecutor:
+            # O pool quebrado ficaria no cache e recusaria todas as leituras seguintes, de todas as sessões.
+            executor.shutdown(wait=False, cancel_futures=True)
+            get_executor_locais.clear()
+    erro = "o processo auxiliar de leitura terminou inesperadamente; tente enviar o arquivo de novo"
+    return {}, {nome_do_local(nome_arquivo): erro for nome_arquivo, _ in arquivos}
+
+@st.cache_resource
+def get_ingestor(endereco: str) -> IngestorEventos:
+    """
+    Ingestor de eventos de chegada do endereço dado, compartilhado por todas as sessões.
+
+    Recebe os cursores já gravados no banco de contagens, para que um arquivo
+    relido depois de um reinício não conte de novo os eventos já aplicados.
+    """
+    ingestor = IngestorEventos(cortes=cursores_gravados(COUNTS_DB_PATH))
+    ingestor.adicionar_fonte(criar_fonte(endereco))
+    return ingestor
+
+@st.cache_resource
+def get_armazem_tiles(caminho: str) -> ArmazemTiles:
+    """
+    Arquivo MBTiles do mapa base, compartilhado por todas as sessões.
+
+    Cria o arquivo se ele não existe: fora do download dos tiles, use `armazem_tiles_existente`.
+    """
+    return ArmazemTiles(caminho)
+
+def armazem_tiles_existente(caminho: str):
+    """O arquivo MBTiles do mapa base, ou None se os tiles ainda não foram baixados (sem criar o arquivo)."""
+    if not caminho or not os.path.exists(caminho):
+        return None
+    return get_armazem_tiles(caminho)
+
+@st.cache_resource
+def get_servidor_tiles(caminho: str) -> ServidorTiles:
+    """Servidor local dos tiles do mapa base e da ZAS, iniciado na primeira vez em que é necessário."""
+    servidor = ServidorTiles(
+        armazem_tiles_existente(caminho), *BASEMAP_TILE_SERVER_ADDRESS,
+        url_origem=TILES_PADRAO if BASEMAP_ONLINE_FALLBACK else None,
+        max_bytes_memoria=BASEMAP_MEMORY_CACHE_MB * 1024 * 1024
+    )
+    servidor.iniciar()
+    return servidor
+
+def tiles_mapa_base() -> str:
+    """
+    URL dos tiles do mapa: a do servidor local quando há tiles baixados, senão a da internet.
+
+    O servidor local só é usado com `BASEMAP_TILE_PUBLIC_URL` configurado: o
+    endereço de escuta padrão (127.0.0.1) não é alcançável pelos navegadores
+    de outras máquinas, que ficariam com o mapa base em branco.
+    """
+    if not BASEMAP_TILE_PUBLIC_URL:
+        return TILES_PADRAO
+    armazem = armazem_tiles_existente(BASEMAP_TILES_DB_PATH)
+    if armazem is None or len(armazem) == 0:
+        return TILES_PADRAO
+    try:
+        servidor = get_servidor_tiles(BASEMAP_TILES_DB_PATH)
+    except OSError as e:
+        st.warning(f"Não foi possível iniciar o servidor local de tiles ({e}); usando os tiles da internet.")
+        return TILES_PADRAO
+    if servidor.armazem is None:
+        # O servidor foi iniciado para a ZAS antes de os tiles serem baixados.
+        servidor.armazem = armazem
+    return servidor.url_modelo(BASEMAP_TILE_PUBLIC_URL)
+
+def tiles_zas(gdf_zas, zas_hash: str, campos: list):
+    """
+    Publica a pirâmide de tiles vetoriais da ZAS no servidor local e retorna seu endereço.
+
+    Retorna None (e o mapa volta a receber a ZAS em GeoJSON) se o servidor não pôde ser iniciado.
+    """
+    piramide = obter_piramide(gdf_zas, zas_hash, campos, ZAS_VECTOR_TILES_DIR, cache=get_geo_cache())
+    nome_camada = f"zas-{zas_hash}"
+    try:
+        servidor = get_servidor_tiles(BASEMAP_TILES_DB_PATH)
+    except OSError as e:
+        st.sidebar.warning(f"Não foi possível iniciar o servidor local de tiles ({e}); a ZAS será enviada inteira ao mapa.")
+        return None
+    servidor.registrar_camada(nome_camada, piramide)
+    return servidor.url_modelo(BASEMAP_TILE_PUBLIC_URL, camada=nome_camada)
+
+@st.cache_resource
+def get_registro_diagnostico() -> RegistroDiagnostico:
+    """Execuções medidas pelo diagnóstico de desempenho, de todas as sessões do servidor."""
+    return RegistroDiagnostico(DIAGNOSTICS_JSONL_PATH, DIAGNOSTICS_PROMETHEUS_PATH)
+
+_VALOR_NAO_COMPARADO = object()
+
+def _assinatura_valor(valor):
+    """Forma comparável de um valor da sessão: valores simples, arquivos enviados pelo id; o resto não é comparado."""
+    if valor is None or isinstance(valor, (str, int, float, bool)):
+        return valor
+    if hasattr(valor, 'file_id'):
+        return ('arquivo', valor.file_id)
+    if isinstance(valor, (list, tuple)):
+        itens = tuple(_assinatura_valor(item) for item in valor)
+        return _VALOR_NAO_COMPARADO if any(item is _VALOR_NAO_COMPARADO for item in itens) else itens
+    if isinstance(valor, dict):
+        # Estado dos editores de tabela ({'edited_rows': ..., ...}).
+        try:
+            return json.dumps(valor, sort_keys=True, default=str)
+        except (TypeError, ValueError):
+            return _VALOR_NAO_COMPARADO
+    return _VALOR_NAO_COMPARADO
+
+def gatilho_execucao(fragmento: str = None) -> str:
+    """
+    Descreve o que disparou a execução: as chaves da sessão (widgets e valores
+    guardados pelo app) que mudaram desde a execução medida anterior.
+
+    Botões (chaves 'botao_*') só contam na execução em que foram pressionados.
+    Sem nenhuma chave alterada, um fragmento foi reexecutado pela verificação
+    periódica ou por uma alteração do exercício.
+    """
+    anteriores = st.session_state.get('_diagnostico_valores')
+    atuais = {}
+    for chave in list(st.session_state.keys()):
+        if chave.startswith('_diagnostico'):
+            continue
+        try:
+            assinatura = _assinatura_valor(st.session_state[chave])
+        except KeyError:
+            continue
+        if assinatura is not _VALOR_NAO_COMPARADO:
+            atuais[chave] = assinatura
+    st.session_state._diagnostico_valores = atuais
+    if anteriores is None:
+        return "primeira execução medida"
+    alteradas = sorted(
+        chave for chave, valor in atuais.items()
+        if anteriores.get(chave, _VALOR_NAO_COMPARADO) != valor and not (chave.startswith('botao_') and not valor)
+    )
+    if alteradas:
+        return ", ".join(alteradas)
+    return f"reexecução do fragmento '{fragmento}'" if fragmento else "reexecução do script"
+
+def iniciar_diagnostico(fragmento: str = None):
+    """
+    Começa a medir a execução atual, se o diagnóstico estiver ativado na sessão.
+
+    Argumentos:
+    fragmento: Nome do fragmento reexecutado sozinho, ou None numa execução completa.
+
+    Retorna:
+    A `Execucao` da sessão, ou `EXECUCAO_INATIVA` com o diagnóstico desativado.
+    """
+    anterior = st.session_state.pop('_diagnostico_execucao', None)
+    if anterior is not None:
+        # A execução anterior foi interrompida (reexecução pedida no meio dela ou exceção) antes de
+        # `registrar_diagnostico`: é descartada, para não deixar o tracemalloc ligado.
+        anterior.finalizar()
+    if not st.session_state.get('diagnostico_ativo'):
+        st.session_state.pop('_diagnostico_valores', None)
+        return EXECUCAO_INATIVA
+    ctx = get_script_run_ctx()
+    execucao = Execucao(
+        gatilho=gatilho_execucao(fragmento),
+        fragmento=fragmento,
+        sessao=ctx.session_id if ctx is not None else "local",
+        medir_memoria=st.session_state.get('diagnostico_memoria', False),
+        caches={'geodados': get_geo_cache()},
+    )
+    st.session_state._diagnostico_execucao = execucao
+    return execucao
+
+def execucao_diagnostico():
+    """A execução em medição na sessão (ou `EXECUCAO_INATIVA`)."""
+    return st.session_state.get('_diagnostico_execucao', EXECUCAO_INATIVA)
+
+def registrar_diagnostico(execucao):
+    """Finaliza a medição da execução e a guarda no registro de diagnóstico."""
+    registro = execucao.finalizar()
+    if registro is not None:
+        get_registro_diagnostico().registrar(registro)
+
+def medido(painel: str):
+    """
+    Mede um painel como a etapa `painel` da execução.
+
+    Deve ficar sob o `@st.fragment`: quando só o fragmento é reexecutado, a
+    medição abre e registra uma execução própria.
+    """
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            if not st.session_state.get('diagnostico_ativo'):
+                return funcao(*args, **kwargs)
+            ctx = get_script_run_ctx()
+            if ctx is not None and ctx.fragment_ids_this_run:
+                execucao = iniciar_diagnostico(painel)
+                try:
+                    with execucao.etapa(painel):
+                        return funcao(*args, **kwargs)
+                finally:
+                    registrar_diagnostico(execucao)
+            with execucao_diagnostico().etapa(painel):
+                return funcao(*args, **kwargs)
+        return envoltorio
+    return decorador
+
+@st.fragment(run_every=EXERCISE_POLL_SECONDS)
+def acompanhar_exercicio(ingestor, nomes_pes):
+    """
+    Acompanha o exercício compartilhado e dispara um rerun só quando ele muda.
+
+    Roda como fragmento: a verificação periódica não reexecuta o script inteiro.
+    Também aplica ao exercício os lotes novos do ingestor de chegadas, se houver.
+    """
+    exercicio = exercicio_da_sessao()
+    if ingestor is not None:
+        exercicio.sincronizar_ingestao(ingestor, nomes_pes)
+        estatisticas = ingestor.estatisticas()
+        st.caption(
+            f"Eventos recebidos: {estatisticas['recebidos']:,} | duplicados: {estatisticas['duplicados']:,} | "
+            f"inválidos: {estatisticas['invalidos']:,} | na fila: {estatisticas['na_fila']:,}"
+        )
+    reexecutados = propagar_alteracoes(exercicio)
+    if locais_da_sessao():
+        # Contagens de outros locais, alteradas por outras sessões, só afetam os totais consolidados.
+        versoes_locais = versoes_dos_locais()
+        if versoes_locais != st.session_state.get('locais_versoes'):
+            st.session_state.locais_versoes = versoes_locais
+            if not reexecutados:
+                reexecutar_paineis(['metricas', 'locais'])
+
+def reexecutar_paineis(paineis: list, em_callback: bool = False):
+    """
+    Reexecuta apenas os fragmentos `paineis` (chaves de `@st.fragment`).
+
+    Em callbacks de widgets usa o `st.rerun` com chaves; no corpo de um
+    fragmento (verificação periódica) usa `paineis.reexecutar_fragmentos`,
+    pois o `st.rerun` público só aceita chaves em callbacks. Se o painel 'app'
+    estiver entre eles, o script inteiro é reexecutado.
+    """
+    if not paineis:
+        return
+    if PAINEL_APP in paineis:
+        st.rerun()
+    if em_callback:
+        st.rerun(paineis)
+    reexecutar_fragmentos(paineis)
+    st.empty()
+
+def propagar_alteracoes(exercicio: ExercicioCompartilhado, em_callback: bool = False):
+    """
+    Reexecuta os painéis que dependem das fontes do exercício alteradas desde a última vez que a sessão as viu.
+
+    No modo com vários locais, a tabela de locais também é reexecutada, já que
+    inclui o local em detalhe.
+
+    Argumentos:
+    exercicio: O exercício compartilhado da sessão.
+    em_callback: True quando chamada de um callback de widget.
+
+    Retorna:
+    A lista de painéis reexecutados (vazia se nada mudou).
+    """
+    atuais = exercicio.versoes()
+    alteradas = fontes_alteradas(st.session_state.get('exercicio_versoes', {}), atuais)
+    if not alteradas:
+        return []
+    st.session_state.exercicio_versoes = atuais
+    paineis = paineis_afetados(alteradas)
+    if locais_da_sessao() and PAINEL_APP not in paineis:
+        paineis.append('locais')
+    reexecutar_paineis(paineis, em_callback)
+    return paineis
+
+def df_pe_atual(df_pe_base: pd.DataFrame) -> pd.DataFrame:
+    """
+    Retorna os PEs com as contagens e os indicadores atuais do exercício.
+
+    O resultado fica guardado na sessão enquanto os PEs e a versão das contagens
+    não mudam, de modo que os painéis reexecutados por uma mesma alteração o
+    montam uma única vez. Não deve ser alterado no lugar.
+
+    Argumentos:
+    df_pe_base: DataFrame de PEs indexado por 'Nome', com 'Latitude' e 'Longitude'.
+    """
+    exercicio = exercicio_da_sessao()
+    versao_contagens = exercicio.versoes()['contagens']
+    guardado = st.session_state.get('df_pe_atual')
+    if guardado is not None and guardado[0] is df_pe_base and guardado[1] == versao_contagens:
+        return guardado[2]
+    df_pe = df_pe_base.copy()
+    contagens = exercicio.contagens(df_pe.index)
+    df_pe[COL_PARTICIPANTES] = contagens[COL_PARTICIPANTES].to_numpy()
+    df_pe[COL_ESPERADAS] = contagens[COL_ESPERADAS].to_numpy()
+    aplicar_indicadores(df_pe)
+    st.session_state.df_pe_atual = (df_pe_base, versao_contagens, df_pe)
+    return df_pe
+
+def locais_consolidados() -> pd.DataFrame:
+    """
+    Contagens de todos os locais da sessão agregadas por local (ver `locais.consolidar_locais`).
+
+    Como em `df_pe_atual`, o resultado fica na sessão enquanto as versões dos
+    locais não mudam. Os índices da ZAS de cada local vêm do cache de
+    geodados, os mesmos usados quando o local está em detalhe.
+    """
+    exercicios = exercicios_dos_locais()
+    assinatura = tuple((local, id(exercicio), tuple(exercicio.versoes().values())) for local, exercicio in exercicios.items())
+    guardado = st.session_state.get('locais_consolidados')
+    if guardado is not None and guardado[0] == assinatura:
+        return guardado[1]
+    df_por_local = {}
+    for local, exercicio in exercicios.items():
+        pes = exercicio.pes()
+        if pes is None:
+            continue
+        df_local = pes.set_index('Nome')
+        contagens = exercicio.contagens(df_local.index)
+        df_local[COL_PARTICIPANTES] = contagens[COL_PARTICIPANTES].to_numpy()
+        df_local[COL_ESPERADAS] = contagens[COL_ESPERADAS].to_numpy()
+        if exercicio.zas() is not None:
+            zas_hash_local, gdf_zas_local = exercicio.zas()
+            aplicar_relacao_zas(df_local, obter_indice(gdf_zas_local, zas_hash_local, cache=get_geo_cache()))
+        df_por_local[local] = df_local
+    consolidado = consolidar_locais(df_por_local)
+    st.session_state.locais_consolidados = (assinatura, consolidado)
+    return consolidado
+
+def aplicar_edicoes_contagens(editor_key: str, nomes_pagina: list):
+    """
+    Callback da tabela de contagens: aplica apenas as células editadas ao exercício compartilhado.
+
+    Depois de aplicar o diff, a versão do editor é incrementada para que a tabela
+    seja recriada a partir dos valores atuais, sem reaplicar edições antigas, e
+    só os painéis que dependem das contagens são reexecutados.
+    """
+    diff = {}
+    for posicao, valores in st.session_state[editor_key]["edited_rows"].items():
+        diff[nomes_pagina[int(posicao)]] = {
+            'participantes': valores.get('Participantes'),
+            'esperadas': valores.get('Esperados'),
+        }
+    exercicio = exercicio_da_sessao()
+    exercicio.aplicar_diff(diff)
+    st.session_state.contagens_editor_versao = st.session_state.get('contagens_editor_versao', 0) + 1
+    propagar_alteracoes(exercicio, em_callback=True)
+
 def parse_pe_data(data_string: str) -> pd.DataFrame:
     """
     Analisa dados de Ponto de Encontro (PE) inseridos manualmente.
@@ -32,84 +553,409 @@ def parse_pe_data(data_string: str) -> pd.DataFrame:
     no formato "Nome | Latitude | Longitude".
 
     Retorna:
-    Um DataFrame Pandas com colunas ['Nome', 'Latitude', 'Longitude'].
+    Um DataFrame Pandas com colunas ['Nome', 'Latitude', 'Longitude']. As linhas
+    descartadas são relatadas num único aviso na barra lateral, com os detalhes
+    numa tabela recolhível.
     """
-    pes_list = []
-    for line in data_string.strip().split('\n'):
-        if '|' in line:
-            parts = line.split('|')
-            if len(parts) == 3:
-                try:
-                    name = parts[0].strip()
-                    lat = float(parts[1].strip().replace(',', '.'))
-                    lon = float(parts[2].strip().replace(',', '.'))
-                    pes_list.append({'Nome': name, 'Latitude': lat, 'Longitude': lon})
-                except ValueError:
-                    st.sidebar.warning(f"A linha '{line}' não pôde ser processada. Verifique o formato.")
-            else:
-                st.sidebar.warning(f"A linha '{line}' não tem o formato esperado (Nome | Lat | Lon).")
-        else:
-            st.sidebar.warning(f"A linha '{line}' não contém '|' como delimitador.")
-    return pd.DataFrame(pes_list)
-
-def load_pe_from_file(uploaded_file, file_type: str) -> pd.DataFrame:
+    resultado = obter_pes_do_texto(data_string, cache=get_geo_cache())
+    if not resultado.erros.empty:
+        st.sidebar.warning(f"{len(resultado.erros)} linha(s) não puderam ser processadas. {resultado.resumo_erros()}")
+        with st.sidebar.expander("Linhas com problema"):
+            st.dataframe(resultado.erros, hide_index=True, width='stretch')
+    return resultado.pes
+
+def resumo_alteracao_pes(diferenca, total_pes: int) -> str:
+    """Complemento da mensagem de PEs processados com o que mudou em relação ao conjunto anterior."""
+    if diferenca.vazia():
+        return " Nenhuma alteração em relação aos PEs atuais."
+    if len(diferenca.adicionados) == total_pes:
+        return ""
+    return f" Alterações: {diferenca.resumo()}; as contagens dos PEs mantidos foram preservadas."
+
+def load_pe_from_file(uploaded_file, file_type: str, layer: str = None, columns: list = None) -> pd.DataFrame:
     """
-    Carrega dados de Ponto de Encontro (PE) de um arquivo enviado (XLSX ou Shapefile ZIP).
+    Carrega dados de Ponto de Encontro (PE) de um arquivo enviado (XLSX ou arquivo geográfico).
 
     Argumentos:
     uploaded_file: O arquivo enviado pelo usuário via st.file_uploader.
-    file_type: Uma string que indica o tipo de arquivo ("xlsx" ou "shp").
+    file_type: Uma string que indica o tipo de arquivo ("xlsx" ou "geo": Shapefile .zip, GeoPackage, FlatGeobuf ou GeoParquet).
+    layer: Camada do arquivo geográfico ou aba da planilha (padrão: a primeira).
+    columns: Colunas a carregar (None = todas).
 
     Retorna:
     Um DataFrame Pandas contendo dados de PE. Retorna um DataFrame vazio em caso de erro.
     """
+    if file_type not in ("xlsx", "geo"):
+        return pd.DataFrame()
     try:
-        if file_type == "xlsx":
-            df = pd.read_excel(uploaded_file)
-        elif file_type == "shp":
-            with tempfile.TemporaryDirectory() as tmpdir:
-                temp_zip_path = os.path.join(tmpdir, uploaded_file.name)
-                with open(temp_zip_path, "wb") as f:
-                    f.write(uploaded_file.getvalue())
-                with zipfile.ZipFile(temp_zip_path, 'r') as zip_ref:
-                    zip_ref.extractall(tmpdir)
-                shp_file_path = None
-                for item in os.listdir(tmpdir):
-                    if item.endswith(".shp"):
-                        shp_file_path = os.path.join(tmpdir, item)
-                        break
-                if not shp_file_path:
-                    st.sidebar.error("Nenhum arquivo .shp encontrado no .zip.")
-                    return pd.DataFrame()
-                gdf = geopandas.read_file(shp_file_path)
-                if gdf.crs is None:
-                    st.sidebar.warning("Shapefile dos PEs não possui CRS definido. Assumindo WGS84 (EPSG:4326).")
-                    gdf.set_crs("EPSG:4326", inplace=True, allow_override=True)
-                elif gdf.crs.to_string() != "EPSG:4326":
-                    gdf = gdf.to_crs("EPSG:4326")
-                df = pd.DataFrame()
-                df['geometry'] = gdf.geometry
-                df['Longitude'] = gdf.geometry.x
-                df['Latitude'] = gdf.geometry.y
-                for col in gdf.columns:
-                    if col not in ['geometry', 'Longitude', 'Latitude']:
-                        df[col] = gdf[col]
-        else:
-            return pd.DataFrame()
-
+        data = uploaded_file.getvalue()
+        df, crs_assumido = carregar_pes(
+            data, uploaded_file.name, file_type, layer, columns,
+            cache=get_geo_cache(), content_hash=hash_bytes(data), pasta_parquet=PE_SHEET_PARQUET_DIR
+        )
+        if crs_assumido:
+            st.sidebar.warning("Arquivo dos PEs não possui CRS definido. Assumindo WGS84 (EPSG:4326).")
         st.session_state.uploaded_pe_df_columns = df.columns.tolist()
         return df
 
+    except FileNotFoundError:
+        st.sidebar.error("Nenhum arquivo .shp encontrado no .zip.")
+        return pd.DataFrame()
+
     except Exception as e:
         st.sidebar.error(f"Erro ao carregar o arquivo de PEs: {e}")
         return pd.DataFrame()
 
+# --- Painéis (fragmentos reexecutados de forma independente; ver pae_dashboard.paineis) ---
+@st.fragment(key="contagens")
+@medido("contagens")
+def painel_contagens(df_pe_base: pd.DataFrame):
+    """Tabela paginada de contagens da barra lateral, com busca e filtro por situação."""
+    df_pe = df_pe_atual(df_pe_base)
+    st.markdown("---")
+    st.subheader("Contagem por Ponto de Encontro")
+    busca_pe = st.text_input("Buscar PE:", key="contagens_busca")
+    filtro_situacao = st.selectbox("Filtrar por situação:", list(COUNTS_STATUS_FILTERS), key="contagens_filtro")
+
+    mascara = np.ones(len(df_pe), dtype=bool)
+    if busca_pe:
+        mascara &= df_pe.index.astype(str).str.contains(busca_pe, case=False, regex=False)
+    if COUNTS_STATUS_FILTERS[filtro_situacao] is not None:
+        mascara &= (df_pe[COL_COR] == COUNTS_STATUS_FILTERS[filtro_situacao]).to_numpy()
+    df_filtrado = df_pe[mascara]
+
+    total_paginas = max(1, math.ceil(len(df_filtrado) / COUNTS_EDITOR_PAGE_SIZE))
+    if st.session_state.get("contagens_pagina", 1) > total_paginas:
+        st.session_state.contagens_pagina = 1
+    pagina = 1
+    if total_paginas > 1:
+        pagina = st.number_input("Página", min_value=1, max_value=total_paginas, key="contagens_pagina")
+    inicio = (pagina - 1) * COUNTS_EDITOR_PAGE_SIZE
+    df_pagina = df_filtrado.iloc[inicio:inicio + COUNTS_EDITOR_PAGE_SIZE]
+
+    if df_pagina.empty:
+        st.info("Nenhum PE corresponde à busca.")
+        return
+    st.caption(f"Exibindo {inicio + 1}–{inicio + len(df_pagina)} de {len(df_filtrado)} PEs")
+    editor_key = f"contagens_editor_{st.session_state.get('contagens_editor_versao', 0)}"
+    st.data_editor(
+        pd.DataFrame({
+            'Participantes': df_pagina[COL_PARTICIPANTES].to_numpy(),
+            'Esperados': df_pagina[COL_ESPERADAS].to_numpy(),
+            'Efetividade (%)': df_pagina[COL_EFETIVIDADE].to_numpy(),
+        }, index=pd.Index(df_pagina.index, name='Nome')),
+        key=editor_key,
+        disabled=['Efetividade (%)'],
+        column_config={
+            'Participantes': st.column_config.NumberColumn(min_value=0, step=1, help="Número de participantes que chegaram ao PE"),
+            'Esperados': st.column_config.NumberColumn(min_value=0, step=1, help="Número de pessoas que eram esperadas no PE"),
+            'Efetividade (%)': st.column_config.NumberColumn(format="%.1f%%"),
+        },
+        on_change=aplicar_edicoes_contagens,
+        args=(editor_key, df_pagina.index.tolist()),
+    )
+
+@st.fragment(key="metricas")
+@medido("metricas")
+def painel_metricas(df_pe_base: pd.DataFrame):
+    """Totais gerais de participantes, esperados e efetividade."""
+    st.markdown("###### Visão Geral")
+    locais = locais_da_sessao()
+    if locais:
+        totais = totais_consolidados(locais_consolidados())
+        total_participantes_geral = totais[COL_PARTICIPANTES]
+        total_esperados_geral = totais[COL_ESPERADAS]
+        efetividade_geral = totais[COL_EFETIVIDADE]
+        st.caption(f"Todos os {len(locais)} locais")
+    else:
+        df_pe = df_pe_atual(df_pe_base)
+        total_participantes_geral = df_pe['Total de Participantes'].sum()
+        total_esperados_geral = df_pe['Número de Pessoas Esperadas'].sum()
+        efetividade_geral = (total_participantes_geral / total_esperados_geral * 100) if total_esperados_geral > 0 else 0
+
+    st.metric(label="Total Participantes", value=f"{total_participantes_geral:,.0f}")
+    st.metric(label="Total Esperado", value=f"{total_esperados_geral:,.0f}")
+    st.metric(label="Efetividade Geral", value=f"{efetividade_geral:.2f}%")
+
+@st.fragment(key="locais")
+@medido("locais")
+def painel_locais():
+    """Participantes, esperados e efetividade de cada local do exercício, com o local em detalhe destacado."""
+    consolidado = locais_consolidados()
+    local_ativo = local_em_detalhe()
+    st.dataframe(
+        consolidado.reset_index().style.apply(
+            lambda linha: ['font-weight: bold; background-color: #e8f1f4' if linha[COL_LOCAL] == local_ativo else ''] * len(linha),
+            axis=1
+        ),
+        hide_index=True, width='stretch',
+        column_config={
+            COL_PARTICIPANTES: st.column_config.NumberColumn("Participantes", format="%d"),
+            COL_ESPERADAS: st.column_config.NumberColumn("Esperados", format="%d"),
+            COL_EFETIVIDADE: st.column_config.ProgressColumn("Efetividade", format="%.1f%%", min_value=0, max_value=100),
+            COL_PES_DENTRO_ZAS: st.column_config.NumberColumn(format="%d"),
+        },
+    )
+    st.caption(f"Em detalhe abaixo: {local_ativo}. Escolha outro local na barra lateral.")
+
+@st.fragment(key="pe_detalhe")
+@medido("pe_detalhe")
+def painel_pe_detalhe(df_pe_base: pd.DataFrame):
+    """Cartão de um PE escolhido pelo usuário."""
+    df_pe = df_pe_atual(df_pe_base)
+    st.markdown("###### Visão Detalhada - Ponto de Encontro")
+    pe_names_list = df_pe.index.tolist()
+    if not pe_names_list:
+        st.info("Nenhum PE disponível para seleção.")
+        return
+    current_selection_idx = 0
+    if 'selected_pe_name_dashboard' in st.session_state and st.session_state.selected_pe_name_dashboard in pe_names_list:
+        current_selection_idx = pe_names_list.index(st.session_state.selected_pe_name_dashboard)
+    else:
+        st.session_state.selected_pe_name_dashboard = pe_names_list[0]
+
+    selected_pe_name = st.selectbox(
+        "Selecione o Ponto de Encontro:",
+        options=pe_names_list,
+        index=current_selection_idx,
+        key="selected_pe_name_dashboard_selectbox"
+    )
+    st.session_state.selected_pe_name_dashboard = selected_pe_name
+
+    if selected_pe_name:
+        row_pe_data = df_pe.loc[selected_pe_name]
+        st.markdown(f"<div class='pe-card'><h6>{selected_pe_name}</h6>", unsafe_allow_html=True)
+        efetividade_val = row_pe_data['Efetividade (%)']
+        st.progress(min(int(efetividade_val), 100))
+        st.caption(f"Efetividade: {efetividade_val:.2f}%")
+        if COL_DENTRO_ZAS in row_pe_data.index:
+            situacao_zas = "⚠️ Dentro da ZAS" if row_pe_data[COL_DENTRO_ZAS] else "Fora da ZAS"
+            st.caption(f"{situacao_zas} (limite a {row_pe_data[COL_DISTANCIA_ZAS]:,.0f} m)")
+
+        card_metric_col1, card_metric_col2 = st.columns(2)
+        with card_metric_col1:
+            st.markdown(f"<p class='pe-card-metric-label'>Participantes</p>"
+                        f"<p class='pe-card-metric-value'>{row_pe_data['Total de Participantes']:,.0f}</p>",
+                        unsafe_allow_html=True)
+        with card_metric_col2:
+            st.markdown(f"<p class='pe-card-metric-label'>Esperados</p>"
+                        f"<p class='pe-card-metric-value pe-card-metric-value-alt'>{row_pe_data['Número de Pessoas Esperadas']:,.0f}</p>",
+                        unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
+
+@st.fragment(key="grafico")
+@medido("grafico")
+def painel_grafico(df_pe_base: pd.DataFrame):
+    """
+    Gráfico de participantes realizados vs. esperados por PE.
+
+    Acima de `CHART_AGGREGATE_THRESHOLD_PES` PEs, mostra só os PEs de menor
+    efetividade ou os totais por faixa de efetividade. A figura fica na sessão
+    e, entre reruns, só os valores alterados são trocados.
+    """
+    df_pe = df_pe_atual(df_pe_base)
+    titulo = st.empty()
+    modo_agregado = MODO_PIORES
+    if len(df_pe) > CHART_AGGREGATE_THRESHOLD_PES:
+        modo_agregado = st.radio(
+            "Exibir:", [MODO_PIORES, MODO_FAIXAS], horizontal=True, key="grafico_modo_agregado",
+            format_func=lambda modo: f"{CHART_TOP_N_PES} piores PEs" if modo == MODO_PIORES else "Faixas de efetividade",
+            label_visibility="collapsed"
+        )
+    modo = modo_realizado_esperado(len(df_pe), modo_agregado, CHART_AGGREGATE_THRESHOLD_PES)
+    titulos = {
+        MODO_PIORES: f"{CHART_TOP_N_PES} PEs de Menor Efetividade",
+        MODO_FAIXAS: "por Faixa de Efetividade",
+    }
+    titulo.markdown(f"###### Participantes: Realizado vs. Esperado ({titulos.get(modo, 'Todos PEs')})")
+    if 'cache_grafico' not in st.session_state:
+        st.session_state.cache_grafico = CacheGrafico()
+    fig_participantes_esperados = st.session_state.cache_grafico.figura(
+        df_pe, PALETA_GRAFICOS, TOP_DATA_ROW_CONTENT_HEIGHT_PX, modo, CHART_TOP_N_PES
+    )
+    execucao_diagnostico().registrar_valor("barras_atualizadas", st.session_state.cache_grafico.atualizadas)
+    st.plotly_chart(fig_participantes_esperados, width='stretch')
+
+def formatar_minutos(minutos) -> str:
+    """Formata um tempo em minutos como 'h:mm:ss' (ou '—' se ainda não atingido)."""
+    if minutos is None or pd.isna(minutos):
+        return "—"
+    segundos = int(round(minutos * 60))
+    return f"{segundos // 3600}:{segundos % 3600 // 60:02d}:{segundos % 60:02d}"
+
+@st.fragment(key="evolucao")
+@medido("evolucao")
+def painel_evolucao(df_pe_base: pd.DataFrame):
+    """Chegadas por minuto, efetividade acumulada e tempo até as metas, a partir da série de chegadas do exercício."""
+    df_pe = df_pe_atual(df_pe_base)
+    chegadas = exercicio_da_sessao().chegadas
+    esperadas = df_pe[COL_ESPERADAS]
+    tempos_gerais = chegadas.tempos_gerais_ate_meta(esperadas, TIMESERIES_TARGETS)
+    st.markdown(
+        "###### Evolução das Chegadas — " + " | ".join(
+            f"{meta}% em {formatar_minutos(minutos)}" for meta, minutos in tempos_gerais.items()
+        )
+    )
+    por_minuto = chegadas.chegadas_por_minuto(df_pe.index, TIMESERIES_ROLLING_MINUTES, TIMESERIES_MAX_POINTS)
+    if por_minuto.empty:
+        st.info("Nenhuma chegada registrada ainda: a evolução aparece conforme as contagens são atualizadas.")
+        return
+    acumulada = chegadas.efetividade_acumulada(esperadas, TIMESERIES_MAX_POINTS)
+
+    fig_evolucao = figura_evolucao(
+        por_minuto, acumulada, TIMESERIES_TARGETS, TIMESERIES_ROLLING_MINUTES, PALETA_GRAFICOS, TOP_DATA_ROW_CONTENT_HEIGHT_PX
+    )
+    st.plotly_chart(fig_evolucao, width='stretch')
+
+    with st.expander("Tempo até as metas por PE"):
+        tempos = chegadas.tempos_ate_meta(esperadas, TIMESERIES_TARGETS)
+        st.dataframe(
+            tempos.sort_values(coluna_meta(TIMESERIES_TARGETS[0])),
+            column_config={
+                coluna_meta(meta): st.column_config.NumberColumn(format="%.1f") for meta in TIMESERIES_TARGETS
+            },
+        )
+
+@st.fragment(key="mapa")
+@medido("mapa")
+def painel_mapa(df_pe_base: pd.DataFrame, zas_lod=None, zas_tiles: str = None, sobreposicao: tuple = None):
+    """
+    Mapa dos PEs sobre a ZAS.
+
+    O mapa base (fundo e ZAS) e a camada de marcadores são enviados
+    separadamente: quando só as contagens mudam, o navegador mantém o mapa
+    base e troca apenas a camada de marcadores, e no modo individual só os
+    marcadores alterados têm o código regerado.
+
+    O st_folium ainda recebe o mapa base inteiro a cada reexecução: a ZAS entra
+    como texto já serializado (ver `mapa.CamadaZas`), e o piso é o do próprio
+    componente, que percorre o script do mapa com expressões regulares e o
+    reenvia ao navegador (~50 ms para uma ZAS de 2 MB, contra ~600 ms com o
+    `folium.GeoJson`).
+
+    Com `zas_tiles`, a ZAS vem em tiles vetoriais do servidor local, no lugar de `zas_lod`.
+    `sobreposicao` é a imagem da área descoberta da ZAS (ver `mapa.mapa_base`).
+    """
+    # Importado só aqui: o componente carrega o folium e não é necessário antes de haver PEs.
+    from streamlit_folium import st_folium
+
+    df_pe = df_pe_atual(df_pe_base)
+    diagnostico = execucao_diagnostico()
+    tiles = tiles_mapa_base()
+    with diagnostico.etapa("mapa_base"):
+        m, controle_camadas = mapa_base(df_pe, zas_lod, tiles=tiles, zas_tiles=zas_tiles, sobreposicao=sobreposicao)
+
+    if 'cache_marcadores' not in st.session_state:
+        st.session_state.cache_marcadores = CacheMarcadores()
+    with diagnostico.etapa("mapa_marcadores"):
+        camada_pes = camada_marcadores(df_pe, st.session_state.cache_marcadores, limiar_agrupado=MAP_CLUSTER_THRESHOLD_PES)
+    diagnostico.registrar_valor("marcadores_regerados", st.session_state.cache_marcadores.regerados)
+
+    # Pass MAP_SECTION_HEIGHT_PX to st_folium. CSS will also enforce this.
+    with diagnostico.etapa("mapa_envio"):
+        st_folium(
+            m, width=None, height=MAP_SECTION_HEIGHT_PX, use_container_width=True,
+            feature_group_to_add=camada_pes,
+            layer_control=controle_camadas,
+            returned_objects=[]
+        )
+    if diagnostico.ativa:
+        with diagnostico.etapa("mapa_tamanho"):
+            marcadores_bytes = tamanho_script(camada_pes)
+            chave_base = (
+                tuple(m.location), tiles, id(zas_lod), zas_tiles,
+                hash(sobreposicao[0]) if sobreposicao is not None else None,
+            )
+            medida = st.session_state.get('_mapa_base_bytes')
+            if medida is None or medida[0] != chave_base:
+                # Só quando o mapa base muda: o st_folium já juntou a camada de marcadores e o
+                # controle de camadas ao mapa, e uma nova renderização do mapa completo, menos os
+                # marcadores, dá o tamanho do mapa base enviado ao navegador.
+                medida = (chave_base, len(m.get_root().render().encode('utf-8')) - marcadores_bytes)
+                st.session_state['_mapa_base_bytes'] = medida
+            diagnostico.registrar_valor("mapa_envio_bytes", medida[1] + marcadores_bytes)
+
+def painel_cobertura(cobertura, limite_m: float):
+    """Área da ZAS por faixa de distância até o PE mais próximo e área além da distância aceitável."""
+    limites = sorted({*COVERAGE_DISTANCE_BANDS_M, limite_m})
+    area_descoberta = cobertura.area_descoberta_km2(limite_m)
+    area_total = len(cobertura.grade) * cobertura.grade.area_celula_km2
+    col_resumo, col_faixas = st.columns([0.25, 0.75])
+    with col_resumo:
+        st.metric(
+            label=f"ZAS a até {limite_m:,} m de um PE",
+            value=f"{(1 - area_descoberta / area_total) * 100 if area_total else 0:.1f}%"
+        )
+        st.metric(label="Área descoberta", value=f"{area_descoberta:,.2f} km²")
+        st.caption(
+            f"Grade de {len(cobertura.grade):,} células de {cobertura.grade.resolucao:,.0f} m; "
+            f"distâncias em linha reta. A área descoberta aparece em vermelho no mapa."
+        )
+    with col_faixas:
+        st.dataframe(cobertura.faixas(limites), hide_index=True, width='stretch', column_config={
+            COL_AREA_KM2: st.column_config.NumberColumn(format="%.2f"),
+            COL_PERCENTUAL: st.column_config.NumberColumn(format="%.1f%%"),
+            COL_PERCENTUAL_ACUMULADO: st.column_config.ProgressColumn(format="%.1f%%", min_value=0, max_value=100),
+        })
+
+def painel_diagnostico():
+    """Etapas, gatilhos e consultas aos caches das execuções recentes da sessão, medidos pelo diagnóstico."""
+    registro = get_registro_diagnostico()
+    ctx = get_script_run_ctx()
+    execucoes = registro.execucoes(ctx.session_id if ctx is not None else "local")[-DIAGNOSTICS_RECENT_RUNS:]
+    with st.expander("🔎 Diagnóstico de Desempenho", expanded=True):
+        if registro.erro_gravacao:
+            st.warning(f"Não foi possível gravar os arquivos de diagnóstico: {registro.erro_gravacao}")
+        if not execucoes:
+            st.info("Nenhuma execução medida ainda.")
+            return
+        ultima = execucoes[-1]
+        consultas = " | ".join(
+            f"cache {nome}: {c['acertos']} acerto(s), {c['faltas']} falta(s)" for nome, c in ultima['caches'].items()
+        )
+        st.caption(f"Última execução: {ultima['duracao_ms']:,.0f} ms | gatilho: {ultima['gatilho']} | {consultas}")
+
+        col_ultima, col_resumo = st.columns(2)
+        with col_ultima:
+            st.markdown("###### Etapas da última execução")
+            etapas = sorted(ultima['etapas'], key=lambda etapa: etapa['inicio_ms'])
+            st.dataframe(pd.DataFrame({
+                'Etapa': ["\u2003" * etapa['nivel'] + etapa['etapa'] for etapa in etapas],
+                'Duração (ms)': [etapa['ms'] for etapa in etapas],
+                'Pico de memória (MB)': [None if etapa['pico_bytes'] is None else etapa['pico_bytes'] / 1e6 for etapa in etapas],
+            }), hide_index=True, column_config={
+                'Duração (ms)': st.column_config.NumberColumn(format="%.1f"),
+                'Pico de memória (MB)': st.column_config.NumberColumn(format="%.1f"),
+            })
+        with col_resumo:
+            st.markdown(f"###### Resumo das últimas {len(execucoes)} execuções")
+            st.dataframe(resumo_etapas(execucoes), column_config={
+                coluna: st.column_config.NumberColumn(format="%.1f")
+                for coluna in ('Mediana (ms)', 'P95 (ms)', 'Máximo (ms)', 'Pico de memória (MB)')
+            })
+
+        st.markdown("###### Execuções recentes")
+        st.dataframe(pd.DataFrame({
+            'Início': [r['inicio'] for r in execucoes],
+            'Gatilho': [r['gatilho'] for r in execucoes],
+            'Fragmento': [r['fragmento'] or "—" for r in execucoes],
+            'Duração (ms)': [r['duracao_ms'] for r in execucoes],
+            'Acertos de cache': [sum(c['acertos'] for c in r['caches'].values()) for r in execucoes],
+            'Faltas de cache': [sum(c['faltas'] for c in r['caches'].values()) for r in execucoes],
+        }).iloc[::-1], hide_index=True, column_config={'Duração (ms)': st.column_config.NumberColumn(format="%.1f")})
+        st.download_button(
+            "Baixar métricas (formato Prometheus)", registro.texto_prometheus(),
+            file_name="diagnostico_execucoes.prom", mime="text/plain"
+        )
+
 # --- Configurações Iniciais da Página ---
 st.set_page_config(
     page_title=st.session_state.get("app_title", "Dashboard de Simulado PAE"),
     page_icon="📊",
     layout="wide"
 )
+diagnostico = iniciar_diagnostico()
+diagnostico.marco("identidade_visual")
 
 # --- Sidebar para Inputs ---
 st.sidebar.header("⚙️ Configurações e Entradas")
@@ -121,23 +967,28 @@ st.session_state.organizer_name = st.sidebar.text_input("Nome da Empresa Organiz
 st.session_state.organizer_logo_url = st.sidebar.text_input("URL do Logo da Organizadora", st.session_state.get("organizer_logo_url", "https://www.hidrobr.com/wp-content/uploads/2023/09/HidroBR_logo2.png"))
 st.session_state.client_name = st.sidebar.text_input("Nome da Empresa Cliente", st.session_state.get("client_name", "Cliente Exemplo"))
 st.session_state.client_logo_url = st.sidebar.text_input("URL do Logo do Cliente", st.session_state.get("client_logo_url", ""))
+st.session_state.exercise_id = st.sidebar.text_input("Identificador do Exercício", st.session_state.get("exercise_id", "simulado"), help="Sessões com o mesmo identificador compartilham PEs, ZAS e contagens, que são gravadas e recuperadas por ele.")
+exercicio = exercicio_da_sessao()
 
 
 # 2. Definição dos Pontos de Encontro (PEs)
+diagnostico.marco("pes")
 st.sidebar.subheader("Dados dos Pontos de Encontro (PEs)")
+pe_input_options = ("Digitar manualmente", "Upload de arquivo XLSX", "Upload de arquivo geográfico (SHP .zip, GPKG, FGB, GeoParquet)", MULTI_SITE_INPUT_OPTION)
 pe_input_method = st.sidebar.radio(
     "Origem dos dados dos PEs:",
-    ("Digitar manualmente", "Upload de arquivo XLSX", "Upload de Shapefile (.zip)"),
+    pe_input_options,
     key="pe_input_method_key",
     index=st.session_state.get("pe_input_method_idx", 0)
 )
-st.session_state.pe_input_method_idx = ("Digitar manualmente", "Upload de arquivo XLSX", "Upload de Shapefile (.zip)").index(pe_input_method)
+st.session_state.pe_input_method_idx = pe_input_options.index(pe_input_method)
 
 
-df_pe_initial = pd.DataFrame(columns=['Nome', 'Latitude', 'Longitude'])
+df_pe_initial = pd.DataFrame(columns=COLUNAS_PES)
 
-if 'df_pe_configured' not in st.session_state:
-    st.session_state.df_pe_configured = False
+if 'df_pe_configured' not in st.session_state or (pe_input_method != MULTI_SITE_INPUT_OPTION and exercicio.pes() is None):
+    # Ao sair do modo com vários locais, o exercício da sessão pode ainda não ter PEs.
+    st.session_state.df_pe_configured = exercicio.pes() is not None
 
 pe_data_processed = False
 
@@ -165,29 +1016,44 @@ PE-16 | -18.36797733633896 |-48.05208954154255"""),
         key="pe_data_raw_text_area"
     )
     st.session_state.pe_data_raw_input_val = pe_data_raw_input
-    if st.sidebar.button("Processar PEs Manuais") or not st.session_state.df_pe_configured :
+    if st.sidebar.button("Processar PEs Manuais", key="botao_processar_pes_manuais") or not st.session_state.df_pe_configured :
         if pe_data_raw_input:
             df_pe_initial = parse_pe_data(pe_data_raw_input)
-            st.session_state.df_pe_initial_backup = df_pe_initial.copy()
+            pe_diff = exercicio.definir_pes(df_pe_initial)
             st.session_state.df_pe_configured = not df_pe_initial.empty
             pe_data_processed = True
             if not df_pe_initial.empty:
-                st.sidebar.success(f"{len(df_pe_initial)} PEs processados manualmente.")
+                st.sidebar.success(f"{len(df_pe_initial)} PEs processados manualmente.{resumo_alteracao_pes(pe_diff, len(df_pe_initial))}")
             else:
                  st.sidebar.warning("Nenhum PE processado. Verifique os dados e o formato.")
 
 
-elif pe_input_method in ["Upload de arquivo XLSX", "Upload de Shapefile (.zip)"]:
-    file_type_ext = "xlsx" if "XLSX" in pe_input_method else "shp"
+elif pe_input_method in ["Upload de arquivo XLSX", "Upload de arquivo geográfico (SHP .zip, GPKG, FGB, GeoParquet)"]:
+    file_type_ext = "xlsx" if "XLSX" in pe_input_method else "geo"
     uploaded_pe_file = st.sidebar.file_uploader(
-        f"Selecione o arquivo {file_type_ext.upper()}",
-        type=["xlsx", "zip"] if file_type_ext == "shp" else ["xlsx"],
+        "Selecione o arquivo XLSX" if file_type_ext == "xlsx" else "Selecione o arquivo (Shapefile .zip, GeoPackage, FlatGeobuf ou GeoParquet)",
+        type=EXTENSOES_GEODADOS if file_type_ext == "geo" else ["xlsx"],
         key=f"pe_file_uploader_{file_type_ext}"
     )
     if uploaded_pe_file:
-        raw_uploaded_df = load_pe_from_file(uploaded_pe_file, file_type_ext)
-        if not raw_uploaded_df.empty:
-            cols = raw_uploaded_df.columns.tolist()
+        # Só o cabeçalho (ou os metadados da camada) é lido aqui; os dados são carregados depois, só com as colunas mapeadas.
+        try:
+            pe_bytes = uploaded_pe_file.getvalue()
+            pe_hash = hash_bytes(pe_bytes)
+            if file_type_ext == "xlsx":
+                pe_layers = listar_abas(pe_bytes, cache=get_geo_cache(), content_hash=pe_hash)
+                pe_layer = st.sidebar.selectbox("Aba da planilha:", pe_layers, key="pe_sheet_select") if len(pe_layers) > 1 else pe_layers[0]
+                pe_source_fields = ler_cabecalho(pe_bytes, pe_layer, cache=get_geo_cache(), content_hash=pe_hash)
+                cols = pe_source_fields
+            else:
+                pe_layers = listar_camadas(pe_bytes, uploaded_pe_file.name, cache=get_geo_cache(), content_hash=pe_hash)
+                pe_layer = st.sidebar.selectbox("Camada dos PEs:", pe_layers, key="pe_layer_select") if len(pe_layers) > 1 else pe_layers[0]
+                pe_source_fields = ler_info(pe_bytes, uploaded_pe_file.name, pe_layer, cache=get_geo_cache(), content_hash=pe_hash)['colunas']
+                cols = pe_source_fields + [col for col in ('Longitude', 'Latitude') if col not in pe_source_fields]
+        except Exception as e:
+            st.sidebar.error(f"Erro ao carregar o arquivo de PEs: {e}")
+            cols = []
+        if cols:
             st.sidebar.markdown("---")
             st.sidebar.markdown("**Mapeamento de Colunas do Arquivo de PEs:**")
 
@@ -199,104 +1065,324 @@ elif pe_input_method in ["Upload de arquivo XLSX", "Upload de Shapefile (.zip)"]
             lat_col = st.sidebar.selectbox("Coluna para 'Latitude':", cols, index=default_lat_col_idx, key="pe_lat_col_select")
             lon_col = st.sidebar.selectbox("Coluna para 'Longitude':", cols, index=default_lon_col_idx, key="pe_lon_col_select")
 
-            if st.sidebar.button("Processar PEs do Arquivo") or not st.session_state.df_pe_configured:
+            if st.sidebar.button("Processar PEs do Arquivo", key="botao_processar_pes_arquivo") or not st.session_state.df_pe_configured:
+                mapped_fields = [col for col in dict.fromkeys((name_col, lat_col, lon_col)) if col in pe_source_fields]
+                raw_uploaded_df = load_pe_from_file(uploaded_pe_file, file_type_ext, pe_layer, mapped_fields)
                 try:
-                    df_pe_initial = pd.DataFrame({
-                        'Nome': raw_uploaded_df[name_col].astype(str),
-                        'Latitude': pd.to_numeric(raw_uploaded_df[lat_col]),
-                        'Longitude': pd.to_numeric(raw_uploaded_df[lon_col])
-                    })
-                    df_pe_initial.dropna(subset=['Latitude', 'Longitude'], inplace=True)
-                    st.session_state.df_pe_initial_backup = df_pe_initial.copy()
+                    df_pe_initial = mapear_pes(raw_uploaded_df, name_col, lat_col, lon_col)
+                    pe_diff = exercicio.definir_pes(df_pe_initial)
                     st.session_state.df_pe_configured = not df_pe_initial.empty
                     pe_data_processed = True
                     if not df_pe_initial.empty:
-                        st.sidebar.success(f"{len(df_pe_initial)} PEs processados do arquivo.")
+                        st.sidebar.success(f"{len(df_pe_initial)} PEs processados do arquivo.{resumo_alteracao_pes(pe_diff, len(df_pe_initial))}")
                     else:
                         st.sidebar.warning("Nenhum PE válido encontrado no arquivo após mapeamento.")
                 except Exception as e:
                     st.sidebar.error(f"Erro ao mapear colunas: {e}")
                     st.session_state.df_pe_configured = False
 
+elif pe_input_method == MULTI_SITE_INPUT_OPTION:
+    uploaded_site_files = st.sidebar.file_uploader(
+        "Arquivos dos locais (um por local; o nome do arquivo é o nome do local)",
+        type=EXTENSOES_GEODADOS,
+        accept_multiple_files=True,
+        key="locais_uploader",
+        help="Em cada arquivo, a primeira camada de pontos são os PEs e a primeira camada de polígonos, a ZAS do local. "
+             "Cada local tem suas próprias contagens."
+    )
+    if uploaded_site_files:
+        # Arquivos já lidos vêm do cache; os demais são lidos em paralelo, em processos auxiliares.
+        with st.spinner("Lendo os arquivos dos locais..."):
+            locais_lidos, erros_locais = ler_arquivos_locais(
+                [(arquivo.name, arquivo.getvalue()) for arquivo in uploaded_site_files]
+            )
+        for local, erro in erros_locais.items():
+            st.sidebar.error(f"Erro ao ler o arquivo do local '{local}': {erro}")
+        st.session_state.locais = list(locais_lidos)
+        locais_aplicados = st.session_state.setdefault('locais_aplicados', {})
+        for local, exercicio_local in exercicios_dos_locais().items():
+            dados_local = locais_lidos[local]
+            if exercicio_local.pes() is not None and locais_aplicados.get(local) == dados_local.conteudo_hash:
+                continue
+            exercicio_local.definir_pes(dados_local.pes)
+            if dados_local.zas is not None:
+                exercicio_local.definir_zas(dados_local.zas_hash, dados_local.zas)
+            if dados_local.crs_assumido:
+                st.sidebar.warning(f"Arquivo do local '{local}' sem CRS definido nas camadas {', '.join(dados_local.crs_assumido)}. Assumindo WGS84 (EPSG:4326).")
+            locais_aplicados[local] = dados_local.conteudo_hash
+    else:
+        st.session_state.locais = []
+    if locais_da_sessao():
+        st.sidebar.selectbox("Local em detalhe:", locais_da_sessao(), key="local_ativo")
+        exercicio = exercicio_da_sessao()
+        st.session_state.df_pe_configured = exercicio.pes() is not None
+        st.sidebar.success(f"{len(locais_da_sessao())} locais carregados.")
+
 
-if not pe_data_processed and 'df_pe_initial_backup' in st.session_state:
-    df_pe_initial = st.session_state.df_pe_initial_backup.copy()
+if not pe_data_processed and exercicio.pes() is not None:
+    df_pe_initial = exercicio.pes().copy()
 
 if df_pe_initial.empty and 'pe_data_raw_input_val' in st.session_state and not st.session_state.get('df_pe_configured', False):
     df_pe_initial = parse_pe_data(st.session_state.pe_data_raw_input_val)
 
 
-current_pe_names = frozenset(df_pe_initial['Nome'].tolist()) if not df_pe_initial.empty else frozenset()
-previous_pe_names = st.session_state.get('previous_pe_names_for_inputs', frozenset())
-
-if current_pe_names != previous_pe_names:
-    keys_to_delete = []
-    for k in st.session_state.keys():
-        if k.startswith('participantes_') or k.startswith('esperadas_') or k.startswith('widget_'):
-            keys_to_delete.append(k)
-    for k_del in keys_to_delete:
-        del st.session_state[k_del]
-    st.session_state.previous_pe_names_for_inputs = current_pe_names
-
-
+diagnostico.marco("populacao")
 if not df_pe_initial.empty:
-    df_pe_initial.set_index('Nome', inplace=True)
-    df_pe = df_pe_initial.copy()
-
     st.sidebar.markdown("---")
-    st.sidebar.subheader("Contagem por Ponto de Encontro")
-    for pe_name in df_pe.index:
-        with st.sidebar.expander(f"PE: {pe_name}", expanded=False):
-            participantes_key_ss = f'participantes_{pe_name}'
-            esperadas_key_ss = f'esperadas_{pe_name}'
-            participantes_key_widget = f'widget_participantes_{pe_name}'
-            esperadas_key_widget = f'widget_esperadas_{pe_name}'
-
-            if participantes_key_ss not in st.session_state:
-                st.session_state[participantes_key_ss] = 0
-            if esperadas_key_ss not in st.session_state:
-                st.session_state[esperadas_key_ss] = 1
-
-            current_participantes = st.number_input(
-                f"Total de Participantes",
-                min_value=0,
-                value=st.session_state[participantes_key_ss],
-                key=participantes_key_widget,
-                help=f"Número de participantes que chegaram ao PE {pe_name}"
+    st.sidebar.subheader("População da ZAS (Pessoas Esperadas)")
+    uploaded_pop_file = st.sidebar.file_uploader(
+        "Pontos de população (CSV ou Parquet com latitude/longitude)",
+        type=["csv", "txt", "parquet"],
+        key="pop_uploader",
+        help="Cada ponto é atribuído ao PE mais próximo; o total de pessoas de cada PE substitui as Pessoas Esperadas."
+    )
+    if uploaded_pop_file is not None:
+        try:
+            pop_bytes = uploaded_pop_file.getvalue()
+            pop_cols = ler_colunas(pop_bytes, uploaded_pop_file.name)
+            default_pop_lat_idx = next((i for i, col in enumerate(pop_cols) if 'lat' in col.lower()), 0)
+            default_pop_lon_idx = next((i for i, col in enumerate(pop_cols) if 'lon' in col.lower()), min(1, len(pop_cols) - 1))
+            pop_lat_col = st.sidebar.selectbox("Coluna para 'Latitude':", pop_cols, index=default_pop_lat_idx, key="pop_lat_col_select")
+            pop_lon_col = st.sidebar.selectbox("Coluna para 'Longitude':", pop_cols, index=default_pop_lon_idx, key="pop_lon_col_select")
+            pop_people_col = st.sidebar.selectbox(
+                "Coluna com o número de pessoas:", ["(1 pessoa por ponto)"] + pop_cols, key="pop_people_col_select"
             )
-            st.session_state[participantes_key_ss] = current_participantes
-
-            current_esperadas = st.number_input(
-                f"Número de Pessoas Esperadas",
-                min_value=0,
-                value=st.session_state[esperadas_key_ss],
-                key=esperadas_key_widget,
-                help=f"Número de pessoas que eram esperadas no PE {pe_name}"
+            pop_max_distance = st.sidebar.number_input(
+                "Distância máxima ao PE (m, 0 = sem limite)", min_value=0, value=POPULATION_MAX_DISTANCE_M, step=100,
+                key="pop_max_distance"
             )
-            st.session_state[esperadas_key_ss] = current_esperadas
+            if st.sidebar.button("Calcular Pessoas Esperadas", key="botao_calcular_esperadas"):
+                with st.spinner("Atribuindo os pontos de população aos PEs..."):
+                    resultado_pop = obter_populacao(
+                        pop_bytes,
+                        uploaded_pop_file.name,
+                        df_pe_initial.set_index('Nome'),
+                        pop_lat_col,
+                        pop_lon_col,
+                        None if pop_people_col == "(1 pessoa por ponto)" else pop_people_col,
+                        pop_max_distance or None,
+                        cache=get_geo_cache(),
+                        content_hash=hash_bytes(pop_bytes),
+                    )
+                exercicio.aplicar_diff({nome: {'esperadas': int(total)} for nome, total in resultado_pop.totais.items()})
+                st.sidebar.success(
+                    f"{resultado_pop.pontos_lidos - resultado_pop.pontos_invalidos} pontos atribuídos: "
+                    f"{int(resultado_pop.totais.sum())} pessoas esperadas nos PEs "
+                    f"(distância média de {resultado_pop.distancia_media_m:.0f} m)."
+                )
+                if resultado_pop.pontos_invalidos:
+                    st.sidebar.warning(f"{resultado_pop.pontos_invalidos} linha(s) sem coordenadas ou número de pessoas válidos foram ignoradas.")
+                if resultado_pop.pessoas_sem_pe:
+                    st.sidebar.warning(f"{resultado_pop.pessoas_sem_pe:.0f} pessoa(s) sem PE dentro da distância máxima.")
+        except Exception as e:
+            st.sidebar.error(f"Erro ao processar o arquivo de população: {e}")
 
-            df_pe.loc[pe_name, 'Total de Participantes'] = st.session_state[participantes_key_ss]
-            df_pe.loc[pe_name, 'Número de Pessoas Esperadas'] = st.session_state[esperadas_key_ss]
-    
-    def calcular_efetividade(row):
-        """Calcula a eficácia com base nos participantes e nas pessoas esperadas."""
-        if row['Número de Pessoas Esperadas'] > 0:
-            return (row['Total de Participantes'] / row['Número de Pessoas Esperadas']) * 100
-        return 0.0
-    df_pe['Efetividade (%)'] = df_pe.apply(calcular_efetividade, axis=1)
 
-else:
-    df_pe = pd.DataFrame(columns=['Latitude', 'Longitude', 'Total de Participantes', 'Número de Pessoas Esperadas', 'Efetividade (%)'])
+diagnostico.marco("recepcao_chegadas")
+st.sidebar.markdown("---")
+st.sidebar.subheader("Recepção Automática de Chegadas")
+ingestor = None
+if st.sidebar.toggle("Receber eventos de chegada", key="ingestao_ativa"):
+    endereco_ingestao = st.sidebar.text_input(
+        "Arquivo de eventos (NDJSON/CSV) ou tcp://host:porta",
+        "chegadas.ndjson",
+        key="ingestao_endereco",
+        help="Cada evento: {\"id\", \"pe\", \"delta\" ou \"absolute\", \"timestamp\"}"
+    )
+    try:
+        ingestor = get_ingestor(endereco_ingestao)
+    except Exception as e:
+        st.sidebar.error(f"Erro ao iniciar a recepção de eventos: {e}")
+
+nomes_pes = df_pe_initial['Nome'].tolist() if not df_pe_initial.empty else []
+if ingestor is not None and nomes_pes:
+    exercicio.sincronizar_ingestao(ingestor, nomes_pes)
+    if exercicio.pes_desconhecidos:
+        st.sidebar.warning(f"Eventos para PEs desconhecidos ignorados: {', '.join(sorted(exercicio.pes_desconhecidos)[:10])}")
+st.session_state.exercicio_versoes = exercicio.versoes()
+st.session_state.locais_versoes = versoes_dos_locais()
+with st.sidebar:
+    acompanhar_exercicio(ingestor, nomes_pes)
 
+df_pe_base = df_pe_initial.set_index('Nome') if not df_pe_initial.empty else None
+# A tabela de contagens é desenhada depois que a ZAS é relacionada aos PEs, mas fica nesta posição da barra lateral.
+area_contagens = st.sidebar.container()
 
+
+diagnostico.marco("zas")
 st.sidebar.markdown("---")
 st.sidebar.subheader("Upload da Zona de Autossalvamento (ZAS)")
 uploaded_zas_file = st.sidebar.file_uploader(
-    "Selecione o arquivo Shapefile (.zip contendo .shp, .dbf, .shx, etc.)",
-    type=["zip"],
+    "Selecione o arquivo (Shapefile .zip contendo .shp, .dbf, .shx, etc., GeoPackage, FlatGeobuf ou GeoParquet)",
+    type=EXTENSOES_GEODADOS,
     key="zas_uploader"
 )
 
+gdf_zas = None
+zas_hash = None
+tooltip_columns = None
+if uploaded_zas_file is not None:
+    try:
+        zas_bytes = uploaded_zas_file.getvalue()
+        zas_file_hash = hash_bytes(zas_bytes)
+        zas_layers = listar_camadas(zas_bytes, uploaded_zas_file.name, cache=get_geo_cache(), content_hash=zas_file_hash)
+        zas_layer = st.sidebar.selectbox("Camada da ZAS:", zas_layers, key="zas_layer_select") if len(zas_layers) > 1 else zas_layers[0]
+        zas_fields = ler_info(zas_bytes, uploaded_zas_file.name, zas_layer, cache=get_geo_cache(), content_hash=zas_file_hash)['colunas']
+        # Só os atributos exibidos no tooltip são lidos do arquivo.
+        tooltip_columns = st.sidebar.multiselect(
+            "Campos exibidos no tooltip da ZAS:",
+            zas_fields,
+            default=zas_fields[:MAX_TOOLTIP_FIELDS],
+            key="zas_tooltip_columns"
+        )
+        zas_bbox = None
+        if df_pe_base is not None and st.sidebar.checkbox(
+            "Carregar só a parte da ZAS próxima aos PEs",
+            key="zas_bbox_pes",
+            help=f"Ignora as feições da ZAS a mais de {ZAS_PE_BBOX_MARGIN_KM} km do retângulo que envolve os PEs."
+        ):
+            margem_lat = ZAS_PE_BBOX_MARGIN_KM / 111.32
+            margem_lon = margem_lat / max(math.cos(math.radians(df_pe_base['Latitude'].mean())), 0.01)
+            zas_bbox = (
+                df_pe_base['Longitude'].min() - margem_lon, df_pe_base['Latitude'].min() - margem_lat,
+                df_pe_base['Longitude'].max() + margem_lon, df_pe_base['Latitude'].max() + margem_lat,
+            )
+        # A chave identifica o GeoDataFrame carregado (arquivo, camada, recorte e atributos lidos), usada pelos
+        # caches da ZAS e pelo exercício: trocar os campos do tooltip gera uma nova versão da ZAS para as
+        # outras sessões, em vez de deixá-las com os atributos anteriores.
+        zas_hash = hash_bytes(repr((zas_file_hash, zas_layer, zas_bbox, tuple(tooltip_columns))).encode())
+        gdf_zas, crs_assumido = obter_geodados(
+            zas_bytes, uploaded_zas_file.name, zas_layer, tooltip_columns, zas_bbox,
+            cache=get_geo_cache(), content_hash=zas_file_hash
+        )
+        if crs_assumido:
+            st.sidebar.warning("Arquivo da ZAS não possui CRS definido. Assumindo WGS84 (EPSG:4326).")
+        if not gdf_zas.empty:
+            exercicio.definir_zas(zas_hash, gdf_zas)
+            st.session_state.exercicio_versoes = exercicio.versoes()
+        else:
+            st.sidebar.warning("O GeoDataFrame da ZAS está vazio, não é válido ou não pôde ser processado.")
+            gdf_zas = None
+    except FileNotFoundError:
+        st.sidebar.warning("O GeoDataFrame da ZAS está vazio, não é válido ou não pôde ser processado.")
+    except Exception as e:
+        st.sidebar.error(f"Erro ao processar o arquivo da ZAS: {e}")
+        gdf_zas = None
+elif exercicio.zas() is not None:
+    zas_hash, gdf_zas = exercicio.zas()
+
+diagnostico.marco("relacao_zas")
+zas_lod = None
+zas_tiles = None
+if gdf_zas is not None and df_pe_base is not None:
+    if tooltip_columns is None:
+        # ZAS recebida de outra sessão do exercício: os campos vêm do GeoDataFrame já carregado.
+        attribute_columns = [col for col in gdf_zas.columns if col != gdf_zas.geometry.name]
+        tooltip_columns = st.sidebar.multiselect(
+            "Campos exibidos no tooltip da ZAS:",
+            attribute_columns,
+            default=campos_tooltip_padrao(gdf_zas),
+            key="zas_tooltip_columns"
+        )
+    zas_vertices = contar_vertices(gdf_zas)
+    # Sem um endereço público configurado, os tiles vêm de 127.0.0.1 e só aparecem no navegador da própria
+    # máquina do servidor: o padrão continua sendo o GeoJSON, que chega a todos os operadores.
+    if st.sidebar.checkbox(
+        "Desenhar a ZAS com tiles vetoriais",
+        value=bool(BASEMAP_TILE_PUBLIC_URL) and zas_vertices >= ZAS_VECTOR_TILES_MIN_VERTICES,
+        key="zas_tiles_vetoriais",
+        help=f"A ZAS tem {zas_vertices:,} vértices. Com tiles vetoriais, o navegador carrega só a área visível "
+             "e os atributos de uma feição são buscados ao clicar nela."
+             + ("" if BASEMAP_TILE_PUBLIC_URL else " Sem BASEMAP_TILE_PUBLIC_URL configurado, os tiles só aparecem "
+                "no navegador da máquina do servidor.")
+    ):
+        zas_tiles = tiles_zas(gdf_zas, zas_hash, tooltip_columns)
+    if zas_tiles is None:
+        zas_lod = obter_lods(gdf_zas, zas_hash, tooltip_columns, cache=get_geo_cache())
+    indice_zas = obter_indice(gdf_zas, zas_hash, cache=get_geo_cache())
+    aplicar_relacao_zas(df_pe_base, indice_zas)
+    pes_dentro_zas = df_pe_base.index[df_pe_base[COL_DENTRO_ZAS]].tolist()
+    if pes_dentro_zas:
+        st.sidebar.warning(f"{len(pes_dentro_zas)} PE(s) dentro da ZAS: {', '.join(map(str, pes_dentro_zas[:10]))}{'...' if len(pes_dentro_zas) > 10 else ''}")
+
+diagnostico.marco("cobertura")
+cobertura = None
+cobertura_limite = COVERAGE_ACCEPTABLE_DISTANCE_M
+sobreposicao_mapa = None
+if gdf_zas is not None and df_pe_base is not None:
+    st.sidebar.markdown("---")
+    st.sidebar.subheader("Cobertura da ZAS pelos PEs")
+    if st.sidebar.toggle(
+        "Calcular a cobertura da ZAS",
+        key="cobertura_ativa",
+        help="Divide a ZAS numa grade e mede, em cada célula, a distância em linha reta até o PE mais próximo."
+    ):
+        cobertura_limite = st.sidebar.number_input(
+            "Distância aceitável até um PE (m):", min_value=50, max_value=COVERAGE_MAX_DISTANCE_M,
+            value=COVERAGE_ACCEPTABLE_DISTANCE_M, step=50, key="cobertura_limite"
+        )
+        cobertura_resolucao = st.sidebar.select_slider(
+            "Lado das células da grade (m):", options=COVERAGE_GRID_RESOLUTIONS_M, value=COVERAGE_GRID_RESOLUTION_M,
+            key="cobertura_resolucao"
+        )
+        try:
+            # Com a cobertura anterior (mesma ZAS), só a região afetada pelos PEs alterados é recalculada.
+            with st.spinner("Calculando a cobertura da ZAS..."):
+                cobertura = obter_cobertura(
+                    indice_zas, zas_hash, df_pe_base, cobertura_resolucao, COVERAGE_MAX_DISTANCE_M,
+                    cache=get_geo_cache(), anterior=st.session_state.get('cobertura_anterior')
+                )
+            st.session_state.cobertura_anterior = cobertura
+            if cobertura.grade.resolucao > cobertura_resolucao:
+                st.sidebar.caption(f"ZAS grande: a grade usa células de {cobertura.grade.resolucao:,.0f} m.")
+            png_descoberta, limites_descoberta = cobertura.imagem_descoberta(cobertura_limite)
+            if png_descoberta is not None:
+                sobreposicao_mapa = (png_descoberta, limites_descoberta, f"Área a mais de {cobertura_limite:,} m de um PE")
+        except ValueError as e:
+            st.sidebar.warning(f"Não foi possível calcular a cobertura da ZAS: {e}")
+
+diagnostico.marco("mapa_offline")
+if BASEMAP_TILES_DB_PATH and df_pe_base is not None:
+    st.sidebar.markdown("---")
+    st.sidebar.subheader("Mapa Base Offline")
+    # O arquivo só é criado no primeiro download: uma abertura comum do painel não deixa um MBTiles vazio.
+    armazem_tiles = armazem_tiles_existente(BASEMAP_TILES_DB_PATH)
+    tiles_guardados = len(armazem_tiles) if armazem_tiles is not None else 0
+    if not BASEMAP_TILE_PUBLIC_URL:
+        uso_tiles = ": o mapa usa os tiles da internet (configure BASEMAP_TILE_PUBLIC_URL para usar os baixados)."
+    elif tiles_guardados:
+        uso_tiles = ": o mapa usa o servidor local."
+    else:
+        uso_tiles = ": o mapa usa os tiles da internet."
+    st.sidebar.caption(f"{tiles_guardados:,} tiles guardados em {BASEMAP_TILES_DB_PATH}{uso_tiles}")
+    zoom_min, zoom_max = st.sidebar.slider(
+        "Zooms a baixar:", min_value=0, max_value=19, value=BASEMAP_PREFETCH_ZOOMS, key="tiles_zooms",
+        help="Baixe antes do exercício, com conexão, os tiles da área dos PEs e da ZAS."
+    )
+    area_tiles = area_de_interesse(
+        df_pe_base, tuple(gdf_zas.total_bounds) if gdf_zas is not None else None, BASEMAP_PREFETCH_MARGIN_KM
+    )
+    st.sidebar.caption(f"A área tem {contar_tiles(area_tiles, zoom_min, zoom_max):,} tiles nesses zooms.")
+    if st.sidebar.button("Baixar Tiles da Área", key="botao_baixar_tiles"):
+        barra_tiles = st.sidebar.progress(0.0, text="Baixando tiles...")
+        try:
+            resultado_tiles = prebaixar(
+                get_armazem_tiles(BASEMAP_TILES_DB_PATH), area_tiles, zoom_min, zoom_max, TILES_PADRAO,
+                progresso=lambda feitos, total: barra_tiles.progress(feitos / total if total else 1.0, text=f"Baixando tiles... {feitos:,}/{total:,}")
+            )
+            st.sidebar.success(
+                f"{resultado_tiles['baixados']:,} tiles baixados, {resultado_tiles['existentes']:,} já estavam guardados."
+            )
+            if resultado_tiles['falhas']:
+                st.sidebar.warning(f"{resultado_tiles['falhas']:,} tile(s) não puderam ser baixados; tente novamente com conexão.")
+        except ValueError as e:
+            st.sidebar.error(str(e))
+
+diagnostico.marco("paineis")
+if df_pe_base is not None:
+    with area_contagens:
+        painel_contagens(df_pe_base)
+
 
 # --- Layout Principal da Página ---
 
@@ -315,177 +1401,36 @@ with row1_col3:
     st.caption(st.session_state.get("client_name", ""))
 
 
-if not df_pe.empty:
+if locais_da_sessao():
+    st.subheader("🏗️ Locais do Exercício")
+    painel_locais()
+    st.markdown("---")
+
+if df_pe_base is not None:
     col_geral_metrics, col_single_pe, col_chart = st.columns([0.07, 0.13, 0.5])
 
     with col_geral_metrics:
-        st.markdown("###### Visão Geral")
-        total_participantes_geral = df_pe['Total de Participantes'].sum()
-        total_esperados_geral = df_pe['Número de Pessoas Esperadas'].sum()
-        efetividade_geral = (total_participantes_geral / total_esperados_geral * 100) if total_esperados_geral > 0 else 0
-
-        st.metric(label="Total Participantes", value=f"{total_participantes_geral:,.0f}")
-        st.metric(label="Total Esperado", value=f"{total_esperados_geral:,.0f}")
-        st.metric(label="Efetividade Geral", value=f"{efetividade_geral:.2f}%")
+        painel_metricas(df_pe_base)
 
     with col_single_pe:
-        st.markdown("###### Visão Detalhada - Ponto de Encontro")
-        if not df_pe.empty:
-            pe_names_list = df_pe.index.tolist()
-            if not pe_names_list:
-                st.info("Nenhum PE disponível para seleção.")
-            else:
-                current_selection_idx = 0
-                if 'selected_pe_name_dashboard' in st.session_state and st.session_state.selected_pe_name_dashboard in pe_names_list:
-                    current_selection_idx = pe_names_list.index(st.session_state.selected_pe_name_dashboard)
-                else:
-                    st.session_state.selected_pe_name_dashboard = pe_names_list[0]
-
-                selected_pe_name = st.selectbox(
-                    "Selecione o Ponto de Encontro:",
-                    options=pe_names_list,
-                    index=current_selection_idx,
-                    key="selected_pe_name_dashboard_selectbox"
-                )
-                st.session_state.selected_pe_name_dashboard = selected_pe_name
-
-                if selected_pe_name:
-                    row_pe_data = df_pe.loc[selected_pe_name]
-                    st.markdown(f"<div class='pe-card'><h6>{selected_pe_name}</h6>", unsafe_allow_html=True)
-                    efetividade_val = row_pe_data['Efetividade (%)']
-                    st.progress(int(efetividade_val))
-                    st.caption(f"Efetividade: {efetividade_val:.2f}%")
-
-                    card_metric_col1, card_metric_col2 = st.columns(2)
-                    with card_metric_col1:
-                        st.markdown(f"<p class='pe-card-metric-label'>Participantes</p>"
-                                    f"<p class='pe-card-metric-value'>{row_pe_data['Total de Participantes']:,.0f}</p>",
-                                    unsafe_allow_html=True)
-                    with card_metric_col2:
-                        st.markdown(f"<p class='pe-card-metric-label'>Esperados</p>"
-                                    f"<p class='pe-card-metric-value pe-card-metric-value-alt'>{row_pe_data['Número de Pessoas Esperadas']:,.0f}</p>",
-                                    unsafe_allow_html=True)
-                    st.markdown("</div>", unsafe_allow_html=True)
-        else:
-            st.info("Pontos de Encontro não configurados.")
-
+        painel_pe_detalhe(df_pe_base)
 
     with col_chart:
-        st.markdown("###### Participantes: Realizado vs. Esperado (Todos PEs)")
-        df_melted = df_pe.reset_index().melt(
-            id_vars=['Nome'],
-            value_vars=['Total de Participantes', 'Número de Pessoas Esperadas'],
-            var_name='Métrica', value_name='Quantidade'
-        )
-        fig_participantes_esperados = px.bar(
-            df_melted, x='Nome', y='Quantidade', color='Métrica', barmode='group',
-            color_discrete_map={
-                'Total de Participantes': COLOR_SECONDARY,
-                'Número de Pessoas Esperadas': COLOR_PRIMARY
-            },
-            labels={'Nome': 'Ponto de Encontro', 'Quantidade': 'Número de Pessoas'}
-        )
-        fig_participantes_esperados.update_layout(
-            height=TOP_DATA_ROW_CONTENT_HEIGHT_PX,
-            xaxis_title=None, yaxis_title="Número de Pessoas",
-            plot_bgcolor=COLOR_WHITE, paper_bgcolor=COLOR_WHITE,
-            font_color=COLOR_PRIMARY,
-            xaxis=dict(tickfont=dict(color=COLOR_PRIMARY)),
-            yaxis=dict(tickfont=dict(color=COLOR_PRIMARY)),
-            legend_title_text='',
-            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1, font=dict(color=COLOR_PRIMARY)),
-            margin=dict(t=20, b=0, l=0, r=0)
-        )
-        fig_participantes_esperados.update_yaxes(showgrid=True, gridwidth=0.5, gridcolor='LightGrey')
-        st.plotly_chart(fig_participantes_esperados, use_container_width=True)
+        aba_grafico, aba_evolucao = st.tabs(["Realizado vs. Esperado", "Evolução no Tempo"])
+        with aba_grafico:
+            painel_grafico(df_pe_base)
+        with aba_evolucao:
+            painel_evolucao(df_pe_base)
 
     st.markdown("---")
 
     st.subheader("🗺️ Mapa Interativo dos Pontos de Encontro")
-    if not df_pe.empty:
-        map_center_lat = df_pe['Latitude'].mean()
-        map_center_lon = df_pe['Longitude'].mean()
-        zoom_start = 11
-    else:
-        map_center_lat = -18.45 
-        map_center_lon = -48.00 
-        zoom_start = 11
-
-    m = folium.Map(
-        location=[map_center_lat, map_center_lon],
-        zoom_start=zoom_start,
-        tiles="https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}",
-        attr="Esri &mdash; Esri, i-cubed, USDA, USGS, AEX, GeoEye, Getmapping, Aerogrid, IGN, IGP, UPR-EGP, and the GIS User Community"
-    )
-
-    gdf_zas = None
-    if uploaded_zas_file is not None:
-        try:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                temp_zip_path = os.path.join(tmpdir, uploaded_zas_file.name)
-                with open(temp_zip_path, "wb") as f:
-                    f.write(uploaded_zas_file.getvalue())
-
-                with zipfile.ZipFile(temp_zip_path, 'r') as zip_ref:
-                   zip_ref.extractall(tmpdir)
-
-                shp_file_path = None
-                for item in os.listdir(tmpdir):
-                     if item.endswith(".shp"):
-                        shp_file_path = os.path.join(tmpdir, item)
-                        break
-                
-                if shp_file_path:
-                   gdf_zas = geopandas.read_file(shp_file_path)
-                   if gdf_zas.crs is None:
-                        st.sidebar.warning("Shapefile da ZAS não possui CRS definido. Assumindo WGS84 (EPSG:4326).")
-                        gdf_zas.set_crs("EPSG:4326", inplace=True, allow_override=True)
-                   elif gdf_zas.crs.to_string() != "EPSG:4326":
-                        try:
-                            gdf_zas = gdf_zas.to_crs("EPSG:4326")
-                        except Exception as e_crs:
-                            st.sidebar.error(f"Erro ao reprojetar ZAS para EPSG:4326: {e_crs}")
-                            gdf_zas = None
-                   if gdf_zas is not None and isinstance(gdf_zas, geopandas.GeoDataFrame) and not gdf_zas.empty:
-                        attribute_columns = [col for col in gdf_zas.columns if col != gdf_zas.geometry.name]
-                        style_zas = {'fillColor': '#00c5ff', 'color': '#e41a1c', 'weight': 0.7, 'fillOpacity': 0.5}
-                        folium.GeoJson(
-                            gdf_zas, name='Zona de Autossalvamento (ZAS)', style_function=lambda x: style_zas,
-                            tooltip=folium.GeoJsonTooltip(fields=attribute_columns, aliases=[f"{col}:" for col in attribute_columns], sticky=False)
-                        ).add_to(m)
-                elif uploaded_zas_file and (gdf_zas is None or (isinstance(gdf_zas, geopandas.GeoDataFrame) and gdf_zas.empty)):
-                     st.sidebar.warning("O GeoDataFrame da ZAS está vazio, não é válido ou não pôde ser processado.")
-
-        except Exception as e:
-            st.sidebar.error(f"Erro ao processar o shapefile da ZAS: {e}")
-            gdf_zas = None
+    painel_mapa(df_pe_base, zas_lod, zas_tiles, sobreposicao_mapa)
 
-    for idx_name, row_pe_map in df_pe.iterrows():
-        popup_html = f"""<div style="font-family: Arial, sans-serif; font-size: 12px;">
-            <strong>PE:</strong> {idx_name}<br>
-            <strong>Participantes:</strong> {row_pe_map['Total de Participantes']:,.0f}<br>
-            <strong>Esperados:</strong> {row_pe_map['Número de Pessoas Esperadas']:,.0f}<br>
-            <strong>Efetividade:</strong> {row_pe_map['Efetividade (%)']:.2f}%</div>"""
-        efetividade_valor = row_pe_map['Efetividade (%)']
-        pe_icon_color = 'gray'
-        pe_icon_symbol = 'minus-sign' 
-        if row_pe_map['Número de Pessoas Esperadas'] > 0 or row_pe_map['Total de Participantes'] > 0 :
-            if efetividade_valor >= 80: pe_icon_color, pe_icon_symbol = 'green', 'ok-sign'
-            elif efetividade_valor >= 50: pe_icon_color, pe_icon_symbol = 'orange', 'info-sign'
-            else: pe_icon_color, pe_icon_symbol = 'red', 'remove-sign'
-
-        folium.Marker(
-            location=[row_pe_map['Latitude'], row_pe_map['Longitude']],
-            popup=folium.Popup(popup_html, max_width=250),
-            tooltip=f"{idx_name} | Efetividade: {row_pe_map['Efetividade (%)']:.1f}%",
-            icon=folium.Icon(color=pe_icon_color, icon=pe_icon_symbol, prefix='glyphicon')
-        ).add_to(m)
-
-    if gdf_zas is not None and isinstance(gdf_zas, geopandas.GeoDataFrame) and not gdf_zas.empty:
-        folium.LayerControl().add_to(m)
-    
-    # Pass MAP_SECTION_HEIGHT_PX to st_folium. CSS will also enforce this.
-    st_folium(m, width=None, height=MAP_SECTION_HEIGHT_PX, use_container_width=True)
+    if cobertura is not None:
+        st.markdown("---")
+        st.subheader("🧭 Cobertura da ZAS pelos Pontos de Encontro")
+        painel_cobertura(cobertura, cobertura_limite)
 
 else:
     st.info("👈 Configure os Pontos de Encontro na barra lateral para visualizar o dashboard.")
@@ -613,4 +1558,20 @@ st.markdown(custom_css, unsafe_allow_html=True)
 
 # REMOVIDO: st.markdown("---") que estava aqui para reduzir o espaço antes do rodapé.
 st.markdown("---")
-st.markdown(f"<p style='text-align:center; color:{COLOR_PRIMARY}; font-size:0.9em; margin-top: 0rem !important; margin-bottom: 0rem !important;'>{st.session_state.get('app_title', 'Painel de Simulado PAE')} | Desenvolvido para visualização otimizada de dados.</p>", unsafe_allow_html=True)
\ No newline at end of file
+st.markdown(f"<p style='text-align:center; color:{COLOR_PRIMARY}; font-size:0.9em; margin-top: 0rem !important; margin-bottom: 0rem !important;'>{st.session_state.get('app_title', 'Painel de Simulado PAE')} | Desenvolvido para visualização otimizada de dados.</p>", unsafe_allow_html=True)
+
+# --- Diagnóstico de Desempenho ---
+st.sidebar.markdown("---")
+st.sidebar.subheader("Diagnóstico de Desempenho")
+if st.sidebar.toggle(
+    "Medir etapas das execuções", key="diagnostico_ativo",
+    help="Registra o tempo de cada etapa, o que disparou cada execução e as consultas aos caches, "
+         f"em {DIAGNOSTICS_JSONL_PATH} e {DIAGNOSTICS_PROMETHEUS_PATH}."
+):
+    st.sidebar.toggle(
+        "Medir pico de memória", key="diagnostico_memoria",
+        help="Mede a memória alocada em cada etapa com o tracemalloc, o que deixa as execuções mais lentas."
+    )
+registrar_diagnostico(diagnostico)
+if diagnostico.ativa:
+    painel_diagnostico()
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from pae_dashboard.chegadas import (
+    COL_CHEGADAS_MINUTO, COL_EFETIVIDADE_ACUMULADA, COL_PARTICIPANTES_ACUMULADOS, SerieChegadas, coluna_meta
+)
+
+
+def test_registros_fora_de_ordem_sao_reordenados():
+    serie = SerieChegadas(tamanho_bloco=4)
+    serie.registrar(['PE-01', 'PE-01'], [1, 2], [600.0, 660.0])
+    # Chegadas de outro PE lidas com atraso, anteriores às já registradas.
+    serie.registrar(['PE-02', 'PE-02', 'PE-02'], [1, 2, 3], [0.0, 60.0, 120.0])
+
+    ts, _, _, _ = serie.colunas()
+
+    assert serie.inicio == 0.0
+    assert np.all(np.diff(ts) >= 0)
+    assert serie.chegadas_por_minuto()[COL_CHEGADAS_MINUTO].tolist() == [1, 1, 1] + [0] * 7 + [1, 1]
+
+
+def test_tempos_ate_meta_com_registros_fora_de_ordem():
+    serie = SerieChegadas()
+    serie.registrar(['PE-01'], [10], [300.0])
+    serie.registrar(['PE-02', 'PE-02'], [5, 10], [60.0, 120.0])
+
+    tempos = serie.tempos_ate_meta(pd.Series([10, 10], index=['PE-01', 'PE-02']))
+
+    assert tempos.loc['PE-01', coluna_meta(50)] == 4.0
+    assert tempos.loc['PE-02', coluna_meta(50)] == 0.0
+    assert tempos.loc['PE-02', coluna_meta(80)] == 1.0
+
+
+def test_registro_atrasado_do_mesmo_pe():
+    serie = SerieChegadas()
+    serie.registrar(['PE-01'], [5], [600.0])
+    # Evento lido com atraso, anterior ao valor já registrado (como uma edição manual seguida da ingestão).
+    serie.registrar(['PE-01'], [3], [300.0])
+    # Registro em ordem com o mesmo valor do atrasado: é uma mudança (5 -> 3), não uma repetição.
+    serie.registrar(['PE-01'], [3], [900.0])
+    serie.registrar(['PE-01'], [3], [960.0])
+    esperadas = pd.Series([10], index=['PE-01'])
+
+    acumulada = serie.efetividade_acumulada(esperadas)
+
+    assert acumulada[COL_PARTICIPANTES_ACUMULADOS].tolist() == [3, 5, 3]
+    assert acumulada[COL_EFETIVIDADE_ACUMULADA].tolist() == [30.0, 50.0, 30.0]
+    assert serie.tempos_gerais_ate_meta(esperadas) == {50: 5.0, 80: None}
+    _, _, valores, deltas = serie.colunas()
+    assert valores.tolist() == [3, 5, 3]
+    assert deltas.tolist() == [3, 2, -2]
+
+    # Depois da reordenação, o valor mais recente do PE é o de 900 s.
+    serie.registrar(['PE-01'], [4], [1000.0])
+    assert serie.efetividade_acumulada(esperadas)[COL_PARTICIPANTES_ACUMULADOS].tolist() == [3, 5, 3, 4]
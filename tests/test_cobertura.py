@@ -0,0 +1,79 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+from shapely.geometry import Point, Polygon, box
+
+from pae_dashboard.cobertura import calcular_cobertura, construir_grade, rasterizar
+from pae_dashboard.relacao_zas import construir_indice
+
+
+def test_rasterizar_confere_com_contains_xy():
+    rng = np.random.default_rng(1)
+    estrela = Polygon([
+        (5_000 + raio * np.cos(angulo), 5_000 + raio * np.sin(angulo))
+        for angulo, raio in zip(np.linspace(0, 2 * np.pi, 60, endpoint=False), rng.uniform(1_500, 4_000, 60))
+    ])
+    com_buraco = Polygon(
+        [(9_013.7, 1_021.3), (12_987.1, 1_530.9), (12_411.9, 6_978.2), (9_534.3, 6_001.7)],
+        [[(10_203.1, 2_517.7), (11_796.3, 2_711.1), (11_113.9, 4_489.3)]],
+    )
+    # Dois polígonos que se sobrepõem: as células em comum aparecem uma vez só.
+    sobrepostos = [Point(3_000.3, 9_000.7).buffer(1_200.1), Point(4_100.9, 9_400.3).buffer(900.7)]
+    poligonos = np.array([estrela, com_buraco, *sobrepostos], dtype=object)
+    resolucao = 37.3
+
+    x0, y0, nx, ny, celulas = rasterizar(poligonos, resolucao)
+
+    assert (x0, y0) == tuple(shapely.total_bounds(poligonos)[:2])
+    assert np.all(np.diff(celulas) > 0)
+    linha, coluna = np.divmod(np.arange(nx * ny), nx)
+    xc, yc = x0 + (coluna + 0.5) * resolucao, y0 + (linha + 0.5) * resolucao
+    esperado = np.zeros(nx * ny, dtype=bool)
+    for poligono in poligonos:
+        esperado |= shapely.contains_xy(poligono, xc, yc)
+    dentro = np.zeros(nx * ny, dtype=bool)
+    dentro[celulas] = True
+    assert np.count_nonzero(dentro != esperado) == 0
+    assert esperado.sum() > 10_000
+
+
+@pytest.fixture
+def grade():
+    zas = gpd.GeoDataFrame(
+        geometry=[box(-43.30, -22.95, -43.22, -22.88), box(-43.22, -22.93, -43.17, -22.90)], crs="EPSG:4326"
+    )
+    return construir_grade(construir_indice(zas), resolucao=50)
+
+
+def pes_aleatorios(rng, nomes):
+    return pd.DataFrame(
+        {'Latitude': rng.uniform(-22.96, -22.87, len(nomes)), 'Longitude': rng.uniform(-43.31, -43.16, len(nomes))},
+        index=pd.Index(nomes, name='Nome'),
+    )
+
+
+def test_atualizada_igual_ao_calculo_completo(grade):
+    rng = np.random.default_rng(7)
+    df_pe = pes_aleatorios(rng, [f"PE {i}" for i in range(40)])
+    cobertura = calcular_cobertura(grade, df_pe, distancia_maxima_m=1_500)
+    proximo = 40
+
+    for _ in range(5):
+        # Três PEs movidos, um removido e um incluído por rodada.
+        df_pe = df_pe.copy()
+        movidos = rng.choice(len(df_pe), 3, replace=False)
+        df_pe.iloc[movidos] = pes_aleatorios(rng, df_pe.index[movidos]).to_numpy()
+        df_pe = df_pe.drop(df_pe.index[rng.integers(len(df_pe))])
+        df_pe = pd.concat([df_pe, pes_aleatorios(rng, [f"PE {proximo}"])])
+        proximo += 1
+
+        cobertura = cobertura.atualizada(df_pe)
+        completa = calcular_cobertura(grade, df_pe, distancia_maxima_m=1_500)
+
+        assert 0 < cobertura.recalculadas < len(grade)
+        np.testing.assert_array_equal(cobertura.distancias, completa.distancias)
+        np.testing.assert_array_equal(cobertura.mais_proximo, completa.mais_proximo)
+        np.testing.assert_array_equal(cobertura.distancia_bloco, completa.distancia_bloco)
+        pd.testing.assert_frame_equal(cobertura.faixas(), completa.faixas())
@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+from pae_dashboard.compartilhado import RegistroExercicios
+from pae_dashboard.ingestao import IngestorEventos
+from pae_dashboard.persistencia import ArmazemContagens
+
+
+NOMES = ['PE-01', 'PE-02']
+
+
+def esperar_versao(ingestor, versao, limite_s=5.0):
+    prazo = time.monotonic() + limite_s
+    while ingestor.versao < versao:
+        assert time.monotonic() < prazo, "o ingestor não consolidou os eventos a tempo"
+        time.sleep(0.005)
+
+
+def publicar_chegadas(ingestor, pe, quantidade):
+    versao = ingestor.versao
+    for _ in range(quantidade):
+        ingestor.publicar((None, pe, 'participantes', None, 1, None))
+        # Um lote por evento: o exercício recebe vários lotes, como num exercício real.
+        esperar_versao(ingestor, versao + 1)
+        versao = ingestor.versao
+
+
+@pytest.fixture
+def ingestor():
+    ingestor = IngestorEventos(intervalo_lote_s=0.001)
+    yield ingestor
+    ingestor.parar()
+
+
+@pytest.fixture
+def registro(tmp_path):
+    caminho = str(tmp_path / 'contagens.sqlite3')
+    armazens = []
+
+    def fabrica(exercicio):
+        armazens.append(ArmazemContagens(caminho, exercicio))
+        return armazens[-1]
+
+    yield RegistroExercicios(fabrica, ttl_s=0.0)
+    for armazem in armazens:
+        armazem.fechar()
+
+
+def participantes(exercicio, pe):
+    return int(exercicio.contagens(NOMES).loc[pe].iloc[0])
+
+
+def test_sincronizar_ingestao_aplica_cada_lote_uma_vez(ingestor, registro):
+    exercicio = registro.obter('ex', 'sessao-a')
+    publicar_chegadas(ingestor, 'PE-01', 5)
+
+    exercicio.sincronizar_ingestao(ingestor, NOMES)
+    exercicio.sincronizar_ingestao(ingestor, NOMES)
+
+    assert participantes(exercicio, 'PE-01') == 5
+
+
+def test_exercicio_reaberto_nao_reaplica_lotes(ingestor, registro):
+    exercicio = registro.obter('ex', 'sessao-a')
+    publicar_chegadas(ingestor, 'PE-01', 5)
+    exercicio.sincronizar_ingestao(ingestor, NOMES)
+    assert participantes(exercicio, 'PE-01') == 5
+
+    # Outra sessão em outro exercício: a sessão 'a' expira e o exercício é descartado da memória.
+    time.sleep(0.01)
+    registro.obter('outro', 'sessao-b')
+    publicar_chegadas(ingestor, 'PE-02', 3)
+    time.sleep(0.01)
+    reaberto = registro.obter('ex', 'sessao-a')
+    assert reaberto is not exercicio
+
+    reaberto.sincronizar_ingestao(ingestor, NOMES)
+
+    assert participantes(reaberto, 'PE-01') == 5
+    assert participantes(reaberto, 'PE-02') == 3
@@ -0,0 +1,113 @@
+import pandas as pd
+import pytest
+
+from pae_dashboard import contagens
+from pae_dashboard.contagens import CHAVE_FRAME, diferenca_pes, obter_contagens, reconciliar_contagens
+from pae_dashboard.efetividade import COL_ESPERADAS, COL_PARTICIPANTES, montar_contagens
+
+
+def pes(*linhas):
+    return pd.DataFrame(linhas, columns=['Nome', 'Latitude', 'Longitude'])
+
+
+ANTERIORES = pes(('PE 1', -22.9, -43.1), ('PE 2', -22.8, -43.2), ('PE 3', -22.7, -43.3))
+
+
+class ArmazemFalso:
+    def __init__(self):
+        self.registrados = []
+
+    def registrar(self, valores):
+        self.registrados.append(valores)
+
+
+@pytest.fixture
+def state():
+    state = {
+        'participantes_PE 1': 5, 'esperadas_PE 1': 10,
+        'participantes_PE 2': 7, 'esperadas_PE 2': 20,
+        'participantes_PE 3': 9,
+    }
+    obter_contagens(state, ANTERIORES['Nome'])
+    return state
+
+
+@pytest.fixture
+def montagens(monkeypatch):
+    """Nomes de cada montagem do DataFrame de contagens feita pelo módulo."""
+    chamadas = []
+
+    def montar(nomes, state):
+        chamadas.append(list(nomes))
+        return montar_contagens(nomes, state)
+
+    monkeypatch.setattr(contagens, 'montar_contagens', montar)
+    return chamadas
+
+
+def test_renomeado_pelas_coordenadas_leva_as_contagens(state, montagens):
+    novos = pes(('PE 1', -22.9, -43.1), ('PE Dois', -22.8, -43.2), ('PE 3', -22.7, -43.3))
+    diferenca = diferenca_pes(ANTERIORES, novos)
+    armazem = ArmazemFalso()
+
+    assert diferenca.renomeados == {'PE 2': 'PE Dois'}
+    assert not (diferenca.adicionados or diferenca.removidos or diferenca.movidos)
+
+    assert reconciliar_contagens(state, diferenca, novos['Nome'], armazem) == ['PE Dois']
+
+    assert (state['participantes_PE Dois'], state['esperadas_PE Dois']) == (7, 20)
+    assert 'participantes_PE 2' not in state and 'esperadas_PE 2' not in state
+    assert armazem.registrados == [{'PE Dois': {'participantes': 7, 'esperadas': 20}}]
+    frame = state[CHAVE_FRAME]
+    assert list(frame.index) == ['PE 1', 'PE Dois', 'PE 3']
+    assert frame.loc['PE Dois', COL_PARTICIPANTES] == 7
+    # O DataFrame foi ajustado, não remontado, e continua igual ao que uma nova montagem daria.
+    assert montagens == []
+    pd.testing.assert_frame_equal(frame, montar_contagens(novos['Nome'], state), check_index_type=False)
+    assert obter_contagens(state, novos['Nome']) is frame
+
+
+def test_removido_perde_as_chaves_e_adicionado_usa_os_padroes(state, montagens):
+    novos = pes(('PE 3', -22.7, -43.3), ('PE 1', -22.9, -43.1), ('PE 4', -22.6, -43.4))
+    diferenca = diferenca_pes(ANTERIORES, novos)
+
+    assert (list(diferenca.adicionados), list(diferenca.removidos), diferenca.renomeados) == (['PE 4'], ['PE 2'], {})
+
+    assert reconciliar_contagens(state, diferenca, novos['Nome']) == []
+
+    assert not any(chave.endswith('_PE 2') for chave in state)
+    assert not any(chave.endswith('_PE 4') for chave in state)
+    frame = state[CHAVE_FRAME]
+    assert list(frame.index) == ['PE 3', 'PE 1', 'PE 4']
+    # Só o PE adicionado passou pela montagem.
+    assert montagens == [['PE 4']]
+    pd.testing.assert_frame_equal(frame, montar_contagens(novos['Nome'], state), check_index_type=False)
+
+
+def test_mesmo_nome_em_outro_lugar_mantem_as_contagens(state, montagens):
+    novos = pes(('PE 1', -22.9, -43.1), ('PE 2', -22.85, -43.25), ('PE 3', -22.7, -43.3))
+    diferenca = diferenca_pes(ANTERIORES, novos)
+
+    assert list(diferenca.movidos) == ['PE 2']
+    assert not (diferenca.adicionados or diferenca.removidos or diferenca.renomeados)
+
+    frame = state[CHAVE_FRAME]
+    assert reconciliar_contagens(state, diferenca, novos['Nome']) == []
+
+    assert (state['participantes_PE 2'], state['esperadas_PE 2']) == (7, 20)
+    pd.testing.assert_frame_equal(state[CHAVE_FRAME], frame, check_index_type=False)
+    assert montagens == []
+
+
+def test_pe_movido_para_o_lugar_de_um_removido_nao_e_renomeacao(state):
+    # O PE 3 vai para as coordenadas do PE 2, que some: é o mesmo nome movido, não uma renomeação.
+    novos = pes(('PE 1', -22.9, -43.1), ('PE 3', -22.8, -43.2))
+    diferenca = diferenca_pes(ANTERIORES, novos)
+
+    assert (list(diferenca.removidos), list(diferenca.movidos), diferenca.renomeados) == (['PE 2'], ['PE 3'], {})
+
+    reconciliar_contagens(state, diferenca, novos['Nome'])
+
+    assert state['participantes_PE 3'] == 9
+    assert 'participantes_PE 2' not in state
+    pd.testing.assert_frame_equal(state[CHAVE_FRAME], montar_contagens(novos['Nome'], state), check_index_type=False)
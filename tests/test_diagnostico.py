@@ -0,0 +1,65 @@
+import gc
+import json
+import tracemalloc
+
+from pae_dashboard.diagnostico import PREFIXO_METRICAS, Execucao, RegistroDiagnostico
+
+
+def registrar_execucao(registro, **valores):
+    execucao = Execucao(gatilho='teste', sessao='s')
+    with execucao.etapa('mapa_envio'):
+        pass
+    for nome, valor in valores.items():
+        execucao.registrar_valor(nome, valor)
+    registro.registrar(execucao.finalizar())
+
+
+def test_valores_exportados_em_jsonl_e_prometheus(tmp_path):
+    jsonl, prom = tmp_path / 'execucoes.jsonl', tmp_path / 'execucoes.prom'
+    registro = RegistroDiagnostico(str(jsonl), str(prom))
+
+    registrar_execucao(registro, mapa_envio_bytes=120_000, marcadores_regerados=3)
+    registrar_execucao(registro, mapa_envio_bytes=95_000)
+
+    linhas = [json.loads(linha) for linha in jsonl.read_text(encoding='utf-8').splitlines()]
+    assert [linha['valores'].get('mapa_envio_bytes') for linha in linhas] == [120_000, 95_000]
+    texto = prom.read_text(encoding='utf-8')
+    assert f'# TYPE {PREFIXO_METRICAS}_valor gauge' in texto
+    assert f'{PREFIXO_METRICAS}_valor{{nome="mapa_envio_bytes"}} 95000' in texto.splitlines()
+    assert f'{PREFIXO_METRICAS}_valor{{nome="marcadores_regerados"}} 3' in texto.splitlines()
+    assert f'{PREFIXO_METRICAS}_etapa_duracao_segundos_count{{etapa="mapa_envio"}} 2' in texto.splitlines()
+
+
+def test_valores_nao_numericos_ficam_so_no_jsonl():
+    registro = RegistroDiagnostico()
+
+    registrar_execucao(registro, origem='arquivo', ligado=True)
+
+    assert registro.execucoes()[0]['valores'] == {'origem': 'arquivo', 'ligado': True}
+    assert f'{PREFIXO_METRICAS}_valor{{' not in registro.texto_prometheus()
+
+
+def test_medicao_de_memoria_e_liberada_uma_vez():
+    assert not tracemalloc.is_tracing()
+    primeira, segunda = Execucao(medir_memoria=True), Execucao(medir_memoria=True)
+
+    primeira.finalizar()
+    primeira.finalizar()
+    assert tracemalloc.is_tracing()
+
+    segunda.finalizar()
+    assert not tracemalloc.is_tracing()
+
+
+def test_execucao_interrompida_libera_o_tracemalloc_ao_ser_descartada():
+    assert not tracemalloc.is_tracing()
+    execucao = Execucao(medir_memoria=True)
+    with execucao.etapa('mapa'):
+        pass
+    assert tracemalloc.is_tracing()
+
+    # Como numa reexecução interrompida: a execução nunca chega a `finalizar`.
+    del execucao
+    gc.collect()
+
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pae_dashboard.efetividade import (
+    COL_COR, COL_EFETIVIDADE, COL_ESPERADAS, COL_ICONE, COL_PARTICIPANTES, aplicar_indicadores,
+    calcular_efetividade, classificar_marcadores, montar_contagens
+)
+
+
+def test_montar_contagens_usa_estado_e_padroes():
+    state = {'participantes_PE-01': 7, 'esperadas_PE-01': 10, 'esperadas_PE-02': 0}
+
+    contagens = montar_contagens(['PE-01', 'PE-02', 'PE-03'], state)
+
+    assert list(contagens.index) == ['PE-01', 'PE-02', 'PE-03']
+    assert contagens.index.name == 'Nome'
+    assert contagens[COL_PARTICIPANTES].tolist() == [7, 0, 0]
+    assert contagens[COL_ESPERADAS].tolist() == [10, 0, 1]
+    assert contagens[COL_PARTICIPANTES].dtype == np.int64
+
+
+def test_montar_contagens_sem_pes():
+    contagens = montar_contagens([], {})
+
+    assert contagens.empty
+    assert list(contagens.columns) == [COL_PARTICIPANTES, COL_ESPERADAS]
+
+
+def test_calcular_efetividade_sem_esperados_vale_zero():
+    efetividade = calcular_efetividade([5, 0, 3, 8], [10, 0, 0, 4])
+
+    np.testing.assert_allclose(efetividade, [50.0, 0.0, 0.0, 200.0])
+
+
+def test_calcular_efetividade_com_nan():
+    efetividade = calcular_efetividade([np.nan, 5, 5], [10, np.nan, -1])
+
+    assert np.isnan(efetividade[0])
+    assert efetividade[1] == 0.0
+    assert efetividade[2] == 0.0
+
+
+@pytest.mark.parametrize('participantes, esperadas, cor, icone', [
+    (8, 10, 'green', 'ok-sign'),
+    (10, 10, 'green', 'ok-sign'),
+    (5, 10, 'orange', 'info-sign'),
+    (79, 100, 'orange', 'info-sign'),
+    (49, 100, 'red', 'remove-sign'),
+    (0, 10, 'red', 'remove-sign'),
+    (3, 0, 'red', 'remove-sign'),
+    (0, 0, 'gray', 'minus-sign'),
+    (np.nan, np.nan, 'gray', 'minus-sign'),
+    (np.nan, 10, 'red', 'remove-sign'),
+])
+def test_classificar_marcadores(participantes, esperadas, cor, icone):
+    efetividade = calcular_efetividade([participantes], [esperadas])
+
+    cores, icones = classificar_marcadores(efetividade, [participantes], [esperadas])
+
+    assert cores[0] == cor
+    assert icones[0] == icone
+
+
+def test_classificar_marcadores_retorna_categoricos():
+    cores, icones = classificar_marcadores([90.0, 10.0], [9, 1], [10, 10])
+
+    assert isinstance(cores, pd.Categorical)
+    assert list(cores.categories) == ['red', 'orange', 'green', 'gray']
+    assert list(icones.categories) == ['remove-sign', 'info-sign', 'ok-sign', 'minus-sign']
+
+
+def test_aplicar_indicadores_em_100k_pes():
+    n = 100_000
+    nomes = [f'PE-{i:06d}' for i in range(n)]
+    state = {}
+    for i, nome in enumerate(nomes):
+        state[f'participantes_{nome}'] = i % 11
+        state[f'esperadas_{nome}'] = i % 10
+    df_pe = montar_contagens(nomes, state)
+
+    aplicar_indicadores(df_pe)
+
+    participantes = np.arange(n) % 11
+    esperadas = np.arange(n) % 10
+    esperado = np.divide(participantes * 100, esperadas, out=np.zeros(n), where=esperadas > 0)
+    np.testing.assert_allclose(df_pe[COL_EFETIVIDADE].to_numpy(), esperado)
+    cinzas = (participantes == 0) & (esperadas == 0)
+    assert (df_pe[COL_COR].to_numpy()[cinzas] == 'gray').all()
+    assert (df_pe[COL_ICONE].to_numpy()[esperado >= 80] == 'ok-sign').all()
+    assert (df_pe[COL_COR].to_numpy()[(esperado < 50) & ~cinzas] == 'red').all()
@@ -0,0 +1,161 @@
+import json
+import time
+
+import pytest
+
+from pae_dashboard.chegadas import COL_CHEGADAS_MINUTO
+from pae_dashboard.compartilhado import ExercicioCompartilhado
+from pae_dashboard.ingestao import PREFIXO_CURSOR_VERSAO, FonteArquivo, IngestorEventos, interpretar_momento
+from pae_dashboard.persistencia import ArmazemContagens, cursores_gravados
+
+
+NOMES = ['PE-01', 'PE-02']
+
+
+def escrever_eventos(caminho, inicio, quantidade, pe='PE-01'):
+    with open(caminho, 'a') as f:
+        for i in range(inicio, inicio + quantidade):
+            f.write(json.dumps({"id": f"ev-{i}", "pe": pe, "delta": 1}) + "\n")
+
+
+def esperar_recebidos(ingestor, recebidos, limite_s=5.0):
+    prazo = time.monotonic() + limite_s
+    while ingestor.recebidos < recebidos:
+        assert time.monotonic() < prazo, "o ingestor não leu os eventos a tempo"
+        time.sleep(0.01)
+
+
+def iniciar_servidor(banco, eventos, intervalo_lote_s=0.01):
+    """Simula a subida do servidor: novo ingestor lendo o arquivo do início e exercício recarregado do banco."""
+    ingestor = IngestorEventos(intervalo_lote_s=intervalo_lote_s, cortes=cursores_gravados(banco))
+    ingestor.adicionar_fonte(FonteArquivo(eventos, intervalo_s=0.01))
+    armazem = ArmazemContagens(banco, 'ex')
+    return ingestor, armazem, ExercicioCompartilhado('ex', armazem)
+
+
+def participantes(exercicio, pe='PE-01'):
+    return int(exercicio.contagens(NOMES).loc[pe].iloc[0])
+
+
+def test_reinicio_nao_reaplica_eventos_do_arquivo(tmp_path):
+    banco, eventos = str(tmp_path / 'contagens.sqlite3'), str(tmp_path / 'chegadas.ndjson')
+    escrever_eventos(eventos, 0, 5)
+
+    ingestor, armazem, exercicio = iniciar_servidor(banco, eventos)
+    esperar_recebidos(ingestor, 5)
+    exercicio.sincronizar_ingestao(ingestor, NOMES)
+    assert participantes(exercicio) == 5
+    ingestor.parar()
+    armazem.fechar()
+
+    # Chegadas durante a parada; o lote longo juntaria tudo num só lote se não fosse cortado na posição gravada.
+    escrever_eventos(eventos, 5, 2)
+    ingestor, armazem, exercicio = iniciar_servidor(banco, eventos, intervalo_lote_s=0.5)
+    assert participantes(exercicio) == 5
+    esperar_recebidos(ingestor, 7)
+    time.sleep(0.6)
+    exercicio.sincronizar_ingestao(ingestor, NOMES)
+
+    assert participantes(exercicio) == 7
+    ingestor.parar()
+    armazem.fechar()
+
+
+def test_reinicios_mantem_um_so_cursor_de_versao(tmp_path):
+    banco, eventos = str(tmp_path / 'contagens.sqlite3'), str(tmp_path / 'chegadas.ndjson')
+
+    for reinicio in range(3):
+        escrever_eventos(eventos, 2 * reinicio, 2)
+        ingestor, armazem, exercicio = iniciar_servidor(banco, eventos)
+        esperar_recebidos(ingestor, 2 * reinicio + 2)
+        time.sleep(0.05)
+        exercicio.sincronizar_ingestao(ingestor, NOMES)
+        assert participantes(exercicio) == 2 * reinicio + 2
+
+        versoes = [chave for chave in armazem.cursores_ingestao() if chave.startswith(PREFIXO_CURSOR_VERSAO)]
+        assert versoes == [PREFIXO_CURSOR_VERSAO + ingestor.identificador]
+        assert [chave for chave in exercicio._cursores_ingestao if chave.startswith(PREFIXO_CURSOR_VERSAO)] == versoes
+        ingestor.parar()
+        armazem.fechar()
+
+
+def test_arquivo_substituido_e_lido_por_inteiro(tmp_path):
+    banco, eventos = str(tmp_path / 'contagens.sqlite3'), str(tmp_path / 'chegadas.ndjson')
+    escrever_eventos(eventos, 0, 3)
+    ingestor, armazem, exercicio = iniciar_servidor(banco, eventos)
+    esperar_recebidos(ingestor, 3)
+    exercicio.sincronizar_ingestao(ingestor, NOMES)
+    ingestor.parar()
+    armazem.fechar()
+
+    substituto = tmp_path / 'novo.ndjson'
+    escrever_eventos(str(substituto), 100, 2, pe='PE-02')
+    substituto.replace(eventos)
+    ingestor, armazem, exercicio = iniciar_servidor(banco, eventos)
+    esperar_recebidos(ingestor, 2)
+    time.sleep(0.05)
+    exercicio.sincronizar_ingestao(ingestor, NOMES)
+
+    assert participantes(exercicio, 'PE-01') == 3
+    assert participantes(exercicio, 'PE-02') == 2
+    ingestor.parar()
+    armazem.fechar()
+
+
+def test_cursores_gravados_nao_cria_o_banco(tmp_path):
+    banco = tmp_path / 'inexistente.sqlite3'
+
+    assert cursores_gravados(str(banco)) == {}
+    assert not banco.exists()
+
+
+def test_interpretar_momento():
+    assert interpretar_momento(None) is None
+    assert interpretar_momento('') is None
+    assert interpretar_momento(1_700_000_000) == 1_700_000_000.0
+    assert interpretar_momento(1_700_000_000_500) == 1_700_000_000.5
+    assert interpretar_momento('1700000000') == 1_700_000_000.0
+    assert interpretar_momento('2023-11-14T22:13:20Z') == 1_700_000_000.0
+    assert interpretar_momento('2023-11-14T19:13:20-03:00') == 1_700_000_000.0
+    with pytest.raises(ValueError):
+        interpretar_momento('ontem')
+
+
+def test_chegadas_ficam_no_momento_dos_eventos(tmp_path):
+    banco, eventos = str(tmp_path / 'contagens.sqlite3'), str(tmp_path / 'chegadas.ndjson')
+    inicio = 1_700_000_000
+    # Uma chegada por minuto durante 10 minutos, lidas todas de uma vez (como na releitura de um arquivo).
+    with open(eventos, 'w') as f:
+        for minuto in range(10):
+            f.write(json.dumps({"id": f"ev-{minuto}", "pe": "PE-01", "delta": 1, "timestamp": inicio + 60 * minuto}))
+            f.write("\n")
+
+    ingestor, armazem, exercicio = iniciar_servidor(banco, eventos, intervalo_lote_s=0.5)
+    esperar_recebidos(ingestor, 10)
+    exercicio.sincronizar_ingestao(ingestor, NOMES)
+
+    assert participantes(exercicio) == 10
+    assert [ts for _, _, ts in armazem.historico('participantes')] == [inicio + 60 * minuto for minuto in range(10)]
+    assert exercicio.chegadas.inicio == inicio
+    por_minuto = exercicio.chegadas.chegadas_por_minuto()
+    assert por_minuto[COL_CHEGADAS_MINUTO].tolist() == [1.0] * 10
+    ingestor.parar()
+    armazem.fechar()
+
+    # O exercício recarregado do banco reconstrói a mesma série.
+    recarregado = ExercicioCompartilhado('ex', ArmazemContagens(banco, 'ex'))
+    assert recarregado.chegadas.chegadas_por_minuto()[COL_CHEGADAS_MINUTO].tolist() == [1.0] * 10
+    recarregado.armazem.fechar()
+
+
+def test_eventos_do_mesmo_segundo_sao_combinados():
+    ingestor = IngestorEventos(intervalo_lote_s=0.5)
+    for i in range(3):
+        ingestor.publicar((f'e{i}', 'PE-01', 'participantes', None, 1, 100.0 + i * 0.2))
+    ingestor.publicar(('e3', 'PE-01', 'participantes', None, 1, 160.0))
+    esperar_recebidos(ingestor, 4)
+
+    _, alteracoes, _ = ingestor.alteracoes_desde(0)
+
+    assert sorted(alteracoes.values(), key=lambda alteracao: alteracao[2]) == [(None, 3, 100.4), (None, 1, 160.0)]
+    ingestor.parar()
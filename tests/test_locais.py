@@ -0,0 +1,158 @@
+import os
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import Point, box
+
+from pae_dashboard.efetividade import COL_EFETIVIDADE, COL_ESPERADAS, COL_PARTICIPANTES
+from pae_dashboard.locais import (
+    COL_NUM_PES, COL_PES_DENTRO_ZAS, carregar_locais, consolidar_locais, ler_local, totais_consolidados
+)
+from pae_dashboard.relacao_zas import COL_DENTRO_ZAS
+
+
+ARQUIVOS = [('Barragem A.gpkg', b'nao e gpkg'), ('Barragem B.gpkg', b'')]
+
+
+def gpkg(tmp_path, camadas: dict) -> bytes:
+    """Um GeoPackage com as `camadas` ({nome: GeoDataFrame}), na ordem dada."""
+    caminho = tmp_path / 'local.gpkg'
+    for nome, gdf in camadas.items():
+        gdf.to_file(caminho, layer=nome, driver='GPKG')
+    dados = caminho.read_bytes()
+    caminho.unlink()
+    return dados
+
+
+def zas():
+    return gpd.GeoDataFrame({'setor': ['1']}, geometry=[box(-43.3, -23.0, -43.1, -22.8)], crs="EPSG:4326")
+
+
+def test_ler_local_com_zas_antes_dos_pes(tmp_path):
+    pes = gpd.GeoDataFrame(
+        {'codigo': [1, 2], 'Nome': ['PE Escola', 'PE Praça']},
+        geometry=[Point(-43.2, -22.9), Point(-43.15, -22.85)], crs="EPSG:4326",
+    )
+    # Uma segunda camada de pontos é ignorada: os PEs são a primeira.
+    outros = pes.assign(Nome=['outro 1', 'outro 2'])
+    dados = gpkg(tmp_path, {'zas': zas(), 'pes': pes, 'outros': outros})
+
+    local = ler_local(dados, 'Barragem B1.gpkg', 'hash-b1')
+
+    assert (local.nome, local.conteudo_hash, local.crs_assumido) == ('Barragem B1', 'hash-b1', [])
+    assert local.pes['Nome'].tolist() == ['PE Escola', 'PE Praça']
+    assert np.allclose(local.pes[['Latitude', 'Longitude']].to_numpy(), [[-22.9, -43.2], [-22.85, -43.15]])
+    assert local.zas is not None and local.zas.crs.to_epsg() == 4326
+    assert local.zas['setor'].tolist() == ['1']
+    assert local.zas_hash is not None
+    assert ler_local(dados, 'Barragem B1.gpkg', 'outro-hash').zas_hash != local.zas_hash
+
+
+def test_ler_local_reprojeta_e_usa_outra_coluna_de_nome(tmp_path):
+    # Sem uma das colunas de nome conhecidas, a primeira coluna de texto dá os nomes dos PEs.
+    pes = gpd.GeoDataFrame(
+        {'capacidade': [100, 200], 'rotulo': ['Ginásio', 'Igreja']},
+        geometry=[Point(-43.2, -22.9), Point(-43.15, -22.85)], crs="EPSG:4326",
+    ).to_crs("EPSG:31983")
+    dados = gpkg(tmp_path, {'pes': pes})
+
+    local = ler_local(dados, 'b2.gpkg', 'hash-b2')
+
+    assert local.nome == 'b2'
+    assert local.pes['Nome'].tolist() == ['Ginásio', 'Igreja']
+    assert np.allclose(local.pes[['Latitude', 'Longitude']].to_numpy(), [[-22.9, -43.2], [-22.85, -43.15]])
+    assert local.zas is None and local.zas_hash is None
+
+
+def test_ler_local_sem_coluna_de_texto_numera_os_pes(tmp_path):
+    pes = gpd.GeoDataFrame({'capacidade': [100, 200]}, geometry=[Point(-43.2, -22.9), Point(-43.1, -22.8)],
+                           crs="EPSG:4326")
+
+    local = ler_local(gpkg(tmp_path, {'pes': pes}), 'b3.gpkg', 'hash-b3')
+
+    assert local.pes['Nome'].tolist() == ['PE-01', 'PE-02']
+
+
+def test_ler_local_sem_pontos(tmp_path):
+    with pytest.raises(ValueError):
+        ler_local(gpkg(tmp_path, {'zas': zas()}), 'b4.gpkg', 'hash-b4')
+
+
+def test_erros_de_leitura_ficam_por_local():
+    with ThreadPoolExecutor(2) as executor:
+        locais, erros = carregar_locais(ARQUIVOS, executor=executor)
+
+    assert locais == {}
+    assert list(erros) == ['Barragem A', 'Barragem B']
+
+
+def test_arquivos_do_mesmo_local_sao_um_erro():
+    arquivos = [('Barragem A.gpkg', b''), ('B1.gpkg', b'um'), ('B1.zip', b'outro')]
+
+    locais, erros = carregar_locais(arquivos)
+
+    assert locais == {}
+    assert list(erros) == ['Barragem A', 'B1']
+    assert 'B1.gpkg, B1.zip' in erros['B1']
+
+
+def test_arquivo_valido_com_o_nome_repetido_nao_e_lido(tmp_path):
+    pes = gpd.GeoDataFrame({'Nome': ['PE 1']}, geometry=[Point(-43.2, -22.9)], crs="EPSG:4326")
+    dados = gpkg(tmp_path, {'pes': pes})
+
+    locais, erros = carregar_locais([('B1.gpkg', dados), ('B2.gpkg', dados), ('b1/B1.gpkg', dados)])
+
+    assert list(locais) == ['B2'] and list(erros) == ['B1']
+
+
+def test_pool_quebrado_e_propagado():
+    executor = ProcessPoolExecutor(1)
+    try:
+        # Um processo do pool que morre (como por falta de memória) quebra o pool inteiro.
+        with pytest.raises(BrokenExecutor):
+            executor.submit(os._exit, 1).result()
+
+        with pytest.raises(BrokenExecutor):
+            carregar_locais(ARQUIVOS, executor=executor)
+    finally:
+        executor.shutdown(wait=False)
+
+
+def pes_com_contagens(participantes, esperadas, dentro_zas=None):
+    df = pd.DataFrame(
+        {COL_PARTICIPANTES: participantes, COL_ESPERADAS: esperadas},
+        index=pd.Index([f"PE {i}" for i in range(len(participantes))], name='Nome'),
+    )
+    if dentro_zas is not None:
+        df[COL_DENTRO_ZAS] = dentro_zas
+    return df
+
+
+def test_consolidar_locais_por_local():
+    consolidado = consolidar_locais({
+        'B1': pes_com_contagens([10, 30], [20, 20], [True, False]),
+        'B2': pes_com_contagens([5], [0]),
+        'B3': pes_com_contagens([0, 0, 0], [10, 10, 20], [True, True, True]),
+    })
+
+    assert consolidado.index.name == 'Local'
+    assert consolidado.index.tolist() == ['B1', 'B2', 'B3']
+    assert consolidado[COL_NUM_PES].tolist() == [2, 1, 3]
+    assert consolidado[COL_PARTICIPANTES].tolist() == [40, 5, 0]
+    assert consolidado[COL_ESPERADAS].tolist() == [40, 0, 40]
+    assert consolidado[COL_EFETIVIDADE].tolist() == [100.0, 0.0, 0.0]
+    # O local sem ZAS fica sem a contagem de PEs dentro dela.
+    assert consolidado[COL_PES_DENTRO_ZAS].iloc[[0, 2]].tolist() == [1, 3]
+    assert pd.isna(consolidado[COL_PES_DENTRO_ZAS].iloc[1])
+
+    assert totais_consolidados(consolidado) == {COL_PARTICIPANTES: 45, COL_ESPERADAS: 80, COL_EFETIVIDADE: 56.25}
+
+
+def test_consolidar_sem_locais():
+    consolidado = consolidar_locais({})
+
+    assert consolidado.empty
+    assert totais_consolidados(consolidado) == {COL_PARTICIPANTES: 0, COL_ESPERADAS: 0, COL_EFETIVIDADE: 0.0}
@@ -0,0 +1,60 @@
+import json
+
+import geopandas as gpd
+import pandas as pd
+from shapely.geometry import box
+
+from pae_dashboard.efetividade import (
+    COL_COR, COL_EFETIVIDADE, COL_ESPERADAS, COL_ICONE, COL_PARTICIPANTES, classificar_marcadores
+)
+from pae_dashboard.mapa import camada_marcadores, mapa_base, tamanho_script
+from pae_dashboard.zas import construir_lods
+
+
+def zas_lod(nome='setor </script><b>1</b>'):
+    gdf = gpd.GeoDataFrame({'nome': [nome, 'setor 2']}, geometry=[box(0, 0, 1, 1), box(1, 0, 2, 1)], crs="EPSG:4326")
+    return construir_lods(gdf, ['nome'])
+
+
+def test_geojson_texto_e_gerado_uma_vez_e_seguro_no_script():
+    lod = zas_lod()
+
+    texto = lod.geojson_texto_para(11)
+
+    assert lod.geojson_texto_para(11) is texto
+    assert '</script>' not in texto and '<b>' not in texto
+    assert json.loads(texto) == json.loads(json.dumps(lod.geojson_para(11)))
+
+
+def test_mapa_base_embute_a_zas_com_tooltip():
+    df_pe = pd.DataFrame({'Latitude': [0.5], 'Longitude': [0.5]})
+    lod = zas_lod()
+    m, controle = mapa_base(df_pe, lod)
+
+    html = m.get_root().render()
+
+    assert controle is not None
+    assert f".addData({lod.geojson_texto_para(11)});" in html
+    assert 'var campos = ["nome"];' in html
+    assert 'bindTooltip' in html
+    # Renderizar de novo (como a cada reenvio do mapa) reaproveita o mesmo texto, sem duplicar a camada.
+    assert m.get_root().render().count(lod.geojson_texto_para(11)) == 1
+
+
+def test_tamanho_script_da_camada_de_marcadores():
+    df_pe = pd.DataFrame(
+        {'Latitude': [0.2, 0.8], 'Longitude': [0.5, 0.5], COL_PARTICIPANTES: [10, 40], COL_ESPERADAS: [50, 50]},
+        index=['PE 1', 'PE 2'],
+    )
+    df_pe[COL_EFETIVIDADE] = df_pe[COL_PARTICIPANTES] / df_pe[COL_ESPERADAS] * 100
+    df_pe[COL_COR], df_pe[COL_ICONE] = classificar_marcadores(
+        df_pe[COL_EFETIVIDADE], df_pe[COL_PARTICIPANTES], df_pe[COL_ESPERADAS]
+    )
+    base = len(mapa_base(df_pe)[0].get_root().render().encode('utf-8'))
+    m, _ = mapa_base(df_pe)
+    camada = camada_marcadores(df_pe).add_to(m)
+
+    completo = len(m.get_root().render().encode('utf-8'))
+
+    # O mapa completo é o mapa base mais o script da camada (a menos das quebras de linha entre os scripts).
+    assert abs(completo - base - tamanho_script(camada)) < 20
@@ -0,0 +1,56 @@
+from streamlit.testing.v1 import AppTest
+
+from pae_dashboard.paineis import PAINEL_APP, fontes_alteradas, paineis_afetados
+
+
+def test_fontes_alteradas():
+    assert fontes_alteradas({}, {'pes': 1, 'contagens': 0}) == {'pes', 'contagens'}
+    assert fontes_alteradas({'pes': 1, 'contagens': 2}, {'pes': 1, 'contagens': 3}) == {'contagens'}
+
+
+def test_paineis_afetados():
+    assert paineis_afetados({'contagens'}) == ['contagens', 'metricas', 'pe_detalhe', 'grafico', 'evolucao', 'mapa']
+    assert paineis_afetados({'zas'}) == [PAINEL_APP]
+    assert paineis_afetados(set()) == []
+
+
+def _app_fragmentos():
+    import streamlit as st
+
+    from pae_dashboard.paineis import reexecutar_fragmentos
+
+    for chave in ('execucoes_script', 'execucoes_alvo', 'execucoes_outro'):
+        st.session_state.setdefault(chave, 0)
+    st.session_state.execucoes_script += 1
+
+    @st.fragment(key='alvo')
+    def alvo():
+        st.session_state.execucoes_alvo += 1
+
+    @st.fragment(key='outro')
+    def outro():
+        st.session_state.execucoes_outro += 1
+
+    @st.fragment(key='verificacao')
+    def verificacao():
+        # Como a verificação periódica do exercício: o pedido sai do corpo do fragmento, não de um callback.
+        if st.session_state.pop('pedir', False):
+            reexecutar_fragmentos(['alvo'])
+
+    alvo()
+    outro()
+    verificacao()
+
+
+def test_reexecutar_fragmentos_reexecuta_so_os_paineis_pedidos():
+    at = AppTest.from_function(_app_fragmentos)
+    at.run()
+    assert (at.session_state.execucoes_script, at.session_state.execucoes_alvo) == (1, 1)
+
+    at.session_state.pedir = True
+    at.run()
+
+    assert not at.exception
+    assert at.session_state.execucoes_script == 2
+    assert at.session_state.execucoes_outro == 2
+    assert at.session_state.execucoes_alvo == 3
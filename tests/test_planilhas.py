@@ -0,0 +1,132 @@
+import io
+import zipfile
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from pae_dashboard.planilhas import (
+    _ler_colunas_xml, _ler_primeira_linha_xml, _MarcacaoIncomum, ler_cabecalho, ler_colunas
+)
+
+
+def xlsx(linhas_xml: str, compartilhadas=()) -> bytes:
+    """Um .xlsx mínimo, escrito à mão, com uma aba de `sheetData` dado e a tabela de textos compartilhados."""
+    planilha = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+    relacao = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+    pacote = 'http://schemas.openxmlformats.org/package/2006/relationships'
+    saida = io.BytesIO()
+    with zipfile.ZipFile(saida, 'w') as arquivo:
+        arquivo.writestr('[Content_Types].xml', (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '<Override PartName="/xl/sharedStrings.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+            '</Types>'
+        ))
+        arquivo.writestr('_rels/.rels', (
+            f'<Relationships xmlns="{pacote}"><Relationship Id="rId1" Target="xl/workbook.xml" '
+            f'Type="{relacao}/officeDocument"/></Relationships>'
+        ))
+        arquivo.writestr('xl/workbook.xml', (
+            f'<workbook xmlns="{planilha}" xmlns:r="{relacao}">'
+            '<sheets><sheet name="PEs" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ))
+        arquivo.writestr('xl/_rels/workbook.xml.rels', (
+            f'<Relationships xmlns="{pacote}">'
+            f'<Relationship Id="rId1" Target="worksheets/sheet1.xml" Type="{relacao}/worksheet"/>'
+            f'<Relationship Id="rId2" Target="sharedStrings.xml" Type="{relacao}/sharedStrings"/>'
+            '</Relationships>'
+        ))
+        arquivo.writestr('xl/worksheets/sheet1.xml', (
+            f'<worksheet xmlns="{planilha}"><sheetData>{linhas_xml}</sheetData></worksheet>'
+        ))
+        arquivo.writestr('xl/sharedStrings.xml', (
+            f'<sst xmlns="{planilha}" count="{len(compartilhadas)}" uniqueCount="{len(compartilhadas)}">'
+            + ''.join(f'<si>{si}</si>' for si in compartilhadas) + '</sst>'
+        ))
+    return saida.getvalue()
+
+
+def esperado(data: bytes, colunas: list) -> list:
+    """As linhas das `colunas` como o pandas as lê, sem as inteiramente vazias."""
+    df = pd.read_excel(io.BytesIO(data))[colunas].dropna(how='all')
+    return [tuple(None if pd.isna(valor) else valor for valor in linha) for linha in df.itertuples(index=False)]
+
+
+def conferir(data: bytes):
+    cabecalho = ler_cabecalho(data)
+    assert cabecalho == list(pd.read_excel(io.BytesIO(data)).columns)
+    for colunas in (cabecalho, cabecalho[::-1], cabecalho[1:2]):
+        lidas = ler_colunas(data, colunas)
+        assert list(lidas.columns) == colunas
+        assert [tuple(None if pd.isna(valor) else valor for valor in linha)
+                for linha in lidas.itertuples(index=False)] == esperado(data, colunas)
+
+
+def test_planilha_do_openpyxl_com_textos_compartilhados():
+    workbook = openpyxl.Workbook()
+    planilha = workbook.active
+    # Cabeçalho com coluna vazia e repetida; textos com entidades XML; células esparsas e uma linha vazia.
+    planilha.append(['Nome', 'Latitude', None, 'Nome', 'Longitude', 'Obs'])
+    planilha.append(['PE <1> & "A"', -22.9, 'x', 'PE 1', -43.1, None])
+    planilha.append([101, None, None, None, -43.2, 'só obs'])
+    planilha.append([None] * 6)
+    planilha.append(['PE 3', -22.7, None, 'PE 3', None, 'ç & ã'])
+    saida = io.BytesIO()
+    workbook.save(saida)
+    data = saida.getvalue()
+
+    assert _ler_primeira_linha_xml(data) == ['Nome', 'Latitude', None, 'Nome', 'Longitude', 'Obs']
+    assert ler_cabecalho(data) == ['Nome', 'Latitude', 'Unnamed: 2', 'Nome.1', 'Longitude', 'Obs']
+    assert _ler_colunas_xml(data, [0, 4]) == [('PE <1> & "A"', -43.1), (101, -43.2), ('PE 3', None)]
+    conferir(data)
+
+
+def test_textos_inline_compartilhados_e_entidades_escritos_a_mao():
+    compartilhadas = [
+        '<t>Nome</t>',
+        # Texto com formatação em partes e uma fonética, que não entra no valor.
+        '<r><t>Ponto </t></r><r><rPr><b/></rPr><t xml:space="preserve">&amp; Encontro</t></r><rPh sb="0" eb="1"><t>x</t></rPh>',
+        '<t>Escola &lt;Municipal&gt;</t>',
+    ]
+    linhas = (
+        '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="inlineStr"><is><t>Lat</t></is></c>'
+        '<c r="C1" t="s"><v>1</v></c><c r="E1" t="inlineStr"><is><t>A &amp; B</t></is></c></row>'
+        '<row r="2"><c r="A2" t="s"><v>2</v></c><c r="B2"><v>-22.5</v></c><c r="C2" t="b"><v>1</v></c>'
+        '<c r="D2" s="1"/><c r="E2" t="str"><v>f &gt; 1</v></c></row>'
+        '<row r="3"><c r="B3"><v>7</v></c><c r="C3" t="e"><v>#N/A</v></c></row>'
+        '<row r="5"><c r="A5" t="inlineStr"><is><r><t>Praça </t></r><r><t>Central</t></r></is></c>'
+        '<c r="E5" t="s"><v>0</v></c></row>'
+    )
+    data = xlsx(linhas, compartilhadas)
+
+    assert _ler_primeira_linha_xml(data) == ['Nome', 'Lat', 'Ponto & Encontro', None, 'A & B']
+    assert _ler_colunas_xml(data, [0, 2, 4]) == [
+        ('Escola <Municipal>', True, 'f > 1'), ('Praça Central', None, 'Nome')
+    ]
+    assert _ler_colunas_xml(data, [1]) == [(-22.5,), (7,)]
+    conferir(data)
+
+
+def test_marcacao_incomum_usa_o_openpyxl():
+    # Células sem a referência `r`: o openpyxl as posiciona pela ordem; a leitura direta desiste.
+    linhas = (
+        '<row r="1"><c t="inlineStr"><is><t>Nome</t></is></c><c t="inlineStr"><is><t>Lat</t></is></c></row>'
+        '<row r="2"><c t="inlineStr"><is><t>PE &amp; 1</t></is></c><c><v>-22.5</v></c></row>'
+        '<row r="3"><c t="s"><v>0</v></c></row>'
+    )
+    data = xlsx(linhas, ['<t>Escola</t>'])
+
+    with pytest.raises(_MarcacaoIncomum):
+        _ler_primeira_linha_xml(data)
+    with pytest.raises(_MarcacaoIncomum):
+        _ler_colunas_xml(data, [0])
+    assert ler_cabecalho(data) == ['Nome', 'Lat']
+    conferir(data)
@@ -0,0 +1,122 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from pae_dashboard.tiles import ArmazemTiles, ServidorTiles, contar_tiles, formato_imagem, prebaixar, tile_do_ponto
+
+
+ORIGEM = "http://origem.teste/{z}/{x}/{y}.png"
+BBOX = (-43.3, -22.95, -43.1, -22.8)
+
+
+class OrigemFalsa:
+    """Origem de tiles local: responde um PNG que identifica o tile e registra as URLs pedidas."""
+
+    def __init__(self, falhar=()):
+        self.pedidos = []
+        self.falhar = set(falhar)
+
+    def __call__(self, url: str) -> bytes:
+        self.pedidos.append(url)
+        if url in self.falhar:
+            raise urllib.error.URLError("sem conexão")
+        return b'\x89PNG' + url.encode()
+
+
+@pytest.fixture
+def armazem(tmp_path):
+    armazem = ArmazemTiles(str(tmp_path / 'tiles.mbtiles'))
+    yield armazem
+    armazem.fechar()
+
+
+def test_prebaixar_grava_a_area_e_nao_repete_tiles(armazem):
+    origem = OrigemFalsa()
+    total = contar_tiles(BBOX, 10, 12)
+
+    resultado = prebaixar(armazem, BBOX, 10, 12, ORIGEM, buscar=origem, trabalhadores=2)
+
+    assert resultado == {'total': total, 'existentes': 0, 'baixados': total, 'falhas': 0}
+    assert len(armazem) == total == len(origem.pedidos)
+    metadados = armazem.metadados()
+    assert (metadados['format'], metadados['minzoom'], metadados['maxzoom']) == ('png', '10', '12')
+
+    x, y = tile_do_ponto(BBOX[0], BBOX[3], 12)
+    assert armazem.obter(12, x, y) == b'\x89PNG' + ORIGEM.format(z=12, x=x, y=y).encode()
+
+    resultado = prebaixar(armazem, BBOX, 10, 13, ORIGEM, buscar=origem)
+
+    assert resultado['existentes'] == total
+    assert resultado['baixados'] == contar_tiles(BBOX, 13, 13)
+    assert armazem.metadados()['maxzoom'] == '13'
+
+
+def test_prebaixar_conta_falhas_e_as_busca_de_novo(armazem):
+    x, y = tile_do_ponto(BBOX[0], BBOX[3], 10)
+    falha = ORIGEM.format(z=10, x=x, y=y)
+    origem = OrigemFalsa(falhar=[falha])
+
+    resultado = prebaixar(armazem, BBOX, 10, 10, ORIGEM, buscar=origem)
+
+    assert resultado['falhas'] == 1
+    assert resultado['baixados'] == resultado['total'] - 1
+
+    resultado = prebaixar(armazem, BBOX, 10, 10, ORIGEM, buscar=OrigemFalsa())
+
+    assert (resultado['baixados'], resultado['falhas']) == (1, 0)
+
+
+def test_prebaixar_recusa_areas_grandes(armazem):
+    with pytest.raises(ValueError):
+        prebaixar(armazem, BBOX, 0, 18, ORIGEM, buscar=OrigemFalsa(), max_tiles=1000)
+    assert len(armazem) == 0
+
+
+def baixar(url):
+    with urllib.request.urlopen(url, timeout=5) as resposta:
+        return resposta.read(), resposta.headers['Content-Type']
+
+
+def test_servidor_busca_na_origem_tiles_ausentes_e_os_grava(armazem):
+    origem = OrigemFalsa()
+    servidor = ServidorTiles(armazem, url_origem=ORIGEM, buscar=origem)
+    servidor.iniciar()
+    try:
+        url = servidor.url_modelo().format(z=12, x=1517, y=2323)
+
+        dados, tipo = baixar(url)
+        assert dados == b'\x89PNG' + ORIGEM.format(z=12, x=1517, y=2323).encode()
+        assert tipo == 'image/png'
+        assert armazem.obter(12, 1517, 2323) == dados
+
+        assert baixar(url)[0] == dados
+        assert len(origem.pedidos) == 1
+        assert servidor.estatisticas == {'memoria': 1, 'arquivo': 0, 'origem': 1, 'ausentes': 0}
+    finally:
+        servidor.parar()
+
+
+def test_servidor_sem_origem_responde_404_para_tiles_ausentes(armazem):
+    armazem.gravar([(12, 1517, 2323, b'\xff\xd8jpeg')])
+    servidor = ServidorTiles(armazem)
+    servidor.iniciar()
+    try:
+        dados, tipo = baixar(servidor.url_modelo().format(z=12, x=1517, y=2323))
+        assert (dados, tipo) == (b'\xff\xd8jpeg', 'image/jpeg')
+        assert formato_imagem(dados) == 'jpg'
+
+        with pytest.raises(urllib.error.HTTPError) as erro:
+            baixar(servidor.url_modelo().format(z=12, x=1518, y=2323))
+        assert erro.value.code == 404
+        assert servidor.estatisticas['ausentes'] == 1
+    finally:
+        servidor.parar()
+
+
+def test_url_modelo_usa_o_endereco_publico():
+    servidor = ServidorTiles(None, porta=8765)
+
+    assert servidor.url_modelo() == "http://127.0.0.1:8765/{z}/{x}/{y}"
+    assert servidor.url_modelo("https://painel.exemplo/tiles/") == "https://painel.exemplo/tiles/{z}/{x}/{y}"
+    assert servidor.url_modelo("http://10.0.0.5:8765", camada='zas-1') == "http://10.0.0.5:8765/zas-1"
@@ -0,0 +1,175 @@
+import geopandas as gpd
+import pytest
+from shapely.geometry import MultiPolygon, Polygon, box
+
+from pae_dashboard.tiles import tile_do_ponto
+from pae_dashboard.tiles_vetoriais import (
+    CAMPO_ID, EXTENSAO_MVT, NOME_CAMADA_MVT, PiramideZas, codificar_tile, comandos_geometria
+)
+
+
+# --- Leitura mínima de protobuf/MVT, só para os testes ---
+
+def ler_varint(dados: bytes, i: int) -> tuple:
+    valor = deslocamento = 0
+    while True:
+        byte = dados[i]
+        i += 1
+        valor |= (byte & 0x7F) << deslocamento
+        deslocamento += 7
+        if not byte & 0x80:
+            return valor, i
+
+
+def ler_mensagem(dados: bytes) -> dict:
+    """{número do campo: [valores]}: varints como int, campos com tamanho como bytes."""
+    campos, i = {}, 0
+    while i < len(dados):
+        chave, i = ler_varint(dados, i)
+        numero, tipo = chave >> 3, chave & 7
+        if tipo == 0:
+            valor, i = ler_varint(dados, i)
+        elif tipo == 1:
+            valor, i = dados[i:i + 8], i + 8
+        elif tipo == 2:
+            tamanho, i = ler_varint(dados, i)
+            valor, i = dados[i:i + tamanho], i + tamanho
+        else:
+            raise AssertionError(f"tipo de campo inesperado: {tipo}")
+        campos.setdefault(numero, []).append(valor)
+    return campos
+
+
+def ler_empacotados(dados: bytes) -> list:
+    valores, i = [], 0
+    while i < len(dados):
+        valor, i = ler_varint(dados, i)
+        valores.append(valor)
+    return valores
+
+
+def dezigzag(valor: int) -> int:
+    return (valor >> 1) ^ -(valor & 1)
+
+
+def ler_tile(dados: bytes) -> dict:
+    """A única camada do tile: nome, versão, extensão, chaves, valores e feições (id, tipo, tags, comandos)."""
+    camadas = ler_mensagem(dados)[3]
+    assert len(camadas) == 1
+    camada = ler_mensagem(camadas[0])
+    feicoes = []
+    for mensagem in camada.get(2, []):
+        feicao = ler_mensagem(mensagem)
+        feicoes.append({
+            'id': feicao[1][0],
+            'tipo': feicao[3][0],
+            'tags': ler_empacotados(feicao[2][0]) if 2 in feicao else [],
+            'comandos': ler_empacotados(feicao[4][0]),
+        })
+    return {
+        'nome': camada[1][0].decode(),
+        'versao': camada[15][0],
+        'extensao': camada[5][0],
+        'chaves': [chave.decode() for chave in camada.get(3, [])],
+        'valores': [ler_mensagem(valor) for valor in camada.get(4, [])],
+        'feicoes': feicoes,
+    }
+
+
+def aneis(comandos: list) -> list:
+    """Anéis (listas de pontos absolutos) de uma geometria de polígono, conferindo a sequência de comandos."""
+    resultado, cursor, i = [], [0, 0], 0
+    while i < len(comandos):
+        comando, contagem = comandos[i] & 7, comandos[i] >> 3
+        assert (comando, contagem) == (1, 1), "cada anel começa com um MoveTo de um ponto"
+        cursor = [cursor[0] + dezigzag(comandos[i + 1]), cursor[1] + dezigzag(comandos[i + 2])]
+        anel = [tuple(cursor)]
+        i += 3
+        comando, contagem = comandos[i] & 7, comandos[i] >> 3
+        assert comando == 2 and contagem >= 2, "seguido de um LineTo com ao menos dois pontos"
+        for j in range(contagem):
+            cursor = [cursor[0] + dezigzag(comandos[i + 1 + 2 * j]), cursor[1] + dezigzag(comandos[i + 2 + 2 * j])]
+            anel.append(tuple(cursor))
+        i += 1 + 2 * contagem
+        assert comandos[i] == (7 | (1 << 3)), "e terminado por um ClosePath"
+        i += 1
+        resultado.append(anel)
+    return resultado
+
+
+def area(anel: list) -> float:
+    """Área assinada com y para baixo: positiva no sentido horário da tela (anel externo no MVT)."""
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(anel, anel[1:] + anel[:1])) / 2
+
+
+# --- Testes ---
+
+def test_comandos_de_um_quadrado():
+    tipo, comandos = comandos_geometria(Polygon([(0, 0), (10, 0), (10, 10), (0, 10)]), [0, 0])
+
+    # MoveTo(0, 0), LineTo x3 (+10, 0), (0, +10), (-10, 0), ClosePath.
+    assert tipo == 3
+    assert comandos == [9, 0, 0, 26, 20, 0, 0, 20, 19, 0, 15]
+
+
+def test_poligono_com_buraco():
+    # Anel externo no sentido anti-horário da tela e buraco no horário: o codificador inverte os dois.
+    externo = [(100, 100), (100, 300), (300, 300), (300, 100)]
+    buraco = [(150, 150), (250, 150), (250, 250), (150, 250)]
+
+    tile = ler_tile(codificar_tile([(7, Polygon(externo, [buraco]), {CAMPO_ID: 7})]))
+
+    assert (tile['nome'], tile['versao'], tile['extensao']) == (NOME_CAMADA_MVT, 2, EXTENSAO_MVT)
+    [feicao] = tile['feicoes']
+    assert (feicao['id'], feicao['tipo']) == (7, 3)
+    assert tile['chaves'] == [CAMPO_ID]
+    assert feicao['tags'] == [0, 0]
+    assert tile['valores'] == [{5: [7]}]
+    anel_externo, anel_interno = aneis(feicao['comandos'])
+    assert set(anel_externo) == set(externo) and area(anel_externo) > 0
+    assert set(anel_interno) == set(buraco) and area(anel_interno) < 0
+
+
+def test_multipoligono_com_varias_feicoes():
+    partes = MultiPolygon([box(0, 0, 10, 10), box(20, 20, 40, 40)])
+
+    tile = ler_tile(codificar_tile([(3, partes, {CAMPO_ID: 3}), (11, box(50, 0, 60, -10), {CAMPO_ID: 11})]))
+
+    assert [feicao['id'] for feicao in tile['feicoes']] == [3, 11]
+    primeira, segunda = (aneis(feicao['comandos']) for feicao in tile['feicoes'])
+    # O segundo anel é relativo ao último ponto do primeiro (cursor contínuo na feição).
+    assert [set(anel) for anel in primeira] == [set(box(0, 0, 10, 10).exterior.coords), set(box(20, 20, 40, 40).exterior.coords)]
+    assert all(area(anel) > 0 for anel in primeira)
+    # Coordenadas negativas (na margem do tile) usam o zigzag.
+    assert set(segunda[0]) == set(box(50, 0, 60, -10).exterior.coords) and area(segunda[0]) > 0
+    assert tile['valores'] == [{5: [3]}, {5: [11]}]
+    assert [feicao['tags'] for feicao in tile['feicoes']] == [[0, 0], [0, 1]]
+
+
+def test_tile_vazio():
+    assert codificar_tile([]) == b''
+    # Anéis degenerados (área zero) são descartados, e a feição com eles.
+    assert codificar_tile([(1, Polygon([(0, 0), (10, 0), (20, 0)]), {})]) == b''
+
+
+@pytest.fixture
+def piramide():
+    gdf = gpd.GeoDataFrame(
+        {'nome': ['a', 'b']},
+        geometry=[box(-43.30, -22.95, -43.25, -22.90), box(-43.20, -22.95, -43.15, -22.90)],
+        crs="EPSG:4326",
+    )
+    return PiramideZas(gdf, 'teste')
+
+
+def test_piramide_ids_das_feicoes(piramide):
+    # No zoom 8, um só tile cobre as duas feições.
+    x, y = tile_do_ponto(-43.2, -22.9, 8)
+    tile = ler_tile(piramide.tile(8, x, y))
+
+    assert [feicao['id'] for feicao in tile['feicoes']] == [0, 1]
+    for feicao in tile['feicoes']:
+        [anel] = aneis(feicao['comandos'])
+        assert area(anel) > 0
+    assert piramide.atributos(1) == {'nome': 'b'}
+    assert piramide.tile(8, 0, 0) == b''